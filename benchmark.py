@@ -0,0 +1,468 @@
+#!/usr/bin/env python3
+"""
+Performance benchmarks for the Tkinter and PyQt5 task managers.
+
+Tasks are generated synthetically (seeded, so every run sees the same data)
+in sizes from a thousand to a million, with a choice of text lengths and
+priority mixes. For each frontend and size the suite times cold start (a
+fresh process until every task is on screen), load_tasks, save_tasks, a full
+refresh, sort_by_priority, a single add, toggle and delete, and a toggle and
+delete of a 500-task selection.
+
+The PyQt5 app runs on the offscreen platform. The Tkinter app needs an X
+display; without one the suite starts Xvfb if it is installed and otherwise
+skips Tk.
+
+--storage also times the store without a frontend: loading and saving one
+tasks.json against the sharded layout (parsed on every core, and rewriting
+only the shards that changed), with the speedups printed to stderr.
+
+Results are printed as JSON. With --compare the run is checked against a
+stored baseline and the exit status is 1 if anything got slower than the
+tolerance allows.
+
+    python benchmark.py --sizes 1000,100000 --output baseline.json
+    python benchmark.py --sizes 1000,100000 --compare baseline.json
+    python benchmark.py --sizes 100000,1000000 --frontend none --storage
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from unittest.mock import patch
+
+from task_model import TaskList, PRIORITY_LEVELS, NO_PRIORITY
+from task_storage import open_store, BACKENDS, JournalStore, ShardedStore
+
+DEFAULT_SIZES = (1000, 10000, 100000)
+BULK_SELECTION = 500  # tasks selected for the bulk toggle and delete
+FRONTENDS = ("qt", "tk")
+STORES = (("json", JournalStore, "tasks.json"), ("sharded", ShardedStore, "tasks.shards"))
+TEXT_LENGTHS = {  # words per task: (shortest, longest)
+    "short": (1, 4),
+    "medium": (3, 12),
+    "long": (20, 60),
+}
+PRIORITY_MIXES = {  # weights for High, Medium, Low and no priority
+    "even": (1, 1, 1, 1),
+    "skewed": (1, 6, 2, 1),
+    "none": (0, 0, 0, 1),
+}
+WORDS = (
+    "buy milk call mom write report review code fix bug plan sprint book flight pay rent "
+    "clean kitchen water plants read chapter send invoice update docs meet team prepare slides "
+    "renew passport walk dog order parts email landlord draft proposal test release backup photos "
+    "schedule dentist cancel subscription refactor parser deploy server sort receipts"
+).split()
+TOLERANCE = 0.25  # fractional slowdown tolerated by --compare
+MIN_DELTA_MS = 1.0  # slowdowns smaller than this are noise, whatever the ratio
+COLD_START_TIMEOUT = 600  # seconds
+
+
+def generate_tasks(count, text="medium", priorities="even", completed=0.3, seed=0):
+    """``count`` task dicts, the same ones for the same arguments."""
+    rng = random.Random(seed)
+    shortest, longest = TEXT_LENGTHS[text]
+    levels = list(PRIORITY_LEVELS[::-1]) + [NO_PRIORITY]  # High, Medium, Low, none
+    weights = PRIORITY_MIXES[priorities]
+    tasks = []
+    for _ in range(count):
+        tasks.append({
+            "task": " ".join(rng.choices(WORDS, k=rng.randint(shortest, longest))),
+            "priority": rng.choices(levels, weights)[0],
+            "completed": rng.random() < completed,
+            "id": "%016x" % rng.getrandbits(64),
+        })
+    return tasks
+
+
+def write_tasks(directory, tasks):
+    """Save ``tasks`` as ``tasks.json`` (or the $TASKS_BACKEND equivalent) in ``directory``."""
+    store = open_store(os.path.join(directory, "tasks.json"))
+    try:
+        store.save(TaskList(tasks))
+    finally:
+        store.close()
+
+
+def measure(action, repeat, setup=None):
+    """Run ``action`` ``repeat`` times; returns the median and fastest run in ms."""
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        action()
+        times.append((time.perf_counter() - start) * 1000)
+    return {"median": round(statistics.median(times), 3), "min": round(min(times), 3)}
+
+
+def cold_start(frontend, directory, repeat):
+    """Time fresh app processes: until the window is up, and until all tasks are loaded."""
+    first_paint, loaded = [], []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        child = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--cold-start-child", frontend],
+            cwd=directory, stdout=subprocess.PIPE, text=True)
+        try:
+            for line in child.stdout:
+                if line.strip() == "shown":
+                    first_paint.append((time.perf_counter() - start) * 1000)
+                elif line.strip() == "ready":
+                    loaded.append((time.perf_counter() - start) * 1000)
+                    break
+            child.wait(COLD_START_TIMEOUT)
+        finally:
+            if child.poll() is None:
+                child.kill()
+        if child.returncode != 0 or len(loaded) < len(first_paint) or not loaded:
+            raise RuntimeError("%s cold start failed (exit status %s)" % (frontend, child.returncode))
+    summary = {}
+    for name, times in (("cold_start_first_paint", first_paint), ("cold_start", loaded)):
+        summary[name] = {"median": round(statistics.median(times), 3), "min": round(min(times), 3)}
+    return summary
+
+
+def cold_start_child(frontend):
+    """Body of a cold start process: report once shown and once fully loaded."""
+    if frontend == "qt":
+        from PyQt5.QtWidgets import QApplication
+        from task_manager_qt import TaskManager
+        app = QApplication(sys.argv)
+        window = TaskManager(defer_load=True)
+        window.show()
+        app.processEvents()
+        print("shown", flush=True)
+        window.load_more()
+        while window.loader is not None:
+            app.processEvents()
+        app.processEvents()
+        print("ready", flush=True)
+        window.close()
+    else:
+        import tkinter as tk
+        from task_manager import TaskManagerApp
+        root = tk.Tk()
+        app = TaskManagerApp(root, defer_load=True)
+        root.update()
+        print("shown", flush=True)
+        app.load_more()
+        while app.loader is not None:
+            root.update()
+        root.update()
+        print("ready", flush=True)
+        app.on_close()
+    return 0
+
+
+def bench_qt(repeat):
+    """Time the PyQt5 operations on the tasks.json in the current directory."""
+    from PyQt5.QtCore import QItemSelection, QItemSelectionModel
+    from PyQt5.QtWidgets import QApplication, QMessageBox
+    from task_manager_qt import TaskManager
+    app = QApplication.instance() or QApplication(sys.argv)
+    window = TaskManager()
+    window.show()
+    window.finish_loading()
+    app.processEvents()
+
+    def settled(action):
+        # Include the view's own work, not just the model's
+        def run():
+            action()
+            app.processEvents()
+        return run
+
+    def unsorted():
+        window.model.set_sorted(False)
+
+    def select_middle():
+        unsorted()
+        window.table.selectRow(len(window.tasks) // 2)
+
+    def select_block():
+        unsorted()
+        first = max(0, len(window.tasks) // 2 - BULK_SELECTION // 2)
+        last = min(len(window.tasks), first + BULK_SELECTION) - 1
+        block = QItemSelection(window.model.index(first, 0), window.model.index(last, 0))
+        window.table.selectionModel().select(block, QItemSelectionModel.ClearAndSelect | QItemSelectionModel.Rows)
+
+    def add():
+        window.task_input.setText("Benchmark task")
+        window.add_task()
+
+    results = {}
+    try:
+        results["load_tasks"] = measure(settled(window.load_tasks), repeat)
+        results["save_tasks"] = measure(window.save_tasks, repeat)
+        results["refresh_table"] = measure(settled(window.refresh_table), repeat)
+        results["sort_by_priority"] = measure(settled(lambda: window.sort_by_priority(False)), repeat, unsorted)
+        results["add_task"] = measure(settled(add), repeat, unsorted)
+        results["toggle_complete"] = measure(settled(window.toggle_complete), repeat, select_middle)
+        results["toggle_selection"] = measure(settled(window.toggle_complete), repeat, select_block)
+        with patch("task_manager_qt.QMessageBox.question", return_value=QMessageBox.Yes):
+            results["delete_task"] = measure(settled(window.delete_task), repeat, select_middle)
+            results["delete_selection"] = measure(settled(window.delete_task), repeat, select_block)
+    finally:
+        window.close()
+    return results
+
+
+def bench_tk(repeat):
+    """Time the Tkinter operations on the tasks.json in the current directory."""
+    import tkinter as tk
+    from task_manager import TaskManagerApp
+    root = tk.Tk()
+    app = TaskManagerApp(root)
+    app.finish_loading()
+    root.update()
+
+    def settled(action):
+        def run():
+            action()
+            root.update()
+        return run
+
+    def unsorted():
+        if app.order is not None:
+            app.order.detach()
+            app.order = None
+            app.refresh_tasks()
+            root.update()
+
+    def select_middle():
+        unsorted()
+        app.selected_keys = {app.row_keys[len(app.row_keys) // 2]}
+
+    def select_block():
+        unsorted()
+        first = max(0, len(app.row_keys) // 2 - BULK_SELECTION // 2)
+        app.selected_keys = set(app.row_keys[first:first + BULK_SELECTION])
+
+    def add():
+        app.task_entry.insert(0, "Benchmark task")
+        app.add_task()
+
+    results = {}
+    try:
+        results["load_tasks"] = measure(settled(app.load_tasks), repeat)
+        results["save_tasks"] = measure(app.save_tasks, repeat)
+        results["refresh_tasks"] = measure(settled(app.refresh_tasks), repeat)
+        results["sort_by_priority"] = measure(settled(lambda: app.sort_by_priority(False)), repeat, unsorted)
+        results["add_task"] = measure(settled(add), repeat, unsorted)
+        results["toggle_complete"] = measure(settled(app.toggle_complete), repeat, select_middle)
+        results["toggle_selection"] = measure(settled(app.toggle_complete), repeat, select_block)
+        with patch("task_manager.messagebox.askyesno", return_value=True):
+            results["delete_task"] = measure(settled(app.delete_task), repeat, select_middle)
+            results["delete_selection"] = measure(settled(app.delete_task), repeat, select_block)
+    finally:
+        app.on_close()
+    return results
+
+
+def start_display():
+    """Make sure Tk has an X display; returns (Xvfb process or None, reason if unusable)."""
+    if os.environ.get("DISPLAY") or sys.platform in ("win32", "darwin"):
+        return None, None
+    if shutil.which("Xvfb") is None:
+        return None, "no DISPLAY and Xvfb is not installed"
+    read_fd, write_fd = os.pipe()
+    server = subprocess.Popen(["Xvfb", "-displayfd", str(write_fd), "-screen", "0", "1024x768x24", "-nolisten", "tcp"],
+                              pass_fds=(write_fd,), stderr=subprocess.DEVNULL)
+    os.close(write_fd)
+    with os.fdopen(read_fd) as f:
+        number = f.readline().strip()
+    if not number:
+        server.kill()
+        return None, "Xvfb did not start"
+    os.environ["DISPLAY"] = ":" + number
+    return server, None
+
+
+def run_frontend(frontend, tasks, repeat):
+    """Cold start plus operation timings for one frontend on a private copy of the data."""
+    directory = tempfile.mkdtemp(prefix="task-bench-")
+    original_cwd = os.getcwd()
+    try:
+        write_tasks(directory, tasks)
+        results = cold_start(frontend, directory, repeat)
+        os.chdir(directory)
+        results.update(bench_qt(repeat) if frontend == "qt" else bench_tk(repeat))
+        return results
+    finally:
+        os.chdir(original_cwd)
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def bench_storage(tasks, repeat):
+    """Load, first save, and save after editing one task, for each layout in STORES."""
+    directory = tempfile.mkdtemp(prefix="task-bench-")
+    results = {}
+    try:
+        for name, store_class, filename in STORES:
+            path = os.path.join(directory, filename)
+            task_list = TaskList(list(tasks))
+            store = store_class(path)
+            try:
+                def first_save():
+                    # Into a fresh directory each time, so no shard can be reused
+                    fresh = store_class(os.path.join(tempfile.mkdtemp(dir=directory), filename))
+                    try:
+                        fresh.save(task_list)
+                    finally:
+                        fresh.close()
+                results[name + "_save"] = measure(first_save, repeat)
+                store.save(task_list)
+                middle = task_list[len(task_list) // 2]
+
+                def edit():
+                    task_list.update(middle.id, completed=not middle.completed)
+                results[name + "_save_one_edit"] = measure(lambda: store.save(task_list), repeat, setup=edit)
+            finally:
+                store.close()
+
+            def load():
+                fresh = store_class(path)
+                try:
+                    fresh.load()
+                finally:
+                    fresh.close()
+            results[name + "_load"] = measure(load, repeat)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return results
+
+
+def report_speedups(size, results):
+    speedups = []
+    for operation in ("load", "save", "save_one_edit"):
+        single, sharded = results["json_" + operation]["min"], results["sharded_" + operation]["min"]
+        speedups.append("%s %.1fx" % (operation.replace("_", " "), single / sharded if sharded else float("inf")))
+    print("storage: %d tasks, sharded vs one file (%d cores): %s"
+          % (size, os.cpu_count() or 1, ", ".join(speedups)), file=sys.stderr)
+
+
+def run(sizes, frontends, repeat, text, priorities, seed, storage=False):
+    """Run the suite; returns the JSON-ready results."""
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "backend": os.environ.get("TASKS_BACKEND", "json"),
+            "cpus": os.cpu_count(),
+            "repeat": repeat,
+            "text": text,
+            "priorities": priorities,
+            "seed": seed,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": {},
+        "skipped": {},
+    }
+    display = None
+    if "tk" in frontends:
+        display, reason = start_display()
+        if reason is not None:
+            report["skipped"]["tk"] = reason
+            frontends = [f for f in frontends if f != "tk"]
+    try:
+        for size in sizes:
+            tasks = generate_tasks(size, text, priorities, seed=seed)
+            for frontend in frontends:
+                print("%s: %d tasks..." % (frontend, size), file=sys.stderr, flush=True)
+                report["results"].setdefault(frontend, {})[str(size)] = run_frontend(frontend, tasks, repeat)
+            if storage:
+                print("storage: %d tasks..." % size, file=sys.stderr, flush=True)
+                results = report["results"].setdefault("storage", {})[str(size)] = bench_storage(tasks, repeat)
+                report_speedups(size, results)
+    finally:
+        if display is not None:
+            display.terminate()
+    return report
+
+
+def compare(baseline, current, tolerance=TOLERANCE, min_delta=MIN_DELTA_MS):
+    """Timings in ``current`` that are slower than in ``baseline``.
+
+    Fastest runs are compared, as they are the least noisy. Returns a list of
+    (frontend, size, operation, baseline ms, current ms).
+    """
+    regressions = []
+    for frontend, sizes in current["results"].items():
+        for size, operations in sizes.items():
+            old_operations = baseline["results"].get(frontend, {}).get(size, {})
+            for operation, timing in operations.items():
+                if operation not in old_operations:
+                    continue
+                old, new = old_operations[operation]["min"], timing["min"]
+                if new > old * (1 + tolerance) and new - old > min_delta:
+                    regressions.append((frontend, size, operation, old, new))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the task manager frontends.")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                        help="comma-separated task counts (default: %(default)s)")
+    parser.add_argument("--frontend", choices=FRONTENDS + ("both", "none"), default="both")
+    parser.add_argument("--storage", action="store_true", help="also time one tasks.json against sharded storage")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per timing (default: %(default)s)")
+    parser.add_argument("--text", choices=sorted(TEXT_LENGTHS), default="medium", help="task text length")
+    parser.add_argument("--priorities", choices=sorted(PRIORITY_MIXES), default="even", help="priority mix")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--backend", choices=BACKENDS, help="storage backend (default: $TASKS_BACKEND or json)")
+    parser.add_argument("--output", help="write the JSON results here instead of to stdout")
+    parser.add_argument("--compare", metavar="BASELINE", help="flag regressions against a stored results file")
+    parser.add_argument("--results", metavar="FILE", help="compare these stored results instead of running")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE,
+                        help="fractional slowdown allowed by --compare (default: %(default)s)")
+    parser.add_argument("--cold-start-child", choices=FRONTENDS, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    if args.backend:
+        os.environ["TASKS_BACKEND"] = args.backend
+    if args.cold_start_child:
+        return cold_start_child(args.cold_start_child)
+
+    if args.results:
+        with open(args.results, "r", encoding="utf-8") as f:
+            report = json.load(f)
+    else:
+        sizes = [int(size) for size in args.sizes.split(",")]
+        frontends = {"both": list(FRONTENDS), "none": []}.get(args.frontend, [args.frontend])
+        report = run(sizes, frontends, args.repeat, args.text, args.priorities, args.seed, args.storage)
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+        else:
+            json.dump(report, sys.stdout, indent=2)
+            print()
+    for frontend, reason in report.get("skipped", {}).items():
+        print("%s skipped: %s" % (frontend, reason), file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, report, args.tolerance)
+        for frontend, size, operation, old, new in regressions:
+            change = (new / old - 1) * 100 if old else float("inf")
+            print("REGRESSION %s %s tasks %s: %.1f ms -> %.1f ms (%+.0f%%)"
+                  % (frontend, size, operation, old, new, change), file=sys.stderr)
+        if regressions:
+            return 1
+        print("No regressions against %s" % args.compare, file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
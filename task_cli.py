@@ -0,0 +1,343 @@
+"""
+Headless command line for the task list: bulk import, export and batch edits.
+
+It works on the same store as the Tkinter and PyQt5 apps (``tasks.json``,
+whatever $TASKS_BACKEND selects, or the task server $TASKS_SERVER names) and
+needs neither a display nor Qt. It is safe to run while the apps are open:
+writes take the store's lock, and the apps merge them in like changes from
+another window.
+
+    python task_cli.py import tracker.csv
+    python task_cli.py export --format jsonl - > tasks.jsonl
+    python task_cli.py complete --priority Low --match release
+    python task_cli.py delete --completed
+    python task_cli.py archive --days 30
+    python task_cli.py agenda --days 7
+
+Import and export stream the data a batch at a time, so memory use does not
+grow with the number of tasks. An import into tasks.json is one new
+snapshot, and a batch edit is a single write: one journal append (one
+transaction with SQLite). Every command reports its throughput
+on stderr.
+"""
+
+import argparse
+import csv
+import itertools
+import json
+import os
+import sys
+import time
+
+from task_model import (Task, DUE, NO_PRIORITY_LABEL, completion_records, due_label, new_task_id, normalize_priority,
+                        occurrences, priority_label, repeat_day, task_repeat, task_tags)
+from task_storage import BACKENDS, LOAD_BATCH, JournalStore, archive_age, archive_records, open_store
+
+TASKS_FILE = 'tasks.json'
+FORMATS = ("csv", "jsonl")
+CSV_FIELDS = ("task", "priority", "completed", "id")
+TRUE_WORDS = {"1", "true", "yes", "y", "x", "done", "complete", "completed"}
+
+
+def guess_format(path, fmt=None):
+    """``fmt`` if given, else from the file suffix (JSON Lines for stdin)."""
+    if fmt:
+        return fmt
+    suffix = os.path.splitext(path)[1].lower()
+    if suffix == '.csv':
+        return 'csv'
+    if suffix in ('.jsonl', '.ndjson', '') or path == '-':
+        return 'jsonl'
+    raise ValueError("Cannot tell the format of %s; pass --format" % path)
+
+
+def read_rows(f, fmt):
+    """Yield one task dict per CSV row or JSON line of text file ``f``."""
+    if fmt == 'csv':
+        reader = csv.DictReader(f)
+        if reader.fieldnames is None or "task" not in reader.fieldnames:
+            raise ValueError("CSV input needs a 'task' column")
+        for row in reader:
+            # Empty cells (and short rows) are left out rather than stored as ""
+            row = {key: value for key, value in row.items() if key is not None and value not in (None, "")}
+            if "completed" in row:
+                row["completed"] = row["completed"].strip().lower() in TRUE_WORDS
+            yield row
+        return
+    for number, line in enumerate(f, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as exc:
+            raise ValueError("line %d: %s" % (number, exc))
+        if not isinstance(row, dict):
+            raise ValueError("line %d: expected a JSON object" % number)
+        yield row
+
+
+def write_rows(f, tasks, fmt):
+    """Write ``tasks`` to text file ``f``; returns how many were written.
+
+    CSV holds the standard fields only; JSON Lines keeps every key.
+    """
+    count = 0
+    if fmt == 'csv':
+        writer = csv.writer(f)
+        writer.writerow(CSV_FIELDS)
+        for task in tasks:
+            writer.writerow((task.text, priority_label(task.priority), "true" if task.completed else "false",
+                             task.id or ""))
+            count += 1
+        return count
+    for task in tasks:
+        f.write(json.dumps(dict(task), ensure_ascii=False, separators=(',', ':')) + '\n')
+        count += 1
+    return count
+
+
+def task_filter(priorities=None, match=None, completed=None, tags=None):
+    """A predicate for tasks with one of ``priorities`` and every tag in
+    ``tags`` whose text contains every string in ``match`` (ignoring case)
+    and, unless None, whose completed flag is ``completed``."""
+    priorities = {normalize_priority(p) for p in priorities} if priorities else None
+    words = [word.casefold() for word in match or ()]
+    tags = set(tags or ())
+
+    def matches(task):
+        if priorities is not None and task.priority not in priorities:
+            return False
+        if completed is not None and bool(task.completed) != completed:
+            return False
+        if tags and not tags.issubset(task_tags(task)):
+            return False
+        if words:
+            text = task.text.casefold()
+            return all(word in text for word in words)
+        return True
+    return matches
+
+
+def iter_matching(store, matches, scanned=None):
+    """Yield the tasks in ``store`` that ``matches`` accepts, counting every
+    task looked at in ``scanned[0]`` if given."""
+    for batch in store.iter_tasks():
+        if scanned is not None:
+            scanned[0] += len(batch)
+        for task in batch:
+            if matches(task):
+                yield task
+
+
+def import_tasks(store, rows, batch_size=LOAD_BATCH):
+    """Add every row to ``store`` as a new task; returns the number added.
+
+    Ids in the input are kept unless a task already has them, so an export
+    imported elsewhere keeps its ids; only the ids of existing tasks are held
+    in memory. A JSON or binary store gets one new snapshot, the existing
+    tasks followed by the new ones, written as the rows stream past; if a row
+    is bad nothing is imported. SQLite gets one insert per batch of rows.
+    """
+    taken = None
+    count = 0
+
+    def new_tasks():
+        nonlocal taken, count
+        for row in rows:
+            task = Task.from_dict(row)
+            if task.id is not None:
+                if taken is None:
+                    taken = {task.id for tasks in store.iter_tasks() for task in tasks}
+                if task.id in taken:
+                    task.id = None
+            if task.id is None:
+                task.id = new_task_id()
+            if taken is not None:
+                taken.add(task.id)
+            count += 1
+            yield task
+
+    if isinstance(store, JournalStore):
+        with store.locked():
+            existing = (task for tasks in store.iter_tasks() for task in tasks)
+            store.save(itertools.chain(existing, new_tasks()))
+        return count
+    batch = []
+    for task in new_tasks():
+        batch.append({"op": "add", "task": task})
+        if len(batch) == batch_size:
+            store.append_many(batch)
+            batch = []
+    if batch:
+        store.append_many(batch)
+    return count
+
+
+def edit_tasks(store, action, matches, dry_run=False):
+    """Complete, reopen or delete every task ``matches`` accepts, in one write.
+
+    The store stays locked from the scan to the write, so no other window
+    changes a task in between. Returns (tasks scanned, matched, changed).
+    """
+    scanned = [0]
+    now = time.time()
+    with store.locked():
+        matched = changed = 0
+        records = []
+        for task in iter_matching(store, matches, scanned):
+            matched += 1
+            # Completing a recurring task is two records: the occurrence, and the task moving on
+            edits = ([{"op": "delete", "id": task.id}] if action == 'delete'
+                     else completion_records([task], action == 'complete', now))
+            if edits:
+                changed += 1
+                records.extend(edits)
+        if records and not dry_run:
+            store.append_many(records)
+    return scanned[0], matched, changed
+
+
+def archive_tasks(store, older_than, now=None):
+    """Move the tasks completed more than ``older_than`` seconds ago into the
+    store's archive, taking them out of the list in one write. Returns
+    (tasks archived, completed tasks given a completion time)."""
+    with store.locked():
+        tasks = (task for batch in store.iter_tasks() for task in batch)
+        records = archive_records(store.archive, tasks, older_than, now)
+        if records:
+            store.append_many(records)
+    archived = sum(record["op"] == "delete" for record in records)
+    return archived, len(records) - archived
+
+
+def agenda(store, matches, start, end):
+    """(due time, task) for every occurrence of an open task ``matches``
+    accepts that falls in [start, end), earliest first. A recurring task
+    stands for all its occurrences; only those in the window are generated."""
+    entries = []
+    for task in iter_matching(store, matches):
+        due = task.get(DUE)
+        if task.completed or due is None:
+            continue
+        repeat = task_repeat(task)
+        if repeat is None:
+            if start <= due < end:
+                entries.append((due, task))
+        else:
+            entries.extend((when, task) for when in occurrences(repeat, due, start, end, repeat_day(task)))
+    entries.sort(key=lambda entry: entry[0])
+    return entries
+
+
+def report(what, count, seconds):
+    rate = count / seconds if seconds > 0 else float("inf")
+    print("%s %d tasks in %.2f s (%.0f tasks/s)" % (what, count, seconds, rate), file=sys.stderr)
+
+
+def add_filter_arguments(parser):
+    parser.add_argument("--priority", action="append", metavar="LEVEL",
+                        help="only tasks with this priority (%s for none); repeat for several"
+                             % NO_PRIORITY_LABEL)
+    parser.add_argument("--match", action="append", metavar="TEXT",
+                        help="only tasks whose text contains TEXT, ignoring case; repeat to require several")
+    parser.add_argument("--tag", action="append", metavar="TAG",
+                        help="only tasks tagged TAG; repeat to require several")
+    status = parser.add_mutually_exclusive_group()
+    status.add_argument("--completed", dest="status", action="store_const", const=True,
+                        help="only completed tasks")
+    status.add_argument("--incomplete", dest="status", action="store_const", const=False,
+                        help="only incomplete tasks")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk import, export and batch edits without the GUI.")
+    parser.add_argument("--file", default=TASKS_FILE, help="tasks file (default: %(default)s)")
+    parser.add_argument("--backend", choices=BACKENDS, help="storage backend (default: $TASKS_BACKEND or json)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    importer = commands.add_parser("import", help="add tasks from a CSV or JSON Lines file ('-' for stdin)")
+    importer.add_argument("source")
+    importer.add_argument("--format", choices=FORMATS)
+    exporter = commands.add_parser("export", help="write tasks as CSV or JSON Lines ('-' for stdout)")
+    exporter.add_argument("target")
+    exporter.add_argument("--format", choices=FORMATS)
+    exporter.add_argument("--archived", action="store_true", help="export archived tasks instead")
+    add_filter_arguments(exporter)
+    for action in ("complete", "reopen", "delete"):
+        editor = commands.add_parser(action, help="%s every matching task in one write" % action)
+        add_filter_arguments(editor)
+        editor.add_argument("--dry-run", action="store_true", help="count the matches without writing")
+    archiver = commands.add_parser("archive", help="move long-completed tasks into the archive")
+    archiver.add_argument("--days", type=float,
+                          help="completed more than this many days ago (default: $TASKS_ARCHIVE_DAYS or 14)")
+    planner = commands.add_parser("agenda", help="list what is due in the next few days, recurring tasks included")
+    planner.add_argument("--days", type=float, default=7, help="how many days ahead (default: %(default)s)")
+    add_filter_arguments(planner)
+    args = parser.parse_args(argv)
+
+    store = open_store(args.file, args.backend)
+    start = time.perf_counter()
+    try:
+        if (args.command == "archive" or getattr(args, "archived", False)) and store.archive is None:
+            parser.error("the task server keeps its own archive")
+        if args.command == "archive":
+            older_than = archive_age() if args.days is None else args.days * 24 * 60 * 60
+            if older_than is None:
+                parser.error("archiving is off (TASKS_ARCHIVE_DAYS=off); pass --days")
+            archived, stamped = archive_tasks(store, older_than)
+            if stamped:
+                print("%d completed tasks had no completion time; their wait starts now" % stamped, file=sys.stderr)
+            report("Archived", archived, time.perf_counter() - start)
+            return 0
+
+        if args.command == "import":
+            fmt = guess_format(args.source, args.format)
+            if args.source == '-':
+                count = import_tasks(store, read_rows(sys.stdin, fmt))
+            else:
+                with open(args.source, "r", encoding="utf-8", newline="") as f:
+                    count = import_tasks(store, read_rows(f, fmt))
+            report("Imported", count, time.perf_counter() - start)
+            return 0
+
+        matches = task_filter(args.priority, args.match, args.status, args.tag)
+        if args.command == "agenda":
+            now = time.time()
+            entries = agenda(store, matches, now, now + args.days * 24 * 60 * 60)
+            for due, task in entries:
+                print("%s  %s" % (due_label(due), task.text))
+            print("%d due in the next %g days" % (len(entries), args.days), file=sys.stderr)
+            return 0
+        if args.command == "export":
+            fmt = guess_format(args.target, args.format)
+            if args.archived:
+                tasks = (task for task in store.archive.load() if matches(task))
+            else:
+                tasks = iter_matching(store, matches)
+            if args.target == '-':
+                count = write_rows(sys.stdout, tasks, fmt)
+            else:
+                with open(args.target, "w", encoding="utf-8", newline="") as f:
+                    count = write_rows(f, tasks, fmt)
+            report("Exported", count, time.perf_counter() - start)
+            return 0
+
+        scanned, matched, changed = edit_tasks(store, args.command, matches, args.dry_run)
+        verb = {"complete": "Completed", "reopen": "Reopened", "delete": "Deleted"}[args.command]
+        if args.dry_run:
+            verb = "Would have " + verb.lower()
+        print("%s %d of %d matching tasks" % (verb, changed, matched), file=sys.stderr)
+        report("Scanned", scanned, time.perf_counter() - start)
+        return 0
+    except ValueError as exc:
+        parser.error(str(exc))
+    except BrokenPipeError:
+        # The reader went away (``export - | head``); send what is still
+        # buffered nowhere so the interpreter's exit does not raise again
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 1
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
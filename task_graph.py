@@ -0,0 +1,253 @@
+"""
+Subtasks and "blocked by" links for the Tkinter and PyQt5 task managers.
+
+A task may name a parent task (``"parent"``, a task id) and the tasks it is
+blocked by (``"blocked_by"``, a list of task ids). TaskGraph keeps both kinds
+of link as adjacency sets, with, per task, how many of its blockers are still
+open and how many of the tasks below it are done. It listens to a TaskList,
+so completing or reopening a task only visits the tasks it blocks and the
+tasks above it, never the whole graph.
+
+Links may name tasks that are not (or not yet) in the list: a missing
+blocker blocks nothing and a missing parent shows no progress. Links that
+would close a cycle are refused by check_parent() and check_blockers(); ones
+that arrive anyway (from another program writing the file) are ignored.
+"""
+
+from task_model import Task
+
+PARENT = "parent"  # the id of the task this one is a subtask of; optional
+BLOCKED_BY = "blocked_by"  # ids of the tasks that must be completed first; optional
+NO_LINK = "(none)"  # the link choice that clears the link
+
+
+class CycleError(ValueError):
+    """A parent or blocked-by link that would make a task depend on itself."""
+
+
+def task_parent(task):
+    extra = task.extra if isinstance(task, Task) else task
+    parent = extra.get(PARENT) if extra else None
+    return parent if isinstance(parent, str) and parent else None
+
+
+def task_blockers(task):
+    extra = task.extra if isinstance(task, Task) else task
+    blockers = extra.get(BLOCKED_BY) if extra else None
+    if not isinstance(blockers, list):
+        return []
+    return [blocker for blocker in blockers if isinstance(blocker, str)]
+
+
+def progress_label(done, total):
+    """How a task's subtasks are coming along, for display; '' without subtasks."""
+    if not total:
+        return ""
+    return "%d%% (%d/%d)" % (done * 100 // total, done, total)
+
+
+def link_choices(tasks, exclude=()):
+    """(label, task id) pairs for the open tasks a link can point at, the
+    NO_LINK choice first. Labels carry the start of the id, since task names
+    need not be unique."""
+    choices = [(NO_LINK, None)]
+    for task in tasks:
+        if not task.completed and task.id not in exclude:
+            choices.append(("%s  [%s]" % (task.text, task.id[:6]), task.id))
+    return choices
+
+
+class TaskGraph:
+    """Parent/child and blocked-by links between the tasks of a TaskList.
+
+    ``blocked`` holds the open tasks with at least one open blocker and
+    ``ready`` the open tasks with none. progress() is the roll-up of a task's
+    subtasks (at every depth). Tasks whose blocked state or progress changed
+    collect in a set that take_changed() hands to the view to repaint.
+    """
+
+    def __init__(self, tasks):
+        self.tasks = tasks
+        self.blocked = set()
+        self.ready = set()
+        self._done = {}  # task id -> completed, for the tasks in the list
+        self._parent = {}  # task id -> parent id
+        self._children = {}  # parent id -> ids of its subtasks
+        self._subtree = {}  # task id -> [done, total] over every task below it
+        self._blockers = {}  # task id -> ids of the tasks blocking it
+        self._dependents = {}  # task id -> ids of the tasks it blocks
+        self._open = {}  # task id -> how many of its blockers are in the list and open, if any
+        self._changed = set()
+        self.tasks_extended(tasks)
+        tasks.listeners.append(self)
+
+    def detach(self):
+        self.tasks.listeners.remove(self)
+
+    def parent(self, task_id):
+        return self._parent.get(task_id)
+
+    def children(self, task_id):
+        return self._children.get(task_id, set())
+
+    def blockers(self, task_id):
+        return self._blockers.get(task_id, set())
+
+    def progress(self, task_id):
+        """(done, total) over the subtasks of ``task_id`` at every depth."""
+        done, total = self._subtree.get(task_id, (0, 0))
+        return done, total
+
+    def take_changed(self):
+        """Ids of the tasks whose blocked state or progress changed since the last call."""
+        changed, self._changed = self._changed, set()
+        return changed
+
+    def check_parent(self, task_id, parent):
+        """Raise CycleError if ``parent`` is ``task_id`` or one of its subtasks."""
+        node = parent
+        while node is not None:
+            if node == task_id:
+                raise CycleError("A task cannot be a subtask of itself or of one of its subtasks")
+            node = self._parent.get(node)
+
+    def check_blockers(self, task_id, blockers):
+        """Raise CycleError if any of ``blockers`` is (directly or not) blocked by ``task_id``."""
+        for blocker in blockers:
+            if self._reaches(blocker, task_id):
+                raise CycleError("A task cannot be blocked by itself or by a task it blocks")
+
+    def task_added(self, task):
+        self._add(task.id, bool(task.completed), task_parent(task), task_blockers(task))
+
+    def tasks_extended(self, tasks):
+        # Most tasks have no links and block nothing; those only need filing as ready (or done)
+        done, ready, dependents = self._done, self.ready, self._dependents
+        for task in tasks:
+            extra = task.extra
+            task_id = task.id
+            if (extra and (PARENT in extra or BLOCKED_BY in extra)) or task_id in dependents:
+                self._add(task_id, bool(task.completed), task_parent(task), task_blockers(task))
+                continue
+            completed = done[task_id] = bool(task.completed)
+            if not completed:
+                ready.add(task_id)
+
+    def task_updated(self, task, old):
+        if PARENT in old or BLOCKED_BY in old:
+            self._remove(task.id)
+            self._add(task.id, bool(task.completed), task_parent(task), task_blockers(task))
+        elif "completed" in old and bool(old["completed"]) != bool(task.completed):
+            self._set_done(task.id, bool(task.completed))
+
+    def task_removed(self, task):
+        self._remove(task.id)
+
+    def _add(self, task_id, done, parent, blockers):
+        self._done[task_id] = done
+        if parent is not None:
+            try:
+                self.check_parent(task_id, parent)
+            except CycleError:
+                parent = None
+        if parent is not None:
+            self._parent[task_id] = parent
+            self._children.setdefault(parent, set()).add(task_id)
+            below_done, below = self._subtree.get(task_id, (0, 0))
+            self._roll_up(parent, below_done + done, below + 1)
+        accepted = set()
+        for blocker in blockers:
+            if blocker not in accepted and not self._reaches(blocker, task_id):
+                accepted.add(blocker)
+                self._dependents.setdefault(blocker, set()).add(task_id)
+        if accepted:
+            self._blockers[task_id] = accepted
+        blocking = sum(1 for blocker in accepted if self._done.get(blocker) is False)
+        if blocking:
+            self._open[task_id] = blocking
+        if not done:
+            self._unblock(task_id, 1)
+        self._file(task_id)
+
+    def _remove(self, task_id):
+        done = self._done[task_id]
+        parent = self._parent.pop(task_id, None)
+        if parent is not None:
+            siblings = self._children[parent]
+            siblings.discard(task_id)
+            if not siblings:
+                del self._children[parent]
+            below_done, below = self._subtree.get(task_id, (0, 0))
+            self._roll_up(parent, -(below_done + done), -(below + 1))
+        for blocker in self._blockers.pop(task_id, ()):
+            dependents = self._dependents[blocker]
+            dependents.discard(task_id)
+            if not dependents:
+                del self._dependents[blocker]
+        self._open.pop(task_id, None)
+        if not done:
+            self._unblock(task_id, -1)
+        del self._done[task_id]
+        self.blocked.discard(task_id)
+        self.ready.discard(task_id)
+
+    def _set_done(self, task_id, done):
+        # The common case (a toggle): only the tasks above and the tasks it blocks change
+        self._done[task_id] = done
+        parent = self._parent.get(task_id)
+        if parent is not None:
+            self._roll_up(parent, 1 if done else -1, 0)
+        self._unblock(task_id, -1 if done else 1)
+        self._file(task_id)
+
+    def _unblock(self, blocker, delta):
+        # ``blocker`` is open (delta 1) or no longer open (-1) for the tasks it blocks
+        for task_id in self._dependents.get(blocker, ()):
+            if task_id in self._done:
+                blocking = self._open.get(task_id, 0) + delta
+                if blocking:
+                    self._open[task_id] = blocking
+                else:
+                    del self._open[task_id]
+                self._file(task_id)
+
+    def _file(self, task_id):
+        was_blocked = task_id in self.blocked
+        if self._done[task_id]:
+            self.blocked.discard(task_id)
+            self.ready.discard(task_id)
+        elif task_id in self._open:
+            self.blocked.add(task_id)
+            self.ready.discard(task_id)
+        else:
+            self.blocked.discard(task_id)
+            self.ready.add(task_id)
+        if was_blocked != (task_id in self.blocked):
+            self._changed.add(task_id)
+
+    def _roll_up(self, task_id, done, total):
+        node = task_id
+        while node is not None:
+            counts = self._subtree.get(node)
+            if counts is None:
+                counts = self._subtree[node] = [0, 0]
+            counts[0] += done
+            counts[1] += total
+            if not counts[1]:
+                del self._subtree[node]
+            self._changed.add(node)
+            node = self._parent.get(node)
+
+    def _reaches(self, start, target):
+        """Whether ``target`` is ``start`` or one of the tasks blocking it, at any depth."""
+        seen = {start}
+        stack = [start]
+        while stack:
+            node = stack.pop()
+            if node == target:
+                return True
+            for blocker in self._blockers.get(node, ()):
+                if blocker not in seen:
+                    seen.add(blocker)
+                    stack.append(blocker)
+        return False
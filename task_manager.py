@@ -1,19 +1,144 @@
+import time
+STARTED = time.perf_counter()  # for --startup-profile
+import importlib
 import tkinter as tk
-from tkinter import messagebox, simpledialog, ttk
-import json
-import os
+from tkinter import ttk
+import queue
+import sys
+from task_model import (TaskList, SortedOrder, TaskCounts, DueSchedule, PRIORITY_LEVELS, NO_PRIORITY_LABEL, DUE, TAGS,
+                        REPEAT, completion, completion_records, normalize_priority, priority_label, parse_due,
+                        due_label, parse_repeat, task_repeat, parse_tags, task_tags, tags_label)
+from task_storage import open_store, archive_age, archive_records, PersistenceWorker
+from task_search import SearchIndex, FilterIndex, in_order, tokenize
+from task_graph import (TaskGraph, CycleError, PARENT, BLOCKED_BY, task_parent, task_blockers, progress_label,
+                        link_choices)
+import task_metrics
+IMPORTED = time.perf_counter()
 
 TASKS_FILE = 'tasks.json'
-PRIORITIES = ["None", "Low", "Medium", "High"]
+PRIORITIES = [NO_PRIORITY_LABEL] + list(PRIORITY_LEVELS)
+PERSIST_POLL_MS = 250  # how often the Tk thread picks up results from the writer thread
+RELOAD_POLL_MS = 1000  # how often to look for changes other windows have saved
+ARCHIVE_POLL_MS = 60 * 60 * 1000  # how often to move long-completed tasks to the archive
+WINDOW_THRESHOLD = 2000  # above this many tasks the tree only holds a window of rows
+WINDOW_ROWS = 300  # rows kept in the tree in windowed mode
+WINDOW_BUFFER = 100  # rows kept above the first visible one in windowed mode
+LOAD_SLICE = 0.03  # seconds of loading between chances for the window to repaint
+COLUMNS = ("Task", "Priority", "Status", "Due", "Tags", "Progress", "Repeat")
+ANY = "All"  # the filter choice that does not filter
+LINKS = "links"  # the filter on the TaskGraph: "ready" or "blocked"
+STATUS_FILTERS = {ANY: {}, "Incomplete": {"completed": False}, "Complete": {"completed": True},
+                  "Ready": {LINKS: "ready"}, "Blocked": {LINKS: "blocked"}}
+OVERDUE_COLOR = "#c62828"  # text colour of overdue tasks
+MAX_TIMER_MS = 2 ** 31 - 1  # longest after() delay; a due time further off re-arms when this fires
+REMINDER_MS = 10000  # how long a reminder stays in the status bar
+# Event state bits of the modifiers that extend a tree selection (Shift, and Control or Command)
+EXTEND_SELECTION = 0x0001 | (0x0008 if sys.platform == 'darwin' else 0x0004)
+
+class LazyModule:
+    """A module that is only imported when one of its names is first used."""
+
+    def __init__(self, name):
+        self._name = name
+
+    def __getattr__(self, attr):
+        return getattr(importlib.import_module(self._name), attr)
+
+# Dialogs are not needed to start, so their modules load on first use
+messagebox = LazyModule("tkinter.messagebox")
+simpledialog = LazyModule("tkinter.simpledialog")
+
+class ArchiveWindow:
+    """The archived tasks in a window of their own, read from the archive
+    only when it opens.
+
+    Restoring a task reopens it in the task list; deleting it here removes
+    it for good.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.tasks = app.store.archive.load()
+        self.top = tk.Toplevel(app.root)
+        self.top.title("Archive")
+        self.count_label = ttk.Label(self.top)
+        self.count_label.pack(padx=10, pady=(10, 0), anchor=tk.W)
+        list_frame = ttk.Frame(self.top)
+        list_frame.pack(padx=10, pady=10, fill=tk.BOTH, expand=True)
+        self.tree = ttk.Treeview(list_frame, columns=COLUMNS, show="headings", selectmode="extended")
+        for column in COLUMNS:
+            self.tree.heading(column, text=column)
+        scrollbar = ttk.Scrollbar(list_frame, orient=tk.VERTICAL, command=self.tree.yview)
+        self.tree.configure(yscrollcommand=scrollbar.set)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        for task in self.tasks:
+            self.tree.insert("", "end", iid=task["id"], values=app.row_values(task))
+        btn_frame = tk.Frame(self.top)
+        btn_frame.pack(pady=5)
+        tk.Button(btn_frame, text="Restore", command=self.restore).pack(side=tk.LEFT, padx=5)
+        tk.Button(btn_frame, text="Delete", command=self.delete).pack(side=tk.LEFT, padx=5)
+        tk.Button(btn_frame, text="Close", command=self.top.destroy).pack(side=tk.LEFT, padx=5)
+        self.update_count()
+
+    def update_count(self):
+        self.count_label.config(text="%d archived tasks" % len(self.tasks))
+
+    def restore(self):
+        task_ids = list(self.tree.selection())
+        if not task_ids:
+            messagebox.showinfo("Restore Task", "Please select a task.", parent=self.top)
+            return
+        self.app.restore_tasks([self.tasks.get(task_id) for task_id in task_ids])
+        self.forget(task_ids)
+
+    def delete(self):
+        task_ids = list(self.tree.selection())
+        if not task_ids:
+            messagebox.showinfo("Delete Task", "Please select a task to delete.", parent=self.top)
+            return
+        question = ("Are you sure you want to delete this task for good?" if len(task_ids) == 1
+                    else "Are you sure you want to delete these %d tasks for good?" % len(task_ids))
+        if messagebox.askyesno("Delete Task", question, parent=self.top):
+            self.app.store.archive.remove(task_ids)
+            self.forget(task_ids)
+
+    def forget(self, task_ids):
+        self.tree.delete(*task_ids)
+        for task_id in task_ids:
+            self.tasks.remove(task_id)
+        self.update_count()
 
 class TaskManagerApp:
-    def __init__(self, root):
+    def __init__(self, root, defer_load=False):
         self.root = root
         self.root.title("Task Manager")
-        self.tasks = []
-        self.load_tasks()
+        self.store = open_store(TASKS_FILE)
+        self.tasks = TaskList()
+        self.counts = TaskCounts(self.tasks)  # for the status bar
+        self.reminder = None  # the after() id of the one timer armed for the next due time
+        self.due = DueSchedule(self.tasks, self.arm_reminder)
+        self.graph = TaskGraph(self.tasks)  # subtasks and blocked-by links
+        self.order = None  # a SortedOrder while sorted, else tasks show in stored order
+        self.search = None  # SearchIndex, built on the first search
+        self.query = ""
+        self.filter_index = None  # FilterIndex, built on the first filter
+        self.filters = {}  # FilterIndex.filter() arguments, and LINKS
+        self.loader = None
+        self.pending_changes = []
+        self.archive_after = archive_age()
+        self.persist_errors = queue.Queue()
+        self.persistence = PersistenceWorker(self.store)
+        self.persistence.on_error = self.persist_errors.put
+        self.persistence.start()
         self.create_widgets()
+        self.restore_sort()
         self.refresh_tasks()
+        self.start_loading(defer_load)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.root.after(PERSIST_POLL_MS, self.poll_persistence)
+        self.root.after(RELOAD_POLL_MS, self.poll_changes)
+        self.root.after(ARCHIVE_POLL_MS, self.poll_archive)
 
     def create_widgets(self):
         # Set minimum window size
@@ -27,21 +152,67 @@ class TaskManagerApp:
         self.task_entry.grid(row=0, column=1, padx=5)
         self.task_entry.focus_set()  # Focus entry on startup
         self.task_entry.bind('<Return>', lambda event: self.add_task())  # Enter to add
+        self.task_entry.bind('<<Paste>>', self.on_paste)
 
         ttk.Label(add_frame, text="Priority:").grid(row=0, column=2)
         self.priority_var = tk.StringVar(value=PRIORITIES[0])
         self.priority_menu = ttk.Combobox(add_frame, textvariable=self.priority_var, values=PRIORITIES, state="readonly", width=8)
         self.priority_menu.grid(row=0, column=3, padx=5)
 
+        ttk.Label(add_frame, text="Tags:").grid(row=0, column=4)
+        self.tags_entry = ttk.Entry(add_frame, width=15)
+        self.tags_entry.grid(row=0, column=5, padx=5)
+
         add_btn = ttk.Button(add_frame, text="Add Task", command=self.add_task)
-        add_btn.grid(row=0, column=4, padx=5)
+        add_btn.grid(row=0, column=6, padx=5)
+
+        # Search box; each keystroke re-filters through the index
+        search_frame = ttk.Frame(self.root)
+        search_frame.pack(padx=10, fill=tk.X)
+        ttk.Label(search_frame, text="Search:").pack(side=tk.LEFT)
+        self.search_var = tk.StringVar()
+        self.search_var.trace_add("write", lambda *args: self.search_tasks(self.search_var.get()))
+        ttk.Entry(search_frame, textvariable=self.search_var).pack(side=tk.LEFT, padx=5, fill=tk.X, expand=True)
+
+        # Filters; each is a set of task ids in the FilterIndex
+        filter_frame = ttk.Frame(self.root)
+        filter_frame.pack(padx=10, pady=(5, 0), fill=tk.X)
+        ttk.Label(filter_frame, text="Tags:").pack(side=tk.LEFT)
+        self.tag_filter_var = tk.StringVar()
+        # The tags are only gathered when the list is about to open
+        self.tag_filter = ttk.Combobox(filter_frame, textvariable=self.tag_filter_var, postcommand=self.list_tags)
+        self.tag_filter.pack(side=tk.LEFT, padx=5, fill=tk.X, expand=True)
+        ttk.Label(filter_frame, text="Priority:").pack(side=tk.LEFT)
+        self.priority_filter_var = tk.StringVar(value=ANY)
+        ttk.Combobox(filter_frame, textvariable=self.priority_filter_var, values=[ANY] + PRIORITIES,
+                     state="readonly", width=8).pack(side=tk.LEFT, padx=5)
+        ttk.Label(filter_frame, text="Status:").pack(side=tk.LEFT)
+        self.status_filter_var = tk.StringVar(value=ANY)
+        ttk.Combobox(filter_frame, textvariable=self.status_filter_var, values=list(STATUS_FILTERS),
+                     state="readonly", width=10).pack(side=tk.LEFT, padx=5)
+        for var in (self.tag_filter_var, self.priority_filter_var, self.status_filter_var):
+            var.trace_add("write", lambda *args: self.filter_tasks())
 
         # Task list
-        self.tree = ttk.Treeview(self.root, columns=("Task", "Priority", "Status"), show="headings", selectmode="browse")
-        self.tree.heading("Task", text="Task")
-        self.tree.heading("Priority", text="Priority")
-        self.tree.heading("Status", text="Status")
-        self.tree.pack(padx=10, pady=10, fill=tk.BOTH, expand=True)
+        list_frame = ttk.Frame(self.root)
+        list_frame.pack(padx=10, pady=10, fill=tk.BOTH, expand=True)
+        self.tree = ttk.Treeview(list_frame, columns=COLUMNS, show="headings", selectmode="extended",
+                                 yscrollcommand=self.on_tree_scrolled)
+        for column in COLUMNS:
+            self.tree.heading(column, text=column)
+        self.tree.tag_configure("overdue", foreground=OVERDUE_COLOR)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.tree.bind('<<TreeviewSelect>>', self.on_select)
+        self.tree.bind('<ButtonPress-1>', self.on_click)
+        self.scrollbar = ttk.Scrollbar(list_frame, orient=tk.VERTICAL, command=self.on_scrollbar)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        # What the tree currently shows: iid -> (values, tags), in tree order
+        self.rendered = {}
+        self.row_keys = []
+        self.selected_keys = set()
+        self.click_replaces = False  # the last click started a new selection
+        self.window_start = 0
+        self.rewindow_pending = False
 
         # Buttons
         btn_frame = tk.Frame(self.root)
@@ -49,6 +220,30 @@ class TaskManagerApp:
         tk.Button(btn_frame, text="Edit", command=self.edit_task).pack(side=tk.LEFT, padx=5)
         tk.Button(btn_frame, text="Delete", command=self.delete_task).pack(side=tk.LEFT, padx=5)
         tk.Button(btn_frame, text="Mark Complete/Incomplete", command=self.toggle_complete).pack(side=tk.LEFT, padx=5)
+        tk.Button(btn_frame, text="Set Priority", command=self.set_priority).pack(side=tk.LEFT, padx=5)
+        tk.Button(btn_frame, text="Set Due Date", command=self.set_due).pack(side=tk.LEFT, padx=5)
+        tk.Button(btn_frame, text="Set Repeat", command=self.set_repeat).pack(side=tk.LEFT, padx=5)
+        tk.Button(btn_frame, text="Set Tags", command=self.set_tags).pack(side=tk.LEFT, padx=5)
+        tk.Button(btn_frame, text="Set Parent", command=self.set_parent).pack(side=tk.LEFT, padx=5)
+        tk.Button(btn_frame, text="Blocked By", command=self.set_blocked_by).pack(side=tk.LEFT, padx=5)
+        tk.Button(btn_frame, text="Sort by Priority", command=self.sort_by_priority).pack(side=tk.LEFT, padx=5)
+        self.descending_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(btn_frame, text="Descending", variable=self.descending_var,
+                       command=lambda: self.set_sort_descending(self.descending_var.get())).pack(side=tk.LEFT, padx=5)
+        tk.Button(btn_frame, text="Archive", command=self.show_archive,
+                  state=tk.NORMAL if self.store.archive is not None else tk.DISABLED).pack(side=tk.LEFT, padx=5)
+
+        # Shown while tasks are still streaming in from disk
+        self.loading_frame = ttk.Frame(self.root)
+        self.loading_frame.pack(padx=10, pady=5, fill=tk.X)
+        self.loading_label = ttk.Label(self.loading_frame, text="Loading tasks...")
+        self.loading_label.pack(side=tk.LEFT)
+        self.loading_bar = ttk.Progressbar(self.loading_frame, maximum=100)
+        self.loading_bar.pack(side=tk.LEFT, padx=5, fill=tk.X, expand=True)
+
+        # Status bar: live counts by priority and status
+        self.status_label = ttk.Label(self.root, relief=tk.SUNKEN, anchor=tk.W, padding=(5, 2))
+        self.status_label.pack(side=tk.BOTTOM, fill=tk.X)
 
     def add_task(self):
         task_text = self.task_entry.get().strip()
@@ -57,24 +252,60 @@ class TaskManagerApp:
             messagebox.showwarning("Input Error", "Task cannot be empty.")
             self.task_entry.focus_set()
             return
-        self.tasks.append({
+        task = {
             "task": task_text,
-            "priority": priority if priority != "None" else "",
+            "priority": priority,
             "completed": False
-        })
-        self.save_tasks()
-        self.refresh_tasks()
+        }
+        tags = parse_tags(self.tags_entry.get())
+        if tags:
+            task[TAGS] = tags
+        self.apply_change({"op": "add", "task": task})
         self.task_entry.delete(0, tk.END)
         self.priority_var.set(PRIORITIES[0])
+        self.tags_entry.delete(0, tk.END)
         self.task_entry.focus_set()  # Refocus after adding
 
+    def on_paste(self, event):
+        # Several lines on the clipboard become one task each instead of one long task
+        try:
+            text = self.root.clipboard_get()
+        except tk.TclError:
+            return None
+        lines = [line.strip() for line in text.splitlines() if line.strip()]
+        if len(lines) < 2:
+            return None
+        self.add_tasks(lines)
+        return "break"
+
+    def add_tasks(self, texts):
+        """Add one task per pasted line, in one batch."""
+        priority = self.priority_var.get()
+        tags = parse_tags(self.tags_entry.get())
+        extra = {TAGS: tags} if tags else {}
+        self.apply_changes([{"op": "add", "task": dict(task=text, priority=priority, completed=False, **extra)}
+                            for text in texts])
+        self.task_entry.delete(0, tk.END)
+        self.priority_var.set(PRIORITIES[0])
+        self.tags_entry.delete(0, tk.END)
+        self.task_entry.focus_set()
+
+    def selected_ids(self):
+        # In view order. Selected rows may have scrolled out of the window, so
+        # go by id, and walk the whole view only when some of them have
+        shown = self.rendered if all(key in self.rendered for key in self.selected_keys) else self.row_keys
+        return [task_id for task_id in shown if task_id in self.selected_keys]
+
+    def selected_id(self):
+        ids = self.selected_ids()
+        return ids[0] if ids else None
+
     def edit_task(self):
-        selected = self.tree.selection()
-        if not selected:
+        task_id = self.selected_id()
+        if task_id is None:
             messagebox.showinfo("Edit Task", "Please select a task to edit.")
             return
-        idx = int(selected[0])
-        task = self.tasks[idx]
+        task = self.tasks.get(task_id)
         new_task = simpledialog.askstring("Edit Task", "Edit task:", initialvalue=task["task"])
         if new_task is not None and new_task.strip():
             new_priority = simpledialog.askstring("Edit Priority (Low, Medium, High, or leave blank)", "Edit priority:", initialvalue=task["priority"])
@@ -82,52 +313,625 @@ class TaskManagerApp:
                 if new_priority not in PRIORITIES and new_priority != "":
                     messagebox.showwarning("Input Error", "Priority must be Low, Medium, High, or blank.")
                     return
-                self.tasks[idx]["task"] = new_task.strip()
-                self.tasks[idx]["priority"] = new_priority if new_priority != "None" else ""
-                self.save_tasks()
-                self.refresh_tasks()
+                self.apply_change({"op": "update", "id": task_id,
+                                   "task": dict(task, task=new_task.strip(), priority=new_priority)})
 
     def delete_task(self):
-        selected = self.tree.selection()
-        if not selected:
+        task_ids = self.selected_ids()
+        if not task_ids:
             messagebox.showinfo("Delete Task", "Please select a task to delete.")
             return
-        idx = int(selected[0])
-        if messagebox.askyesno("Delete Task", "Are you sure you want to delete this task?"):
-            del self.tasks[idx]
-            self.save_tasks()
-            self.refresh_tasks()
+        question = ("Are you sure you want to delete this task?" if len(task_ids) == 1
+                    else "Are you sure you want to delete these %d tasks?" % len(task_ids))
+        if messagebox.askyesno("Delete Task", question):
+            self.apply_changes([{"op": "delete", "id": task_id} for task_id in task_ids])
 
     def toggle_complete(self):
-        selected = self.tree.selection()
-        if not selected:
+        # With several tasks selected, all are completed unless all already are
+        task_ids = self.selected_ids()
+        if not task_ids:
             messagebox.showinfo("Toggle Complete", "Please select a task.")
             return
-        idx = int(selected[0])
-        self.tasks[idx]["completed"] = not self.tasks[idx]["completed"]
-        self.save_tasks()
+        tasks = [self.tasks.get(task_id) for task_id in task_ids]
+        completed = not all(task["completed"] for task in tasks)
+        self.apply_changes(completion_records(tasks, completed))
+
+    def set_priority(self):
+        task_ids = self.selected_ids()
+        if not task_ids:
+            messagebox.showinfo("Set Priority", "Please select a task.")
+            return
+        tasks = [self.tasks.get(task_id) for task_id in task_ids]
+        new_priority = simpledialog.askstring("Set Priority (Low, Medium, High, or leave blank)",
+                                              "Priority for %d selected task(s):" % len(tasks),
+                                              initialvalue=tasks[0]["priority"])
+        if new_priority is None:
+            return
+        if new_priority not in PRIORITIES and new_priority != "":
+            messagebox.showwarning("Input Error", "Priority must be Low, Medium, High, or blank.")
+            return
+        new_priority = normalize_priority(new_priority)
+        self.apply_changes([{"op": "update", "id": task["id"], "task": dict(task, priority=new_priority)}
+                            for task in tasks if task["priority"] != new_priority])
+
+    def set_due(self):
+        task_ids = self.selected_ids()
+        if not task_ids:
+            messagebox.showinfo("Set Due Date", "Please select a task.")
+            return
+        tasks = [self.tasks.get(task_id) for task_id in task_ids]
+        text = simpledialog.askstring("Set Due Date (YYYY-MM-DD [HH:MM], or leave blank)",
+                                      "Due date for %d selected task(s):" % len(tasks),
+                                      initialvalue=due_label(tasks[0].get(DUE)))
+        if text is None:
+            return
+        try:
+            due = parse_due(text)
+        except ValueError as exc:
+            messagebox.showwarning("Input Error", str(exc))
+            return
+        self.apply_changes([{"op": "update", "id": task["id"], "task": dict(task, **{DUE: due})}
+                            for task in tasks if task.get(DUE) != due])
+
+    def set_repeat(self):
+        task_ids = self.selected_ids()
+        if not task_ids:
+            messagebox.showinfo("Set Repeat", "Please select a task.")
+            return
+        tasks = [self.tasks.get(task_id) for task_id in task_ids]
+        text = simpledialog.askstring("Set Repeat (daily, weekly, monthly, every N days/weeks/months, or leave blank)",
+                                      "Repeat %d selected task(s):" % len(tasks),
+                                      initialvalue=task_repeat(tasks[0]) or "")
+        if text is None:
+            return
+        try:
+            repeat = parse_repeat(text)
+        except ValueError as exc:
+            messagebox.showwarning("Input Error", str(exc))
+            return
+        # Occurrences count from the due time; without one, the first is the end of today
+        today = parse_due(time.strftime("%Y-%m-%d"))
+        records = []
+        for task in tasks:
+            if task.get(REPEAT) != repeat:
+                changes = {REPEAT: repeat}
+                if repeat is not None and task.get(DUE) is None:
+                    changes[DUE] = today
+                records.append({"op": "update", "id": task["id"], "task": dict(task, **changes)})
+        self.apply_changes(records)
+
+    def set_tags(self):
+        task_ids = self.selected_ids()
+        if not task_ids:
+            messagebox.showinfo("Set Tags", "Please select a task.")
+            return
+        tasks = [self.tasks.get(task_id) for task_id in task_ids]
+        text = simpledialog.askstring("Set Tags", "Tags for %d selected task(s), comma-separated:" % len(tasks),
+                                      initialvalue=tags_label(task_tags(tasks[0])))
+        if text is None:
+            return
+        tags = parse_tags(text)
+        self.apply_changes([{"op": "update", "id": task["id"], "task": dict(task, **{TAGS: tags})}
+                            for task in tasks if task_tags(task) != tags])
+
+    def choose_link(self, title, prompt, tasks):
+        """Ask which open task a link of ``tasks`` should point at; returns
+        (task id or None, ok)."""
+        choices = link_choices(self.tasks, {task["id"] for task in tasks})
+        top = tk.Toplevel(self.root)
+        top.title(title)
+        top.transient(self.root)
+        ttk.Label(top, text=prompt).pack(padx=10, pady=(10, 0), anchor=tk.W)
+        listbox = tk.Listbox(top, width=50, height=12, exportselection=False)
+        listbox.insert(tk.END, *(label for label, _ in choices))
+        listbox.selection_set(0)
+        listbox.pack(padx=10, pady=5, fill=tk.BOTH, expand=True)
+        chosen = []
+
+        def ok(event=None):
+            chosen.extend(listbox.curselection())
+            top.destroy()
+        listbox.bind('<Double-Button-1>', ok)
+        btn_frame = tk.Frame(top)
+        btn_frame.pack(pady=5)
+        tk.Button(btn_frame, text="OK", command=ok).pack(side=tk.LEFT, padx=5)
+        tk.Button(btn_frame, text="Cancel", command=top.destroy).pack(side=tk.LEFT, padx=5)
+        top.grab_set()
+        self.root.wait_window(top)
+        if not chosen:
+            return None, False
+        return choices[chosen[0]][1], True
+
+    def set_parent(self):
+        task_ids = self.selected_ids()
+        if not task_ids:
+            messagebox.showinfo("Set Parent", "Please select a task.")
+            return
+        tasks = [self.tasks.get(task_id) for task_id in task_ids]
+        parent, ok = self.choose_link("Set Parent", "Make %d selected task(s) subtasks of:" % len(tasks), tasks)
+        if not ok:
+            return
+        try:
+            for task in tasks:
+                self.graph.check_parent(task["id"], parent)
+        except CycleError as exc:
+            messagebox.showwarning("Input Error", str(exc))
+            return
+        self.apply_changes([{"op": "update", "id": task["id"], "task": dict(task, **{PARENT: parent})}
+                            for task in tasks if task_parent(task) != parent])
+
+    def set_blocked_by(self):
+        task_ids = self.selected_ids()
+        if not task_ids:
+            messagebox.showinfo("Blocked By", "Please select a task.")
+            return
+        tasks = [self.tasks.get(task_id) for task_id in task_ids]
+        blocker, ok = self.choose_link("Blocked By", "%d selected task(s) wait for (or none, to clear):" % len(tasks),
+                                       tasks)
+        if not ok:
+            return
+        try:
+            for task in tasks:
+                self.graph.check_blockers(task["id"], [blocker] if blocker else [])
+        except CycleError as exc:
+            messagebox.showwarning("Input Error", str(exc))
+            return
+        records = []
+        for task in tasks:
+            blockers = task_blockers(task)
+            new_blockers = (blockers if blocker in blockers else blockers + [blocker]) if blocker else []
+            if new_blockers != blockers:
+                records.append({"op": "update", "id": task["id"], "task": dict(task, **{BLOCKED_BY: new_blockers})})
+        self.apply_changes(records)
+
+    def arm_reminder(self, when):
+        if self.reminder is not None:
+            self.root.after_cancel(self.reminder)
+            self.reminder = None
+        if when is not None:
+            delay = max(0.0, when - time.time())
+            self.reminder = self.root.after(min(int(delay * 1000) + 1, MAX_TIMER_MS), self.remind)
+
+    def remind(self):
+        """Highlight the tasks that just came due and say so in the status bar."""
+        self.reminder = None
+        task_ids = self.due.advance()
+        for task_id in task_ids:
+            if task_id in self.rendered:
+                self.show_row(task_id)
+        if task_ids:
+            names = ", ".join(self.tasks.get(task_id)["task"] for task_id in task_ids[:3])
+            more = " and %d more" % (len(task_ids) - 3) if len(task_ids) > 3 else ""
+            self.status_label.config(text="Due: %s%s" % (names, more))
+            self.root.after(REMINDER_MS, self.update_status)
+        # Also when it fired early because the due time was past MAX_TIMER_MS
+        if self.reminder is None:
+            self.arm_reminder(self.due.next_due)
+
+    def apply_change(self, record):
+        """Apply a journal-style change record to the list and the tree, and persist it."""
+        self.apply_changes([record])
+
+    def apply_changes(self, records):
+        """Apply a batch of change records to the list, update the tree once,
+        and persist them in one write."""
+        if not records:
+            return
+        if self.loader is not None:
+            # Replayed after the snapshot and its journal, so nothing older lands on top
+            self.pending_changes.extend(records)
+            self.loading_label.config(text="Loading tasks... (%d changes waiting)" % len(self.pending_changes))
+            return
+        records = self.show_changes(records)
+        if records:
+            self.persistence.submit_many(records)
+
+    def show_change(self, record, refresh=True):
+        """Apply a change record to the list (and, if ``refresh``, the tree)
+        only; returns it as it should be persisted, or None if it no longer
+        applies."""
+        op = record["op"]
+        if op != "add" and self.tasks.get(record["id"]) is None:
+            return None  # the journal already deleted it
+        # What gets persisted is the task as the list now holds it (with its
+        # id and normalized priority)
+        if op == "add":
+            record = dict(record, task=self.tasks.add(record["task"]))
+        elif op == "update":
+            task = self.tasks.update(record["id"], **{k: v for k, v in record["task"].items() if k != "id"})
+            record = dict(record, task=task)
+        else:
+            row = self.view_row(record["id"]) if refresh else None
+            self.tasks.remove(record["id"])
+        if refresh:
+            if op == "update":
+                self.refresh_task(record["id"])
+            elif op == "add":
+                self.show_added(record["task"]["id"])
+            else:
+                self.show_removed(row)
+        return record
+
+    def show_changes(self, records):
+        """Apply change records to the list, then bring the tree up to date
+        once; returns those that still apply, as they should be persisted."""
+        if len(records) == 1:
+            record = self.show_change(records[0])
+            self.show_links()
+            return [record] if record is not None else []
+        shown = (self.show_change(record, refresh=False) for record in records)
+        shown = [record for record in shown if record is not None]
+        if shown:
+            self.refresh_tasks()
+        self.show_links()
+        return shown
+
+    def show_links(self):
+        # The rows whose blocked state or progress the last changes moved; the graph says which
+        for task_id in self.graph.take_changed():
+            if task_id in self.rendered and self.tasks.get(task_id) is not None:
+                self.show_row(task_id)
+
+    def merge_changes(self):
+        """Show the changes other windows have saved since the last look."""
+        if self.loader is not None or not self.persistence.idle():
+            return  # our own changes go to disk first, so theirs apply on top
+        records = self.store.changes(self.tasks)
+        if records:
+            self.show_changes(records)
+
+    def poll_changes(self):
+        self.merge_changes()
+        self.root.after(RELOAD_POLL_MS, self.poll_changes)
+
+    def sort_by_priority(self, descending=None):
+        # The order follows later adds and edits by itself; self.tasks is never reordered
+        if descending is None:
+            descending = self.descending_var.get()
+        if self.order is not None:
+            self.order.detach()
+        self.order = SortedOrder(self.tasks, descending)
+        self.descending_var.set(descending)
+        self.save_sort()
+        self.refresh_tasks()
+
+    def set_sort_descending(self, descending):
+        if self.order is not None and self.order.descending != descending:
+            self.order.descending = descending
+            self.refresh_tasks()
+        self.save_sort()
+
+    def restore_sort(self):
+        settings = self.store.load_settings()
+        if settings.get("sort") == "priority":
+            self.sort_by_priority(settings.get("descending", False))
+
+    def save_sort(self):
+        order = self.order
+        self.store.save_settings({"sort": "priority", "descending": order.descending} if order is not None else {})
+
+    def search_tasks(self, query):
+        self.query = query
+        self.refresh_tasks()
+
+    def searching(self):
+        return bool(tokenize(self.query))
+
+    def filter_tasks(self):
+        filters = {}
+        tags = parse_tags(self.tag_filter_var.get())
+        if tags:
+            filters["tags"] = tags
+        if self.priority_filter_var.get() != ANY:
+            filters["priority"] = normalize_priority(self.priority_filter_var.get())
+        filters.update(STATUS_FILTERS[self.status_filter_var.get()])
+        self.filters = filters
         self.refresh_tasks()
 
+    def filtered_by(self):
+        if self.filter_index is None:
+            self.filter_index = FilterIndex(self.tasks)
+        return self.filter_index
+
+    def allowed(self):
+        # The ids self.filters lets through
+        filters = dict(self.filters)
+        links = filters.pop(LINKS, None)
+        allowed = self.filtered_by().filter(**filters)
+        if links is not None:
+            linked = getattr(self.graph, links)
+            allowed = set(linked) if allowed is None else allowed & linked
+        return allowed
+
+    def list_tags(self):
+        self.tag_filter["values"] = self.filtered_by().tags()
+
+    def update_status(self):
+        self.status_label.config(text=self.counts.summary())
+
+    def refresh_task(self, task_id):
+        # An edit in place only ever touches its own row, if it is in the tree
+        self.update_status()
+        if self.searching() or self.filters or \
+                (self.order is not None and self.row_keys[self.order.row_of(task_id)] != task_id):
+            self.refresh_tasks()  # the edit may have moved the task or changed what matches
+            return
+        if task_id in self.rendered:
+            self.show_row(task_id)
+
+    def show_row(self, task_id):
+        # Bring one rendered row up to date, if it changed
+        row = self.row_state(self.tasks.get(task_id))
+        if row != self.rendered[task_id]:
+            self.tree.item(task_id, values=row[0], tags=row[1])
+            self.rendered[task_id] = row
+
+    def view_row(self, task_id):
+        # Where the task is in the view, unless a search or filter decides
+        return (self.tasks if self.order is None else self.order).row_of(task_id)
+
+    def show_added(self, task_id):
+        # One new row, where the order puts it; only a search or filter
+        # needs the rows worked out again
+        if self.searching() or self.filters:
+            self.refresh_tasks()
+            return
+        self.row_keys.insert(self.view_row(task_id), task_id)
+        self.render_window()
+        self.update_status()
+
+    def show_removed(self, row):
+        # ``row`` is where the removed task was in the view
+        if self.searching() or self.filters:
+            self.refresh_tasks()
+            return
+        del self.row_keys[row]
+        self.render_window()
+        self.update_status()
+
     def refresh_tasks(self):
-        for i in self.tree.get_children():
-            self.tree.delete(i)
-        for idx, task in enumerate(self.tasks):
-            status = "Complete" if task["completed"] else "Incomplete"
-            priority = task["priority"] if task["priority"] else "None"
-            self.tree.insert("", "end", iid=str(idx), values=(task["task"], priority, status))
+        # Rows are keyed by task id, so unchanged rows are left alone
+        order = self.order if self.order is not None else self.tasks
+        if self.searching():
+            if self.search is None:
+                self.search = SearchIndex(self.tasks)
+            self.row_keys = self.search.search(self.query, self.order)
+            if self.filters:
+                allowed = self.allowed()
+                self.row_keys = [key for key in self.row_keys if key in allowed]
+        elif self.filters:
+            self.row_keys = in_order(self.allowed(), order)
+        else:
+            self.row_keys = order.ids()
+        self.render_window()
+        self.update_status()
 
-    def load_tasks(self):
-        if os.path.exists(TASKS_FILE):
-            with open(TASKS_FILE, 'r') as f:
-                self.tasks = json.load(f)
+    def render_window(self):
+        total = len(self.row_keys)
+        if self.windowed():
+            self.window_start = max(0, min(self.window_start, total - WINDOW_ROWS))
+            self.render_rows(self.window_start, self.window_start + WINDOW_ROWS)
+        else:
+            self.window_start = 0
+            self.render_rows(0, total)
+
+    def row_values(self, task):
+        if task["completed"]:
+            status = "Complete"
+        else:
+            status = "Blocked" if task["id"] in self.graph.blocked else "Incomplete"
+        priority = priority_label(task["priority"])
+        return (task["task"], priority, status, due_label(task.get(DUE)), tags_label(task_tags(task)),
+                progress_label(*self.graph.progress(task["id"])), task_repeat(task) or "")
+
+    def row_state(self, task):
+        return self.row_values(task), ("overdue",) if task["id"] in self.due.overdue else ()
+
+    def render_rows(self, start, end):
+        # Make the tree hold exactly rows start:end, touching only rows that differ
+        wanted = self.row_keys[start:end]
+        wanted_set = set(wanted)
+        gone = [key for key in self.rendered if key not in wanted_set]
+        if gone:
+            self.tree.delete(*gone)
+            for key in gone:
+                del self.rendered[key]
+        for key in wanted:
+            row = self.row_state(self.tasks.get(key))
+            old = self.rendered.get(key)
+            if old is None:
+                self.tree.insert("", "end", iid=key, values=row[0], tags=row[1])
+            elif old != row:
+                self.tree.item(key, values=row[0], tags=row[1])
+            self.rendered[key] = row
+        # New rows went in at the end; reorder in a single call only if needed
+        if list(self.rendered) != wanted:
+            self.tree.set_children("", *wanted)
+            self.rendered = {key: self.rendered[key] for key in wanted}
+        keep = [key for key in self.selected_keys if key in self.rendered]
+        if keep and set(keep) != set(self.tree.selection()):
+            self.tree.selection_set(keep)
+
+    def windowed(self):
+        return len(self.row_keys) > WINDOW_THRESHOLD
+
+    def show_window_at(self, top):
+        # Materialize the rows around row `top` and scroll it to the top
+        total = len(self.row_keys)
+        start = int(max(0, min(top - WINDOW_BUFFER, total - WINDOW_ROWS)))
+        self.window_start = start
+        self.render_rows(start, start + WINDOW_ROWS)
+        if self.rendered:
+            self.tree.yview_moveto((top - start) / len(self.rendered))
+
+    def on_tree_scrolled(self, first, last):
+        first, last = float(first), float(last)
+        if not self.windowed():
+            self.scrollbar.set(first, last)
+            return
+        # Translate the position inside the window to one in the whole list
+        total = len(self.row_keys)
+        count = len(self.rendered)
+        top = self.window_start + first * count
+        bottom = self.window_start + last * count
+        self.scrollbar.set(top / total, bottom / total)
+        margin = WINDOW_BUFFER // 2
+        near_top = self.window_start > 0 and top - self.window_start < margin
+        near_bottom = self.window_start + count < total and self.window_start + count - bottom < margin
+        if (near_top or near_bottom) and not self.rewindow_pending:
+            self.rewindow_pending = True
+            self.root.after_idle(self.slide_window, top)
+
+    def slide_window(self, top):
+        self.rewindow_pending = False
+        self.show_window_at(top)
+
+    def on_scrollbar(self, *args):
+        if self.windowed() and args[0] == "moveto":
+            self.show_window_at(float(args[1]) * len(self.row_keys))
+        else:
+            self.tree.yview(*args)
+
+    def on_click(self, event):
+        # Runs before the tree's own binding, and so before on_select()
+        self.click_replaces = not event.state & EXTEND_SELECTION
+
+    def on_select(self, event):
+        # The tree only knows about the rows in the window. Selected rows
+        # outside it are kept unless a plain click replaced the selection or
+        # a selected row inside it was deselected.
+        selection = set(self.tree.selection())
+        inside = {key for key in self.selected_keys if key in self.rendered}
+        if not self.click_replaces and inside <= selection:
+            selection |= {key for key in self.selected_keys
+                          if key not in self.rendered and self.tasks.get(key) is not None}
+        self.click_replaces = False
+        self.selected_keys = selection
+
+    def start_loading(self, defer=False):
+        """Begin streaming tasks in.
+
+        Creating the loader reads nothing. The first slice runs now (so small
+        files are complete before the window shows) unless ``defer`` is set,
+        in which case the caller runs load_more() once the window is painted.
+        """
+        self.loader = self.store.load_batches()
+        if not defer:
+            self.load_more()
+
+    def load_more(self):
+        if self.loader is None:
+            return
+        deadline = time.monotonic() + LOAD_SLICE
+        for batch, done in self.loader:
+            self.tasks.extend(batch)
+            self.loading_bar["value"] = done * 100
+            if time.monotonic() > deadline:
+                self.show_loaded()
+                self.root.after(1, self.load_more)
+                return
+        self.finish_loading()
+
+    def show_loaded(self):
+        # While loading in stored order rows only ever go on the end
+        if self.order is None and not (self.searching() or self.filters):
+            self.row_keys.extend(task["id"] for task in self.tasks[len(self.row_keys):])
+            self.render_window()
+            self.update_status()
         else:
-            self.tasks = []
+            self.refresh_tasks()
+
+    def finish_loading(self):
+        """Load whatever is left right away, then apply queued changes."""
+        if self.loader is None:
+            return
+        for batch, done in self.loader:
+            self.tasks.extend(batch)
+        self.loader = None
+        self.store.finish_load(self.tasks)
+        self.refresh_tasks()
+        self.loading_frame.pack_forget()
+        pending, self.pending_changes = self.pending_changes, []
+        self.apply_changes(pending)
+        self.archive_completed()
+
+    def archive_completed(self):
+        """Move the tasks completed longer ago than $TASKS_ARCHIVE_DAYS out
+        of the list and into the store's archive."""
+        if self.store.archive is None or self.archive_after is None or self.loader is not None:
+            return
+        self.apply_changes(archive_records(self.store.archive, self.tasks, self.archive_after))
+
+    def poll_archive(self):
+        self.archive_completed()
+        self.root.after(ARCHIVE_POLL_MS, self.poll_archive)
+
+    def show_archive(self):
+        ArchiveWindow(self)
+
+    def restore_tasks(self, tasks):
+        """Put archived ``tasks`` back in the list, reopened."""
+        records = []
+        for task in tasks:
+            records.append({"op": "add", "task": dict(task, **completion(False))})
+        self.apply_changes(records)
+        # Written to the list before they leave the archive, so a crash cannot lose them
+        self.persistence.flush()
+        self.store.archive.remove([task["id"] for task in tasks])
+
+    def load_tasks(self):
+        self.tasks = self.store.load()
+        self.counts.detach()
+        self.counts = TaskCounts(self.tasks)
+        self.due.detach()
+        self.due = DueSchedule(self.tasks, self.arm_reminder)
+        self.graph.detach()
+        self.graph = TaskGraph(self.tasks)
+        if self.search is not None:
+            self.search.detach()
+            self.search = None
+        if self.filter_index is not None:
+            self.filter_index.detach()
+            self.filter_index = None
+        if self.order is not None:
+            self.order.detach()
+            self.order = SortedOrder(self.tasks, self.order.descending)
+        # The rows on screen belong to the old list
+        if self.rendered:
+            self.tree.delete(*self.rendered)
+        self.rendered = {}
+        self.refresh_tasks()
 
     def save_tasks(self):
-        with open(TASKS_FILE, 'w') as f:
-            json.dump(self.tasks, f, indent=2)
+        self.finish_loading()
+        self.persistence.flush()
+        with self.store.locked():
+            # A full snapshot must not undo what other windows wrote
+            self.merge_changes()
+            self.store.save(self.tasks)
+
+    def poll_persistence(self):
+        # Tk is not thread-safe, so writer errors are handed over through a queue
+        try:
+            error = self.persist_errors.get_nowait()
+        except queue.Empty:
+            pass
+        else:
+            try:
+                self.save_tasks()
+            except OSError:
+                messagebox.showerror("Save Error", f"Could not save tasks: {error}")
+        self.root.after(PERSIST_POLL_MS, self.poll_persistence)
+
+    def on_close(self):
+        self.finish_loading()
+        self.persistence.stop()
+        self.store.close()
+        self.root.destroy()
 
 def main():
+    argv, _ = task_metrics.configure(sys.argv, TaskManagerApp)
+    _, startup = task_metrics.startup_profile(argv, STARTED, IMPORTED)
     root = tk.Tk()
     # Set ttk theme for macOS compatibility
     style = ttk.Style(root)
@@ -135,7 +939,13 @@ def main():
         style.theme_use('clam')
     except:
         pass
-    app = TaskManagerApp(root)
+    app = TaskManagerApp(root, defer_load=True)
+    startup.mark("window built")
+    # Paint the empty window before any task data is read
+    root.update()
+    startup.mark("first paint")
+    startup.follow(app, "finish_loading", "tasks loaded", lambda: "%d tasks" % len(app.tasks))
+    app.load_more()
     root.mainloop()
 
 if __name__ == "__main__":
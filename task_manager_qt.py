@@ -1,35 +1,485 @@
+import time
+STARTED = time.perf_counter()  # for --startup-profile
 import sys
-import json
-import os
+import atexit
+import itertools
 from PyQt5.QtWidgets import (
-    QApplication, QWidget, QVBoxLayout, QHBoxLayout, QTableWidget, QTableWidgetItem,
+    QApplication, QWidget, QVBoxLayout, QHBoxLayout, QTableView,
     QPushButton, QLineEdit, QComboBox, QMessageBox, QHeaderView, QAbstractItemView, QLabel,
-    QInputDialog
+    QInputDialog, QCheckBox, QProgressBar, QDialog, QStatusBar
 )
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import (
+    Qt, QThread, QTimer, pyqtSignal, QAbstractTableModel, QModelIndex
+)
+from PyQt5.QtGui import QColor, QKeySequence
+from task_model import (
+    TaskList, SortedOrder, TaskCounts, DueSchedule, PRIORITY_LEVELS, NO_PRIORITY_LABEL, DUE, TAGS, REPEAT, as_task,
+    completion, completion_records, normalize_priority, priority_label, parse_due, due_label, parse_repeat, task_repeat,
+    parse_tags, task_tags, tags_label
+)
+from task_storage import open_store, archive_age, archive_records, PersistenceWorker
+from task_search import SearchIndex, FilterIndex, in_order, tokenize
+from task_graph import (TaskGraph, CycleError, PARENT, BLOCKED_BY, task_parent, task_blockers, progress_label,
+                        link_choices)
+import task_metrics
+IMPORTED = time.perf_counter()
 
 TASKS_FILE = 'tasks.json'
-PRIORITIES = ["Low", "Medium", "High"]
+PRIORITIES = list(PRIORITY_LEVELS)
+PRIORITY_CHOICES = [NO_PRIORITY_LABEL] + PRIORITIES  # what the priority pickers offer
+COLUMNS = ["Task", "Priority", "Status", "Due", "Tags", "Progress", "Repeat"]
+PRIORITY_COLUMN = 1
+DUE_COLUMN = 3
+TAGS_COLUMN = 4
+PROGRESS_COLUMN = 5
+REPEAT_COLUMN = 6
+ANY = "All"  # the filter choice that does not filter
+LINKS = "links"  # the filter on the model's TaskGraph: "ready" or "blocked"
+STATUS_FILTERS = {ANY: {}, "Incomplete": {"completed": False}, "Complete": {"completed": True},
+                  "Ready": {LINKS: "ready"}, "Blocked": {LINKS: "blocked"}}
+OVERDUE_COLOR = "#c62828"  # text colour of overdue tasks
+MAX_TIMER_MS = 2 ** 31 - 1  # QTimer's limit; a due time further off re-arms when this fires
+REMINDER_MS = 10000  # how long a reminder stays in the status bar
+LOAD_SLICE = 0.03  # seconds of loading between chances for the window to repaint
+RELOAD_POLL_MS = 1000  # how often to look for changes other windows have saved
+ARCHIVE_POLL_MS = 60 * 60 * 1000  # how often to move long-completed tasks to the archive
+
+class PersistenceThread(QThread):
+    failed = pyqtSignal(str)
+
+    def __init__(self, worker):
+        # No parent: the thread must outlive a window that is garbage collected
+        super().__init__()
+        self.worker = worker
+        worker.on_error = lambda exc: self.failed.emit(str(exc))
+        atexit.register(self.shutdown)
+
+    def run(self):
+        self.worker.run()
+
+    def shutdown(self):
+        # Once stopped there is nothing left for exit to do, and by then the
+        # Qt side of this object may already be gone
+        atexit.unregister(self.shutdown)
+        self.worker.stop()
+        self.wait()
+
+class TaskInput(QLineEdit):
+    """The new-task box. Pasting several lines hands them to ``lines_pasted``
+    (one task each) instead of running them together into one task."""
+    lines_pasted = pyqtSignal(list)
+
+    def keyPressEvent(self, event):
+        if event.matches(QKeySequence.Paste):
+            lines = [line.strip() for line in QApplication.clipboard().text().splitlines() if line.strip()]
+            if len(lines) > 1:
+                self.lines_pasted.emit(lines)
+                return
+        super().keyPressEvent(event)
+
+class TagFilter(QComboBox):
+    """The tag filter box: type tags (comma-separated, all required) or pick
+    one. The list of tags is only gathered when it is about to open."""
+    about_to_open = pyqtSignal()
+
+    def showPopup(self):
+        self.about_to_open.emit()
+        super().showPopup()
+
+class TaskTableModel(QAbstractTableModel):
+    # Views only ask for the rows they paint, and every mutation below
+    # announces exactly the rows it touched. With a SortedOrder set, rows are
+    # in sorted order and a change that moves a task is announced as a move.
+    # While a search or filter is active the rows are the matches instead.
+    nextDueChanged = pyqtSignal(object)  # the earliest due time still ahead, or None
+
+    def __init__(self, tasks=None, parent=None):
+        super().__init__(parent)
+        self.tasks = TaskList(tasks)
+        self.counts = TaskCounts(self.tasks)
+        self.due = DueSchedule(self.tasks, self.nextDueChanged.emit)
+        self.graph = TaskGraph(self.tasks)
+        self.order = None
+        self.search = None  # SearchIndex, built on the first search
+        self.query = ""
+        self.filter_index = None  # FilterIndex, built on the first filter
+        self.filters = {}  # FilterIndex.filter() arguments, and LINKS
+        self.matches = None
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.tasks) if self.matches is None else len(self.matches)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(COLUMNS)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == Qt.DisplayRole:
+            task = self.task_at(index.row())
+            column = index.column()
+            if column == 0:
+                return task["task"]
+            if column == PRIORITY_COLUMN:
+                return priority_label(task["priority"])
+            if column == DUE_COLUMN:
+                return due_label(task.get(DUE))
+            if column == TAGS_COLUMN:
+                return tags_label(task_tags(task))
+            if column == PROGRESS_COLUMN:
+                return progress_label(*self.graph.progress(task["id"]))
+            if column == REPEAT_COLUMN:
+                return task_repeat(task) or ""
+            if task["completed"]:
+                return "Complete"
+            return "Blocked" if task["id"] in self.graph.blocked else "Incomplete"
+        if role == Qt.ForegroundRole and self.task_at(index.row())["id"] in self.due.overdue:
+            return QColor(OVERDUE_COLOR)
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return COLUMNS[section]
+        return super().headerData(section, orientation, role)
+
+    def task_at(self, row):
+        if self.matches is not None:
+            return self.tasks.get(self.matches[row])
+        if self.order is None:
+            return self.tasks[row]
+        return self.tasks.get(self.order.id_at(row))
+
+    def row_of(self, task_id):
+        if self.order is None:
+            return self.tasks.row_of(task_id)
+        return self.order.row_of(task_id)
+
+    def set_tasks(self, tasks):
+        self.beginResetModel()
+        descending = self.order.descending if self.order is not None else None
+        if self.order is not None:
+            self.order.detach()
+        if self.search is not None:
+            self.search.detach()
+            self.search = None
+        if self.filter_index is not None:
+            self.filter_index.detach()
+            self.filter_index = None
+        self.counts.detach()
+        self.due.detach()
+        self.graph.detach()
+        self.tasks = tasks if isinstance(tasks, TaskList) else TaskList(tasks)
+        self.counts = TaskCounts(self.tasks)
+        self.due = DueSchedule(self.tasks, self.nextDueChanged.emit)
+        self.graph = TaskGraph(self.tasks)
+        self.order = SortedOrder(self.tasks, descending) if descending is not None else None
+        self.run_query()
+        self.endResetModel()
+
+    def set_sorted(self, sorted_, descending=False):
+        """Show tasks in SortedOrder (or stored order when ``sorted_`` is false)."""
+        self.beginResetModel()
+        if self.order is not None:
+            self.order.detach()
+        self.order = SortedOrder(self.tasks, descending) if sorted_ else None
+        self.run_query()
+        self.endResetModel()
+
+    def set_descending(self, descending):
+        if self.order is not None and self.order.descending != descending:
+            # Flipping is O(1) in the order; the view just re-reads what it shows
+            self.layoutAboutToBeChanged.emit()
+            self.order.descending = descending
+            self.run_query()
+            self.layoutChanged.emit()
+
+    def set_query(self, query):
+        self.beginResetModel()
+        self.query = query
+        self.run_query()
+        self.endResetModel()
+
+    def set_filters(self, filters):
+        self.beginResetModel()
+        self.filters = filters
+        self.run_query()
+        self.endResetModel()
+
+    def tags(self):
+        return self.filtered_by().tags()
+
+    def filtered_by(self):
+        if self.filter_index is None:
+            self.filter_index = FilterIndex(self.tasks)
+        return self.filter_index
+
+    def run_query(self):
+        searching = bool(tokenize(self.query))
+        if not searching and not self.filters:
+            self.matches = None
+            return
+        matches = None
+        if searching:
+            if self.search is None:
+                self.search = SearchIndex(self.tasks)
+            matches = self.search.search(self.query, self.order)
+        if self.filters:
+            filters = dict(self.filters)
+            links = filters.pop(LINKS, None)
+            allowed = self.filtered_by().filter(**filters)
+            if links is not None:
+                linked = getattr(self.graph, links)
+                allowed = set(linked) if allowed is None else allowed & linked
+            if matches is None:
+                matches = in_order(allowed, self.tasks if self.order is None else self.order)
+            else:
+                matches = [task_id for task_id in matches if task_id in allowed]
+        self.matches = matches
+
+    def rematches(self, changes):
+        # Whether ``changes`` may change which tasks match, or how they rank.
+        # Completing a task can unblock others, so it re-runs a LINKS filter.
+        return (("task" in changes and bool(tokenize(self.query))) or not self.filters.keys().isdisjoint(changes)
+                or (LINKS in self.filters and ("completed" in changes or BLOCKED_BY in changes)))
+
+    def append_tasks(self, tasks):
+        if self.order is not None or self.matches is not None:
+            return self.reset_around(lambda: self.tasks.extend(tasks))
+        first = len(self.tasks)
+        self.beginInsertRows(QModelIndex(), first, first + len(tasks) - 1)
+        added = self.tasks.extend(tasks)
+        self.endInsertRows()
+        return added
+
+    def append_task(self, task):
+        task = as_task(task)
+        if self.matches is not None:
+            return self.reset_around(lambda: self.tasks.add(task))
+        row = len(self.tasks) if self.order is None else self.order.row_for_new(task)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.tasks.add(task)
+        self.endInsertRows()
+        return task
+
+    def remove_task(self, task_id):
+        if self.matches is not None:
+            return self.reset_around(lambda: self.tasks.remove(task_id))
+        row = self.row_of(task_id)
+        self.beginRemoveRows(QModelIndex(), row, row)
+        self.tasks.remove(task_id)
+        self.endRemoveRows()
+
+    def update_task(self, task_id, **changes):
+        if self.matches is not None:
+            if self.rematches(changes):
+                return self.reset_around(lambda: self.tasks.update(task_id, **changes))
+            # Nothing else decides what matches, so other edits stay in place
+            try:
+                row = self.matches.index(task_id)
+            except ValueError:
+                return self.tasks.update(task_id, **changes)  # hidden, so no row to repaint
+            task = self.tasks.update(task_id, **changes)
+            self.dataChanged.emit(self.index(row, 0), self.index(row, len(COLUMNS) - 1))
+            return task
+        row = self.row_of(task_id)
+        new_row = row if self.order is None else self.order.row_after_update(task_id, changes)
+        moved = new_row != row
+        if moved:
+            # Qt wants the destination as the row to insert before
+            self.beginMoveRows(QModelIndex(), row, row, QModelIndex(),
+                               new_row + 1 if new_row > row else new_row)
+        task = self.tasks.update(task_id, **changes)
+        if moved:
+            self.endMoveRows()
+        self.dataChanged.emit(self.index(new_row, 0), self.index(new_row, len(COLUMNS) - 1))
+        return task
+
+    def remove_tasks(self, task_ids):
+        if self.matches is not None:
+            return self.reset_around(lambda: [self.tasks.remove(task_id) for task_id in task_ids])
+        # One removal per run of adjacent rows, bottom up so the rows above stay put
+        runs = []
+        for row, task_id in sorted(((self.row_of(task_id), task_id) for task_id in task_ids), reverse=True):
+            if runs and runs[-1][0] == row + 1:
+                runs[-1][0] = row
+                runs[-1][1].append(task_id)
+            else:
+                runs.append([row, [task_id]])
+        for first, ids in runs:
+            self.beginRemoveRows(QModelIndex(), first, first + len(ids) - 1)
+            for task_id in ids:
+                self.tasks.remove(task_id)
+            self.endRemoveRows()
+
+    def update_tasks(self, updates):
+        """Apply (task id, changes) pairs. Rows that stay where they are are
+        announced with one dataChanged for the span they cover; a task the
+        sorted order moves is moved as in update_task()."""
+        if self.matches is not None and any(self.rematches(changes) for _, changes in updates):
+            return self.reset_around(lambda: [self.tasks.update(task_id, **changes) for task_id, changes in updates])
+        if self.order is not None and any(self.order.affected_by(task_id, changes) for task_id, changes in updates):
+            return [self.update_task(task_id, **changes) for task_id, changes in updates]
+        if self.matches is not None:
+            shown = {task_id: row for row, task_id in enumerate(self.matches)}
+            # Tasks the search or filter hides have no row to repaint
+            rows = [shown[task_id] for task_id, _ in updates if task_id in shown]
+        else:
+            rows = [self.row_of(task_id) for task_id, _ in updates]
+        tasks = [self.tasks.update(task_id, **changes) for task_id, changes in updates]
+        if rows:
+            self.dataChanged.emit(self.index(min(rows), 0), self.index(max(rows), len(COLUMNS) - 1))
+        return tasks
+
+    def advance_due(self, now=None):
+        """Mark the tasks due by ``now`` overdue and repaint just their rows;
+        returns the newly overdue tasks."""
+        task_ids = self.due.advance(now)
+        if self.matches is not None:
+            shown = {task_id: row for row, task_id in enumerate(self.matches)}
+            rows = [shown[task_id] for task_id in task_ids if task_id in shown]
+        else:
+            rows = [self.row_of(task_id) for task_id in task_ids]
+        if rows:
+            self.dataChanged.emit(self.index(min(rows), 0), self.index(max(rows), len(COLUMNS) - 1),
+                                  [Qt.ForegroundRole])
+        return [self.tasks.get(task_id) for task_id in task_ids]
+
+    def show_links(self):
+        """Repaint the rows whose blocked state or progress the last changes
+        moved; the graph says which, so this never looks at other rows."""
+        task_ids = self.graph.take_changed()
+        if self.matches is not None:
+            shown = {task_id: row for row, task_id in enumerate(self.matches)}
+            rows = [shown[task_id] for task_id in task_ids if task_id in shown]
+        else:
+            rows = [self.row_of(task_id) for task_id in task_ids if self.tasks.get(task_id) is not None]
+        for row in rows:
+            self.dataChanged.emit(self.index(row, 0), self.index(row, len(COLUMNS) - 1))
+
+    def reset_around(self, change):
+        # For changes that can add, drop or re-rank any number of rows
+        self.beginResetModel()
+        result = change()
+        self.run_query()
+        self.endResetModel()
+        return result
+
+class ArchiveDialog(QDialog):
+    """The archived tasks, read from the archive only when this opens.
+
+    Restoring a task reopens it in the task list; deleting it here removes
+    it for good.
+    """
+
+    def __init__(self, manager):
+        super().__init__(manager)
+        self.manager = manager
+        self.setWindowTitle("Archive")
+        self.resize(600, 400)
+        self.model = TaskTableModel(manager.store.archive.load(), parent=self)
+        layout = QVBoxLayout()
+        self.count_label = QLabel()
+        layout.addWidget(self.count_label)
+        self.table = QTableView()
+        self.table.setModel(self.model)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        layout.addWidget(self.table)
+        btn_layout = QHBoxLayout()
+        restore_btn = QPushButton("Restore")
+        restore_btn.clicked.connect(self.restore)
+        delete_btn = QPushButton("Delete")
+        delete_btn.clicked.connect(self.delete)
+        close_btn = QPushButton("Close")
+        close_btn.clicked.connect(self.accept)
+        btn_layout.addWidget(restore_btn)
+        btn_layout.addWidget(delete_btn)
+        btn_layout.addWidget(close_btn)
+        layout.addLayout(btn_layout)
+        self.setLayout(layout)
+        self.update_count()
+
+    def selected_ids(self):
+        indexes = sorted(self.table.selectionModel().selectedRows(), key=lambda index: index.row())
+        return [self.model.task_at(index.row())["id"] for index in indexes]
+
+    def update_count(self):
+        self.count_label.setText("%d archived tasks" % len(self.model.tasks))
+
+    def restore(self):
+        task_ids = self.selected_ids()
+        if not task_ids:
+            QMessageBox.information(self, "Restore Task", "Please select a task.")
+            return
+        self.manager.restore_tasks([self.model.tasks.get(task_id) for task_id in task_ids])
+        self.model.remove_tasks(task_ids)
+        self.update_count()
+
+    def delete(self):
+        task_ids = self.selected_ids()
+        if not task_ids:
+            QMessageBox.information(self, "Delete Task", "Please select a task to delete.")
+            return
+        question = ("Are you sure you want to delete this task for good?" if len(task_ids) == 1
+                    else "Are you sure you want to delete these %d tasks for good?" % len(task_ids))
+        reply = QMessageBox.question(self, "Delete Task", question, QMessageBox.Yes | QMessageBox.No)
+        if reply == QMessageBox.Yes:
+            self.manager.store.archive.remove(task_ids)
+            self.model.remove_tasks(task_ids)
+            self.update_count()
 
 class TaskManager(QWidget):
-    def __init__(self):
+    def __init__(self, defer_load=False):
         super().__init__()
         self.setWindowTitle("Task Manager")
         self.resize(600, 400)
-        self.tasks = []
-        self.load_tasks()
+        self.store = open_store(TASKS_FILE)
+        self.model = TaskTableModel(parent=self)
+        # One timer, armed for the earliest due time only
+        self.due_timer = QTimer(self)
+        self.due_timer.setSingleShot(True)
+        self.due_timer.timeout.connect(self.remind)
+        self.model.nextDueChanged.connect(self.arm_reminder)
+        self.loader = None
+        self.pending_changes = []
+        self.archive_after = archive_age()
+        self.persistence = PersistenceWorker(self.store)
+        self.persistence_thread = PersistenceThread(self.persistence)
+        self.persistence_thread.failed.connect(self.on_persist_error)
+        self.persistence_thread.start()
         self.init_ui()
-        self.refresh_table()
+        self.restore_sort()
+        self.start_loading(defer_load)
+        self.reload_timer = QTimer(self)
+        self.reload_timer.timeout.connect(self.merge_changes)
+        self.reload_timer.start(RELOAD_POLL_MS)
+        self.archive_timer = QTimer(self)
+        self.archive_timer.timeout.connect(self.archive_completed)
+        self.archive_timer.start(ARCHIVE_POLL_MS)
+
+    @property
+    def tasks(self):
+        return self.model.tasks
+
+    @tasks.setter
+    def tasks(self, tasks):
+        self.model.set_tasks(tasks)
 
     def init_ui(self):
         layout = QVBoxLayout()
 
         # Add task controls
         add_layout = QHBoxLayout()
-        self.task_input = QLineEdit()
+        self.task_input = TaskInput()
         self.task_input.setPlaceholderText("Enter task...")
+        self.task_input.lines_pasted.connect(self.add_tasks)
         self.priority_input = QComboBox()
-        self.priority_input.addItems(PRIORITIES)
+        self.priority_input.addItems(PRIORITY_CHOICES)
         self.priority_input.setCurrentText("Medium")
         add_btn = QPushButton("Add Task")
         add_btn.clicked.connect(self.add_task)
@@ -37,14 +487,51 @@ class TaskManager(QWidget):
         add_layout.addWidget(self.task_input)
         add_layout.addWidget(QLabel("Priority:"))
         add_layout.addWidget(self.priority_input)
+        self.tags_input = QLineEdit()
+        self.tags_input.setPlaceholderText("tag, tag...")
+        add_layout.addWidget(QLabel("Tags:"))
+        add_layout.addWidget(self.tags_input)
         add_layout.addWidget(add_btn)
         layout.addLayout(add_layout)
 
-        # Task table
-        self.table = QTableWidget(0, 3)
-        self.table.setHorizontalHeaderLabels(["Task", "Priority", "Status"])
+        # Search box; matching is done by an index, not by scanning the tasks
+        search_layout = QHBoxLayout()
+        self.search_input = QLineEdit()
+        self.search_input.setPlaceholderText("Search tasks...")
+        self.search_input.setClearButtonEnabled(True)
+        self.search_input.textChanged.connect(self.search_tasks)
+        search_layout.addWidget(QLabel("Search:"))
+        search_layout.addWidget(self.search_input)
+        layout.addLayout(search_layout)
+
+        # Filters; each is a set of task ids in the model's FilterIndex
+        filter_layout = QHBoxLayout()
+        self.tag_filter = TagFilter()
+        self.tag_filter.setEditable(True)
+        self.tag_filter.lineEdit().setPlaceholderText(ANY)
+        self.tag_filter.about_to_open.connect(self.list_tags)
+        self.tag_filter.currentTextChanged.connect(self.filter_tasks)
+        self.priority_filter = QComboBox()
+        self.priority_filter.addItems([ANY] + PRIORITY_CHOICES)
+        self.priority_filter.currentTextChanged.connect(self.filter_tasks)
+        self.status_filter = QComboBox()
+        self.status_filter.addItems(list(STATUS_FILTERS))
+        self.status_filter.currentTextChanged.connect(self.filter_tasks)
+        filter_layout.addWidget(QLabel("Tags:"))
+        filter_layout.addWidget(self.tag_filter, 1)
+        filter_layout.addWidget(QLabel("Priority:"))
+        filter_layout.addWidget(self.priority_filter)
+        filter_layout.addWidget(QLabel("Status:"))
+        filter_layout.addWidget(self.status_filter)
+        layout.addLayout(filter_layout)
+
+        # Task table; the model keeps its own sorted order, never reordering self.tasks
+        self.table = QTableView()
+        self.table.setModel(self.model)
         self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
         self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.setSelectionMode(QAbstractItemView.ExtendedSelection)
         self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
         layout.addWidget(self.table)
 
@@ -56,100 +543,492 @@ class TaskManager(QWidget):
         delete_btn.clicked.connect(self.delete_task)
         toggle_btn = QPushButton("Mark Complete/Incomplete")
         toggle_btn.clicked.connect(self.toggle_complete)
+        priority_btn = QPushButton("Set Priority")
+        priority_btn.clicked.connect(self.set_priority)
+        due_btn = QPushButton("Set Due Date")
+        due_btn.clicked.connect(self.set_due)
+        parent_btn = QPushButton("Set Parent")
+        parent_btn.clicked.connect(self.set_parent)
+        blocked_btn = QPushButton("Blocked By")
+        blocked_btn.clicked.connect(self.set_blocked_by)
+        repeat_btn = QPushButton("Set Repeat")
+        repeat_btn.clicked.connect(self.set_repeat)
+        tags_btn = QPushButton("Set Tags")
+        tags_btn.clicked.connect(self.set_tags)
         sort_btn = QPushButton("Sort by Priority")
-        sort_btn.clicked.connect(self.sort_by_priority)
+        sort_btn.clicked.connect(lambda: self.sort_by_priority())
+        self.descending_check = QCheckBox("Descending")
+        self.descending_check.toggled.connect(self.set_sort_descending)
+        archive_btn = QPushButton("Archive")
+        archive_btn.clicked.connect(self.show_archive)
+        archive_btn.setEnabled(self.store.archive is not None)
         btn_layout.addWidget(edit_btn)
         btn_layout.addWidget(delete_btn)
         btn_layout.addWidget(toggle_btn)
+        btn_layout.addWidget(priority_btn)
+        btn_layout.addWidget(due_btn)
+        btn_layout.addWidget(repeat_btn)
+        btn_layout.addWidget(parent_btn)
+        btn_layout.addWidget(blocked_btn)
+        btn_layout.addWidget(tags_btn)
         btn_layout.addWidget(sort_btn)
+        btn_layout.addWidget(self.descending_check)
+        btn_layout.addWidget(archive_btn)
         layout.addLayout(btn_layout)
 
+        # Shown while tasks are still streaming in from disk
+        load_layout = QHBoxLayout()
+        self.loading_label = QLabel("Loading tasks...")
+        self.loading_bar = QProgressBar()
+        self.loading_bar.setRange(0, 100)
+        load_layout.addWidget(self.loading_label)
+        load_layout.addWidget(self.loading_bar)
+        layout.addLayout(load_layout)
+
+        # Status bar: live counts by priority and status. Rows changing is the
+        # cue to redraw it; applied changes redraw it too, since a task that
+        # is not in the current search results changes no rows.
+        self.status_bar = QStatusBar()
+        self.status_bar.setSizeGripEnabled(False)
+        self.status_label = QLabel()
+        self.status_bar.addWidget(self.status_label)
+        layout.addWidget(self.status_bar)
+        for signal in (self.model.rowsInserted, self.model.rowsRemoved, self.model.rowsMoved,
+                       self.model.dataChanged, self.model.modelReset):
+            signal.connect(self.update_status)
+        self.update_status()
+
         self.setLayout(layout)
 
+    def update_status(self, *_):
+        self.status_label.setText(self.model.counts.summary())
+
     def add_task(self):
         text = self.task_input.text().strip()
         priority = self.priority_input.currentText()
         if not text:
             QMessageBox.warning(self, "Input Error", "Task cannot be empty.")
             return
-        self.tasks.append({
+        task = {
             "task": text,
             "priority": priority,
             "completed": False
-        })
-        self.save_tasks()
-        self.refresh_table()
+        }
+        tags = parse_tags(self.tags_input.text())
+        if tags:
+            task[TAGS] = tags
+        self.apply_change({"op": "add", "task": task})
+        self.task_input.clear()
+        self.priority_input.setCurrentText("Medium")
+        self.tags_input.clear()
+
+    def add_tasks(self, texts):
+        """Add one task per pasted line, in one batch."""
+        priority = self.priority_input.currentText()
+        tags = parse_tags(self.tags_input.text())
+        extra = {TAGS: tags} if tags else {}
+        self.apply_changes([{"op": "add", "task": dict(task=text, priority=priority, completed=False, **extra)}
+                            for text in texts])
         self.task_input.clear()
         self.priority_input.setCurrentText("Medium")
+        self.tags_input.clear()
+
+    def selected_ids(self):
+        # Ids of the selected tasks, in view order
+        indexes = sorted(self.table.selectionModel().selectedRows(), key=lambda index: index.row())
+        return [self.model.task_at(index.row())["id"] for index in indexes]
+
+    def selected_id(self):
+        ids = self.selected_ids()
+        return ids[0] if ids else None
 
     def edit_task(self):
-        row = self.table.currentRow()
-        if row == -1:
+        task_id = self.selected_id()
+        if task_id is None:
             QMessageBox.information(self, "Edit Task", "Please select a task to edit.")
             return
-        task = self.tasks[row]
+        task = self.tasks.get(task_id)
         text, ok = QInputDialog.getText(self, "Edit Task", "Edit task:", text=task["task"])
         if ok and text.strip():
-            priority, ok2 = QInputDialog.getItem(self, "Edit Priority", "Edit priority:", PRIORITIES, PRIORITIES.index(task["priority"] if task["priority"] else "Medium"), False)
+            label = priority_label(task["priority"])
+            current = PRIORITY_CHOICES.index(label) if label in PRIORITY_CHOICES else PRIORITY_CHOICES.index("Medium")
+            priority, ok2 = QInputDialog.getItem(self, "Edit Priority", "Edit priority:", PRIORITY_CHOICES, current, False)
             if ok2:
-                self.tasks[row]["task"] = text.strip()
-                self.tasks[row]["priority"] = priority
-                self.save_tasks()
-                self.refresh_table()
+                self.apply_change({"op": "update", "id": task_id,
+                                   "task": dict(task, task=text.strip(), priority=priority)})
 
     def delete_task(self):
-        row = self.table.currentRow()
-        if row == -1:
+        task_ids = self.selected_ids()
+        if not task_ids:
             QMessageBox.information(self, "Delete Task", "Please select a task to delete.")
             return
-        reply = QMessageBox.question(self, "Delete Task", "Are you sure you want to delete this task?", QMessageBox.Yes | QMessageBox.No)
+        question = ("Are you sure you want to delete this task?" if len(task_ids) == 1
+                    else "Are you sure you want to delete these %d tasks?" % len(task_ids))
+        reply = QMessageBox.question(self, "Delete Task", question, QMessageBox.Yes | QMessageBox.No)
         if reply == QMessageBox.Yes:
-            del self.tasks[row]
-            self.save_tasks()
-            self.refresh_table()
+            self.apply_changes([{"op": "delete", "id": task_id} for task_id in task_ids])
 
     def toggle_complete(self):
-        row = self.table.currentRow()
-        if row == -1:
+        # With several tasks selected, all are completed unless all already are
+        task_ids = self.selected_ids()
+        if not task_ids:
             QMessageBox.information(self, "Toggle Complete", "Please select a task.")
             return
-        self.tasks[row]["completed"] = not self.tasks[row]["completed"]
-        self.save_tasks()
-        self.refresh_table()
+        tasks = [self.tasks.get(task_id) for task_id in task_ids]
+        completed = not all(task["completed"] for task in tasks)
+        self.apply_changes(completion_records(tasks, completed))
+
+    def set_priority(self):
+        task_ids = self.selected_ids()
+        if not task_ids:
+            QMessageBox.information(self, "Set Priority", "Please select a task.")
+            return
+        tasks = [self.tasks.get(task_id) for task_id in task_ids]
+        label = priority_label(tasks[0]["priority"])
+        current = PRIORITY_CHOICES.index(label) if label in PRIORITY_CHOICES else PRIORITY_CHOICES.index("Medium")
+        priority, ok = QInputDialog.getItem(self, "Set Priority", "Priority for %d selected task(s):" % len(tasks),
+                                            PRIORITY_CHOICES, current, False)
+        if ok:
+            priority = normalize_priority(priority)
+            self.apply_changes([{"op": "update", "id": task["id"], "task": dict(task, priority=priority)}
+                                for task in tasks if task["priority"] != priority])
+
+    def set_due(self):
+        task_ids = self.selected_ids()
+        if not task_ids:
+            QMessageBox.information(self, "Set Due Date", "Please select a task.")
+            return
+        tasks = [self.tasks.get(task_id) for task_id in task_ids]
+        text, ok = QInputDialog.getText(self, "Set Due Date",
+                                        "Due date for %d selected task(s) (YYYY-MM-DD [HH:MM], blank for none):"
+                                        % len(tasks), text=due_label(tasks[0].get(DUE)))
+        if not ok:
+            return
+        try:
+            due = parse_due(text)
+        except ValueError as exc:
+            QMessageBox.warning(self, "Input Error", str(exc))
+            return
+        self.apply_changes([{"op": "update", "id": task["id"], "task": dict(task, **{DUE: due})}
+                            for task in tasks if task.get(DUE) != due])
+
+    def set_repeat(self):
+        task_ids = self.selected_ids()
+        if not task_ids:
+            QMessageBox.information(self, "Set Repeat", "Please select a task.")
+            return
+        tasks = [self.tasks.get(task_id) for task_id in task_ids]
+        text, ok = QInputDialog.getText(self, "Set Repeat",
+                                        "Repeat %d selected task(s) daily, weekly, monthly or every N days/weeks/months "
+                                        "(blank for never):" % len(tasks), text=task_repeat(tasks[0]) or "")
+        if not ok:
+            return
+        try:
+            repeat = parse_repeat(text)
+        except ValueError as exc:
+            QMessageBox.warning(self, "Input Error", str(exc))
+            return
+        # Occurrences count from the due time; without one, the first is the end of today
+        today = parse_due(time.strftime("%Y-%m-%d"))
+        records = []
+        for task in tasks:
+            if task.get(REPEAT) != repeat:
+                changes = {REPEAT: repeat}
+                if repeat is not None and task.get(DUE) is None:
+                    changes[DUE] = today
+                records.append({"op": "update", "id": task["id"], "task": dict(task, **changes)})
+        self.apply_changes(records)
+
+    def set_tags(self):
+        task_ids = self.selected_ids()
+        if not task_ids:
+            QMessageBox.information(self, "Set Tags", "Please select a task.")
+            return
+        tasks = [self.tasks.get(task_id) for task_id in task_ids]
+        text, ok = QInputDialog.getText(self, "Set Tags", "Tags for %d selected task(s), comma-separated:" % len(tasks),
+                                        text=tags_label(task_tags(tasks[0])))
+        if ok:
+            tags = parse_tags(text)
+            self.apply_changes([{"op": "update", "id": task["id"], "task": dict(task, **{TAGS: tags})}
+                                for task in tasks if task_tags(task) != tags])
+
+    def choose_link(self, title, prompt, tasks):
+        """Ask which open task a link of ``tasks`` should point at; returns
+        (task id or None, ok)."""
+        choices = link_choices(self.tasks, {task["id"] for task in tasks})
+        label, ok = QInputDialog.getItem(self, title, prompt, [label for label, _ in choices], 0, False)
+        return dict(choices).get(label), ok
+
+    def set_parent(self):
+        task_ids = self.selected_ids()
+        if not task_ids:
+            QMessageBox.information(self, "Set Parent", "Please select a task.")
+            return
+        tasks = [self.tasks.get(task_id) for task_id in task_ids]
+        parent, ok = self.choose_link("Set Parent", "Make %d selected task(s) subtasks of:" % len(tasks), tasks)
+        if not ok:
+            return
+        try:
+            for task in tasks:
+                self.model.graph.check_parent(task["id"], parent)
+        except CycleError as exc:
+            QMessageBox.warning(self, "Input Error", str(exc))
+            return
+        self.apply_changes([{"op": "update", "id": task["id"], "task": dict(task, **{PARENT: parent})}
+                            for task in tasks if task_parent(task) != parent])
+
+    def set_blocked_by(self):
+        task_ids = self.selected_ids()
+        if not task_ids:
+            QMessageBox.information(self, "Blocked By", "Please select a task.")
+            return
+        tasks = [self.tasks.get(task_id) for task_id in task_ids]
+        blocker, ok = self.choose_link("Blocked By", "%d selected task(s) wait for (or none, to clear):" % len(tasks),
+                                       tasks)
+        if not ok:
+            return
+        try:
+            for task in tasks:
+                self.model.graph.check_blockers(task["id"], [blocker] if blocker else [])
+        except CycleError as exc:
+            QMessageBox.warning(self, "Input Error", str(exc))
+            return
+        records = []
+        for task in tasks:
+            blockers = task_blockers(task)
+            new_blockers = (blockers if blocker in blockers else blockers + [blocker]) if blocker else []
+            if new_blockers != blockers:
+                records.append({"op": "update", "id": task["id"], "task": dict(task, **{BLOCKED_BY: new_blockers})})
+        self.apply_changes(records)
+
+    def arm_reminder(self, when):
+        if when is None:
+            self.due_timer.stop()
+            return
+        delay = max(0.0, when - time.time())
+        self.due_timer.start(min(int(delay * 1000) + 1, MAX_TIMER_MS))
+
+    def remind(self):
+        """Highlight the tasks that just came due and say so in the status bar."""
+        tasks = self.model.advance_due()
+        if tasks:
+            names = ", ".join(task["task"] for task in tasks[:3])
+            more = " and %d more" % (len(tasks) - 3) if len(tasks) > 3 else ""
+            self.status_bar.showMessage("Due: %s%s" % (names, more), REMINDER_MS)
+        # Also when it fired early because the due time was past MAX_TIMER_MS
+        self.arm_reminder(self.model.due.next_due)
+
+    def apply_change(self, record):
+        """Apply a journal-style change record to the view and persist it."""
+        self.apply_changes([record])
+
+    def apply_changes(self, records):
+        """Apply a batch of change records to the view as one update and
+        persist them in one write."""
+        if not records:
+            return
+        if self.loader is not None:
+            # Replayed after the snapshot and its journal, so nothing older lands on top
+            self.pending_changes.extend(records)
+            self.loading_label.setText("Loading tasks... (%d changes waiting)" % len(self.pending_changes))
+            return
+        records = self.show_changes(records)
+        self.model.show_links()
+        self.update_status()
+        if records:
+            self.persistence.submit_many(records)
+
+    def show_changes(self, records):
+        """Apply change records to the view only; returns those that still
+        apply, as they should be persisted. A batch of one kind of change is
+        shown with the model's batch updates."""
+        ops = {record["op"] for record in records}
+        if len(records) == 1:
+            record = self.show_change(records[0])
+            return [record] if record is not None else []
+        if len(ops) > 1:
+            # Each run of one kind of change is still one batch
+            return [record for _, run in itertools.groupby(records, key=lambda record: record["op"])
+                    for record in self.show_changes(list(run))]
+        if ops == {"add"}:
+            tasks = self.model.append_tasks([record["task"] for record in records])
+            return [dict(record, task=task) for record, task in zip(records, tasks)]
+        # The journal may already have deleted some of them
+        records = [record for record in records if self.tasks.get(record["id"]) is not None]
+        if ops == {"delete"}:
+            records = list({record["id"]: record for record in records}.values())
+            self.model.remove_tasks([record["id"] for record in records])
+            return records
+        tasks = self.model.update_tasks([(record["id"], {k: v for k, v in record["task"].items() if k != "id"})
+                                         for record in records])
+        return [dict(record, task=task) for record, task in zip(records, tasks)]
+
+    def show_change(self, record):
+        """Apply a change record to the view only; returns it as it should be
+        persisted, or None if it no longer applies."""
+        op = record["op"]
+        if op != "add" and self.tasks.get(record["id"]) is None:
+            return None  # the journal already deleted it
+        # What gets persisted is the task as the list now holds it (with its
+        # id and normalized priority)
+        if op == "add":
+            return dict(record, task=self.model.append_task(record["task"]))
+        if op == "update":
+            task = self.model.update_task(record["id"], **{k: v for k, v in record["task"].items() if k != "id"})
+            return dict(record, task=task)
+        self.model.remove_task(record["id"])
+        return record
+
+    def merge_changes(self):
+        """Show the changes other windows have saved since the last look."""
+        if self.loader is not None or not self.persistence.idle():
+            return  # our own changes go to disk first, so theirs apply on top
+        records = self.store.changes(self.tasks)
+        if records:
+            self.show_changes(records)
+            self.model.show_links()
+            self.update_status()
+
+    def sort_by_priority(self, descending=None):
+        # The model keeps the view sorted as tasks are added or edited
+        if descending is None:
+            descending = self.descending_check.isChecked()
+        self.model.set_sorted(True, descending)
+        self.descending_check.setChecked(descending)
+        self.save_sort()
+
+    def search_tasks(self, query):
+        self.model.set_query(query)
+
+    def filter_tasks(self, *_):
+        filters = {}
+        tags = parse_tags(self.tag_filter.currentText())
+        if tags:
+            filters["tags"] = tags
+        if self.priority_filter.currentText() != ANY:
+            filters["priority"] = normalize_priority(self.priority_filter.currentText())
+        filters.update(STATUS_FILTERS[self.status_filter.currentText()])
+        self.model.set_filters(filters)
+
+    def list_tags(self):
+        text = self.tag_filter.currentText()
+        self.tag_filter.blockSignals(True)
+        self.tag_filter.clear()
+        self.tag_filter.addItems(self.model.tags())
+        self.tag_filter.setEditText(text)
+        self.tag_filter.blockSignals(False)
 
-    def sort_by_priority(self):
-        priority_order = {"High": 0, "Medium": 1, "Low": 2}
-        self.tasks.sort(key=lambda t: priority_order.get(t["priority"], 3))
-        self.save_tasks()
-        self.refresh_table()
+    def set_sort_descending(self, descending):
+        self.model.set_descending(descending)
+        self.save_sort()
+
+    def restore_sort(self):
+        settings = self.store.load_settings()
+        if settings.get("sort") == "priority":
+            self.sort_by_priority(settings.get("descending", False))
+
+    def save_sort(self):
+        order = self.model.order
+        settings = {"sort": "priority", "descending": order.descending} if order is not None else {}
+        self.store.save_settings(settings)
 
     def refresh_table(self):
-        self.table.setRowCount(0)
-        for task in self.tasks:
-            row = self.table.rowCount()
-            self.table.insertRow(row)
-            self.table.setItem(row, 0, QTableWidgetItem(task["task"]))
-            self.table.setItem(row, 1, QTableWidgetItem(task["priority"]))
-            status = "Complete" if task["completed"] else "Incomplete"
-            item = QTableWidgetItem(status)
-            item.setFlags(item.flags() ^ Qt.ItemIsEditable)
-            self.table.setItem(row, 2, item)
+        self.model.set_tasks(self.tasks)
 
     def load_tasks(self):
-        if os.path.exists(TASKS_FILE):
-            with open(TASKS_FILE, 'r') as f:
-                self.tasks = json.load(f)
-        else:
-            self.tasks = []
+        self.tasks = self.store.load()
+
+    def start_loading(self, defer=False):
+        """Begin streaming tasks in.
+
+        Creating the loader reads nothing. The first slice runs now (so small
+        files are complete before the window shows) unless ``defer`` is set,
+        in which case the caller runs load_more() once the window is painted.
+        """
+        self.loader = self.store.load_batches()
+        if not defer:
+            self.load_more()
+
+    def load_more(self):
+        if self.loader is None:
+            return
+        deadline = time.monotonic() + LOAD_SLICE
+        for batch, done in self.loader:
+            self.model.append_tasks(batch)
+            self.loading_bar.setValue(int(done * 100))
+            if time.monotonic() > deadline:
+                QTimer.singleShot(0, self.load_more)
+                return
+        self.finish_loading()
+
+    def finish_loading(self):
+        """Load whatever is left right away, then apply queued changes."""
+        if self.loader is None:
+            return
+        for batch, done in self.loader:
+            self.model.append_tasks(batch)
+        self.loader = None
+        self.model.reset_around(lambda: self.store.finish_load(self.tasks))
+        self.loading_label.hide()
+        self.loading_bar.hide()
+        pending, self.pending_changes = self.pending_changes, []
+        self.apply_changes(pending)
+        self.archive_completed()
+
+    def archive_completed(self):
+        """Move the tasks completed longer ago than $TASKS_ARCHIVE_DAYS out
+        of the list and into the store's archive."""
+        if self.store.archive is None or self.archive_after is None or self.loader is not None:
+            return
+        self.apply_changes(archive_records(self.store.archive, self.tasks, self.archive_after))
+
+    def show_archive(self):
+        ArchiveDialog(self).exec_()
+
+    def restore_tasks(self, tasks):
+        """Put archived ``tasks`` back in the list, reopened."""
+        records = []
+        for task in tasks:
+            records.append({"op": "add", "task": dict(task, **completion(False))})
+        self.apply_changes(records)
+        # Written to the list before they leave the archive, so a crash cannot lose them
+        self.persistence.flush()
+        self.store.archive.remove([task["id"] for task in tasks])
 
     def save_tasks(self):
-        with open(TASKS_FILE, 'w') as f:
-            json.dump(self.tasks, f, indent=2)
+        self.finish_loading()
+        self.persistence.flush()
+        with self.store.locked():
+            # A full snapshot must not undo what other windows wrote
+            self.merge_changes()
+            self.store.save(self.tasks)
+
+    def on_persist_error(self, message):
+        try:
+            self.save_tasks()
+        except OSError:
+            QMessageBox.critical(self, "Save Error", f"Could not save tasks: {message}")
+
+    def closeEvent(self, event):
+        self.reload_timer.stop()
+        self.archive_timer.stop()
+        self.finish_loading()
+        self.persistence_thread.shutdown()
+        self.store.close()
+        super().closeEvent(event)
 
 def main():
-    app = QApplication(sys.argv)
-    window = TaskManager()
+    argv, _ = task_metrics.configure(sys.argv, TaskManager)
+    argv, startup = task_metrics.startup_profile(argv, STARTED, IMPORTED)
+    app = QApplication(argv)
+    window = TaskManager(defer_load=True)
+    startup.mark("window built")
     window.show()
+    # Paint the empty window before any task data is read
+    app.processEvents()
+    startup.mark("first paint")
+    startup.follow(window, "finish_loading", "tasks loaded", lambda: "%d tasks" % len(window.tasks))
+    window.load_more()
     sys.exit(app.exec_())
 
 if __name__ == "__main__":
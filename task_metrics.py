@@ -0,0 +1,296 @@
+"""
+Opt-in timing and profiling for the Tkinter and PyQt5 task managers.
+
+With ``TASKS_METRICS=1`` (or ``--metrics``) the hot methods of the app and
+its store are wrapped to record a latency histogram per method, plus the
+rows each call worked on and the bytes it wrote; a summary is printed to
+stderr at exit. ``TASKS_PROFILE=FILE`` (or ``--profile FILE``) runs the
+session's GUI thread under cProfile and writes pstats data to FILE.
+``--startup-profile`` reports how long imports, the first paint and the
+initial load took.
+
+Nothing is wrapped unless one of them is asked for, so a normal session runs
+the methods exactly as written.
+"""
+
+import atexit
+import bisect
+import functools
+import os
+import sys
+import threading
+import time
+
+from task_storage import JournalStore, SqliteStore
+
+METRICS_ENV = 'TASKS_METRICS'
+PROFILE_ENV = 'TASKS_PROFILE'
+STARTUP_ENV = 'TASKS_STARTUP_PROFILE'
+BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+def _changes_name(self, records):
+    return "apply_changes.%s" % "+".join(sorted({record["op"] for record in records}))
+
+
+# Method -> how to name its timings (None: the method name). Mutation
+# handlers that ask for confirmation include the time the dialog was open;
+# apply_changes (which apply_change goes through too) is the same mutation
+# without it.
+APP_METHODS = {
+    "load_tasks": None,
+    "save_tasks": None,
+    "finish_loading": None,
+    "merge_changes": None,
+    "refresh_table": None,
+    "refresh_tasks": None,
+    "refresh_task": None,
+    "sort_by_priority": None,
+    "search_tasks": None,
+    "add_task": None,
+    "edit_task": None,
+    "delete_task": None,
+    "toggle_complete": None,
+    "set_priority": None,
+    "add_tasks": None,
+    "apply_changes": _changes_name,
+}
+
+
+def _journal_bytes(store, before, args, result):
+    return max(0, store._journal_size - before)
+
+
+def _snapshot_bytes(store, before, args, result):
+    return os.path.getsize(store.path) if os.path.exists(store.path) else 0
+
+
+def _row_bytes(tasks):
+    # What goes into the table; SQLite's own page writes are not visible here
+    return sum(len(task["task"].encode()) + len(task["priority"]) + len(task.get("id") or "") + 1
+               for task in tasks)
+
+
+# (class, method) -> (rows of a call, bytes it wrote, state to take before the call)
+STORE_METHODS = {
+    (JournalStore, "load"): (lambda store, args, result: len(result), None, None),
+    (JournalStore, "finish_load"): (lambda store, args, result: len(args[0]), None, None),
+    (JournalStore, "save"): (lambda store, args, result: len(args[0]), _snapshot_bytes, None),
+    (JournalStore, "append_many"): (lambda store, args, result: len(args[0]), _journal_bytes,
+                                    lambda store: store._journal_size),
+    (SqliteStore, "load"): (lambda store, args, result: len(result), None, None),
+    (SqliteStore, "finish_load"): (lambda store, args, result: len(args[0]), None, None),
+    (SqliteStore, "save"): (lambda store, args, result: len(args[0]),
+                            lambda store, before, args, result: _row_bytes(args[0]), None),
+    (SqliteStore, "append_many"): (lambda store, args, result: len(args[0]),
+                                   lambda store, before, args, result: _row_bytes(
+                                       [r["task"] for r in args[0] if "task" in r]), None),
+}
+
+
+class Histogram:
+    """Call latencies in fixed buckets (upper bounds in BUCKETS_MS)."""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, ms):
+        self.counts[bisect.bisect_left(BUCKETS_MS, ms)] += 1
+        self.calls += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+
+    def percentile(self, fraction):
+        """Upper bound of the bucket holding the given fraction of calls."""
+        wanted = fraction * self.calls
+        seen = 0
+        for bound, count in zip(BUCKETS_MS + (self.max,), self.counts):
+            seen += count
+            if seen >= wanted:
+                return min(bound, self.max)
+        return self.max
+
+
+class Metrics:
+    """Latency histograms, row counts and bytes written, per method."""
+
+    def __init__(self):
+        self.histograms = {}
+        self.rows = {}
+        self.bytes = {}
+        self._wrapped = []  # (class, method name, original) for uninstrument()
+        self._lock = threading.Lock()  # stores are written from the persistence thread
+
+    def record(self, name, seconds, rows=None, nbytes=0):
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+                self.rows[name] = 0
+                self.bytes[name] = 0
+            histogram.add(seconds * 1000)
+            if rows is not None:
+                self.rows[name] = max(self.rows[name], rows)
+            self.bytes[name] += nbytes
+
+    def instrument(self, cls, method_name, name=None, rows=None, nbytes=None, before=None):
+        """Replace ``cls.method_name`` with a timed wrapper.
+
+        ``name(self, *args)`` names the timing, ``rows(self, args, result)``
+        counts the rows of a call and ``nbytes(self, state, args, result)``
+        the bytes it wrote, where ``state`` is ``before(self)`` taken just
+        before the call.
+        """
+        import inspect
+        method = getattr(cls, method_name)
+        code = method.__code__
+        # Qt calls slots with as many signal arguments as they take, so take no more than the original
+        max_args = None if code.co_flags & inspect.CO_VARARGS else code.co_argcount
+        record = self.record
+
+        @functools.wraps(method)
+        def timed(self, *args, **kwargs):
+            if max_args is not None:
+                args = args[:max_args - 1]
+            state = before(self) if before is not None else None
+            start = time.perf_counter()
+            result = method(self, *args, **kwargs)
+            elapsed = time.perf_counter() - start
+            if rows is not None:
+                count = rows(self, args, result)
+            else:
+                tasks = getattr(self, "tasks", None)
+                count = len(tasks) if tasks is not None else None
+            written = nbytes(self, state, args, result) if nbytes is not None else 0
+            record(name(self, *args) if name is not None else method_name, elapsed, count, written)
+            return result
+
+        self._wrapped.append((cls, method_name, cls.__dict__[method_name]))
+        setattr(cls, method_name, timed)
+
+    def uninstrument(self):
+        """Put back every method instrument() replaced."""
+        while self._wrapped:
+            cls, method_name, original = self._wrapped.pop()
+            setattr(cls, method_name, original)
+
+    def summary(self):
+        lines = ["Task manager metrics (ms; p50/p95 are histogram bucket bounds)",
+                 "%-24s %7s %9s %8s %8s %9s %9s %11s" % ("method", "calls", "mean", "p50", "p95", "max", "max rows", "bytes")]
+        with self._lock:
+            for name in sorted(self.histograms, key=lambda n: -self.histograms[n].total):
+                h = self.histograms[name]
+                lines.append("%-24s %7d %9.2f %8.2f %8.2f %9.2f %9d %11d" % (
+                    name, h.calls, h.total / h.calls, h.percentile(0.5), h.percentile(0.95),
+                    h.max, self.rows[name], self.bytes[name]))
+        return "\n".join(lines)
+
+
+class StartupProfile:
+    """Startup milestones, in ms since the app module began importing.
+
+    When not enabled every method returns at once, so the startup path can
+    call them unconditionally.
+    """
+
+    def __init__(self, started, imported, enabled=True, file=None):
+        self.started = started
+        self.enabled = enabled
+        self.file = file
+        self.marks = [("imports", imported, "")]
+        self.reported = False
+
+    def mark(self, label, note=""):
+        if self.enabled:
+            self.marks.append((label, time.perf_counter(), note))
+
+    def follow(self, obj, method_name, label, note=None):
+        """Mark ``label`` and report when ``obj.method_name`` first returns.
+
+        ``note()``, if given, adds detail to the line (such as a task count).
+        """
+        if not self.enabled:
+            return
+        method = getattr(obj, method_name)
+
+        def marked(*args, **kwargs):
+            result = method(*args, **kwargs)
+            delattr(obj, method_name)  # back to the class's method
+            self.mark(label, note() if note is not None else "")
+            self.report()
+            return result
+        setattr(obj, method_name, marked)
+        # Report whatever was reached if the app exits first
+        atexit.register(self.report)
+
+    def report(self):
+        if not self.enabled or self.reported:
+            return
+        self.reported = True
+        lines = ["Startup profile (ms since the app module started importing)"]
+        previous = self.started
+        for label, at, note in self.marks:
+            lines.append("  %-14s %9.1f %+10.1f  %s" % (label, (at - self.started) * 1000,
+                                                       (at - previous) * 1000, note))
+            previous = at
+        print("\n".join(line.rstrip() for line in lines), file=self.file or sys.stderr)
+
+
+def startup_profile(argv, started, imported, environ=os.environ):
+    """Pick up --startup-profile (or $TASKS_STARTUP_PROFILE); returns argv
+    without it, and a StartupProfile that is only enabled when asked for."""
+    argv = list(argv)
+    enabled = environ.get(STARTUP_ENV, "").lower() not in ("", "0", "false", "no")
+    if "--startup-profile" in argv:
+        argv.remove("--startup-profile")
+        enabled = True
+    return argv, StartupProfile(started, imported, enabled)
+
+
+def configure(argv, app_class, environ=os.environ):
+    """Turn on what the environment or ``argv`` asks for.
+
+    ``app_class`` is the frontend whose APP_METHODS get timed. Returns argv
+    without the --metrics / --profile options, and the Metrics in use (None
+    when off).
+    """
+    argv = list(argv)
+    enabled = environ.get(METRICS_ENV, "").lower() not in ("", "0", "false", "no")
+    profile_path = environ.get(PROFILE_ENV) or None
+    if "--metrics" in argv:
+        argv.remove("--metrics")
+        enabled = True
+    if "--profile" in argv:
+        at = argv.index("--profile")
+        if at + 1 >= len(argv):
+            raise SystemExit("--profile needs a file name")
+        profile_path = argv[at + 1]
+        del argv[at:at + 2]
+
+    metrics = None
+    if enabled:
+        metrics = Metrics()
+        for method_name, name in APP_METHODS.items():
+            if hasattr(app_class, method_name):
+                metrics.instrument(app_class, method_name, name=name)
+        for (cls, method_name), (rows, nbytes, before) in STORE_METHODS.items():
+            label = "%s.%s" % (cls.__name__, method_name)
+            metrics.instrument(cls, method_name, name=lambda self, *args, label=label: label,
+                               rows=rows, nbytes=nbytes, before=before)
+        # Registered before the app's own exit hooks, so it runs after their final writes
+        atexit.register(lambda: print(metrics.summary(), file=sys.stderr))
+    if profile_path:
+        import cProfile
+        profiler = cProfile.Profile()
+
+        def write_profile():
+            profiler.disable()
+            profiler.dump_stats(profile_path)
+            print("Profile written to %s (view with: python -m pstats %s)" % (profile_path, profile_path),
+                  file=sys.stderr)
+        atexit.register(write_profile)
+        profiler.enable()
+    return argv, metrics
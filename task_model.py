@@ -0,0 +1,696 @@
+"""
+In-memory task collection shared by the Tkinter and PyQt5 task managers.
+
+Tasks are Task objects: slotted records that read and write like the JSON
+dicts they are stored as, at a fraction of the memory. Every task carries a
+persistent ``"id"``. TaskList keeps the tasks in display
+order together with an id -> task index, so the frontends, the storage layer
+and anything syncing with them can address a task in O(1) instead of by its
+position in the list.
+
+Other indexes (such as SortedOrder) register as listeners on a TaskList and
+are told about every add, update and removal, so they never need a full scan
+to stay current.
+"""
+
+import bisect
+import heapq
+import os
+import sys
+import time
+from collections.abc import MutableMapping
+
+PRIORITY_LEVELS = ("Low", "Medium", "High")
+NO_PRIORITY = ""  # how "no priority" is stored, in memory and on disk
+NO_PRIORITY_LABEL = "None"  # and how it is shown
+PRIORITY_RANK = {"High": 0, "Medium": 1, "Low": 2}
+FIELDS = ("task", "priority", "completed", "id")
+COMPLETED_AT = "completed_at"  # when a completed task was completed, in seconds since the epoch
+DUE = "due"  # when a task is due, in seconds since the epoch; optional
+TAGS = "tags"  # a task's tags (projects, contexts...), as a list of strings; optional
+DUE_FORMATS = ("%Y-%m-%d %H:%M", "%Y-%m-%d")  # what parse_due() accepts, and due_label() shows
+REPEAT = "repeat"  # a recurring task's rule, as parse_repeat() spells it; the task's due time is its current occurrence
+SERIES = "series"  # on a completed occurrence of a recurring task, the id of that task
+REPEAT_DAY = "repeat_day"  # on a monthly task moved to a short month's last day, the day of the month it repeats on
+REPEAT_UNITS = {"day": 1, "week": 7, "month": None}  # days per step; months vary
+_REPEAT_NAMES = {"daily": "day", "weekly": "week", "monthly": "month"}
+_CANONICAL_PRIORITIES = {level.casefold(): level for level in PRIORITY_LEVELS}
+_CANONICAL_PRIORITIES.update({"": NO_PRIORITY, NO_PRIORITY_LABEL.casefold(): NO_PRIORITY})
+_STORED_PRIORITIES = {level: level for level in PRIORITY_LEVELS + (NO_PRIORITY,)}
+
+
+def new_task_id():
+    # What secrets.token_hex(8) does, without importing secrets at startup
+    return os.urandom(8).hex()
+
+
+def priority_key(task):
+    return PRIORITY_RANK.get(task["priority"], 3)
+
+
+def normalize_priority(priority):
+    """The one spelling of ``priority`` used everywhere.
+
+    Known levels map to the shared constants and both "" and "None" (what
+    the Tkinter app used to write) mean no priority. Anything else is kept
+    as it is, interned so that equal strings are stored once.
+    """
+    canonical = _STORED_PRIORITIES.get(priority)  # already in stored form: the usual case
+    if canonical is not None:
+        return canonical
+    if priority is None:
+        return NO_PRIORITY
+    canonical = _CANONICAL_PRIORITIES.get(priority.casefold())
+    return canonical if canonical is not None else sys.intern(priority)
+
+
+def priority_label(priority):
+    return priority or NO_PRIORITY_LABEL
+
+
+def completion(completed, now=None):
+    """The fields that mark a task completed (stamped with when, for the
+    archive) or not completed (stamp cleared)."""
+    if not completed:
+        return {"completed": False, COMPLETED_AT: None}
+    return {"completed": True, COMPLETED_AT: time.time() if now is None else now}
+
+
+def parse_due(text):
+    """A due time from "YYYY-MM-DD HH:MM" or "YYYY-MM-DD" (the end of that
+    day) in local time; None for a blank ``text``. Raises ValueError for
+    anything else."""
+    text = text.strip()
+    if not text:
+        return None
+    for layout in DUE_FORMATS:
+        try:
+            parsed = time.strptime(text, layout)
+        except ValueError:
+            continue
+        if layout == DUE_FORMATS[-1]:
+            parsed = parsed[:3] + (23, 59) + parsed[5:]
+        return time.mktime(parsed)
+    raise ValueError("Due date must look like 2024-05-31 or 2024-05-31 17:00, not %r" % text)
+
+
+def due_label(due):
+    return time.strftime(DUE_FORMATS[0], time.localtime(due)) if due is not None else ""
+
+
+def parse_repeat(text):
+    """A recurrence rule from "daily", "weekly", "monthly" or "every N
+    days/weeks/months", spelled the way it is stored; None for a blank
+    ``text``. Raises ValueError for anything else."""
+    words = text.strip().lower().split()
+    if not words:
+        return None
+    if len(words) == 1 and words[0] in _REPEAT_NAMES:
+        return words[0]
+    if len(words) == 3 and words[0] == "every" and words[1].isdigit() and int(words[1]) > 0 \
+            and words[2].rstrip("s") in REPEAT_UNITS:
+        count, unit = int(words[1]), words[2].rstrip("s")
+        if count == 1:
+            return next(name for name, named in _REPEAT_NAMES.items() if named == unit)
+        return "every %d %ss" % (count, unit)
+    raise ValueError("Repeat must be daily, weekly, monthly or like 'every 2 weeks', not %r" % text)
+
+
+def _repeat_step(repeat):
+    # (count, unit) of a stored rule
+    if repeat in _REPEAT_NAMES:
+        return 1, _REPEAT_NAMES[repeat]
+    _, count, unit = repeat.split()
+    return int(count), unit.rstrip("s")
+
+
+def _shift(due, count, unit, day=None):
+    # ``due`` moved on by ``count`` units in local time, so the hour survives
+    # DST changes. Months land on ``day`` (by default the day ``due`` is on),
+    # or on the last day of a month too short for it
+    year, month, mday, hour, minute = time.localtime(due)[:5]
+    if unit == "month":
+        import calendar  # only monthly repeats pay for the import
+        year, month = divmod(year * 12 + month - 1 + count, 12)
+        month += 1
+        mday = min(day or mday, calendar.monthrange(year, month)[1])
+    else:
+        mday += count * REPEAT_UNITS[unit]
+    return time.mktime((year, month, mday, hour, minute, 0, 0, 0, -1))
+
+
+def next_occurrence(repeat, due, day=None):
+    """The occurrence of rule ``repeat`` that follows the one at ``due``;
+    ``day`` is the day of the month a monthly rule repeats on (see
+    repeat_day()), if not the one ``due`` is on."""
+    count, unit = _repeat_step(repeat)
+    return _shift(due, count, unit, day)
+
+
+def occurrences(repeat, due, start, end, day=None):
+    """Yield the occurrences of rule ``repeat`` (counting from ``due``, and
+    on ``day`` as for next_occurrence()) that fall in [start, end), one at a
+    time. Each is counted from ``due`` itself, so a month too short for the
+    day does not pull the ones after it in, and the steps before ``start``
+    are skipped with arithmetic: the cost follows the window, not how far
+    off it is."""
+    count, unit = _repeat_step(repeat)
+    steps = 0
+    if due < start:
+        # An estimate that stays short of start; the loop below covers the rest
+        days = (start - due) / 86400
+        steps = int(days / (count * REPEAT_UNITS[unit])) if unit != "month" else int(days / (count * 31))
+        steps = max(steps - 1, 0)
+    when = _shift(due, count * steps, unit, day) if steps else due
+    while when < end:
+        if when >= start:
+            yield when
+        steps += 1
+        when = _shift(due, count * steps, unit, day)
+
+
+def repeat_day(task):
+    """The day of the month the occurrences of recurring ``task`` fall on:
+    the day it is due, unless that is the end of a month too short for the
+    ``REPEAT_DAY`` it was moved off."""
+    due = task[DUE]
+    day = task.get(REPEAT_DAY)
+    year, month, mday = time.localtime(due)[:3]
+    if not isinstance(day, int) or day <= mday:
+        return mday
+    import calendar
+    return day if mday == calendar.monthrange(year, month)[1] else mday
+
+
+def task_repeat(task):
+    """The recurrence rule of ``task``, or None if it does not recur (or has
+    no due time to count from)."""
+    extra = task.extra if isinstance(task, Task) else task
+    if not extra or extra.get(DUE) is None:
+        return None
+    try:
+        return parse_repeat(extra.get(REPEAT) or "")
+    except (ValueError, AttributeError):
+        return None
+
+
+def completion_records(tasks, completed, now=None):
+    """The change records that complete (or reopen) ``tasks``, leaving out
+    those already so.
+
+    Completing a recurring task completes just its current occurrence: that
+    is added as a completed task of its own (``SERIES`` names the rule it
+    came from) and the recurring task moves on to its next due time. The
+    occurrences after it never exist until they are completed in turn.
+    """
+    stamp = completion(completed, now)
+    records = []
+    for task in tasks:
+        if task["completed"] == completed:
+            continue
+        repeat = task_repeat(task) if completed else None
+        if repeat is None:
+            records.append({"op": "update", "id": task["id"], "task": dict(task, **stamp)})
+            continue
+        done = {"task": task["task"], "priority": task["priority"], DUE: task[DUE], SERIES: task["id"]}
+        tags = task_tags(task)
+        if tags:
+            done[TAGS] = tags
+        done.update(stamp)
+        records.append({"op": "add", "task": done})
+        day = repeat_day(task)
+        moved = dict(task, **{DUE: next_occurrence(repeat, task[DUE], day)})
+        if day != time.localtime(moved[DUE]).tm_mday and _repeat_step(repeat)[1] == "month":
+            moved[REPEAT_DAY] = day  # clamped to a short month: remember the day to go back to
+        records.append({"op": "update", "id": task["id"], "task": moved})
+    return records
+
+
+def parse_tags(text):
+    """Tags from comma-separated ``text``, stripped, without blanks or repeats."""
+    return list(dict.fromkeys(tag.strip() for tag in text.split(",") if tag.strip()))
+
+
+def task_tags(task):
+    """The tags of ``task`` as a list, whatever was stored."""
+    extra = task.extra if isinstance(task, Task) else task
+    tags = extra.get(TAGS) if extra else None
+    if isinstance(tags, str):
+        return parse_tags(tags)
+    if isinstance(tags, list):
+        return [tag for tag in tags if isinstance(tag, str)]
+    return []
+
+
+def tags_label(tags):
+    return ", ".join(tags)
+
+
+def as_task(task):
+    return task if isinstance(task, Task) else Task.from_dict(task)
+
+
+class Task(MutableMapping):
+    """One task, in slots rather than a dict.
+
+    It reads and writes like the JSON object it is stored as, so
+    ``task["priority"]``, ``dict(task, completed=True)`` and json (through
+    ``dict(task)``) keep working. Keys this version does not know are kept
+    in ``extra`` and written back unchanged.
+    """
+
+    __slots__ = ("text", "priority", "completed", "id", "extra")
+
+    def __init__(self, text="", priority=NO_PRIORITY, completed=False, id=None, extra=None):
+        self.text = text
+        self.priority = normalize_priority(priority)
+        self.completed = completed
+        self.id = id
+        self.extra = extra  # dict of unknown keys, or None
+
+    @classmethod
+    def from_dict(cls, data):
+        extra = {key: value for key, value in data.items() if key not in FIELDS}
+        return cls(data.get("task", ""), data.get("priority"), data.get("completed", False),
+                   data.get("id"), extra or None)
+
+    def __getitem__(self, key):
+        if key == "task":
+            return self.text
+        if key == "priority":
+            return self.priority
+        if key == "completed":
+            return self.completed
+        if key == "id" and self.id is not None:
+            return self.id
+        if self.extra is not None and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key == "task":
+            self.text = value
+        elif key == "priority":
+            self.priority = normalize_priority(value)
+        elif key == "completed":
+            self.completed = value
+        elif key == "id":
+            self.id = value
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def __delitem__(self, key):
+        if key == "id" and self.id is not None:
+            self.id = None
+        elif self.extra is not None and key in self.extra:
+            del self.extra[key]
+        elif key in FIELDS:
+            raise TypeError("%r is required" % key)
+        else:
+            raise KeyError(key)
+
+    def __iter__(self):
+        yield "task"
+        yield "priority"
+        yield "completed"
+        if self.id is not None:
+            yield "id"
+        if self.extra:
+            yield from self.extra
+
+    def __len__(self):
+        return 3 + (self.id is not None) + len(self.extra or ())
+
+    def __repr__(self):
+        return "Task(%r)" % (dict(self),)
+
+
+class TaskList:
+    """Tasks in order plus an index from task id to task.
+
+    Reads behave like a list of task dicts. Changes go through add(),
+    update() and remove() so the index stays in step. Row numbers are cached
+    per id and only repaired (lazily, from the first affected row) after a
+    removal or reorder.
+
+    Listeners implement task_added(task), tasks_extended(tasks) for a bulk
+    append, task_updated(task, old) where ``old`` holds the previous values of
+    the fields that changed, and task_removed(task).
+    """
+
+    def __init__(self, tasks=None):
+        self._tasks = tasks if isinstance(tasks, list) else list(tasks or [])
+        self._by_id = {}
+        self._rows = {}
+        self._rows_valid = 0  # cached rows below this are known to be right
+        self.assigned_ids = 0  # tasks that arrived without an id
+        self.listeners = []
+        for row, task in enumerate(self._tasks):
+            self._tasks[row] = task = as_task(task)
+            self._index(task)
+
+    def __len__(self):
+        return len(self._tasks)
+
+    def __iter__(self):
+        return iter(self._tasks)
+
+    def __getitem__(self, row):
+        return self._tasks[row]
+
+    def __eq__(self, other):
+        if isinstance(other, TaskList):
+            other = other._tasks
+        return self._tasks == other
+
+    def __repr__(self):
+        return "TaskList(%r)" % (self._tasks,)
+
+    def get(self, task_id):
+        return self._by_id.get(task_id)
+
+    def ids(self):
+        return [task["id"] for task in self._tasks]
+
+    def row_of(self, task_id):
+        if task_id not in self._by_id:
+            raise KeyError(task_id)
+        row = self._rows.get(task_id)
+        if row is None or row >= self._rows_valid or self._tasks[row]["id"] != task_id:
+            # Only as far as the task, so removing many tasks in list order
+            # rescans each stretch of rows once rather than the rest of the
+            # list; rows left over from before a reorder fail the check above
+            for row in range(self._rows_valid, len(self._tasks)):
+                found = self._tasks[row]["id"]
+                self._rows[found] = row
+                if found == task_id:
+                    break
+            self._rows_valid = row + 1
+        return row
+
+    def add(self, task):
+        """Append a task (a Task or a dict), giving it an id if it has none;
+        returns the Task now in the list."""
+        task = as_task(task)
+        self._index(task)
+        self._tasks.append(task)
+        if self._rows_valid == len(self._tasks) - 1:
+            self._rows[task["id"]] = self._rows_valid
+            self._rows_valid += 1
+        for listener in self.listeners:
+            listener.task_added(task)
+        return task
+
+    def extend(self, tasks):
+        """Append many tasks, telling listeners about them all at once;
+        returns the Tasks now in the list."""
+        start = len(self._tasks)
+        for task in tasks:
+            task = as_task(task)
+            self._index(task)
+            self._tasks.append(task)
+        added = self._tasks[start:]
+        for listener in self.listeners:
+            listener.tasks_extended(added)
+        return added
+
+    def update(self, task_id, **changes):
+        task = self._by_id[task_id]
+        old = {field: task.get(field) for field, value in changes.items() if task.get(field) != value}
+        task.update(changes)
+        if old:
+            for listener in self.listeners:
+                listener.task_updated(task, old)
+        return task
+
+    def remove(self, task_id):
+        """Remove a task by id; returns (row, task)."""
+        row = self.row_of(task_id)
+        task = self._tasks.pop(row)
+        del self._by_id[task_id]
+        del self._rows[task_id]
+        self._rows_valid = min(self._rows_valid, row)
+        for listener in self.listeners:
+            listener.task_removed(task)
+        return row, task
+
+    def sort(self, key):
+        self._tasks.sort(key=key)
+        self._rows_valid = 0
+
+    def _index(self, task):
+        if task.id is None or task.id in self._by_id:
+            task.id = new_task_id()
+            self.assigned_ids += 1
+        self._by_id[task.id] = task
+
+
+class SortedOrder:
+    """A view order over a TaskList: priority, then status, then casefolded
+    title, then creation order, optionally reversed.
+
+    It listens to the list, so adding, editing or removing a task costs one
+    binary search (plus a memmove of the sorted array) instead of a re-sort.
+    Rows here are view rows, which differ from rows in the TaskList.
+    """
+
+    def __init__(self, tasks, descending=False):
+        self.tasks = tasks
+        self.descending = descending
+        self._entries = []
+        self._entry_of = {}
+        # Stored order is creation order; keep it as the final tie-breaker
+        self._next_seq = 0
+        for task in tasks:
+            self._entry_of[task["id"]] = self._make_entry(task, self._take_seq())
+        self._entries = sorted(self._entry_of.values())
+        tasks.listeners.append(self)
+
+    def detach(self):
+        self.tasks.listeners.remove(self)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def id_at(self, row):
+        return self._entries[self._index(row)][-1]
+
+    def ids(self):
+        ids = [entry[-1] for entry in self._entries]
+        return ids[::-1] if self.descending else ids
+
+    def row_of(self, task_id):
+        return self._index(bisect.bisect_left(self._entries, self._entry_of[task_id]))
+
+    def row_for_new(self, task):
+        """View row a task about to be added will land on."""
+        pos = bisect.bisect_left(self._entries, self._make_entry(task, self._next_seq))
+        return len(self._entries) - pos if self.descending else pos
+
+    def row_after_update(self, task_id, changes):
+        """View row ``task_id`` will move to once ``changes`` are applied."""
+        old = self._entry_of[task_id]
+        new = self._make_entry(dict(self.tasks.get(task_id), **changes), old[-2])
+        pos = bisect.bisect_left(self._entries, new)
+        if pos > bisect.bisect_left(self._entries, old):
+            pos -= 1
+        return self._index(pos)
+
+    def affected_by(self, task_id, changes):
+        """Whether ``changes`` would change where ``task_id`` sorts at all."""
+        old = self._entry_of[task_id]
+        return self._make_entry(dict(self.tasks.get(task_id), **changes), old[-2]) != old
+
+    def task_added(self, task):
+        entry = self._make_entry(task, self._take_seq())
+        self._entry_of[task["id"]] = entry
+        bisect.insort(self._entries, entry)
+
+    def tasks_extended(self, tasks):
+        for task in tasks:
+            self._entry_of[task["id"]] = self._make_entry(task, self._take_seq())
+        # The existing entries are one sorted run, so timsort only sorts the new ones and merges
+        self._entries.extend(self._entry_of[task["id"]] for task in tasks)
+        self._entries.sort()
+
+    def task_updated(self, task, old):
+        previous = self._entry_of[task["id"]]
+        entry = self._make_entry(task, previous[-2])
+        if entry != previous:
+            del self._entries[bisect.bisect_left(self._entries, previous)]
+            bisect.insort(self._entries, entry)
+            self._entry_of[task["id"]] = entry
+
+    def task_removed(self, task):
+        entry = self._entry_of.pop(task["id"])
+        del self._entries[bisect.bisect_left(self._entries, entry)]
+
+    def _index(self, pos):
+        # Maps a position in the ascending array to a view row and back
+        return len(self._entries) - 1 - pos if self.descending else pos
+
+    def _take_seq(self):
+        self._next_seq += 1
+        return self._next_seq - 1
+
+    @staticmethod
+    def _make_entry(task, seq):
+        return (priority_key(task), bool(task["completed"]), task["task"].casefold(), seq, task.get("id"))
+
+
+class TaskCounts:
+    """How many tasks there are per priority and status.
+
+    It listens to a TaskList like SortedOrder does, so every add, edit,
+    toggle or removal adjusts at most two counters instead of recounting.
+    check() recounts from a full scan, for tests and debugging.
+    """
+
+    def __init__(self, tasks):
+        self.tasks = tasks
+        self._counts = {}
+        self.tasks_extended(tasks)
+        tasks.listeners.append(self)
+
+    def detach(self):
+        self.tasks.listeners.remove(self)
+
+    def count(self, priority=None, completed=None):
+        """Tasks with ``priority`` and ``completed``; None matches any."""
+        return sum(n for (p, c), n in self._counts.items()
+                   if (priority is None or p == priority) and (completed is None or c == completed))
+
+    def counts(self):
+        """{(priority, completed): count}, leaving out empty combinations."""
+        return {key: n for key, n in self._counts.items() if n}
+
+    def summary(self):
+        """One line for a status bar: totals, then open/complete per priority."""
+        done = self.count(completed=True)
+        total = len(self.tasks)
+        parts = ["%d tasks: %d open, %d complete" % (total, total - done, done)]
+        priorities = {priority for priority, _ in self.counts()}
+        for priority in sorted(priorities, key=lambda p: (PRIORITY_RANK.get(p, 3), p == NO_PRIORITY, p)):
+            parts.append("%s %d/%d" % (priority_label(priority), self._counts.get((priority, False), 0),
+                                       self._counts.get((priority, True), 0)))
+        if len(parts) > 1:
+            parts.append("(open/complete)")
+        return "   ".join(parts)
+
+    def check(self):
+        """Recount from scratch and raise AssertionError if the counters drifted."""
+        expected = {}
+        for task in self.tasks:
+            key = (task["priority"], bool(task["completed"]))
+            expected[key] = expected.get(key, 0) + 1
+        if expected != self.counts():
+            raise AssertionError("task counts %r do not match a full scan %r" % (self.counts(), expected))
+
+    def task_added(self, task):
+        self._adjust(task["priority"], task["completed"], 1)
+
+    def tasks_extended(self, tasks):
+        counts = self._counts
+        for task in tasks:
+            key = (task.priority, bool(task.completed))
+            counts[key] = counts.get(key, 0) + 1
+
+    def task_updated(self, task, old):
+        if "priority" in old or "completed" in old:
+            self._adjust(old.get("priority", task["priority"]), old.get("completed", task["completed"]), -1)
+            self._adjust(task["priority"], task["completed"], 1)
+
+    def task_removed(self, task):
+        self._adjust(task["priority"], task["completed"], -1)
+
+    def _adjust(self, priority, completed, delta):
+        key = (priority, bool(completed))
+        self._counts[key] = self._counts.get(key, 0) + delta
+
+
+class DueSchedule:
+    """The due times of the open tasks in a TaskList, in a min-heap.
+
+    The frontends keep a single timer armed for the earliest due time (see
+    ``on_next``) rather than polling every task; when it fires, advance()
+    moves what has come due into ``overdue``. Like SortedOrder it listens to
+    the list, so an add or edit pushes one heap entry in O(log n). Entries
+    for tasks since edited, completed or removed are skipped when they reach
+    the top instead of being searched for.
+
+    ``on_next(when)`` is called with the earliest due time still ahead (or
+    None when there is none) whenever it changes; ``when`` may already be
+    past, in which case the timer should fire right away.
+    """
+
+    def __init__(self, tasks, on_next=None):
+        self.tasks = tasks
+        self.on_next = on_next
+        self.overdue = set()  # ids of open tasks whose due time has passed
+        self.next_due = None
+        self._due = {}  # task id -> due time, for open tasks that have one
+        self._heap = []
+        self.tasks_extended(tasks)
+        tasks.listeners.append(self)
+
+    def detach(self):
+        self.tasks.listeners.remove(self)
+
+    def advance(self, now=None):
+        """Mark the tasks due by ``now`` overdue; returns the ids newly overdue."""
+        now = time.time() if now is None else now
+        newly = []
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            due, task_id = heapq.heappop(heap)
+            if self._due.get(task_id) == due and task_id not in self.overdue:
+                self.overdue.add(task_id)
+                newly.append(task_id)
+        self._next()
+        return newly
+
+    def task_added(self, task):
+        self._track(task)
+        self._next()
+
+    def tasks_extended(self, tasks):
+        for task in tasks:
+            self._track(task)
+        self._next()
+
+    def task_updated(self, task, old):
+        if DUE in old or "completed" in old:
+            self._untrack(task.id)
+            self._track(task)
+            self._next()
+
+    def task_removed(self, task):
+        self._untrack(task.id)
+        self._next()
+
+    def _track(self, task):
+        # Straight from the slots: this runs for every task loaded
+        due = task.extra.get(DUE) if task.extra else None
+        if isinstance(due, (int, float)) and not task.completed:
+            self._due[task.id] = due
+            heapq.heappush(self._heap, (due, task.id))
+
+    def _untrack(self, task_id):
+        self._due.pop(task_id, None)
+        self.overdue.discard(task_id)
+
+    def _next(self):
+        heap = self._heap
+        while heap and (self._due.get(heap[0][1]) != heap[0][0] or heap[0][1] in self.overdue):
+            heapq.heappop(heap)
+        if len(heap) > 2 * len(self._due) + 64:
+            # Mostly skipped entries: rebuild from what is still live
+            self._heap = heap = [(due, task_id) for task_id, due in self._due.items() if task_id not in self.overdue]
+            heapq.heapify(heap)
+        next_due = heap[0][0] if heap else None
+        if next_due != self.next_due:
+            self.next_due = next_due
+            if self.on_next is not None:
+                self.on_next(next_due)
@@ -0,0 +1,229 @@
+"""
+Search-as-you-type over task text for the Tkinter and PyQt5 task managers.
+
+A SearchIndex keeps two inverted indexes over the casefolded words of every
+task: word -> task ids (with a sorted vocabulary for prefix ranges) and
+trigram -> words (for typo-tolerant matches). It listens to a TaskList, so an
+add, edit or delete only re-indexes that one task, and a query only touches
+the words it can match instead of scanning every task.
+
+A FilterIndex does the same for tags, priority and status: one set of task
+ids per value, so a filter such as "tag A and High and incomplete" is a set
+intersection.
+"""
+
+import bisect
+import re
+from collections import Counter
+from task_model import TAGS, task_tags
+
+TOKEN_RE = re.compile(r"\w+")
+EXACT_SCORE = 3.0
+FUZZY_THRESHOLD = 0.4  # minimum trigram (Dice) similarity for a fuzzy match
+FUZZY_MIN_LENGTH = 3  # shorter query words only match exactly or by prefix
+BROAD_FRACTION = 16  # results above 1/16 of all tasks are ordered by a scan
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.casefold())
+
+
+def trigrams(word):
+    padded = "$" + word + "$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def in_order(task_ids, order):
+    """The ids in the set ``task_ids`` as they come in ``order`` (a TaskList
+    or SortedOrder)."""
+    if len(task_ids) * BROAD_FRACTION < len(order):
+        return sorted(task_ids, key=order.row_of)
+    # One pass over the order is cheaper than a row lookup per id
+    return [task_id for task_id in order.ids() if task_id in task_ids]
+
+
+class SearchIndex:
+    """Word and trigram index over the ``"task"`` text of a TaskList.
+
+    Every query word must match some word of a task, exactly, as a prefix or
+    fuzzily. Results are ranked by how well they match: exact words first,
+    then prefixes of short words, then near misses.
+    """
+
+    def __init__(self, tasks):
+        self.tasks = tasks
+        self._words_of = {}  # task id -> distinct words in its text
+        self._postings = {}  # word -> ids of tasks containing it
+        self._grams = {}  # trigram -> words containing it
+        for task in tasks:
+            words = set(tokenize(task["task"]))
+            self._words_of[task["id"]] = words
+            for word in words:
+                self._postings.setdefault(word, set()).add(task["id"])
+        self._vocabulary = sorted(self._postings)
+        for word in self._vocabulary:
+            for gram in trigrams(word):
+                self._grams.setdefault(gram, set()).add(word)
+        tasks.listeners.append(self)
+
+    def detach(self):
+        self.tasks.listeners.remove(self)
+
+    def search(self, query, order=None):
+        """Ids of the tasks matching ``query``, best first.
+
+        Equal scores keep their place in ``order`` (a TaskList or
+        SortedOrder), which defaults to the stored order.
+        """
+        scores = None
+        for term in tokenize(query):
+            matches = self._match(term)
+            if scores is None:
+                scores = matches
+            else:
+                if len(matches) < len(scores):
+                    scores, matches = matches, scores
+                scores = {i: score + matches[i] for i, score in scores.items() if i in matches}
+            if not scores:
+                return []
+        if scores is None:
+            return []
+        ranked = in_order(scores, self.tasks if order is None else order)
+        ranked.sort(key=scores.__getitem__, reverse=True)  # stable, so ties keep their order
+        return ranked
+
+    def task_added(self, task):
+        self._index(task["id"], task["task"])
+
+    def tasks_extended(self, tasks):
+        for task in tasks:
+            self._index(task["id"], task["task"])
+
+    def task_updated(self, task, old):
+        if "task" in old:
+            self._unindex(task["id"])
+            self._index(task["id"], task["task"])
+
+    def task_removed(self, task):
+        self._unindex(task["id"])
+
+    def _match(self, term):
+        """Best score of ``term`` against each task that matches it at all."""
+        scored = []
+        vocabulary = self._vocabulary
+        pos = bisect.bisect_left(vocabulary, term)
+        while pos < len(vocabulary) and vocabulary[pos].startswith(term):
+            word = vocabulary[pos]
+            # Shorter completions rank higher; all of them below an exact word
+            scored.append((EXACT_SCORE if word == term else 1 + len(term) / len(word), word))
+            pos += 1
+        if len(term) >= FUZZY_MIN_LENGTH:
+            grams = trigrams(term)
+            shared = Counter()
+            for gram in grams:
+                shared.update(self._grams.get(gram, ()))
+            for word, count in shared.items():
+                similarity = 2 * count / (len(grams) + len(trigrams(word)))
+                if similarity >= FUZZY_THRESHOLD and not word.startswith(term):
+                    scored.append((similarity, word))
+        # Lowest first, so a task's best word is the one that sticks
+        scored.sort()
+        matches = {}
+        for score, word in scored:
+            matches.update(dict.fromkeys(self._postings[word], score))
+        return matches
+
+    def _index(self, task_id, text):
+        words = set(tokenize(text))
+        self._words_of[task_id] = words
+        for word in words:
+            ids = self._postings.get(word)
+            if ids is None:
+                self._postings[word] = {task_id}
+                bisect.insort(self._vocabulary, word)
+                for gram in trigrams(word):
+                    self._grams.setdefault(gram, set()).add(word)
+            else:
+                ids.add(task_id)
+
+    def _unindex(self, task_id):
+        for word in self._words_of.pop(task_id):
+            ids = self._postings[word]
+            ids.discard(task_id)
+            if not ids:
+                del self._postings[word]
+                del self._vocabulary[bisect.bisect_left(self._vocabulary, word)]
+                for gram in trigrams(word):
+                    words = self._grams[gram]
+                    words.discard(word)
+                    if not words:
+                        del self._grams[gram]
+
+
+class FilterIndex:
+    """Sets of task ids per tag, per priority and per status of a TaskList.
+
+    filter() intersects the sets it is asked for, smallest first, so its cost
+    follows the smallest of them rather than the number of tasks. Like
+    SearchIndex it listens to the list and only re-files the task that
+    changed.
+    """
+
+    def __init__(self, tasks):
+        self.tasks = tasks
+        self._tags = {}  # tag -> ids of the tasks that have it
+        self._priorities = {}  # priority -> ids
+        self._completed = {False: set(), True: set()}
+        self.tasks_extended(tasks)
+        tasks.listeners.append(self)
+
+    def detach(self):
+        self.tasks.listeners.remove(self)
+
+    def tags(self):
+        """Every tag some task has, sorted."""
+        return sorted(self._tags, key=str.casefold)
+
+    def filter(self, tags=(), priority=None, completed=None):
+        """Ids of the tasks that have every tag in ``tags`` and, unless None,
+        ``priority`` and the ``completed`` status; None if nothing is asked."""
+        sets = [self._tags.get(tag, ()) for tag in tags]
+        if priority is not None:
+            sets.append(self._priorities.get(priority, ()))
+        if completed is not None:
+            sets.append(self._completed[bool(completed)])
+        if not sets:
+            return None
+        sets.sort(key=len)
+        return set(sets[0]).intersection(*sets[1:])
+
+    def task_added(self, task):
+        self._file(task.id, task.priority, task.completed, task_tags(task))
+
+    def tasks_extended(self, tasks):
+        for task in tasks:
+            self._file(task.id, task.priority, task.completed, task_tags(task))
+
+    def task_updated(self, task, old):
+        if "priority" in old or "completed" in old or TAGS in old:
+            self._unfile(task.id, old.get("priority", task.priority), old.get("completed", task.completed),
+                         task_tags(old) if TAGS in old else task_tags(task))
+            self._file(task.id, task.priority, task.completed, task_tags(task))
+
+    def task_removed(self, task):
+        self._unfile(task.id, task.priority, task.completed, task_tags(task))
+
+    def _file(self, task_id, priority, completed, tags):
+        self._priorities.setdefault(priority, set()).add(task_id)
+        self._completed[bool(completed)].add(task_id)
+        for tag in tags:
+            self._tags.setdefault(tag, set()).add(task_id)
+
+    def _unfile(self, task_id, priority, completed, tags):
+        self._priorities[priority].discard(task_id)
+        self._completed[bool(completed)].discard(task_id)
+        for tag in tags:
+            ids = self._tags[tag]
+            ids.discard(task_id)
+            if not ids:
+                del self._tags[tag]
@@ -0,0 +1,656 @@
+"""
+Local task service: one process owns the task store and serves it to any
+number of windows and scripts over a small JSON-over-HTTP API.
+
+    python task_server.py                                 # http://127.0.0.1:8765
+    python task_server.py --socket /tmp/tasks.sock --backend sqlite
+
+Point the Tkinter and PyQt5 apps (or task_cli.py) at it with
+``TASKS_SERVER=http://127.0.0.1:8765`` or ``TASKS_SERVER=unix:/tmp/tasks.sock``;
+open_store() then returns a ServerStore and nothing else about the apps
+changes. Their once-a-second merge asks the server for the changes since the
+last revision they saw and applies just those rows.
+
+    GET    /tasks              every task, or ?priority=&match=&completed=&tag= to filter
+    POST   /tasks              add one task
+    PUT    /tasks              replace the list (applied as the difference)
+    GET    /tasks/ID           one task; PATCH updates fields of it, DELETE removes it
+    POST   /changes            apply a batch of change records in one write
+    GET    /changes?since=REV  the changes after revision REV; &wait=S holds the
+                               request up to S seconds for the next one and
+                               &stream=1 keeps sending them, a JSON line each
+    GET    /settings           view settings; PUT replaces them
+
+Every change the server applies is numbered with the next revision and kept
+in a bounded log, so a client that fell further behind than the log (or was
+talking to a server that has since restarted) is told to reload instead.
+Connections are HTTP/1.1 keep-alive; a client sends every request over the
+same few sockets.
+"""
+
+import argparse
+import asyncio
+import http.client
+import itertools
+import json
+import os
+import socket
+import sys
+import threading
+from collections import deque
+from collections.abc import Mapping
+from contextlib import contextmanager
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlsplit
+
+from task_cli import TRUE_WORDS, task_filter
+from task_model import COMPLETED_AT, Task, TaskList, completion, new_task_id
+from task_storage import (BACKENDS, CHANGE_LOG, LOAD_BATCH, PersistenceWorker, archive_age, archive_records,
+                          diff_tasks, open_store)
+
+TASKS_FILE = 'tasks.json'
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+RELOAD_POLL = 1.0  # seconds between looks for changes written to the files directly
+ARCHIVE_POLL = 60 * 60.0  # seconds between moves of long-completed tasks to the archive
+MAX_WAIT = 60.0  # longest a /changes request may be held open waiting for a change
+STREAM_HEARTBEAT = 15.0  # seconds of quiet before a streamed feed sends an empty line
+MAX_BODY = 256 * 1024 * 1024  # largest request body accepted, in bytes
+REQUEST_TIMEOUT = 30.0  # seconds a client waits for a reply
+CLIENT_HEADER = 'X-Task-Client'
+
+
+class RequestError(Exception):
+    """A request the server cannot serve; becomes an error reply."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class ServerError(OSError):
+    """An error reply from the task server."""
+
+    def __init__(self, status, message):
+        super().__init__("%d %s" % (status, message))
+        self.status = status
+
+
+def check_record(record):
+    """Raise ValueError unless ``record`` is a change record the server applies."""
+    if not isinstance(record, dict):
+        raise ValueError("A change record must be a JSON object")
+    op = record.get("op")
+    if op not in ("add", "update", "delete"):
+        raise ValueError("Unknown operation: %r" % (op,))
+    if op != "add" and not isinstance(record.get("id"), str):
+        raise ValueError("An %s needs the id of a task" % op)
+    if op == "delete":
+        return
+    fields = record.get("task")
+    if not isinstance(fields, Mapping):
+        raise ValueError("An %s needs a task object" % op)
+    if "task" in fields and not isinstance(fields["task"], str):
+        raise ValueError("Task text must be a string")
+    if fields.get("priority") is not None and not isinstance(fields["priority"], str):
+        raise ValueError("Priority must be a string")
+    if "completed" in fields and not isinstance(fields["completed"], bool):
+        raise ValueError("Completed must be true or false")
+    if fields.get("id") is not None and not isinstance(fields["id"], str):
+        raise ValueError("A task id must be a string")
+
+
+def foreign_changes(entries, client):
+    """The change records in feed ``entries`` that ``client`` did not make
+    itself, less the updates one of its own later updates overwrites (the
+    client's list already holds its own edit, which the server applied last)."""
+    updated = set()
+    records = []
+    for entry in reversed(entries):
+        record = {key: entry[key] for key in ("op", "id", "task") if key in entry}
+        if entry.get("client") == client:
+            if record["op"] == "update":
+                updated.add(record["id"])
+        elif not (record["op"] == "update" and record["id"] in updated):
+            records.append(record)
+    records.reverse()
+    return records
+
+
+class TaskService:
+    """The task list a server process owns.
+
+    apply() changes the list, hands the records to a PersistenceWorker and
+    numbers them in the change log that the feed is served from. Everything
+    but the worker runs on the event loop's thread.
+    """
+
+    def __init__(self, store, log_size=CHANGE_LOG):
+        self.store = store
+        self.tasks = store.load()
+        self.server_id = new_task_id()  # tells clients a restarted server from this one
+        self.revision = 0
+        self.log = deque(maxlen=log_size)
+        self.persistence = PersistenceWorker(store)
+        self.persistence.start()
+        self.archive_after = archive_age()
+        self._waiters = set()  # futures of the requests waiting for the next change
+        self.archive_completed()
+
+    def apply(self, records, client=None, persist=True):
+        """Apply change records to the list, persist them and publish them
+        to the feed; returns those that still applied, as stored.
+
+        The batch is checked first, so a bad record applies none of it.
+        """
+        for record in records:
+            check_record(record)
+        applied = [record for record in (self._apply(record, persist) for record in records)
+                   if record is not None]
+        if applied:
+            if persist:
+                self.persistence.submit_many(applied)
+            for record in applied:
+                self.revision += 1
+                entry = dict(record, revision=self.revision, client=client)
+                if "task" in entry:
+                    entry["task"] = dict(entry["task"])  # the Task keeps changing
+                self.log.append(entry)
+            waiters, self._waiters = self._waiters, set()
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_result(None)
+        return applied
+
+    def replace(self, tasks, client=None):
+        """Make the list hold ``tasks``, publishing only the tasks that differ."""
+        if not isinstance(tasks, list):
+            raise ValueError("Expected a list of task objects")
+        for task in tasks:
+            check_record({"op": "add", "task": task})
+        return self.apply(diff_tasks(self.tasks, TaskList(tasks)), client)
+
+    def changes_since(self, since):
+        """Feed entries after revision ``since``, or None if the log no
+        longer reaches back that far."""
+        behind = self.revision - since
+        if behind < 0 or behind > len(self.log):
+            return None
+        return list(itertools.islice(self.log, len(self.log) - behind, None))
+
+    async def wait_for_change(self, since, timeout):
+        """Return once there is a revision after ``since`` or ``timeout`` passed."""
+        if self.revision != since:
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.add(waiter)
+        try:
+            await asyncio.wait_for(waiter, timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            # A wait that timed out (a stream's heartbeat) must not leave its future behind
+            self._waiters.discard(waiter)
+
+    def merge_store(self):
+        """Publish what other processes wrote to the store's files directly."""
+        if self.persistence.idle():  # our own records go to disk first
+            records = self.store.changes(self.tasks)
+            if records:
+                self.apply(records, persist=False)
+
+    def archive_completed(self):
+        """Move the tasks completed longer ago than $TASKS_ARCHIVE_DAYS into
+        the store's archive; clients see them deleted."""
+        if self.archive_after is not None:
+            self.apply(archive_records(self.store.archive, self.tasks, self.archive_after))
+
+    def close(self):
+        self.persistence.stop()
+        self.store.close()
+
+    def _apply(self, record, stamp):
+        op = record["op"]
+        if op == "add":
+            return {"op": "add", "task": self.tasks.add(record["task"])}
+        task_id = record["id"]
+        if self.tasks.get(task_id) is None:
+            return None  # already deleted
+        if op == "update":
+            fields = {key: value for key, value in record["task"].items() if key != "id"}
+            # A PATCH that only flips "completed" still needs the archive's stamp
+            if stamp and "completed" in fields and COMPLETED_AT not in fields \
+                    and fields["completed"] != self.tasks.get(task_id).completed:
+                fields.update(completion(fields["completed"]))
+            return {"op": "update", "id": task_id, "task": self.tasks.update(task_id, **fields)}
+        self.tasks.remove(task_id)
+        return {"op": "delete", "id": task_id}
+
+
+async def read_request(reader):
+    """Read one HTTP request: (method, path, query, headers, body), or None
+    once the client has closed the connection."""
+    try:
+        line = await reader.readline()
+        if not line:
+            return None
+        try:
+            method, target, _ = line.decode('latin-1').split()
+        except ValueError:
+            raise RequestError(400, "Malformed request line")
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n'):
+                break
+            if not line:
+                return None
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+    except ValueError:  # a line longer than the stream's limit
+        raise RequestError(400, "Request line or header too long")
+    try:
+        length = int(headers.get('content-length') or 0)
+    except ValueError:
+        raise RequestError(400, "Bad Content-Length")
+    if length > MAX_BODY:
+        raise RequestError(413, "Request body too large")
+    body = await reader.readexactly(length) if length else b''
+    url = urlsplit(target)
+    return method.upper(), url.path.rstrip('/') or '/', parse_qs(url.query), headers, body
+
+
+def encode_response(status, payload, keep_alive=True):
+    body = json.dumps(payload, separators=(',', ':'), default=dict).encode()
+    head = ("HTTP/1.1 %d %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\n"
+            "Connection: %s\r\n\r\n" % (status, HTTPStatus(status).phrase, len(body),
+                                        "keep-alive" if keep_alive else "close"))
+    return head.encode('latin-1') + body
+
+
+def parse_json(body):
+    try:
+        return json.loads(body or b'null')
+    except ValueError as exc:
+        raise RequestError(400, "Invalid JSON: %s" % exc)
+
+
+def query_number(query, name, default):
+    try:
+        return float(query[name][-1]) if name in query else default
+    except ValueError:
+        raise RequestError(400, "%s must be a number" % name)
+
+
+def query_revision(query, default):
+    try:
+        return int(query_number(query, 'since', default))
+    except (ValueError, OverflowError):  # nan, inf
+        raise RequestError(400, "since must be a revision number")
+
+
+class TaskServer:
+    """The HTTP front of a TaskService, on a TCP port or a Unix socket."""
+
+    def __init__(self, service):
+        self.service = service
+        self.address = None
+        self._server = None
+        self._socket_path = None
+        self._watcher = None
+        self._connections = set()
+
+    async def start(self, host=DEFAULT_HOST, port=DEFAULT_PORT, path=None):
+        """Start listening; ``address`` is then what TASKS_SERVER should be
+        set to (port 0 picks a free port)."""
+        if path:
+            self._server = await asyncio.start_unix_server(self.handle, path)
+            self._socket_path = path
+            self.address = 'unix:' + path
+        else:
+            self._server = await asyncio.start_server(self.handle, host, port)
+            self.address = 'http://%s:%d' % (host, self._server.sockets[0].getsockname()[1])
+        self._watcher = asyncio.ensure_future(self.watch_store())
+
+    async def close(self):
+        self._server.close()
+        self._watcher.cancel()
+        connections = list(self._connections)
+        for connection in connections:
+            connection.cancel()
+        await asyncio.gather(self._watcher, *connections, return_exceptions=True)
+        await self._server.wait_closed()
+        if self._socket_path and os.path.exists(self._socket_path):
+            os.remove(self._socket_path)
+
+    async def watch_store(self):
+        for poll in itertools.count(1):
+            await asyncio.sleep(RELOAD_POLL)
+            try:
+                self.service.merge_store()
+                if poll % int(ARCHIVE_POLL / RELOAD_POLL) == 0:
+                    self.service.archive_completed()
+            except OSError as exc:
+                print("Could not update the task files: %s" % exc, file=sys.stderr)
+
+    async def handle(self, reader, writer):
+        """Serve the requests of one connection, one after the other."""
+        connection = asyncio.current_task()
+        self._connections.add(connection)
+        try:
+            while True:
+                try:
+                    request = await read_request(reader)
+                    if request is None:
+                        break
+                    method, path, query, headers, body = request
+                    if method == 'GET' and path == '/changes' and query.get('stream', [''])[-1] in TRUE_WORDS:
+                        await self.stream_changes(writer, query)
+                        break
+                except RequestError as exc:
+                    # The request could not be read, so neither can the next one
+                    writer.write(encode_response(exc.status, {"error": str(exc)}, keep_alive=False))
+                    await writer.drain()
+                    break
+                try:
+                    status, payload = await self.route(method, path, query, headers.get(CLIENT_HEADER.lower()),
+                                                       body)
+                except RequestError as exc:
+                    status, payload = exc.status, {"error": str(exc)}
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                writer.write(encode_response(status, payload, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            self._connections.discard(connection)
+            writer.close()
+
+    async def route(self, method, path, query, client, body):
+        """Serve one request; returns (status, reply)."""
+        service = self.service
+        parts = path.strip('/').split('/')
+        try:
+            if parts == ['tasks']:
+                if method == 'GET':
+                    return 200, self.list_tasks(query)
+                if method == 'POST':
+                    applied = service.apply([{"op": "add", "task": parse_json(body)}], client)
+                    return 201, {"revision": service.revision, "task": applied[0]["task"]}
+                if method == 'PUT':
+                    data = parse_json(body)
+                    applied = service.replace(data.get("tasks") if isinstance(data, dict) else None, client)
+                    return 200, {"revision": service.revision, "changed": len(applied)}
+                raise RequestError(405, "Method not allowed")
+            if len(parts) == 2 and parts[0] == 'tasks':
+                task_id = parts[1]
+                if method == 'GET':
+                    task = service.tasks.get(task_id)
+                    applied = [{"task": task}] if task is not None else []
+                elif method == 'PATCH':
+                    applied = service.apply([{"op": "update", "id": task_id, "task": parse_json(body)}], client)
+                elif method == 'DELETE':
+                    applied = service.apply([{"op": "delete", "id": task_id}], client)
+                else:
+                    raise RequestError(405, "Method not allowed")
+                if not applied:
+                    raise RequestError(404, "No task with id %s" % task_id)
+                reply = {"revision": service.revision}
+                if "task" in applied[0]:
+                    reply["task"] = applied[0]["task"]
+                return 200, reply
+            if parts == ['changes']:
+                if method == 'GET':
+                    since = query_revision(query, 0)
+                    if service.changes_since(since) == []:
+                        await service.wait_for_change(since, min(query_number(query, 'wait', 0), MAX_WAIT))
+                    return 200, self.feed(since)
+                if method == 'POST':
+                    data = parse_json(body)
+                    records = data.get("records") if isinstance(data, dict) else None
+                    if not isinstance(records, list):
+                        raise ValueError("Expected {\"records\": [...]}")
+                    return 200, {"revision": service.revision, "applied": len(service.apply(records, client))}
+                raise RequestError(405, "Method not allowed")
+            if parts == ['settings']:
+                if method == 'GET':
+                    return 200, service.store.load_settings()
+                if method == 'PUT':
+                    settings = parse_json(body)
+                    if not isinstance(settings, dict):
+                        raise ValueError("Settings must be a JSON object")
+                    service.store.save_settings(settings)
+                    return 200, settings
+                raise RequestError(405, "Method not allowed")
+        except ValueError as exc:
+            raise RequestError(400, str(exc))
+        except OSError as exc:
+            raise RequestError(500, str(exc))
+        raise RequestError(404, "Not found: %s" % path)
+
+    def list_tasks(self, query):
+        tasks = self.service.tasks
+        if query.keys() & {'priority', 'match', 'completed', 'tag'}:
+            completed = query.get('completed', [None])[-1]
+            matches = task_filter(query.get('priority'), query.get('match'),
+                                  None if completed is None else completed.lower() in TRUE_WORDS, query.get('tag'))
+            tasks = [task for task in tasks if matches(task)]
+        return {"server": self.service.server_id, "revision": self.service.revision, "tasks": list(tasks)}
+
+    def feed(self, since):
+        entries = self.service.changes_since(since)
+        reply = {"server": self.service.server_id, "revision": self.service.revision}
+        if entries is None:
+            reply["reset"] = True
+        else:
+            reply["changes"] = entries
+        return reply
+
+    async def stream_changes(self, writer, query):
+        """Send the feed after ``since`` as chunked JSON lines until the
+        client goes away: one line per change, an empty line as a heartbeat,
+        and a final {"reset": true} line if the client fell too far behind."""
+        since = query_revision(query, self.service.revision)  # before the 200 goes out
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\n"
+                     b"Transfer-Encoding: chunked\r\nConnection: close\r\n\r\n")
+        while True:
+            entries = self.service.changes_since(since)
+            if entries is None:
+                lines = [json.dumps(self.feed(since)) + '\n']
+            else:
+                lines = [json.dumps(entry, separators=(',', ':')) + '\n' for entry in entries] or ['\n']
+                since = self.service.revision
+            data = ''.join(lines).encode()
+            writer.write(b"%x\r\n%s\r\n" % (len(data), data))
+            if entries is None:
+                writer.write(b"0\r\n\r\n")
+                await writer.drain()
+                return
+            await writer.drain()
+            await self.service.wait_for_change(since, STREAM_HEARTBEAT)
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """An HTTPConnection over a Unix socket."""
+
+    def __init__(self, path, timeout=REQUEST_TIMEOUT):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+class ServerStore:
+    """A store whose tasks live in a task_server.py process, with the same
+    load/append/save surface as JournalStore.
+
+    Requests go over persistent connections kept in a small pool: a thread
+    takes an idle one (or opens one) per request, so the GUI thread and the
+    persistence worker never share a socket. changes() fetches only the
+    feed since the last revision seen, leaving out this store's own changes.
+    """
+
+    archive = None  # the server archives its own tasks
+
+    def __init__(self, address, timeout=REQUEST_TIMEOUT):
+        self.address = address
+        self.client_id = new_task_id()
+        if address.startswith('unix:'):
+            path = address[len('unix:'):]
+            self._connect = lambda: UnixHTTPConnection(path, timeout)
+        else:
+            url = urlsplit(address if '//' in address else 'http://' + address)
+            host, port = url.hostname or DEFAULT_HOST, url.port or DEFAULT_PORT
+            self._connect = lambda: http.client.HTTPConnection(host, port, timeout=timeout)
+        self._idle = []
+        self._pool_lock = threading.Lock()
+        self._lock = threading.RLock()
+        self._server = None
+        self._revision = 0
+
+    def request(self, method, path, payload=None):
+        """Send one request and return the decoded reply.
+
+        A pooled connection the server has closed meanwhile is replaced and
+        the request sent once more; error replies raise ServerError.
+        """
+        body = None if payload is None else json.dumps(payload, separators=(',', ':'), default=dict).encode()
+        headers = {CLIENT_HEADER: self.client_id, "Content-Type": "application/json"}
+        for attempt in range(2):
+            with self._pool_lock:
+                connection = self._idle.pop() if self._idle else None
+            reused = connection is not None
+            if connection is None:
+                connection = self._connect()
+            try:
+                connection.request(method, path, body, headers)
+                response = connection.getresponse()
+                data = response.read()
+            except ConnectionError:
+                connection.close()
+                if reused and attempt == 0:
+                    continue  # went stale while idle; the server never saw the request
+                raise
+            except (http.client.HTTPException, OSError):
+                connection.close()
+                raise
+            if response.will_close:
+                connection.close()
+            else:
+                with self._pool_lock:
+                    self._idle.append(connection)
+            reply = json.loads(data) if data else None
+            if response.status >= 400:
+                raise ServerError(response.status, reply.get("error", response.reason)
+                                  if isinstance(reply, dict) else response.reason)
+            return reply
+
+    @contextmanager
+    def locked(self):
+        """Keeps this store's threads apart; the server itself puts the
+        writes of every client in one order."""
+        with self._lock:
+            yield
+
+    def load(self):
+        tasks = TaskList()
+        for batch, _ in self.load_batches():
+            tasks.extend(batch)
+        self.finish_load(tasks)
+        return tasks
+
+    def load_batches(self, batch_size=LOAD_BATCH):
+        """The server's list as (tasks, fraction done) batches; it arrives in
+        one reply, at the revision later changes() calls continue from."""
+        reply = self.request('GET', '/tasks')
+        self._server, self._revision = reply["server"], reply["revision"]
+        tasks = reply["tasks"]
+        for start in range(0, len(tasks), batch_size):
+            batch = [Task.from_dict(task) for task in tasks[start:start + batch_size]]
+            yield batch, min(start + batch_size, len(tasks)) / len(tasks)
+
+    def finish_load(self, tasks):
+        pass  # the list is already current as of the revision loaded
+
+    def iter_tasks(self, batch_size=LOAD_BATCH):
+        for batch, _ in self.load_batches(batch_size):
+            yield batch
+
+    def changes(self, tasks):
+        """Return the change records other clients made since the last call
+        (or the load), to be applied to ``tasks``. If the server cannot say
+        (it restarted, or its log no longer reaches back that far) its list is
+        compared with ``tasks`` instead."""
+        reply = self.request('GET', '/changes?since=%d' % self._revision)
+        if reply["server"] != self._server or reply.get("reset"):
+            current = self.request('GET', '/tasks')
+            self._server, self._revision = current["server"], current["revision"]
+            return diff_tasks(tasks, TaskList(current["tasks"]))
+        self._revision = reply["revision"]
+        return foreign_changes(reply["changes"], self.client_id)
+
+    def append(self, record):
+        self.append_many([record])
+
+    def append_many(self, records):
+        """Send a batch of change records; the server applies them in one write."""
+        self.request('POST', '/changes', {"records": records})
+
+    def save(self, tasks):
+        """Make the server's list ``tasks``; other clients get just the
+        tasks that differ."""
+        self.request('PUT', '/tasks', {"tasks": list(tasks)})
+
+    def load_settings(self):
+        try:
+            return self.request('GET', '/settings')
+        except (OSError, ValueError):
+            return {}
+
+    def save_settings(self, settings):
+        self.request('PUT', '/settings', settings)
+
+    def close(self):
+        with self._pool_lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
+
+
+async def serve(service, host=DEFAULT_HOST, port=DEFAULT_PORT, path=None):
+    server = TaskServer(service)
+    await server.start(host, port, path)
+    print("Serving %d tasks on %s" % (len(service.tasks), server.address), file=sys.stderr)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve one task list to several windows and scripts.")
+    parser.add_argument("--file", default=TASKS_FILE, help="tasks file (default: %(default)s)")
+    parser.add_argument("--backend", choices=BACKENDS, help="storage backend (default: $TASKS_BACKEND or json)")
+    parser.add_argument("--host", default=DEFAULT_HOST, help="address to listen on (default: %(default)s)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="TCP port (default: %(default)s)")
+    parser.add_argument("--socket", metavar="PATH", help="listen on a Unix socket instead of TCP")
+    args = parser.parse_args(argv)
+
+    # Named explicitly, so a TASKS_SERVER in the environment does not make the server its own client
+    service = TaskService(open_store(args.file, args.backend or os.environ.get('TASKS_BACKEND', 'json')))
+    try:
+        asyncio.run(serve(service, args.host, args.port, args.socket))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
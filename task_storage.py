@@ -0,0 +1,1705 @@
+"""
+Persistent storage shared by the Tkinter and PyQt5 task managers.
+
+Tasks live in a JSON snapshot (``tasks.json``) plus an append-only change
+journal next to it (``tasks.json.journal``). Every mutation appends one small
+record to the journal, so the cost of a click does not depend on how many
+tasks there are. Loading replays the journal on top of the snapshot, and once
+the journal grows past a threshold it is folded back into the snapshot on a
+background thread.
+
+Setting ``TASKS_BACKEND=sqlite`` swaps the JSON files for an indexed SQLite
+database (``tasks.db``) behind the same load/append/save surface; an existing
+tasks.json is migrated into it the first time. ``TASKS_BACKEND=binary`` keeps
+the journal but writes the snapshot in a compact binary format
+(``tasks.bin``) that is read through mmap instead of being parsed, and
+``TASKS_BACKEND=sharded`` splits it into shard files (``tasks.shards``) that
+are parsed on several cores and rewritten only when their tasks changed.
+
+Journal writes themselves go through a PersistenceWorker so that the GUI
+thread never waits on the disk. View settings such as the sort mode are kept
+by the store as well (``tasks.json.settings``, or a table in the database).
+
+Several windows (Tk, Qt or both) can share one tasks file. Writes hold an
+advisory lock on ``tasks.json.lock``, and changes() reports what the other
+windows wrote since the last look, read from the end of the journal, so each
+window can merge just those tasks instead of reloading everything.
+``TASKS_SERVER`` hands the store to a task_server.py process instead, which
+the windows then share over a local socket.
+"""
+
+import argparse
+import atexit
+import itertools
+import json
+import mmap
+import os
+import sys
+import re
+import struct
+import threading
+import time
+from array import array
+from contextlib import contextmanager
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+from task_model import (Task, TaskList, FIELDS, PRIORITY_LEVELS, NO_PRIORITY, COMPLETED_AT, as_task, new_task_id,
+                        priority_key)
+
+JOURNAL_SUFFIX = '.journal'
+LOCK_SUFFIX = '.lock'
+SETTINGS_SUFFIX = '.settings'
+COMPACT_THRESHOLD = 1024 * 1024  # journal bytes before a background compaction
+COALESCE_DELAY = 0.05  # seconds a burst of changes may pile up into one write
+LOAD_BATCH = 1000  # tasks handed to the GUI at a time during a streaming load
+READ_CHUNK = 64 * 1024  # characters read at a time by iter_json_array()
+BACKENDS = ("json", "sqlite", "binary", "sharded")
+SQLITE_SUFFIX = '.db'
+CHANGE_LOG = 10000  # change records the SQLite backend keeps for other processes to catch up from
+# Fields older SQLite databases kept in columns of their own, before the extra column
+LEGACY_COLUMNS = ("completed_at", "due", "tags", "parent", "blocked_by", "repeat", "series")
+LEGACY_JSON_COLUMNS = {"tags", "blocked_by"}
+BINARY_SUFFIX = '.bin'
+SHARDS_SUFFIX = '.shards'  # the manifest; the shard files are in a directory named like it plus '.d'
+SHARDS_VERSION = 1
+SHARD_SIZE = 10000  # tasks per shard file
+PARALLEL_LOAD_BYTES = 4 * 1024 * 1024  # smaller snapshots are parsed in-process, as starting workers costs more
+ARCHIVE_SUFFIX = '.archive'
+ARCHIVE_AFTER_DAYS = 14  # default for $TASKS_ARCHIVE_DAYS
+SEGMENT_NAME = re.compile(r'^(\d+)\.jsonl\.gz$')
+
+
+def apply_record(tasks, record):
+    """Apply one journal record to a TaskList."""
+    op = record["op"]
+    if "index" in record:
+        # Journals written before tasks had ids address them by position
+        record = dict(record, id=tasks[record["index"]]["id"])
+    if op == "add":
+        tasks.add(record["task"])
+    elif op in ("update", "delete"):
+        if tasks.get(record["id"]) is None:
+            return  # already gone; replaying a record twice is harmless
+        if op == "update":
+            tasks.update(record["id"], **record["task"])
+        else:
+            tasks.remove(record["id"])
+    elif op == "sort":
+        tasks.sort(key=priority_key)
+    else:
+        raise ValueError("Unknown journal operation: %r" % op)
+
+
+def overlay_records(records):
+    """Fold journal records into ({id: task, or None once deleted} for tasks
+    they change, {id: task} added, in order), so a snapshot can be streamed
+    with them applied. Returns None for records that depend on positions."""
+    changed = {}
+    added = {}
+    for record in records:
+        op = record["op"]
+        if op == "sort" or "index" in record:
+            return None
+        if op == "add":
+            task = as_task(record["task"])
+            if task.id is None:
+                task.id = new_task_id()
+            added[task.id] = task
+        elif op == "update":
+            target = added if record["id"] in added else changed
+            if target.get(record["id"], True) is not None:
+                target[record["id"]] = as_task(record["task"])
+        elif op == "delete":
+            if added.pop(record["id"], None) is None:
+                changed[record["id"]] = None
+    return changed, added
+
+
+def overlay_batches(batches, records, batch_size=LOAD_BATCH):
+    """Yield the tasks in ``batches`` (lists of tasks or task dicts) with
+    journal ``records`` applied, a batch at a time.
+
+    Only the records are held in memory, unless they address tasks by
+    position; those are replayed on the whole list.
+    """
+    overlay = overlay_records(records)
+    if overlay is None:
+        tasks = TaskList(task for batch in batches for task in batch)
+        for record in records:
+            apply_record(tasks, record)
+        for start in range(0, len(tasks), batch_size):
+            yield tasks[start:start + batch_size]
+        return
+    changed, added = overlay
+    for batch in batches:
+        out = []
+        for task in batch:
+            task = as_task(task)
+            if task.id in changed:
+                task = changed[task.id]
+                if task is None:
+                    continue
+            out.append(task)
+        if out:
+            yield out
+    added = list(added.values())
+    for start in range(0, len(added), batch_size):
+        yield added[start:start + batch_size]
+
+
+def task_state(task):
+    return task.text, task.priority, task.completed, task.extra
+
+
+def diff_tasks(tasks, target, key=task_state):
+    """Change records that turn TaskList ``tasks`` into ``target``.
+
+    Only tasks that were added, removed or edited (as far as ``key`` can
+    tell) get a record; the stored order is not compared.
+    """
+    records = [{"op": "delete", "id": task.id} for task in tasks if target.get(task.id) is None]
+    for task in target:
+        mine = tasks.get(task.id)
+        if mine is None:
+            records.append({"op": "add", "task": task})
+        elif key(mine) != key(task):
+            records.append({"op": "update", "id": task.id, "task": task})
+    return records
+
+
+def drop_superseded(incoming, records):
+    """Drop the updates in ``incoming`` that ``records``, written after them,
+    overwrite."""
+    updated = {record["id"] for record in records if record["op"] == "update"}
+    return [record for record in incoming if not (record["op"] == "update" and record["id"] in updated)]
+
+
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+
+def iter_json_array(f, chunk_size=READ_CHUNK):
+    """Yield (element, characters consumed) for each element of the JSON
+    array in text file ``f``, reading it a chunk at a time.
+
+    Only one chunk and the element being decoded are held in memory, never
+    the whole document.
+    """
+    decoder = json.JSONDecoder()
+    buf = ''
+    pos = 0
+    dropped = 0  # characters already discarded from the front of buf
+    eof = False
+    expect = '['
+
+    def more():
+        nonlocal buf, pos, dropped, eof
+        chunk = f.read(chunk_size)
+        if not chunk:
+            eof = True
+        buf = buf[pos:] + chunk
+        dropped += pos
+        pos = 0
+
+    while True:
+        pos = WHITESPACE.match(buf, pos).end()
+        if pos == len(buf):
+            if eof:
+                raise ValueError("Unexpected end of JSON array")
+            more()
+            continue
+        char = buf[pos]
+        if expect == '[':
+            if char != '[':
+                raise ValueError("Expected a JSON array")
+            pos += 1
+            expect = 'first'
+        elif expect in ('first', 'value'):
+            if char == ']' and expect == 'first':
+                return
+            try:
+                value, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                more()
+                continue
+            if not eof and (end == len(buf) or buf[end] in '.eE+-0123456789'):
+                more()  # a bare number may continue in the next chunk
+                continue
+            pos = end
+            expect = 'separator'
+            yield value, dropped + pos
+        else:
+            if char == ']':
+                return
+            if char != ',':
+                raise ValueError("Expected ',' or ']' in JSON array")
+            pos += 1
+            expect = 'value'
+
+
+def _lock_file(f):
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+
+
+def _unlock_file(f):
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def fingerprint(path):
+    """Identify one version of a file; survives the rename in an atomic replace."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return [st.st_ino, st.st_size, st.st_mtime_ns]
+
+
+def temp_path(path):
+    # Per process, as other processes may be writing the same file
+    return '%s.%d.tmp' % (path, os.getpid())
+
+
+@contextmanager
+def temp_file(path, mode):
+    """Open a temp file next to ``path`` to write; it is flushed and fsynced
+    when the block ends, or removed if the block (or opening it) fails."""
+    tmp = temp_path(path)
+    try:
+        with open(tmp, mode) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except FileNotFoundError:
+            pass  # open() failed, so the error to report is its own
+        raise
+
+
+def write_json_atomic(path, data):
+    """Write ``data`` to a temp file next to ``path`` and fsync it.
+
+    Returns the temp path; the caller moves it into place with os.replace().
+    """
+    # ``data`` may fail half way through (a bad row in a streamed import)
+    with temp_file(path, 'w') as f:
+        if isinstance(data, dict):
+            json.dump(data, f, indent=2)
+        else:
+            # A list is written an element at a time, so ``data`` can be a
+            # generator; the text is the same as json.dump(list(data), indent=2)
+            f.write('[')
+            separator = '\n  '
+            for item in data:
+                f.write(separator)
+                f.write(json.dumps(item, indent=2, default=dict).replace('\n', '\n  '))
+                separator = ',\n  '
+            f.write(']' if separator == '\n  ' else '\n]')
+    return f.name
+
+
+class JournalStore:
+    """A JSON snapshot plus an append-only journal of changes since it.
+
+    The first line of the journal is a header naming the snapshot version it
+    applies to. Before a new snapshot is moved into place a checkpoint line is
+    appended, so a crash between the two steps never replays a record twice.
+
+    Other processes may use the same files. Every write holds the lock file,
+    and before appending the store reads whatever the others appended since
+    it last looked; changes() hands those records to the caller. Records are
+    numbered in journal order (``seq``), which tells records already seen
+    from new ones when another process rewrites the journal.
+    """
+
+    def __init__(self, path, compact_threshold=COMPACT_THRESHOLD):
+        self.path = path
+        self.journal_path = path + JOURNAL_SUFFIX
+        self.settings_path = path + SETTINGS_SUFFIX
+        self.compact_threshold = compact_threshold
+        self.archive = TaskArchive(path + ARCHIVE_SUFFIX)
+        self._lock = threading.RLock()
+        self._journal = None
+        self._journal_size = 0
+        self._seq = 0
+        self._compactor = None
+        self._loading = False
+        self._lock_file = None
+        self._lock_depth = 0
+        # What the caller's list already reflects: the snapshot it was loaded
+        # from (or last brought up to date with), the journal read so far, and
+        # the last record in it. _incoming holds records other processes wrote
+        # that were read before one of our appends but not yet handed out;
+        # _stale means they changed the files in a way records cannot describe.
+        self._loaded_snapshot = None
+        self._snapshot_seq = 0  # the last record the snapshot includes, per the journal
+        self._seen_snapshot = None
+        self._journal_id = None
+        self._journal_offset = 0
+        self._seen_seq = 0
+        self._incoming = []
+        self._stale = False
+
+    @contextmanager
+    def locked(self):
+        """Hold the lock file (and this store's thread lock); re-entrant.
+
+        Callers that write a snapshot of their own list hold it around
+        changes() and save(), so nothing another process writes in between is
+        lost.
+        """
+        with self._lock:
+            if self._lock_depth == 0:
+                if self._lock_file is None:
+                    self._lock_file = open(self.path + LOCK_SUFFIX, 'a+b')
+                _lock_file(self._lock_file)
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+                if self._lock_depth == 0:
+                    _unlock_file(self._lock_file)
+
+    def load(self):
+        tasks = TaskList()
+        for batch, _ in self.load_batches():
+            tasks.extend(batch)
+        self.finish_load(tasks)
+        return tasks
+
+    def load_batches(self, batch_size=LOAD_BATCH):
+        """Stream the snapshot as (tasks, fraction done) batches.
+
+        Pass the assembled TaskList to finish_load() afterwards to replay the
+        journal. Compaction is held off in between so the snapshot and the
+        journal still match.
+        """
+        self._begin_load()
+        yield from self._snapshot_batches(batch_size)
+
+    def finish_load(self, tasks):
+        with self.locked():
+            self._loading = False
+            self._catch_up()
+            self._incoming = []  # the journal is replayed in full below
+            if fingerprint(self.path) != self._loaded_snapshot:
+                # Another process replaced the snapshot while it was being
+                # read; changes() will bring the list up to date
+                self._stale = True
+                return
+            records = self._read_journal()
+            for record in records:
+                apply_record(tasks, record)
+            if tasks.assigned_ids:
+                # Files from before task ids: persist the new ids once
+                self.save(tasks)
+            else:
+                # Start from a clean journal holding only what the snapshot lacks
+                self._rewrite_journal(records)
+                self._mark_seen()
+
+    def iter_tasks(self, batch_size=LOAD_BATCH):
+        """Yield every task, with the journal applied, a batch at a time.
+
+        Unlike load() only the journal's records are held in memory, not the
+        whole list, so exports and batch edits run in constant memory however
+        large the snapshot is.
+        """
+        with self.locked():
+            snapshot = self._snapshot_batches(batch_size)
+            # Opened while locked, so it is the snapshot the journal applies to
+            first = next(snapshot, None)
+            records = self._read_journal()
+        try:
+            batches = itertools.chain([first] if first is not None else [], snapshot)
+            yield from overlay_batches((batch for batch, _ in batches), records, batch_size)
+        finally:
+            snapshot.close()
+
+    def changes(self, tasks):
+        """Return the change records other processes wrote since the last
+        call (or the load), to be applied to ``tasks``.
+
+        ``tasks`` is the caller's list, holding every change written through
+        this store. Usually the records are read from the end of the journal.
+        If another process replaced the snapshot with content not seen here,
+        the files are read in full and compared with ``tasks`` instead, so
+        the records still only touch the tasks that differ. When neither file
+        has changed this costs two stat calls.
+        """
+        if not (self._stale or self._incoming or self._files_changed()):
+            return []
+        with self.locked():
+            self._catch_up()
+            if self._stale:
+                current = TaskList(self._read_snapshot())
+                for record in self._read_journal():
+                    apply_record(current, record)
+                records = diff_tasks(tasks, current)
+                self._stale = False
+                self._mark_seen()
+            else:
+                records = self._incoming
+            self._incoming = []
+        # Nothing writes sort records any more; the stored order catches up on the next load
+        return [record for record in records if record["op"] != "sort"]
+
+    def append(self, record):
+        """Append one change record; O(1) in the number of tasks."""
+        self.append_many([record])
+
+    def append_many(self, records):
+        """Append a batch of change records with a single write."""
+        with self.locked():
+            self._catch_up()
+            # Our records land after theirs in the journal, so our edits win
+            self._incoming = drop_superseded(self._incoming, records)
+            lines = []
+            for record in records:
+                self._seq += 1
+                lines.append(json.dumps(dict(record, seq=self._seq), separators=(',', ':'), default=dict) + '\n')
+            data = ''.join(lines)
+            journal = self._open_journal()
+            self._journal_size = os.fstat(journal.fileno()).st_size  # others may have appended
+            try:
+                journal.write(data)
+                journal.flush()
+                os.fsync(journal.fileno())
+            except OSError:
+                # Cut off the torn record so later appends stay replayable
+                self._journal = None
+                for cleanup in (journal.close,
+                                lambda: os.truncate(self.journal_path, self._journal_size)):
+                    try:
+                        cleanup()
+                    except OSError:
+                        pass
+                raise
+            self._journal_size = os.fstat(journal.fileno()).st_size
+            self._mark_seen()
+            if self._journal_size > self.compact_threshold and self._compactor is None and not self._loading:
+                self._compactor = threading.Thread(target=self.compact, daemon=True)
+                self._compactor.start()
+
+    def save(self, tasks):
+        """Write a full snapshot of ``tasks`` and start an empty journal.
+
+        ``tasks`` replaces whatever is on disk, so callers sharing the files
+        apply changes() under locked() first. A compaction running meanwhile
+        sees the new snapshot and drops its own (waiting for it here could
+        deadlock a caller holding the lock).
+        """
+        with self.locked():
+            self._catch_up()
+            tmp = self._write_snapshot(tasks)
+            self._checkpoint(tmp, self._seq)
+            self._replace_snapshot(tmp)
+            self._rewrite_journal([])
+            self._incoming = []
+            self._stale = False
+            self._mark_seen()
+
+    def compact(self):
+        """Fold the journal into the snapshot without touching the GUI's list."""
+        try:
+            with self.locked():
+                base = fingerprint(self.path)
+                records = self._read_journal()
+                upto = max([record["seq"] for record in records], default=self._snapshot_seq)
+            # The slow part runs unlocked while the GUI keeps appending, and
+            # streams, so it holds the journal's records but not the tasks
+            batches = overlay_batches((batch for batch, _ in self._snapshot_batches()), records)
+            tmp = self._write_snapshot(task for batch in batches for task in batch)
+            with self.locked():
+                self._catch_up()
+                if fingerprint(self.path) != base:
+                    # Another process saved or compacted meanwhile
+                    self._discard_snapshot(tmp)
+                    return
+                self._checkpoint(tmp, upto)
+                self._replace_snapshot(tmp)
+                # The header tells other processes which snapshot this one
+                # replaced and how far into its journal it goes
+                self._rewrite_journal([r for r in self._read_journal() if r["seq"] > upto],
+                                      {"from": base, "seq": upto})
+                self._mark_seen()
+        finally:
+            self._compactor = None
+
+    def load_settings(self):
+        try:
+            with open(self.settings_path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save_settings(self, settings):
+        os.replace(write_json_atomic(self.settings_path, settings), self.settings_path)
+
+    def wait_for_compaction(self):
+        compactor = self._compactor
+        if compactor is not None:
+            compactor.join()
+
+    def close(self):
+        self.wait_for_compaction()
+        with self._lock:
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+            if self._lock_file is not None:
+                self._lock_file.close()
+                self._lock_file = None
+
+    def _snapshot_batches(self, batch_size=LOAD_BATCH):
+        try:
+            f = open(self.path, 'r')
+        except FileNotFoundError:
+            return
+        with f:
+            size = max(1, os.fstat(f.fileno()).st_size)
+            batch = []
+            for task, consumed in iter_json_array(f):
+                batch.append(task)
+                if len(batch) == batch_size:
+                    yield batch, min(1.0, consumed / size)
+                    batch = []
+            if batch:
+                yield batch, 1.0
+
+    def _read_snapshot(self):
+        return [task for batch, _ in self._snapshot_batches() for task in batch]
+
+    def _write_snapshot(self, tasks):
+        return write_json_atomic(self.path, tasks)
+
+    def _replace_snapshot(self, tmp):
+        os.replace(tmp, self.path)
+
+    def _discard_snapshot(self, tmp):
+        os.remove(tmp)
+
+    def _begin_load(self):
+        self.wait_for_compaction()
+        self._loading = True
+        self._loaded_snapshot = fingerprint(self.path)
+
+    def _files_changed(self):
+        """Whether the snapshot or the journal differ from what was last read;
+        the mtime poll behind changes(), taken without the lock."""
+        if fingerprint(self.path) != self._seen_snapshot:
+            return True
+        try:
+            st = os.stat(self.journal_path)
+        except FileNotFoundError:
+            return self._journal_id is not None
+        return (st.st_ino, st.st_dev) != self._journal_id or st.st_size != self._journal_offset
+
+    def _catch_up(self):
+        """Queue the records other processes appended since the last look
+        (lock held)."""
+        snapshot = fingerprint(self.path)
+        try:
+            f = open(self.journal_path, 'rb')
+        except FileNotFoundError:
+            if snapshot != self._seen_snapshot:
+                self._stale = True
+            self._journal_id = None
+            self._journal_offset = 0
+            return
+        with f:
+            st = os.fstat(f.fileno())
+            same = (st.st_ino, st.st_dev) == self._journal_id and st.st_size >= self._journal_offset
+            start = self._journal_offset if same else 0
+            if same and st.st_size == start:
+                return
+            f.seek(start)
+            data = f.read()
+        if not same and self._journal is not None:
+            # Our append handle points at a journal that has been replaced
+            self._journal.close()
+            self._journal = None
+        complete = data.rfind(b'\n') + 1  # a torn tail is picked up once it is finished
+        entries = []
+        for line in data[:complete].splitlines():
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                break
+        if not same and snapshot != self._seen_snapshot:
+            header = entries[0] if entries else {}
+            if not (header.get("base") == snapshot and header.get("from") == self._seen_snapshot
+                    and header.get("seq", self._seen_seq + 1) <= self._seen_seq):
+                self._stale = True  # the new snapshot holds changes never seen here
+        self._journal_id = (st.st_ino, st.st_dev)
+        self._journal_offset = start + complete
+        self._seen_snapshot = snapshot
+        for entry in entries:
+            if "op" in entry and entry["seq"] > self._seen_seq:
+                self._seen_seq = entry["seq"]
+                if not self._stale:
+                    self._incoming.append(entry)
+        self._seq = max(self._seq, self._seen_seq)
+
+    def _mark_seen(self):
+        """Note that the files as they are now are reflected in the caller's
+        list (lock held)."""
+        self._seen_snapshot = fingerprint(self.path)
+        try:
+            st = os.stat(self.journal_path)
+        except FileNotFoundError:
+            self._journal_id = None
+            self._journal_offset = 0
+        else:
+            self._journal_id = (st.st_ino, st.st_dev)
+            self._journal_offset = st.st_size
+        self._seen_seq = self._seq
+
+    def _read_journal(self):
+        """Return the records not yet contained in the current snapshot."""
+        if self._journal is not None:
+            self._journal.flush()
+        try:
+            with open(self.journal_path, 'r') as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return []
+        entries = []
+        for line in lines:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                break  # torn write at the tail from a crash
+        if not entries:
+            return []
+        current = fingerprint(self.path)
+        records = [e for e in entries[1:] if "op" in e]
+        if entries[0].get("base") == current:
+            start = entries[0].get("seq", 0)
+        else:
+            start = None
+            for entry in entries:
+                if "checkpoint" in entry and entry["base"] == current:
+                    start = entry["checkpoint"]
+            if start is None:
+                # The snapshot was replaced behind our back; the journal is stale
+                return []
+        self._snapshot_seq = start
+        self._seq = max([self._seq, start] + [r["seq"] for r in records])
+        return [r for r in records if r["seq"] > start]
+
+    def _checkpoint(self, tmp, upto):
+        if not os.path.exists(self.journal_path):
+            return
+        line = json.dumps({"checkpoint": upto, "base": fingerprint(tmp)}) + '\n'
+        journal = self._open_journal()
+        journal.write(line)
+        journal.flush()
+        os.fsync(journal.fileno())
+
+    def _open_journal(self):
+        if self._journal is None:
+            fresh = not os.path.exists(self.journal_path)
+            self._journal = open(self.journal_path, 'a')
+            if fresh:
+                header = json.dumps({"base": fingerprint(self.path)}) + '\n'
+                self._journal.write(header)
+                self._journal_size = len(header)
+            else:
+                self._journal_size = os.path.getsize(self.journal_path)
+        return self._journal
+
+    def _rewrite_journal(self, records, header=None):
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        if not records and not header:
+            if os.path.exists(self.journal_path):
+                os.remove(self.journal_path)
+            self._journal_size = 0
+            return
+        tmp = self.journal_path + '.tmp'
+        with open(tmp, 'w') as f:
+            f.write(json.dumps(dict(header or {}, base=fingerprint(self.path))) + '\n')
+            for record in records:
+                f.write(json.dumps(record, separators=(',', ':')) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.journal_path)
+        self._journal_size = os.path.getsize(self.journal_path)
+
+
+# Binary snapshots: a header, one flags byte per task, then an offsets table
+# into a blob holding each task's strings. Little-endian throughout; the
+# offsets start on an 8-byte boundary so they can be used in place.
+SNAPSHOT_MAGIC = b'TASKSNAP'
+SNAPSHOT_VERSION = 1
+SNAPSHOT_HEADER = struct.Struct('<8sII')  # magic, version, number of tasks
+SNAPSHOT_STRINGS = 4  # per task: text, id, priority (if not a standard one), unknown keys as JSON
+PRIORITY_CODES = {NO_PRIORITY: 0}
+PRIORITY_CODES.update((level, code) for code, level in enumerate(PRIORITY_LEVELS, 1))
+PRIORITY_BY_CODE = {code: level for level, code in PRIORITY_CODES.items()}
+CUSTOM_PRIORITY = 0x07  # the priority is stored as a string instead
+COMPLETED_FLAG = 0x08
+
+
+def write_binary_atomic(path, tasks):
+    """Write ``tasks`` as a binary snapshot to a temp file next to ``path``
+    and fsync it; returns the temp path, like write_json_atomic()."""
+    flags = bytearray()
+    offsets = array('Q', [0])
+    strings = []
+    end = 0
+    for task in tasks:
+        task = as_task(task)
+        code = PRIORITY_CODES.get(task.priority)
+        custom = b''
+        if code is None:
+            code = CUSTOM_PRIORITY
+            custom = task.priority.encode()
+        flags.append(code | COMPLETED_FLAG if task.completed else code)
+        extra = json.dumps(task.extra, separators=(',', ':')).encode() if task.extra else b''
+        for data in (task.text.encode(), (task.id or '').encode(), custom, extra):
+            strings.append(data)
+            end += len(data)
+            offsets.append(end)
+    if sys.byteorder != 'little':
+        offsets.byteswap()
+    header = SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(flags))
+    padding = b'\0' * (-(len(header) + len(flags)) % 8)
+    with temp_file(path, 'wb') as f:
+        for chunk in (header, flags, padding, offsets.tobytes(), b''.join(strings)):
+            f.write(chunk)
+    return f.name
+
+
+class BinarySnapshot:
+    """A binary snapshot mapped into memory.
+
+    Nothing is decoded up front: tasks() builds Task objects only for the
+    rows asked for, straight from the mapped file.
+    """
+
+    def __init__(self, f):
+        self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, version, count = SNAPSHOT_HEADER.unpack_from(self._mmap)
+            if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+                raise ValueError("%s is not a version %d task snapshot" % (f.name, SNAPSHOT_VERSION))
+            self._count = count
+            self._flags_at = SNAPSHOT_HEADER.size
+            offsets_at = self._flags_at + count + (-(self._flags_at + count) % 8)
+            self._strings_at = offsets_at + 8 * (count * SNAPSHOT_STRINGS + 1)
+            self._view = memoryview(self._mmap)[offsets_at:self._strings_at]
+            if sys.byteorder == 'little':
+                self._offsets = self._view.cast('Q')
+            else:
+                self._offsets = array('Q', self._view)
+                self._offsets.byteswap()
+            if self._strings_at + self._offsets[-1] != len(self._mmap):
+                raise ValueError("%s is truncated" % f.name)
+        except (ValueError, struct.error, TypeError):
+            self.close()
+            raise ValueError("%s is not a valid task snapshot" % f.name)
+
+    @classmethod
+    def open(cls, path):
+        """Map the snapshot at ``path``; None if there is none."""
+        try:
+            f = open(path, 'rb')
+        except FileNotFoundError:
+            return None
+        with f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return None
+            return cls(f)
+
+    def __len__(self):
+        return self._count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def tasks(self, start, end):
+        """Tasks ``start`` to ``end`` (exclusive), decoded from the map."""
+        first = self._offsets[start * SNAPSHOT_STRINGS]
+        # Offsets relative to the batch's own slice of the string blob
+        offsets = [offset - first for offset in self._offsets[start * SNAPSHOT_STRINGS:end * SNAPSHOT_STRINGS + 1]]
+        blob = self._mmap[self._strings_at + first:self._strings_at + first + offsets[-1]]
+        flags = self._mmap[self._flags_at + start:self._flags_at + end]
+        tasks = []
+        at = 0
+        for flag in flags:
+            text, task_id, custom, extra, end_at = offsets[at:at + SNAPSHOT_STRINGS + 1]
+            at += SNAPSHOT_STRINGS
+            code = flag & CUSTOM_PRIORITY
+            tasks.append(Task(
+                blob[text:task_id].decode(),
+                PRIORITY_BY_CODE[code] if code != CUSTOM_PRIORITY else blob[custom:extra].decode(),
+                bool(flag & COMPLETED_FLAG),
+                blob[task_id:custom].decode() or None,
+                json.loads(blob[extra:end_at]) if end_at != extra else None))
+        return tasks
+
+    def close(self):
+        # The offsets view must go before the map it points into
+        for view in (getattr(self, '_offsets', None), getattr(self, '_view', None)):
+            if isinstance(view, memoryview):
+                view.release()
+        self._mmap.close()
+
+
+class BinaryStore(JournalStore):
+    """A JournalStore whose snapshot is a binary file read through mmap.
+
+    Loading slices rows out of the mapped file instead of parsing JSON text;
+    the journal, checkpoints and compaction work exactly as for tasks.json.
+    """
+
+    def _snapshot_batches(self, batch_size=LOAD_BATCH):
+        snapshot = BinarySnapshot.open(self.path)
+        if snapshot is None:
+            return
+        with snapshot:
+            count = len(snapshot)
+            for start in range(0, count, batch_size):
+                end = min(start + batch_size, count)
+                yield snapshot.tasks(start, end), end / count
+
+    def _write_snapshot(self, tasks):
+        return write_binary_atomic(self.path, tasks)
+
+
+FIELD_SET = frozenset(FIELDS)
+
+
+def task_row(task):
+    """``task`` as the plain dict json writes, without going through the
+    Mapping interface."""
+    row = {"task": task.text, "priority": task.priority, "completed": task.completed, "id": task.id}
+    if task.extra:
+        row.update(task.extra)
+    return row
+
+
+def parse_shard(data):
+    """Decode a shard file's bytes into the columns Task() takes: texts,
+    priorities, completed flags, ids and unknown keys (or None).
+
+    Runs in the worker processes of a parallel load; lists of strings
+    pickle back to the parent far faster than tasks or dicts would.
+    """
+    rows = json.loads(data)
+    if not isinstance(rows, list):
+        raise ValueError("A task shard must hold a JSON array")
+    return ([row.get("task", "") for row in rows],
+            [row.get("priority") for row in rows],
+            [row.get("completed", False) for row in rows],
+            [row.get("id") for row in rows],
+            [None if row.keys() <= FIELD_SET else {key: value for key, value in row.items() if key not in FIELDS}
+             for row in rows])
+
+
+def task_columns(tasks):
+    """``tasks`` as the columns parse_shard() returns."""
+    return ([task.text for task in tasks], [task.priority for task in tasks], [task.completed for task in tasks],
+            [task.id for task in tasks], [task.extra for task in tasks])
+
+
+def shard_digest(texts, priorities, completed, ids, extras):
+    """Tells whether a shard's tasks changed since it was read or written,
+    from its columns; only comparable within one process."""
+    return hash((tuple(texts), tuple(priorities), tuple(completed), tuple(ids),
+                 tuple(extra and repr(extra) for extra in extras)))
+
+
+class ShardedStore(JournalStore):
+    """A JournalStore whose snapshot is split across shard files.
+
+    The snapshot file (``tasks.shards``) is a small manifest listing the
+    shards in ``tasks.shards.d``: compact JSON arrays of consecutive runs of
+    the list, so the stored order is the shards' order. A task stays in its
+    shard; new tasks join the last one until it holds ``shard_size``.
+    Shard files are written once under a fresh name and never changed, and
+    a save or compaction writes new files only for the shards whose tasks
+    changed, reusing the rest, before replacing the manifest; the journal
+    works exactly as for tasks.json.
+
+    Large snapshots are loaded with a process pool, one shard per task, so
+    parsing runs on every core while the caller builds the list.
+    """
+
+    def __init__(self, path, compact_threshold=COMPACT_THRESHOLD, shard_size=SHARD_SIZE, workers=None,
+                 parallel_threshold=PARALLEL_LOAD_BYTES):
+        super().__init__(path, compact_threshold)
+        self.shard_dir = path + '.d'
+        self.shard_size = shard_size
+        self.workers = workers or os.cpu_count() or 1
+        self.parallel_threshold = parallel_threshold
+        self._digests = {}  # shard file -> shard_digest() of its tasks, for those read or written here
+
+    def load_batches(self, batch_size=LOAD_BATCH):
+        self._begin_load()
+        yield from self._snapshot_batches(batch_size, parallel=True)
+
+    def shards(self):
+        """The manifest's shard entries: the file, its first task's id and
+        its number of tasks."""
+        return self._read_manifest(self.path)
+
+    def _snapshot_batches(self, batch_size=LOAD_BATCH, parallel=False):
+        entries, files = self._open_shards()
+        try:
+            sizes = [os.fstat(f.fileno()).st_size for f in files]
+            total = max(1, sum(sizes))
+            workers = min(self.workers, len(files)) if parallel and sum(sizes) >= self.parallel_threshold else 1
+            if workers > 1:
+                from concurrent.futures import ProcessPoolExecutor
+                pool = ProcessPoolExecutor(workers)
+                try:
+                    columns = [pool.submit(parse_shard, f.read()) for f in files]
+                    done = 0
+                    for entry, size, future in zip(entries, sizes, columns):
+                        yield from self._shard_batches(entry, future.result(), batch_size, done, size, total)
+                        done += size
+                finally:
+                    pool.shutdown(cancel_futures=True)
+            else:
+                done = 0
+                for entry, size, f in zip(entries, sizes, files):
+                    yield from self._shard_batches(entry, parse_shard(f.read()), batch_size, done, size, total)
+                    done += size
+        finally:
+            for f in files:
+                f.close()
+
+    def _shard_batches(self, entry, columns, batch_size, done, size, total):
+        self._digests[entry["file"]] = shard_digest(*columns)
+        tasks = list(map(Task, *columns))
+        for start in range(0, len(tasks), batch_size):
+            end = min(start + batch_size, len(tasks))
+            yield tasks[start:end], min(1.0, (done + size * end / len(tasks)) / total)
+
+    def _open_shards(self):
+        """Open the manifest's shard files; open, they stay readable after
+        another process replaces the manifest and deletes them."""
+        while True:
+            base = fingerprint(self.path)
+            entries = self._read_manifest(self.path)
+            files = []
+            try:
+                for entry in entries:
+                    files.append(open(os.path.join(self.shard_dir, entry["file"]), 'rb'))
+                return entries, files
+            except FileNotFoundError:
+                for f in files:
+                    f.close()
+                if fingerprint(self.path) == base:
+                    raise
+                # Replaced between reading the manifest and its shards: read the new one
+
+    def _write_snapshot(self, tasks):
+        """Write the shards that changed and a manifest listing all of them
+        to a temp file, which _replace_snapshot() moves into place."""
+        current = {entry["first"]: entry for entry in self._read_manifest(self.path)}
+        os.makedirs(self.shard_dir, exist_ok=True)
+        entries = []
+        written = []
+        try:
+            for run in self._runs(tasks, current):
+                digest = shard_digest(*task_columns(run))
+                entry = current.get(run[0].id)
+                if entry is None or entry["count"] != len(run) or self._digests.get(entry["file"]) != digest:
+                    entry = {"file": new_task_id() + '.json', "first": run[0].id, "count": len(run)}
+                    written.append(entry["file"])
+                    self._write_shard(entry["file"], run)
+                    self._digests[entry["file"]] = digest
+                entries.append(entry)
+            return write_json_atomic(self.path, {"version": SHARDS_VERSION, "shards": entries})
+        except BaseException:
+            self._remove_shards(written)
+            raise
+
+    def _runs(self, tasks, current):
+        """Split ``tasks`` where a shard in the manifest starts (so unchanged
+        shards come out as they were) or where a run reaches shard_size."""
+        if isinstance(tasks, TaskList):
+            # Slices between the rows where shards start, rather than a step per task
+            starts = sorted({0, len(tasks)} | {tasks.row_of(first) for first in current
+                                               if first is not None and tasks.get(first) is not None})
+            for start, end in zip(starts, starts[1:]):
+                for at in range(start, end, self.shard_size):
+                    yield tasks[at:min(end, at + self.shard_size)]
+            return
+        run = []
+        for task in tasks:
+            task = as_task(task)
+            if run and (len(run) >= self.shard_size or (task.id is not None and task.id in current)):
+                yield run
+                run = []
+            run.append(task)
+        if run:
+            yield run
+
+    def _write_shard(self, name, tasks):
+        with open(os.path.join(self.shard_dir, name), 'w') as f:
+            f.write(json.dumps([task_row(task) for task in tasks], separators=(',', ':')))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _replace_snapshot(self, tmp):
+        old = self._read_manifest(self.path)
+        keep = {entry["file"] for entry in self._read_manifest(tmp)}
+        os.replace(tmp, self.path)
+        self._remove_shards(entry["file"] for entry in old if entry["file"] not in keep)
+        self._digests = {name: digest for name, digest in self._digests.items() if name in keep}
+
+    def _discard_snapshot(self, tmp):
+        keep = {entry["file"] for entry in self._read_manifest(self.path)}
+        self._remove_shards(entry["file"] for entry in self._read_manifest(tmp) if entry["file"] not in keep)
+        os.remove(tmp)
+
+    def _remove_shards(self, names):
+        for name in names:
+            self._digests.pop(name, None)
+            try:
+                os.remove(os.path.join(self.shard_dir, name))
+            except OSError:
+                pass  # already gone, or still open in another process on Windows
+
+    @staticmethod
+    def _read_manifest(path):
+        try:
+            with open(path, 'r') as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            return []
+        if not isinstance(manifest, dict) or manifest.get("version") != SHARDS_VERSION:
+            raise ValueError("%s is not a version %d shard manifest" % (path, SHARDS_VERSION))
+        return manifest["shards"]
+
+
+class SqliteStore:
+    """Tasks in an SQLite table, one row per task.
+
+    Journal records become single-row statements keyed by the unique task_id
+    index, and a priority sort is one UPDATE over the (priority_rank,
+    position) index instead of a rewrite. Fields beyond the standard ones
+    are kept as JSON in the ``extra`` column, so every task comes back as it
+    went in.
+
+    Each record is also kept in a ``changes`` table, numbered in commit
+    order, so other processes sharing the database can pick up just what
+    changed; see JournalStore.changes().
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS tasks (
+            id INTEGER PRIMARY KEY,
+            task_id TEXT,
+            position INTEGER NOT NULL,
+            task TEXT NOT NULL,
+            priority TEXT NOT NULL DEFAULT '',
+            priority_rank INTEGER NOT NULL DEFAULT 3,
+            completed INTEGER NOT NULL DEFAULT 0,
+            extra TEXT
+        );
+        CREATE TABLE IF NOT EXISTS settings (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            record TEXT NOT NULL
+        );
+    """
+    INDEXES = """
+        CREATE UNIQUE INDEX IF NOT EXISTS tasks_task_id ON tasks (task_id);
+        CREATE INDEX IF NOT EXISTS tasks_position ON tasks (position);
+        CREATE INDEX IF NOT EXISTS tasks_priority ON tasks (priority_rank, position);
+        CREATE INDEX IF NOT EXISTS tasks_completed ON tasks (completed, position);
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.archive = TaskArchive(path + ARCHIVE_SUFFIX)
+        import sqlite3  # only the SQLite backend pays for the import
+        self._lock = threading.RLock()
+        self._depth = 0  # how many _transaction() blocks are open
+        # The persistence worker writes from its own thread, serialized by _lock
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(self.SCHEMA)
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(tasks)")}
+        if "task_id" not in columns:
+            self._db.execute("ALTER TABLE tasks ADD COLUMN task_id TEXT")
+        if "extra" not in columns:
+            self._db.execute("ALTER TABLE tasks ADD COLUMN extra TEXT")
+            self._fold_columns(columns)
+        self._db.executescript(self.INDEXES)
+        self._missing_ids = []
+        # As in JournalStore: the last change the caller's list reflects
+        self._loaded_change = 0
+        self._seen_change = 0
+        self._data_version = None
+        self._incoming = []
+        self._stale = False
+
+    @contextmanager
+    def locked(self):
+        """Hold the database's write lock (and this store's thread lock) until
+        the block ends; re-entrant. See JournalStore.locked()."""
+        with self._transaction():
+            yield
+
+    def load(self):
+        tasks = TaskList()
+        for batch, _ in self.load_batches():
+            tasks.extend(batch)
+        self.finish_load(tasks)
+        return tasks
+
+    def load_batches(self, batch_size=LOAD_BATCH):
+        """Stream the table as (tasks, fraction done) batches; see JournalStore."""
+        with self._lock:
+            self._loaded_change = self._last_change()
+            total = max(1, self._db.execute("SELECT COUNT(*) FROM tasks").fetchone()[0])
+            rows = self._db.execute(
+                "SELECT id, task_id, task, priority, completed, extra FROM tasks ORDER BY position")
+        loaded = 0
+        while True:
+            with self._lock:
+                chunk = rows.fetchmany(batch_size)
+            if not chunk:
+                return
+            batch = []
+            for rowid, task_id, *columns in chunk:
+                task = self._task(task_id, *columns)
+                if task_id is None:
+                    task.id = new_task_id()
+                    self._missing_ids.append((task.id, rowid))
+                batch.append(task)
+            loaded += len(chunk)
+            yield batch, min(1.0, loaded / total)
+
+    def finish_load(self, tasks):
+        self._save_missing_ids()
+        with self._lock:
+            self._data_version = self._db.execute("PRAGMA data_version").fetchone()[0]
+            self._seen_change = self._last_change()
+            self._incoming = []
+            # Rows read while another process was writing may be a mix of before and after
+            self._stale = self._seen_change != self._loaded_change
+
+    def iter_tasks(self, batch_size=LOAD_BATCH):
+        """Yield every task a batch at a time; see JournalStore.iter_tasks()."""
+        for batch, _ in self.load_batches(batch_size):
+            yield batch
+        self._save_missing_ids()
+
+    def changes(self, tasks):
+        """Return the change records other processes committed since the
+        last call (or the load); see JournalStore.changes()."""
+        with self._lock:
+            version = self._db.execute("PRAGMA data_version").fetchone()[0]
+            if version == self._data_version and not (self._stale or self._incoming):
+                return []
+            self._data_version = version
+            self._catch_up()
+            if self._stale:
+                current = TaskList(self._task(*row) for row in self._db.execute(
+                    "SELECT task_id, task, priority, completed, extra FROM tasks ORDER BY position"))
+                records = diff_tasks(tasks, current, key=lambda task: (task.text, task.priority, task.completed,
+                                                                       self._extra(task)))
+                self._stale = False
+            else:
+                records = self._incoming
+            self._incoming = []
+        return [record for record in records if record["op"] != "sort"]
+
+    def append(self, record):
+        self.append_many([record])
+
+    def append_many(self, records):
+        """Apply a batch of journal records in one transaction."""
+        with self._transaction():
+            self._catch_up()
+            # Committed after theirs, so our edits win
+            self._incoming = drop_superseded(self._incoming, records)
+            for record in records:
+                self._apply(record)
+            self._log(records)
+
+    def save(self, tasks):
+        if not isinstance(tasks, TaskList):
+            tasks = TaskList(tasks)
+        with self._transaction():
+            self._db.execute("DELETE FROM tasks")
+            self._db.executemany(
+                "INSERT INTO tasks (task_id, position, task, priority, priority_rank, completed, extra) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                ((task["id"], pos) + self._columns(task) for pos, task in enumerate(tasks)))
+            # Tells other processes to compare everything
+            self._log([{"op": "save"}])
+            self._incoming = []
+            self._stale = False
+
+    def load_settings(self):
+        with self._lock:
+            rows = self._db.execute("SELECT key, value FROM settings")
+            return {key: json.loads(value) for key, value in rows}
+
+    def save_settings(self, settings):
+        with self._transaction():
+            self._db.execute("DELETE FROM settings")
+            self._db.executemany("INSERT INTO settings (key, value) VALUES (?, ?)",
+                                 ((key, json.dumps(value)) for key, value in settings.items()))
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    @contextmanager
+    def _transaction(self):
+        # One transaction however deeply these nest: only the outermost block
+        # begins it and commits (or, on an error, rolls back), so writes made
+        # inside locked() land together with whatever the caller read there
+        with self._lock:
+            if self._depth:
+                self._depth += 1
+                try:
+                    yield
+                finally:
+                    self._depth -= 1
+                return
+            # IMMEDIATE takes the write lock up front, so what _catch_up() reads
+            # is still current when our own statements commit
+            self._db.execute("BEGIN IMMEDIATE")
+            self._depth = 1
+            try:
+                yield
+            except BaseException:
+                self._db.rollback()
+                raise
+            else:
+                self._db.commit()
+            finally:
+                self._depth = 0
+
+    def _save_missing_ids(self):
+        # Rows from before task ids keep the ids they were just given
+        if self._missing_ids:
+            with self._transaction():
+                self._db.executemany("UPDATE tasks SET task_id = ? WHERE id = ?", self._missing_ids)
+            self._missing_ids = []
+
+    def _last_change(self):
+        return self._db.execute("SELECT COALESCE(MAX(seq), 0) FROM changes").fetchone()[0]
+
+    def _catch_up(self):
+        rows = self._db.execute("SELECT seq, record FROM changes WHERE seq > ? ORDER BY seq",
+                                (self._seen_change,)).fetchall()
+        if not rows:
+            return
+        if rows[0][0] != self._seen_change + 1:
+            self._stale = True  # trimmed from the log before we got to them
+        for seq, record in rows:
+            record = json.loads(record)
+            if record["op"] == "save":
+                self._stale = True
+            elif not self._stale:
+                self._incoming.append(record)
+        self._seen_change = rows[-1][0]
+
+    def _log(self, records):
+        self._db.executemany("INSERT INTO changes (record) VALUES (?)",
+                             ((json.dumps(record, separators=(',', ':'), default=dict),) for record in records))
+        self._seen_change = self._last_change()
+        self._db.execute("DELETE FROM changes WHERE seq <= ?", (self._seen_change - CHANGE_LOG,))
+
+    def _apply(self, record):
+        op = record["op"]
+        if op == "add":
+            self._db.execute(
+                "INSERT INTO tasks (task_id, position, task, priority, priority_rank, completed, extra) "
+                "VALUES (?, (SELECT COALESCE(MAX(position), -1) + 1 FROM tasks), ?, ?, ?, ?, ?)",
+                (record["task"]["id"],) + self._columns(record["task"]))
+        elif op == "update":
+            self._db.execute(
+                "UPDATE tasks SET task = ?, priority = ?, priority_rank = ?, completed = ?, extra = ? WHERE task_id = ?",
+                self._columns(record["task"]) + (record["id"],))
+        elif op == "delete":
+            self._db.execute("DELETE FROM tasks WHERE task_id = ?", (record["id"],))
+        elif op == "sort":
+            # Stable like list.sort(): ties keep their current order
+            self._db.execute(
+                "UPDATE tasks SET position = ranked.rn FROM ("
+                "  SELECT id, ROW_NUMBER() OVER (ORDER BY priority_rank, position) - 1 AS rn"
+                "  FROM tasks) AS ranked "
+                "WHERE tasks.id = ranked.id")
+        else:
+            raise ValueError("Unknown journal operation: %r" % op)
+
+    def _fold_columns(self, columns):
+        # Databases from before the extra column kept some fields in columns
+        # of their own; those move into it once and are not read again
+        legacy = [column for column in LEGACY_COLUMNS if column in columns]
+        if not legacy:
+            return
+        updates = []
+        for rowid, *values in self._db.execute("SELECT id, %s FROM tasks" % ", ".join(legacy)).fetchall():
+            extra = {column: json.loads(value) if column in LEGACY_JSON_COLUMNS else value
+                     for column, value in zip(legacy, values) if value is not None}
+            if extra:
+                updates.append((json.dumps(extra, separators=(',', ':')), rowid))
+        with self._transaction():
+            self._db.executemany("UPDATE tasks SET extra = ? WHERE id = ?", updates)
+
+    @staticmethod
+    def _extra(task):
+        # Every field but the standard ones, as the extra column holds them
+        return {key: value for key, value in task.items() if key not in FIELDS and value is not None}
+
+    @classmethod
+    def _columns(cls, task):
+        extra = cls._extra(task)
+        return (task["task"], task["priority"], priority_key(task), int(task["completed"]),
+                json.dumps(extra, separators=(',', ':')) if extra else None)
+
+    @staticmethod
+    def _task(task_id, text, priority, completed, extra=None):
+        return Task(text, priority, bool(completed), task_id, json.loads(extra) if extra else None)
+
+
+def migrate_json_to_sqlite(json_path, db_path):
+    """Copy tasks.json (and its journal) into an SQLite database.
+
+    Returns the number of tasks copied.
+    """
+    tasks = JournalStore(json_path).load()
+    store = SqliteStore(db_path)
+    try:
+        store.save(tasks)
+    finally:
+        store.close()
+    return len(tasks)
+
+
+def store_for_path(path):
+    """The store for a file, by its suffix: .db SQLite, .bin binary snapshot,
+    .shards sharded snapshot, else JSON."""
+    suffix = os.path.splitext(path)[1]
+    if suffix == SQLITE_SUFFIX:
+        return SqliteStore(path)
+    if suffix == BINARY_SUFFIX:
+        return BinaryStore(path)
+    if suffix == SHARDS_SUFFIX:
+        return ShardedStore(path)
+    return JournalStore(path)
+
+
+def convert_tasks(source, target):
+    """Copy the tasks (replaying any journal) and view settings at ``source``
+    into a new store at ``target``; formats follow the file suffixes.
+
+    Returns the number of tasks copied.
+    """
+    source_store = store_for_path(source)
+    try:
+        tasks = source_store.load()
+        settings = source_store.load_settings()
+    finally:
+        source_store.close()
+    target_store = store_for_path(target)
+    try:
+        target_store.save(tasks)
+        if settings:
+            target_store.save_settings(settings)
+    finally:
+        target_store.close()
+    return len(tasks)
+
+
+def archive_age():
+    """Seconds after its completion a task moves to the archive, from
+    $TASKS_ARCHIVE_DAYS (default 14 days); None if that is "off"."""
+    value = os.environ.get('TASKS_ARCHIVE_DAYS', '').strip().lower()
+    if value == 'off':
+        return None
+    try:
+        days = float(value) if value else ARCHIVE_AFTER_DAYS
+    except ValueError:
+        raise ValueError("TASKS_ARCHIVE_DAYS must be a number of days or 'off', not %r" % value)
+    return days * 24 * 60 * 60
+
+
+def archive_records(archive, tasks, older_than, now=None):
+    """Move the tasks completed more than ``older_than`` seconds ago into
+    ``archive``; returns the change records that take them out of the task
+    list, followed by updates stamping a completion time on completed tasks
+    that have none yet (written before tasks had one), which start their
+    wait from now."""
+    now = time.time() if now is None else now
+    old = []
+    unstamped = []
+    for task in tasks:
+        if task.completed:
+            completed_at = task.get(COMPLETED_AT)
+            if not isinstance(completed_at, (int, float)):
+                unstamped.append(task)
+            elif completed_at <= now - older_than:
+                old.append(task)
+    archive.add(old)
+    return ([{"op": "delete", "id": task.id} for task in old] +
+            [{"op": "update", "id": task.id, "task": dict(task, **{COMPLETED_AT: now})} for task in unstamped])
+
+
+class TaskArchive:
+    """Completed tasks moved out of the task list, so that loading, saving
+    and showing the list only pay for the tasks still in use.
+
+    The archive is a directory (``tasks.json.archive``) of numbered segments:
+    gzip-compressed JSON Lines of change records, each written once and never
+    changed. A segment holds "add" records for tasks archived together and
+    "delete" records for tasks restored or deleted from the archive since.
+    Nothing is read until load(), which replays the segments in order.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def segments(self):
+        try:
+            names = os.listdir(self.path)
+        except FileNotFoundError:
+            return []
+        numbered = sorted((int(match.group(1)), name) for match, name in
+                          ((SEGMENT_NAME.match(name), name) for name in names) if match)
+        return [os.path.join(self.path, name) for _, name in numbered]
+
+    def load(self):
+        """Every archived task, in the order they were archived."""
+        import gzip  # only opening the archive pays for the import
+        tasks = {}
+        for path in self.segments():
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                for line in f:
+                    record = json.loads(line)
+                    if record["op"] == "add":
+                        task = as_task(record["task"])
+                        tasks.pop(task.id, None)  # archived twice (two windows at once): keep the later one
+                        tasks[task.id] = task
+                    else:
+                        tasks.pop(record["id"], None)
+        return TaskList(list(tasks.values()))
+
+    def add(self, tasks):
+        """Archive ``tasks`` in one new segment."""
+        self._write([{"op": "add", "task": task} for task in tasks])
+
+    def remove(self, task_ids):
+        """Take tasks out of the archive, to restore them or for good."""
+        self._write([{"op": "delete", "id": task_id} for task_id in task_ids])
+
+    def _write(self, records):
+        if not records:
+            return
+        import gzip
+        os.makedirs(self.path, exist_ok=True)
+        data = ''.join(json.dumps(record, separators=(',', ':'), default=dict) + '\n' for record in records)
+        tmp = temp_path(os.path.join(self.path, 'segment'))
+        try:
+            with open(tmp, 'wb') as f:
+                f.write(gzip.compress(data.encode('utf-8'), compresslevel=6, mtime=0))
+                f.flush()
+                os.fsync(f.fileno())
+            segments = self.segments()
+            number = int(SEGMENT_NAME.match(os.path.basename(segments[-1])).group(1)) + 1 if segments else 1
+            # A hard link never replaces a segment another process numbered the same
+            while True:
+                try:
+                    os.link(tmp, os.path.join(self.path, '%06d.jsonl.gz' % number))
+                    break
+                except FileExistsError:
+                    number += 1
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+
+def open_store(path, backend=None):
+    """Open the store for ``path`` using ``backend`` or $TASKS_BACKEND.
+
+    The SQLite database and the binary and sharded snapshots live next to the
+    JSON file (with a .db, .bin or .shards suffix) and are seeded from the
+    JSON data the first time they are opened. Unless ``backend`` is given, $TASKS_SERVER instead
+    names a running task_server.py to use as the store.
+    """
+    server = os.environ.get('TASKS_SERVER')
+    if server and not backend:
+        from task_server import ServerStore
+        return ServerStore(server)
+    backend = backend or os.environ.get('TASKS_BACKEND', 'json')
+    if backend not in BACKENDS:
+        raise ValueError("Unknown storage backend: %r" % backend)
+    if backend == 'sqlite':
+        db_path = os.path.splitext(path)[0] + SQLITE_SUFFIX
+        if not os.path.exists(db_path) and os.path.exists(path):
+            migrate_json_to_sqlite(path, db_path)
+        return SqliteStore(db_path)
+    if backend == 'binary':
+        bin_path = os.path.splitext(path)[0] + BINARY_SUFFIX
+        if not os.path.exists(bin_path) and os.path.exists(path):
+            convert_tasks(path, bin_path)
+        return BinaryStore(bin_path)
+    if backend == 'sharded':
+        shards_path = os.path.splitext(path)[0] + SHARDS_SUFFIX
+        if not os.path.exists(shards_path) and os.path.exists(path):
+            convert_tasks(path, shards_path)
+        return ShardedStore(shards_path)
+    return JournalStore(path)
+
+
+class PersistenceWorker:
+    """Writes journal records to a store from a background thread.
+
+    submit() only queues the record, so it is safe and cheap to call from the
+    GUI thread. Records submitted within ``coalesce_delay`` of each other are
+    written together. run() is the thread body; the Tk app runs it through
+    start(), the Qt app from a QThread.
+    """
+
+    def __init__(self, store, coalesce_delay=COALESCE_DELAY):
+        self.store = store
+        self.coalesce_delay = coalesce_delay
+        self.on_error = None  # called on the worker thread with the exception
+        self._pending = []
+        self._cond = threading.Condition()
+        self._running = False
+        self._busy = False
+        self._urgent = False
+        self._stopped = False
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True).start()
+        atexit.register(self.stop)
+
+    def submit(self, record):
+        self.submit_many([record])
+
+    def submit_many(self, records):
+        """Queue a batch of records; they are written together, in one
+        append_many() call."""
+        # The GUI keeps mutating its dicts; queue copies
+        records = [dict(record, task=dict(record["task"])) if "task" in record else record
+                   for record in records]
+        with self._cond:
+            if not self._stopped:
+                self._pending.extend(records)
+                self._cond.notify_all()
+                return
+        self.store.append_many(records)
+
+    def run(self):
+        with self._cond:
+            self._running = True
+        try:
+            while True:
+                with self._cond:
+                    self._cond.wait_for(lambda: self._pending or self._stopped)
+                    if not self._pending:
+                        return
+                    if not (self._urgent or self._stopped):
+                        self._cond.wait_for(lambda: self._urgent or self._stopped,
+                                            timeout=self.coalesce_delay)
+                    batch, self._pending = self._pending, []
+                    self._busy = True
+                try:
+                    self.store.append_many(batch)
+                except Exception as exc:
+                    if self.on_error is not None:
+                        self.on_error(exc)
+                finally:
+                    with self._cond:
+                        self._busy = False
+                        self._cond.notify_all()
+        finally:
+            with self._cond:
+                self._running = False
+                self._cond.notify_all()
+
+    def idle(self):
+        """Whether every submitted record has been written."""
+        with self._cond:
+            return not (self._pending or self._busy)
+
+    def flush(self):
+        """Block until every submitted record has been written."""
+        with self._cond:
+            if self._running:
+                self._urgent = True
+                self._cond.notify_all()
+                self._cond.wait_for(lambda: not (self._pending or self._busy) or not self._running)
+                self._urgent = False
+                if self._running:
+                    return
+            batch, self._pending = self._pending, []
+        if batch:
+            self.store.append_many(batch)
+
+    def stop(self):
+        """Flush-on-exit hook: write what is queued and end the thread."""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+            self._cond.wait_for(lambda: not self._running)
+        self.flush()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Task storage maintenance.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    migrate = commands.add_parser('migrate', help="copy tasks.json into an SQLite database")
+    migrate.add_argument('source', nargs='?', default='tasks.json')
+    migrate.add_argument('target', nargs='?')
+    convert = commands.add_parser('convert', help="convert between tasks.json and the binary or sharded "
+                                                  "snapshot (or an SQLite database), by file suffix")
+    convert.add_argument('source')
+    convert.add_argument('target')
+    args = parser.parse_args(argv)
+
+    if args.command == 'convert':
+        if os.path.exists(args.target):
+            parser.error("%s already exists" % args.target)
+        count = convert_tasks(args.source, args.target)
+        print("Converted %d tasks from %s to %s" % (count, args.source, args.target))
+        return 0
+
+    target = args.target or os.path.splitext(args.source)[0] + SQLITE_SUFFIX
+    if os.path.exists(target):
+        parser.error("%s already exists" % target)
+    count = migrate_json_to_sqlite(args.source, target)
+    print("Migrated %d tasks from %s to %s" % (count, args.source, target))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,66 @@
+import unittest
+import os
+import shutil
+import tempfile
+from unittest.mock import patch
+
+from benchmark import bench_qt, generate_tasks, measure, compare, write_tasks, TEXT_LENGTHS
+
+class TestBenchmark(unittest.TestCase):
+    """Test cases for the benchmark data generator and regression check."""
+
+    def test_generated_tasks_are_reproducible(self):
+        """Test that the same seed gives the same tasks and ids are unique."""
+        tasks = generate_tasks(500, seed=7)
+        self.assertEqual(tasks, generate_tasks(500, seed=7))
+        self.assertNotEqual(tasks, generate_tasks(500, seed=8))
+        self.assertEqual(len({task["id"] for task in tasks}), 500)
+
+    def test_text_lengths_and_priority_mixes(self):
+        """Test that the text and priority options shape the data."""
+        shortest, longest = TEXT_LENGTHS["long"]
+        for task in generate_tasks(200, text="long"):
+            self.assertTrue(shortest <= len(task["task"].split()) <= longest)
+        self.assertEqual({task["priority"] for task in generate_tasks(200, priorities="none")}, {""})
+        self.assertEqual({task["priority"] for task in generate_tasks(200)}, {"High", "Medium", "Low", ""})
+
+    def test_measure(self):
+        """Test that every run is timed after its setup."""
+        calls = []
+        result = measure(lambda: calls.append("run"), 3, setup=lambda: calls.append("setup"))
+        self.assertEqual(calls, ["setup", "run"] * 3)
+        self.assertLessEqual(result["min"], result["median"])
+
+    def test_compare_flags_regressions(self):
+        """Test that only slowdowns past the tolerance and the noise floor are flagged."""
+        def report(load, add, sort):
+            return {"results": {"qt": {"1000": {
+                "load_tasks": {"median": load, "min": load},
+                "add_task": {"median": add, "min": add},
+                "sort_by_priority": {"median": sort, "min": sort}}}}}
+        baseline = report(100.0, 0.2, 10.0)
+        self.assertEqual(compare(baseline, report(110.0, 0.2, 8.0)), [])
+        self.assertEqual(compare(baseline, report(150.0, 0.9, 10.0)), [("qt", "1000", "load_tasks", 100.0, 150.0)])
+        self.assertEqual(compare(baseline, report(150.0, 0.2, 10.0), tolerance=0.6), [])
+        # New sizes or frontends have nothing to compare against
+        self.assertEqual(compare({"results": {}}, report(150.0, 0.9, 10.0)), [])
+
+    def test_qt_benchmark_runs(self):
+        """Test that every Qt operation can be timed, on a small list and an offscreen window."""
+        directory = tempfile.mkdtemp()
+        original_cwd = os.getcwd()
+        try:
+            write_tasks(directory, generate_tasks(50))
+            os.chdir(directory)
+            with patch.dict(os.environ, {"QT_QPA_PLATFORM": os.environ.get("QT_QPA_PLATFORM", "offscreen")}):
+                results = bench_qt(1)
+        finally:
+            os.chdir(original_cwd)
+            shutil.rmtree(directory)
+        self.assertEqual(set(results), {"load_tasks", "save_tasks", "refresh_table", "sort_by_priority", "add_task",
+                                        "toggle_complete", "toggle_selection", "delete_task", "delete_selection"})
+        for timing in results.values():
+            self.assertLessEqual(timing["min"], timing["median"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -34,6 +34,8 @@ class TestTaskManagerIntegration(unittest.TestCase):
     
     def tearDown(self):
         """Clean up after each test."""
+        # Let the background writer finish before its directory goes away
+        self.task_manager.persistence_thread.shutdown()
         # Clean up temporary files
         os.chdir(self.original_cwd)
         import shutil
@@ -57,7 +59,7 @@ class TestTaskManagerIntegration(unittest.TestCase):
         self.assertEqual(len(self.task_manager.tasks), 3)
         
         # Step 2: Toggle completion status
-        with patch.object(self.task_manager.table, 'currentRow', return_value=0):
+        with patch.object(self.task_manager, 'selected_ids', return_value=[self.task_manager.tasks[0]["id"]]):
             self.task_manager.toggle_complete()
         
         # Verify first task is now complete
@@ -66,22 +68,23 @@ class TestTaskManagerIntegration(unittest.TestCase):
         # Step 3: Sort by priority
         self.task_manager.sort_by_priority()
         
-        # Verify correct order: High, Medium, Low
-        priorities = [task["priority"] for task in self.task_manager.tasks]
+        # Verify correct view order: High, Medium, Low
+        model = self.task_manager.model
+        priorities = [model.index(row, 1).data() for row in range(model.rowCount())]
         self.assertEqual(priorities, ["High", "Medium", "Low"])
         
-        # Step 4: Edit a task
-        with patch.object(self.task_manager.table, 'currentRow', return_value=1):
+        # Step 4: Edit a task (the medium one, stored third)
+        with patch.object(self.task_manager, 'selected_id', return_value=self.task_manager.tasks[2]["id"]):
             with patch('PyQt5.QtWidgets.QInputDialog.getText', return_value=("Edited medium task", True)):
                 with patch('PyQt5.QtWidgets.QInputDialog.getItem', return_value=("Low", True)):
                     self.task_manager.edit_task()
         
         # Verify task was edited
-        self.assertEqual(self.task_manager.tasks[1]["task"], "Edited medium task")
-        self.assertEqual(self.task_manager.tasks[1]["priority"], "Low")
+        self.assertEqual(self.task_manager.tasks[2]["task"], "Edited medium task")
+        self.assertEqual(self.task_manager.tasks[2]["priority"], "Low")
         
-        # Step 5: Delete a task
-        with patch.object(self.task_manager.table, 'currentRow', return_value=2):
+        # Step 5: Delete a task (the original low one, stored first)
+        with patch.object(self.task_manager, 'selected_ids', return_value=[self.task_manager.tasks[0]["id"]]):
             with patch('PyQt5.QtWidgets.QMessageBox.question', return_value=1):  # Yes
                 self.task_manager.delete_task()
         
@@ -146,7 +149,7 @@ class TestTaskManagerIntegration(unittest.TestCase):
         # Test initial UI state
         self.assertEqual(self.task_manager.task_input.text(), "")
         self.assertEqual(self.task_manager.priority_input.currentText(), "Medium")
-        self.assertEqual(self.task_manager.table.rowCount(), 0)
+        self.assertEqual(self.task_manager.model.rowCount(), 0)
         
         # Add a task and verify UI updates
         self.task_manager.task_input.setText("Test task")
@@ -158,10 +161,11 @@ class TestTaskManagerIntegration(unittest.TestCase):
         self.assertEqual(self.task_manager.priority_input.currentText(), "Medium")
         
         # Verify table was updated
-        self.assertEqual(self.task_manager.table.rowCount(), 1)
-        self.assertEqual(self.task_manager.table.item(0, 0).text(), "Test task")
-        self.assertEqual(self.task_manager.table.item(0, 1).text(), "High")
-        self.assertEqual(self.task_manager.table.item(0, 2).text(), "Incomplete")
+        model = self.task_manager.model
+        self.assertEqual(model.rowCount(), 1)
+        self.assertEqual(model.index(0, 0).data(), "Test task")
+        self.assertEqual(model.index(0, 1).data(), "High")
+        self.assertEqual(model.index(0, 2).data(), "Incomplete")
     
     def test_error_handling(self):
         """Test error handling scenarios."""
@@ -177,7 +181,7 @@ class TestTaskManagerIntegration(unittest.TestCase):
         self.assertEqual(len(self.task_manager.tasks), initial_count)
         
         # Test operations with no selection
-        with patch.object(self.task_manager.table, 'currentRow', return_value=-1):
+        with patch.object(self.task_manager, 'selected_ids', return_value=[]):
             # These should not crash
             self.task_manager.delete_task()
             self.task_manager.toggle_complete()
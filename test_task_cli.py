@@ -0,0 +1,206 @@
+import unittest
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import redirect_stderr, redirect_stdout
+from unittest.mock import patch
+
+from task_cli import edit_tasks, import_tasks, main, read_rows, task_filter
+from task_model import next_occurrence
+from task_storage import JournalStore, SqliteStore, open_store
+
+
+class TestTaskCli(unittest.TestCase):
+    """Test cases for the headless bulk import, export and edit commands."""
+
+    def setUp(self):
+        """Create a temporary tasks file location."""
+        self.test_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.test_dir, 'tasks.json')
+
+    def tearDown(self):
+        """Clean up temporary files."""
+        shutil.rmtree(self.test_dir)
+
+    def write(self, name, text):
+        path = os.path.join(self.test_dir, name)
+        with open(path, 'w', newline='') as f:
+            f.write(text)
+        return path
+
+    def run_cli(self, *args):
+        with redirect_stderr(io.StringIO()) as err:
+            code = main(["--file", self.path] + list(args))
+        return code, err.getvalue()
+
+    def load(self):
+        store = open_store(self.path)
+        try:
+            return store.load()
+        finally:
+            store.close()
+
+    def test_csv_round_trip(self):
+        """Test that a CSV import is exported again as the same rows."""
+        source = self.write('in.csv', "task,priority,completed,owner\n"
+                                      "Write report,high,yes,ann\n"
+                                      "\"Call, then email\",,,\n")
+        code, err = self.run_cli("import", source)
+        self.assertEqual(code, 0)
+        self.assertIn("Imported 2 tasks", err)
+
+        tasks = self.load()
+        self.assertEqual([(t.text, t.priority, t.completed) for t in tasks],
+                         [("Write report", "High", True), ("Call, then email", "", False)])
+        self.assertEqual(tasks[0]["owner"], "ann")
+        self.assertNotIn("owner", tasks[1])
+
+        target = os.path.join(self.test_dir, 'out.csv')
+        self.run_cli("export", target)
+        with open(target, newline='') as f:
+            rows = list(read_rows(f, 'csv'))
+        self.assertEqual([(r["task"], r["priority"], r["completed"], r["id"]) for r in rows],
+                         [(t.text, t.priority or "None", t.completed, t.id) for t in tasks])
+
+    def test_jsonl_keeps_ids_unless_taken(self):
+        """Test that imported ids are kept unless a task already has them."""
+        store = JournalStore(self.path)
+        store.save([{"task": "Existing", "priority": "", "completed": False, "id": "a"}])
+        store.close()
+        source = self.write('in.jsonl', '{"task": "Clash", "id": "a"}\n\n{"task": "Fresh", "id": "b"}\n')
+        self.run_cli("import", source)
+
+        tasks = self.load()
+        self.assertEqual([t.text for t in tasks], ["Existing", "Clash", "Fresh"])
+        self.assertEqual(tasks[0].id, "a")
+        self.assertNotEqual(tasks[1].id, "a")
+        self.assertEqual(tasks[2].id, "b")
+
+    def test_bad_input_imports_nothing(self):
+        """Test that a malformed line is reported and leaves the tasks alone."""
+        source = self.write('in.jsonl', '{"task": "Fine"}\n{oops\n')
+        with redirect_stderr(io.StringIO()), self.assertRaises(SystemExit):
+            main(["--file", self.path, "import", source])
+        self.assertEqual(self.load(), [])
+        self.assertEqual(sorted(os.listdir(self.test_dir)), ['in.jsonl', 'tasks.json.lock'])
+
+    def test_export_filters(self):
+        """Test that export writes only the matching tasks."""
+        store = JournalStore(self.path)
+        store.save([{"task": "Ship release", "priority": "Low", "completed": False, "id": "a"},
+                    {"task": "Ship docs", "priority": "High", "completed": False, "id": "b"},
+                    {"task": "Plan RELEASE party", "priority": "Low", "completed": True, "id": "c"}])
+        store.close()
+        target = os.path.join(self.test_dir, 'out.jsonl')
+        self.run_cli("export", target, "--priority", "low", "--match", "release")
+        with open(target) as f:
+            self.assertEqual([json.loads(line)["id"] for line in f], ["a", "c"])
+        self.run_cli("export", target, "--priority", "low", "--incomplete")
+        with open(target) as f:
+            self.assertEqual([json.loads(line)["id"] for line in f], ["a"])
+
+        store = JournalStore(self.path)
+        store.load()
+        store.append_many([{"op": "update", "id": "a", "task": {"task": "Ship release", "priority": "Low",
+                                                                 "completed": False, "id": "a", "tags": ["work"]}},
+                           {"op": "update", "id": "b", "task": {"task": "Ship docs", "priority": "High",
+                                                                 "completed": False, "id": "b",
+                                                                 "tags": ["work", "docs"]}}])
+        store.close()
+        self.run_cli("export", target, "--tag", "work", "--tag", "docs")
+        with open(target) as f:
+            self.assertEqual([json.loads(line)["id"] for line in f], ["b"])
+
+    def test_edit_is_one_write(self):
+        """Test that a batch edit appends every change in one call."""
+        store = JournalStore(self.path)
+        store.save([{"task": "Low %d" % i, "priority": "Low", "completed": i % 2 == 0, "id": str(i)}
+                    for i in range(6)] + [{"task": "High", "priority": "High", "completed": False, "id": "h"}])
+        with patch.object(store, 'append_many', wraps=store.append_many) as append_many:
+            result = edit_tasks(store, 'complete', task_filter(["Low"]))
+        self.assertEqual(result, (7, 6, 3))
+        append_many.assert_called_once()
+
+        with patch.object(store, 'append_many', wraps=store.append_many) as append_many:
+            result = edit_tasks(store, 'delete', task_filter(completed=True), dry_run=True)
+        self.assertEqual(result, (7, 6, 6))
+        append_many.assert_not_called()
+        store.close()
+
+        code, err = self.run_cli("delete", "--completed")
+        self.assertIn("Deleted 6 of 6 matching tasks", err)
+        self.assertEqual([t.id for t in self.load()], ["h"])
+
+    def test_archive_and_export_archived(self):
+        """Test that archive moves long-completed tasks out and export can read them."""
+        store = JournalStore(self.path)
+        store.save([{"task": "Old", "priority": "", "completed": True, "id": "old", "completed_at": 1.0},
+                    {"task": "Legacy", "priority": "", "completed": True, "id": "legacy"},
+                    {"task": "Open", "priority": "", "completed": False, "id": "open"}])
+        store.close()
+
+        code, err = self.run_cli("archive", "--days", "30")
+        self.assertEqual(code, 0)
+        self.assertIn("Archived 1 tasks", err)
+        self.assertIn("1 completed tasks had no completion time", err)
+        tasks = self.load()
+        self.assertEqual(tasks.ids(), ["legacy", "open"])
+        self.assertIsInstance(tasks.get("legacy")["completed_at"], float)
+
+        target = os.path.join(self.test_dir, 'archived.jsonl')
+        self.run_cli("export", target, "--archived")
+        with open(target) as f:
+            self.assertEqual([json.loads(line)["id"] for line in f], ["old"])
+
+        self.run_cli("reopen", "--match", "legacy")
+        self.assertIsNone(self.load().get("legacy").get("completed_at"))
+
+    def test_recurring_tasks(self):
+        """Test that completing a recurring task keeps one occurrence and agenda lists the rest of the window."""
+        due = time.time() + 3600
+        store = JournalStore(self.path)
+        store.save([{"task": "Stand-up", "priority": "", "completed": False, "id": "s", "due": due, "repeat": "daily"},
+                    {"task": "Report", "priority": "", "completed": False, "id": "r", "due": due + 36 * 3600}])
+        store.close()
+
+        with redirect_stdout(io.StringIO()) as out:
+            code, err = self.run_cli("agenda", "--days", "3")
+        self.assertEqual(code, 0)
+        self.assertEqual([line.split("  ", 1)[1] for line in out.getvalue().splitlines()],
+                         ["Stand-up", "Stand-up", "Report", "Stand-up"])
+
+        code, err = self.run_cli("complete", "--match", "stand-up")
+        self.assertIn("Completed 1 of 1 matching tasks", err)
+        tasks = self.load()
+        self.assertEqual(len(tasks), 3)
+        self.assertEqual((tasks.get("s").completed, tasks.get("s")["due"]), (False, next_occurrence("daily", due)))
+        self.assertEqual((tasks[2].completed, tasks[2]["due"], tasks[2]["series"]), (True, due, "s"))
+
+    def test_sqlite_backend(self):
+        """Test import and a batch edit against the SQLite backend."""
+        self.path = os.path.join(self.test_dir, 'tasks.db')
+        store = open_store(self.path, 'sqlite')
+        self.assertIsInstance(store, SqliteStore)
+        self.assertEqual(import_tasks(store, ({"task": "Task %d" % i, "priority": "Low"} for i in range(25)),
+                                      batch_size=10), 25)
+        self.assertEqual(edit_tasks(store, 'complete', task_filter(match=["task 1"])), (25, 11, 11))
+        tasks = store.load()
+        store.close()
+        self.assertEqual(sum(t.completed for t in tasks), 11)
+
+    def test_runs_without_gui_toolkits(self):
+        """Test that the command line imports neither Qt nor Tkinter."""
+        code = ("import sys, task_cli; "
+                "print(sorted(m for m in ('PyQt5', 'tkinter') if m in sys.modules))")
+        output = subprocess.run([sys.executable, "-c", code], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                capture_output=True, text=True, check=True).stdout
+        self.assertEqual(output.strip(), "[]")
+
+
+if __name__ == '__main__':
+    unittest.main()
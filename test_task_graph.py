@@ -0,0 +1,84 @@
+import unittest
+
+from task_model import TaskList
+from task_graph import TaskGraph, CycleError, link_choices, progress_label
+
+class TestTaskGraph(unittest.TestCase):
+    """Test cases for the incrementally kept subtask and blocked-by links."""
+
+    def setUp(self):
+        # launch has subtasks site (with its own subtask copy) and ads; ads waits for site
+        self.tasks = TaskList([
+            {"task": "launch", "priority": "", "completed": False, "id": "launch"},
+            {"task": "site", "priority": "", "completed": False, "id": "site", "parent": "launch"},
+            {"task": "copy", "priority": "", "completed": True, "id": "copy", "parent": "site"},
+            {"task": "ads", "priority": "", "completed": False, "id": "ads", "parent": "launch",
+             "blocked_by": ["site"]}
+        ])
+        self.graph = TaskGraph(self.tasks)
+
+    def test_initial_state(self):
+        """Test blocked, ready and roll-up progress straight after loading."""
+        self.assertEqual(self.graph.blocked, {"ads"})
+        self.assertEqual(self.graph.ready, {"launch", "site"})
+        self.assertEqual(self.graph.progress("launch"), (1, 3))
+        self.assertEqual(self.graph.progress("site"), (1, 1))
+        self.assertEqual(self.graph.progress("ads"), (0, 0))
+        self.assertEqual(self.graph.children("launch"), {"site", "ads"})
+
+    def test_toggle_updates_incrementally(self):
+        """Test that completing a task unblocks its dependents and rolls up to every ancestor."""
+        self.graph.take_changed()
+        self.tasks.update("site", completed=True)
+        self.assertEqual(self.graph.blocked, set())
+        self.assertEqual(self.graph.ready, {"launch", "ads"})
+        self.assertEqual(self.graph.progress("launch"), (2, 3))
+        self.assertEqual(self.graph.take_changed(), {"ads", "launch"})
+        self.tasks.update("site", completed=False)
+        self.assertEqual(self.graph.blocked, {"ads"})
+        self.assertEqual(self.graph.progress("launch"), (1, 3))
+
+    def test_links_follow_edits_and_removals(self):
+        """Test re-parenting a subtree, dropping a blocker and links to tasks not in the list."""
+        self.tasks.update("site", parent=None)
+        self.assertEqual(self.graph.progress("launch"), (0, 1))
+        self.tasks.update("site", parent="launch")
+        self.assertEqual(self.graph.progress("launch"), (1, 3))
+        self.tasks.remove("site")
+        self.assertEqual(self.graph.blocked, set())
+        self.assertEqual(self.graph.progress("launch"), (0, 1))
+        # A blocker that arrives later blocks from then on
+        self.tasks.update("ads", blocked_by=["later"])
+        self.assertEqual(self.graph.blocked, set())
+        self.tasks.add({"task": "later", "priority": "", "completed": False, "id": "later"})
+        self.assertEqual(self.graph.blocked, {"ads"})
+
+    def test_cycles(self):
+        """Test that cycles are refused before an edit and ignored when loaded."""
+        with self.assertRaises(CycleError):
+            self.graph.check_parent("launch", "copy")
+        with self.assertRaises(CycleError):
+            self.graph.check_blockers("site", ["ads"])
+        with self.assertRaises(CycleError):
+            self.graph.check_blockers("site", ["site"])
+        self.graph.check_parent("copy", "ads")
+        self.graph.check_blockers("ads", ["copy"])
+        # Written by something that did not check: the closing link is ignored
+        self.tasks.update("site", blocked_by=["ads"])
+        self.assertEqual(self.graph.blockers("site"), set())
+        self.assertEqual(self.graph.blocked, {"ads"})
+
+    def test_detach(self):
+        """Test that a detached graph stops following the list."""
+        self.graph.detach()
+        self.tasks.update("site", completed=True)
+        self.assertEqual(self.graph.blocked, {"ads"})
+
+    def test_labels_and_choices(self):
+        """Test the progress text and the tasks offered as link targets."""
+        self.assertEqual(progress_label(1, 3), "33% (1/3)")
+        self.assertEqual(progress_label(0, 0), "")
+        self.assertEqual([task_id for _, task_id in link_choices(self.tasks, {"ads"})], [None, "launch", "site"])
+
+if __name__ == '__main__':
+    unittest.main()
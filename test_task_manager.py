@@ -1,5 +1,6 @@
 import unittest
 import json
+import time
 import os
 import tempfile
 import shutil
@@ -9,7 +10,10 @@ from PyQt5.QtCore import Qt
 import sys
 
 # Import the TaskManager class
-from task_manager_qt import TaskManager, TASKS_FILE, PRIORITIES
+from task_manager_qt import ArchiveDialog, TaskManager, TASKS_FILE, PRIORITIES
+from task_model import due_label, next_occurrence
+from task_storage import JournalStore
+from test_task_server import running_server
 
 class TestTaskManager(unittest.TestCase):
     """Test cases for the TaskManager application."""
@@ -35,10 +39,16 @@ class TestTaskManager(unittest.TestCase):
     
     def tearDown(self):
         """Clean up after each test."""
+        # Let the background writer finish before its directory goes away
+        self.task_manager.persistence_thread.shutdown()
         # Clean up temporary files
         os.chdir(self.original_cwd)
         shutil.rmtree(self.test_dir)
     
+    def view_text(self, row, column):
+        """Return the text shown in the table at a view position."""
+        return self.task_manager.model.index(row, column).data()
+    
     def test_initialization(self):
         """Test that TaskManager initializes correctly."""
         self.assertEqual(self.task_manager.tasks, [])
@@ -100,7 +110,7 @@ class TestTaskManager(unittest.TestCase):
         self.task_manager.refresh_table()
         
         # Mock table selection
-        with patch.object(self.task_manager.table, 'currentRow', return_value=0):
+        with patch.object(self.task_manager, 'selected_ids', return_value=[self.task_manager.tasks[0]["id"]]):
             with patch('PyQt5.QtWidgets.QMessageBox.question', return_value=1):  # Yes
                 self.task_manager.delete_task()
         
@@ -112,7 +122,7 @@ class TestTaskManager(unittest.TestCase):
         initial_count = len(self.task_manager.tasks)
         
         # Mock no selection
-        with patch.object(self.task_manager.table, 'currentRow', return_value=-1):
+        with patch.object(self.task_manager, 'selected_ids', return_value=[]):
             self.task_manager.delete_task()
         
         # Verify no change
@@ -127,7 +137,7 @@ class TestTaskManager(unittest.TestCase):
         self.task_manager.refresh_table()
         
         # Mock table selection
-        with patch.object(self.task_manager.table, 'currentRow', return_value=0):
+        with patch.object(self.task_manager, 'selected_ids', return_value=[self.task_manager.tasks[0]["id"]]):
             # Toggle to complete
             self.task_manager.toggle_complete()
             self.assertTrue(self.task_manager.tasks[0]["completed"])
@@ -144,7 +154,7 @@ class TestTaskManager(unittest.TestCase):
         ]
         
         # Mock no selection
-        with patch.object(self.task_manager.table, 'currentRow', return_value=-1):
+        with patch.object(self.task_manager, 'selected_ids', return_value=[]):
             self.task_manager.toggle_complete()
         
         # Verify no change
@@ -162,10 +172,13 @@ class TestTaskManager(unittest.TestCase):
         # Sort by priority
         self.task_manager.sort_by_priority()
         
-        # Verify correct order: High, Medium, Low
+        # Verify correct view order: High, Medium, Low
         expected_order = ["High", "Medium", "Low"]
-        actual_order = [task["priority"] for task in self.task_manager.tasks]
+        actual_order = [self.view_text(row, 1) for row in range(self.task_manager.model.rowCount())]
         self.assertEqual(actual_order, expected_order)
+        
+        # Verify the underlying data was not reordered
+        self.assertEqual([task["priority"] for task in self.task_manager.tasks], ["Low", "High", "Medium"])
     
     def test_save_and_load_tasks(self):
         """Test saving and loading tasks from file."""
@@ -220,15 +233,15 @@ class TestTaskManager(unittest.TestCase):
         self.task_manager.refresh_table()
         
         # Verify table has correct number of rows
-        self.assertEqual(self.task_manager.table.rowCount(), 2)
+        self.assertEqual(self.task_manager.model.rowCount(), 2)
         
         # Verify table content
-        self.assertEqual(self.task_manager.table.item(0, 0).text(), "Task 1")
-        self.assertEqual(self.task_manager.table.item(0, 1).text(), "High")
-        self.assertEqual(self.task_manager.table.item(0, 2).text(), "Complete")
-        self.assertEqual(self.task_manager.table.item(1, 0).text(), "Task 2")
-        self.assertEqual(self.task_manager.table.item(1, 1).text(), "Medium")
-        self.assertEqual(self.task_manager.table.item(1, 2).text(), "Incomplete")
+        self.assertEqual(self.view_text(0, 0), "Task 1")
+        self.assertEqual(self.view_text(0, 1), "High")
+        self.assertEqual(self.view_text(0, 2), "Complete")
+        self.assertEqual(self.view_text(1, 0), "Task 2")
+        self.assertEqual(self.view_text(1, 1), "Medium")
+        self.assertEqual(self.view_text(1, 2), "Incomplete")
     
     def test_priority_constants(self):
         """Test that priority constants are correct."""
@@ -244,7 +257,7 @@ class TestTaskManager(unittest.TestCase):
         self.task_manager.refresh_table()
         
         # Mock table selection and dialog responses
-        with patch.object(self.task_manager.table, 'currentRow', return_value=0):
+        with patch.object(self.task_manager, 'selected_id', return_value=self.task_manager.tasks[0]["id"]):
             with patch('PyQt5.QtWidgets.QInputDialog.getText', return_value=("Edited task", True)):
                 with patch('PyQt5.QtWidgets.QInputDialog.getItem', return_value=("High", True)):
                     self.task_manager.edit_task()
@@ -260,7 +273,7 @@ class TestTaskManager(unittest.TestCase):
         self.task_manager.refresh_table()
         
         # Mock table selection and cancelled dialog
-        with patch.object(self.task_manager.table, 'currentRow', return_value=0):
+        with patch.object(self.task_manager, 'selected_id', return_value=self.task_manager.tasks[0]["id"]):
             with patch('PyQt5.QtWidgets.QInputDialog.getText', return_value=("", False)):
                 self.task_manager.edit_task()
         
@@ -268,5 +281,570 @@ class TestTaskManager(unittest.TestCase):
         self.assertEqual(self.task_manager.tasks[0]["task"], original_task["task"])
         self.assertEqual(self.task_manager.tasks[0]["priority"], original_task["priority"])
 
+    def test_selection_maps_through_sort(self):
+        """Test that selecting a row in the sorted view acts on the right task."""
+        self.task_manager.tasks = [
+            {"task": "Low priority", "priority": "Low", "completed": False},
+            {"task": "High priority", "priority": "High", "completed": False}
+        ]
+        self.task_manager.sort_by_priority()
+        
+        # The first view row is the High task, stored second
+        self.task_manager.table.selectRow(0)
+        self.assertEqual(self.task_manager.selected_id(), self.task_manager.tasks[1]["id"])
+        self.task_manager.toggle_complete()
+        
+        self.assertTrue(self.task_manager.tasks[1]["completed"])
+        self.assertFalse(self.task_manager.tasks[0]["completed"])
+        self.assertEqual(self.view_text(0, 2), "Complete")
+    
+    def test_mutations_emit_targeted_signals(self):
+        """Test that a toggle updates one row instead of resetting the model."""
+        self.task_manager.tasks = [
+            {"task": "Task %d" % i, "priority": "Low", "completed": False} for i in range(100)
+        ]
+        resets = []
+        changed = []
+        self.task_manager.model.modelReset.connect(lambda: resets.append(True))
+        self.task_manager.model.dataChanged.connect(lambda first, last: changed.append((first.row(), last.row())))
+        
+        with patch.object(self.task_manager, 'selected_ids', return_value=[self.task_manager.tasks[42]["id"]]):
+            self.task_manager.toggle_complete()
+        self.task_manager.task_input.setText("New task")
+        self.task_manager.add_task()
+        
+        self.assertEqual(resets, [])
+        self.assertEqual(changed, [(42, 42)])
+        self.assertEqual(self.task_manager.model.rowCount(), 101)
+
+    def test_sorted_view_follows_edits(self):
+        """Test that the sorted view stays sorted, with a move announced for the moved row."""
+        self.task_manager.tasks = [
+            {"task": "b", "priority": "Low", "completed": False},
+            {"task": "a", "priority": "High", "completed": False},
+            {"task": "c", "priority": "High", "completed": False}
+        ]
+        self.task_manager.sort_by_priority()
+        moves = []
+        resets = []
+        self.task_manager.model.rowsMoved.connect(lambda *args: moves.append((args[1], args[4])))
+        self.task_manager.model.modelReset.connect(lambda: resets.append(True))
+        
+        # Completing "a" moves it below "c"
+        with patch.object(self.task_manager, 'selected_ids', return_value=[self.task_manager.tasks[1]["id"]]):
+            self.task_manager.toggle_complete()
+        self.assertEqual([self.view_text(row, 0) for row in range(3)], ["c", "a", "b"])
+        self.assertEqual(moves, [(0, 2)])
+        
+        self.task_manager.task_input.setText("d")
+        self.task_manager.priority_input.setCurrentText("High")
+        self.task_manager.add_task()
+        self.assertEqual([self.view_text(row, 0) for row in range(4)], ["c", "d", "a", "b"])
+        self.assertEqual(resets, [])
+    
+    def test_sort_mode_is_persistent(self):
+        """Test that the sort mode and direction survive a restart."""
+        self.task_manager.tasks = [
+            {"task": "Low priority", "priority": "Low", "completed": False},
+            {"task": "High priority", "priority": "High", "completed": False}
+        ]
+        self.task_manager.sort_by_priority()
+        self.task_manager.descending_check.setChecked(True)
+        self.assertEqual([self.view_text(row, 1) for row in range(2)], ["Low", "High"])
+        self.task_manager.save_tasks()
+        
+        with patch('task_manager_qt.TASKS_FILE', self.test_tasks_file):
+            new_task_manager = TaskManager()
+        self.assertTrue(new_task_manager.descending_check.isChecked())
+        priorities = [new_task_manager.model.index(row, 1).data() for row in range(2)]
+        self.assertEqual(priorities, ["Low", "High"])
+        new_task_manager.persistence_thread.shutdown()
+
+    def test_search_filters_rows(self):
+        """Test that typing in the search box filters and ranks the table."""
+        self.task_manager.tasks = [
+            {"task": "Buy milk", "priority": "Low", "completed": False},
+            {"task": "Write report", "priority": "High", "completed": False},
+            {"task": "Milkshake", "priority": "Medium", "completed": False}
+        ]
+        self.task_manager.search_input.setText("milk")
+        self.assertEqual(self.task_manager.model.rowCount(), 2)
+        self.assertEqual([self.view_text(row, 0) for row in range(2)], ["Buy milk", "Milkshake"])
+        
+        # Selection and edits act on the task shown in the filtered row
+        self.task_manager.table.selectRow(1)
+        self.assertEqual(self.task_manager.selected_id(), self.task_manager.tasks[2]["id"])
+        self.task_manager.toggle_complete()
+        self.assertTrue(self.task_manager.tasks[2]["completed"])
+        self.assertEqual(self.view_text(1, 2), "Complete")
+        
+        # New tasks show up if they match
+        self.task_manager.task_input.setText("Milk run")
+        self.task_manager.add_task()
+        self.assertEqual(self.task_manager.model.rowCount(), 3)
+        
+        self.task_manager.search_input.clear()
+        self.assertEqual(self.task_manager.model.rowCount(), 4)
+
+    def test_progressive_load(self):
+        """Test that a large file streams in after the window exists, with changes queued."""
+        tasks = [{"task": "Task %d" % i, "priority": "Low", "completed": False, "id": "t%d" % i} for i in range(2500)]
+        with open(self.test_tasks_file, 'w') as f:
+            json.dump(tasks, f)
+        
+        with patch('task_manager_qt.TASKS_FILE', self.test_tasks_file), patch('task_manager_qt.LOAD_SLICE', -1):
+            task_manager = TaskManager()
+            # Only the first batch is in; the rest follows from the event loop
+            self.assertEqual(len(task_manager.tasks), 1000)
+            self.assertFalse(task_manager.loading_bar.isHidden())
+            
+            task_manager.task_input.setText("Added while loading")
+            task_manager.add_task()
+            with patch.object(task_manager, 'selected_ids', return_value=[task_manager.tasks[0]["id"]]):
+                task_manager.toggle_complete()
+            self.assertEqual(len(task_manager.tasks), 1000)
+            self.assertFalse(task_manager.tasks[0]["completed"])
+            
+            while task_manager.loader is not None:
+                self.app.processEvents()
+        
+        self.assertTrue(task_manager.loading_bar.isHidden())
+        self.assertEqual(len(task_manager.tasks), 2501)
+        self.assertEqual(task_manager.tasks[-1]["task"], "Added while loading")
+        self.assertTrue(task_manager.tasks[0]["completed"])
+        self.assertEqual(task_manager.model.rowCount(), 2501)
+        task_manager.persistence_thread.shutdown()
+
+    def test_deferred_load(self):
+        """Test that a deferred window reads no tasks until asked, queuing changes meanwhile."""
+        with open(self.test_tasks_file, 'w') as f:
+            json.dump([{"task": "On disk", "priority": "High", "completed": False, "id": "disk"}], f)
+        
+        with patch('task_manager_qt.TASKS_FILE', self.test_tasks_file):
+            task_manager = TaskManager(defer_load=True)
+        self.assertEqual(len(task_manager.tasks), 0)
+        self.assertIsNotNone(task_manager.loader)
+        
+        task_manager.task_input.setText("Typed before the load")
+        task_manager.add_task()
+        self.assertEqual(len(task_manager.tasks), 0)
+        
+        with patch('task_manager_qt.LOAD_SLICE', 60):
+            task_manager.load_more()
+        self.assertIsNone(task_manager.loader)
+        self.assertEqual([t["task"] for t in task_manager.tasks], ["On disk", "Typed before the load"])
+        task_manager.persistence_thread.shutdown()
+
+    def test_merges_changes_from_other_windows(self):
+        """Test that another window's changes show up, and survive a full save here."""
+        self.task_manager.task_input.setText("Mine")
+        self.task_manager.add_task()
+        self.task_manager.persistence.flush()
+        mine = self.task_manager.tasks[0]
+        
+        other = JournalStore(self.test_tasks_file)
+        other.load()
+        other.append_many([
+            {"op": "add", "task": {"task": "Theirs", "priority": "High", "completed": False, "id": "theirs"}},
+            {"op": "update", "id": mine["id"], "task": dict(mine, completed=True)}
+        ])
+        other.close()
+        
+        self.task_manager.merge_changes()
+        self.assertEqual([t["task"] for t in self.task_manager.tasks], ["Mine", "Theirs"])
+        self.assertTrue(self.task_manager.tasks[0]["completed"])
+        self.assertEqual(self.task_manager.model.rowCount(), 2)
+        
+        other = JournalStore(self.test_tasks_file)
+        other.load()
+        other.append({"op": "delete", "id": "theirs"})
+        other.close()
+        self.task_manager.save_tasks()
+        self.assertEqual([t["task"] for t in JournalStore(self.test_tasks_file).load()], ["Mine"])
+        self.assertEqual(self.task_manager.model.rowCount(), 1)
+
+    def test_no_priority_option(self):
+        """Test that tasks can be added without a priority and show as None."""
+        self.task_manager.task_input.setText("Someday")
+        self.task_manager.priority_input.setCurrentText("None")
+        self.task_manager.add_task()
+        
+        self.assertEqual(self.task_manager.tasks[0]["priority"], "")
+        self.assertEqual(self.view_text(0, 1), "None")
+        
+        # Tasks written by the Tkinter app with "None" read the same way
+        self.task_manager.tasks = [{"task": "Old", "priority": "None", "completed": False}]
+        self.assertEqual(self.task_manager.tasks[0]["priority"], "")
+
+    def select_rows(self, *rows):
+        """Select view rows as a Ctrl+click on each would."""
+        from PyQt5.QtCore import QItemSelectionModel
+        selection = self.task_manager.table.selectionModel()
+        selection.clearSelection()
+        for row in rows:
+            selection.select(self.task_manager.model.index(row, 0),
+                             QItemSelectionModel.Select | QItemSelectionModel.Rows)
+
+    def test_bulk_delete(self):
+        """Test that deleting a selection asks once, writes once and removes only those rows."""
+        from PyQt5.QtWidgets import QMessageBox
+        self.task_manager.tasks = [
+            {"task": "Task %d" % i, "priority": "Low", "completed": False} for i in range(10)
+        ]
+        resets = []
+        removed = []
+        self.task_manager.model.modelReset.connect(lambda: resets.append(True))
+        self.task_manager.model.rowsRemoved.connect(lambda parent, first, last: removed.append((first, last)))
+        self.select_rows(2, 3, 4, 7)
+        
+        submit_many = self.task_manager.persistence.submit_many
+        with patch('PyQt5.QtWidgets.QMessageBox.question', return_value=QMessageBox.Yes) as question, \
+                patch.object(self.task_manager.persistence, 'submit_many', wraps=submit_many) as writes:
+            self.task_manager.delete_task()
+        
+        question.assert_called_once()
+        self.assertIn("these 4 tasks", question.call_args[0][2])
+        writes.assert_called_once()
+        self.assertEqual(len(writes.call_args[0][0]), 4)
+        self.assertEqual([t["task"] for t in self.task_manager.tasks],
+                         ["Task 0", "Task 1", "Task 5", "Task 6", "Task 8", "Task 9"])
+        self.assertEqual(removed, [(7, 7), (2, 4)])
+        self.assertEqual(resets, [])
+
+    def test_bulk_toggle_and_priority(self):
+        """Test that toggling and setting the priority apply to the whole selection."""
+        self.task_manager.tasks = [
+            {"task": "Task %d" % i, "priority": "Low", "completed": i == 1} for i in range(5)
+        ]
+        changed = []
+        self.task_manager.model.dataChanged.connect(lambda first, last: changed.append((first.row(), last.row())))
+        self.select_rows(0, 1, 3)
+        
+        # Mixed: everything selected ends up complete, in one update
+        self.task_manager.toggle_complete()
+        self.assertEqual([t["completed"] for t in self.task_manager.tasks], [True, True, False, True, False])
+        self.assertEqual(changed, [(0, 3)])
+        self.task_manager.toggle_complete()
+        self.assertEqual([t["completed"] for t in self.task_manager.tasks], [False] * 5)
+        
+        with patch('PyQt5.QtWidgets.QInputDialog.getItem', return_value=("High", True)):
+            self.task_manager.set_priority()
+        self.assertEqual([t["priority"] for t in self.task_manager.tasks], ["High", "High", "Low", "High", "Low"])
+        self.assertEqual(self.task_manager.selected_ids(), [self.task_manager.tasks[row]["id"] for row in (0, 1, 3)])
+
+    def test_bulk_toggle_in_sorted_view(self):
+        """Test that a selection toggled in the sorted view is moved, not reset."""
+        self.task_manager.tasks = [
+            {"task": name, "priority": "High", "completed": False} for name in ("a", "b", "c", "d")
+        ]
+        self.task_manager.sort_by_priority()
+        resets = []
+        self.task_manager.model.modelReset.connect(lambda: resets.append(True))
+        self.select_rows(0, 2)
+        
+        self.task_manager.toggle_complete()
+        self.assertEqual([self.view_text(row, 0) for row in range(4)], ["b", "d", "a", "c"])
+        self.assertEqual(resets, [])
+        self.assertEqual(sorted(self.task_manager.tasks.get(task_id)["task"] for task_id in self.task_manager.selected_ids()),
+                         ["a", "c"])
+
+    def test_status_bar_counts(self):
+        """Test that the status bar counts follow adds, toggles, edits, deletes and merges."""
+        from PyQt5.QtWidgets import QMessageBox
+        self.task_manager.tasks = [
+            {"task": "Task %d" % i, "priority": "Low", "completed": i == 1} for i in range(3)
+        ]
+        self.task_manager.save_tasks()
+        counts = self.task_manager.model.counts
+        counts.check()
+        self.assertEqual(self.task_manager.status_label.text(),
+                         "3 tasks: 2 open, 1 complete   Low 2/1   (open/complete)")
+        
+        self.task_manager.task_input.setText("Urgent")
+        self.task_manager.priority_input.setCurrentText("High")
+        self.task_manager.add_task()
+        self.select_rows(0, 3)
+        self.task_manager.toggle_complete()
+        counts.check()
+        self.assertEqual(counts.count("High", True), 1)
+        
+        self.task_manager.search_tasks("Urgent")
+        self.select_rows(0)
+        with patch('PyQt5.QtWidgets.QInputDialog.getItem', return_value=("Medium", True)):
+            self.task_manager.set_priority()
+        # A merged edit to a task the search hides changes no rows, but still the counts
+        self.task_manager.persistence.flush()
+        other = JournalStore(self.test_tasks_file)
+        other.load()
+        other.append({"op": "update", "id": self.task_manager.tasks[2]["id"],
+                      "task": dict(self.task_manager.tasks[2], completed=True)})
+        other.close()
+        self.task_manager.merge_changes()
+        counts.check()
+        self.assertEqual(self.task_manager.status_label.text(),
+                         "4 tasks: 0 open, 4 complete   Medium 0/1   Low 0/3   (open/complete)")
+        
+        self.task_manager.search_tasks("")
+        self.select_rows(0, 1)
+        with patch('PyQt5.QtWidgets.QMessageBox.question', return_value=QMessageBox.Yes):
+            self.task_manager.delete_task()
+        counts.check()
+        self.assertEqual(self.task_manager.status_label.text(),
+                         "2 tasks: 0 open, 2 complete   Medium 0/1   Low 0/1   (open/complete)")
+
+    def test_due_dates_and_reminders(self):
+        """Test that one timer is armed for the next due time and overdue rows are highlighted."""
+        now = time.time()
+        self.task_manager.tasks = [
+            {"task": "Late", "priority": "", "completed": False, "due": now - 60},
+            {"task": "Later", "priority": "", "completed": False, "due": now + 3600},
+            {"task": "Someday", "priority": "", "completed": False}
+        ]
+        self.task_manager.save_tasks()
+        model = self.task_manager.model
+        # Armed for the task already past due, to fire right away
+        self.assertTrue(self.task_manager.due_timer.isActive())
+        self.assertLessEqual(self.task_manager.due_timer.interval(), 1)
+        
+        changed = []
+        model.dataChanged.connect(lambda first, last, roles: changed.append((first.row(), last.row())))
+        self.task_manager.remind()
+        self.assertEqual(changed, [(0, 0)])
+        self.assertIsNotNone(model.index(0, 0).data(Qt.ForegroundRole))
+        self.assertIsNone(model.index(1, 0).data(Qt.ForegroundRole))
+        self.assertEqual(self.task_manager.status_bar.currentMessage(), "Due: Late")
+        self.assertGreater(self.task_manager.due_timer.remainingTime(), 3500 * 1000)
+        self.assertEqual(self.view_text(1, 3), due_label(now + 3600))
+        
+        # Clearing the due date takes the highlight off
+        self.select_rows(0)
+        with patch('PyQt5.QtWidgets.QInputDialog.getText', return_value=("", True)):
+            self.task_manager.set_due()
+        self.assertIsNone(model.index(0, 0).data(Qt.ForegroundRole))
+        self.assertEqual(self.view_text(0, 3), "")
+        self.task_manager.persistence.flush()
+        self.assertIsNone(JournalStore(self.test_tasks_file).load()[0]["due"])
+
+    def test_tag_filters(self):
+        """Test tagging tasks and filtering by tag, priority and status together."""
+        self.task_manager.tasks = [
+            {"task": "Draft", "priority": "High", "completed": False, "tags": ["site", "copy"]},
+            {"task": "Deploy", "priority": "High", "completed": True, "tags": ["site"]},
+            {"task": "Taxes", "priority": "High", "completed": False}
+        ]
+        self.task_manager.task_input.setText("Logo")
+        self.task_manager.priority_input.setCurrentText("High")
+        self.task_manager.tags_input.setText("site, design")
+        self.task_manager.add_task()
+        self.assertEqual(self.task_manager.tasks[3]["tags"], ["site", "design"])
+        self.assertEqual(self.view_text(3, 4), "site, design")
+        
+        def shown():
+            return [self.view_text(row, 0) for row in range(self.task_manager.model.rowCount())]
+        self.task_manager.tag_filter.setEditText("site")
+        self.task_manager.priority_filter.setCurrentText("High")
+        self.task_manager.status_filter.setCurrentText("Incomplete")
+        self.assertEqual(shown(), ["Draft", "Logo"])
+        self.task_manager.search_tasks("logo")
+        self.assertEqual(shown(), ["Logo"])
+        self.task_manager.search_tasks("")
+        
+        # Completing or retagging a task takes it out of (or puts it in) the filtered rows
+        self.select_rows(0)
+        self.task_manager.toggle_complete()
+        self.assertEqual(shown(), ["Logo"])
+        self.task_manager.status_filter.setCurrentText("All")
+        self.task_manager.sort_by_priority()
+        self.assertEqual(shown(), ["Logo", "Deploy", "Draft"])
+        self.task_manager.tag_filter.setEditText("")
+        self.assertEqual(shown(), ["Logo", "Taxes", "Deploy", "Draft"])
+        self.select_rows(1)
+        with patch('PyQt5.QtWidgets.QInputDialog.getText', return_value=("home", True)):
+            self.task_manager.set_tags()
+        self.task_manager.list_tags()
+        self.assertEqual([self.task_manager.tag_filter.itemText(i) for i in range(self.task_manager.tag_filter.count())],
+                         ["copy", "design", "home", "site"])
+        self.task_manager.tag_filter.setEditText("home")
+        self.assertEqual(shown(), ["Taxes"])
+
+    def test_edits_to_filtered_out_tasks(self):
+        """Test that edits to tasks a filter hides are applied without touching the shown rows."""
+        self.task_manager.tasks = [
+            {"task": "Draft", "priority": "High", "completed": False, "tags": ["site"]},
+            {"task": "Taxes", "priority": "Low", "completed": False},
+            {"task": "Notes", "priority": "Low", "completed": False}
+        ]
+        self.task_manager.save_tasks()
+        draft, taxes, notes = (task["id"] for task in self.task_manager.tasks)
+        self.task_manager.tag_filter.setEditText("site")
+        model = self.task_manager.model
+        self.assertEqual(model.rowCount(), 1)
+        changed = []
+        model.dataChanged.connect(lambda first, last, roles: changed.append((first.row(), last.row())))
+        
+        # Another window's edit to one hidden task, then to a hidden and a shown one
+        other = JournalStore(self.test_tasks_file)
+        other.load()
+        other.append({"op": "update", "id": taxes, "task": dict(self.task_manager.tasks.get(taxes), task="Tax return")})
+        other.close()
+        self.task_manager.merge_changes()
+        self.assertEqual(self.task_manager.tasks.get(taxes)["task"], "Tax return")
+        self.assertEqual(changed, [])
+        
+        model.update_tasks([(notes, {"priority": "High"}), (draft, {"task": "First draft"})])
+        self.assertEqual(self.task_manager.tasks.get(notes)["priority"], "High")
+        self.assertEqual(changed, [(0, 0)])
+        self.assertEqual(self.view_text(0, 0), "First draft")
+        model.update_tasks([(notes, {"completed": True})])
+        self.assertEqual(changed, [(0, 0)])
+        self.assertTrue(self.task_manager.tasks.get(notes)["completed"])
+        
+        self.task_manager.tag_filter.setEditText("")
+        self.assertEqual([self.view_text(row, 0) for row in range(model.rowCount())],
+                         ["First draft", "Tax return", "Notes"])
+
+    def test_subtasks_and_blockers(self):
+        """Test linking tasks, the blocked and progress columns, and repainting only the linked rows."""
+        from PyQt5.QtWidgets import QMessageBox
+        self.task_manager.tasks = [
+            {"task": "Launch", "priority": "", "completed": False},
+            {"task": "Site", "priority": "", "completed": False},
+            {"task": "Ads", "priority": "", "completed": False}
+        ]
+        self.task_manager.save_tasks()
+        launch, site, ads = (task["id"] for task in self.task_manager.tasks)
+        self.select_rows(1, 2)
+        with patch.object(self.task_manager, 'choose_link', return_value=(launch, True)):
+            self.task_manager.set_parent()
+        self.select_rows(2)
+        with patch.object(self.task_manager, 'choose_link', return_value=(site, True)):
+            self.task_manager.set_blocked_by()
+        self.assertEqual(self.view_text(0, 5), "0% (0/2)")
+        self.assertEqual(self.view_text(2, 2), "Blocked")
+        
+        # A link that would close a cycle is refused
+        self.select_rows(0)
+        with patch.object(self.task_manager, 'choose_link', return_value=(site, True)), \
+                patch('PyQt5.QtWidgets.QMessageBox.warning') as warning:
+            self.task_manager.set_parent()
+        warning.assert_called_once()
+        self.assertNotIn("parent", self.task_manager.tasks[0])
+        
+        changed = []
+        self.task_manager.model.dataChanged.connect(lambda first, last, roles: changed.append(first.row()))
+        self.select_rows(1)
+        self.task_manager.toggle_complete()
+        self.assertEqual(sorted(changed), [0, 1, 2])
+        self.assertEqual(self.view_text(0, 5), "50% (1/2)")
+        self.assertEqual(self.view_text(2, 2), "Incomplete")
+        self.task_manager.status_filter.setCurrentText("Ready")
+        self.assertEqual([self.view_text(row, 0) for row in range(self.task_manager.model.rowCount())],
+                         ["Launch", "Ads"])
+        self.task_manager.persistence.flush()
+        self.assertEqual(JournalStore(self.test_tasks_file).load()[2]["blocked_by"], [site])
+
+    def test_recurring_task(self):
+        """Test that completing a recurring task materializes one occurrence and moves the task on."""
+        self.task_manager.tasks = [{"task": "Stand-up", "priority": "", "completed": False}]
+        self.task_manager.save_tasks()
+        self.select_rows(0)
+        with patch('PyQt5.QtWidgets.QInputDialog.getText', return_value=("every 2 days", True)):
+            self.task_manager.set_repeat()
+        series = self.task_manager.tasks[0]
+        first = series["due"]
+        self.assertEqual(due_label(first)[11:], "23:59")
+        self.assertEqual(self.view_text(0, 6), "every 2 days")
+        
+        self.select_rows(0)
+        self.task_manager.toggle_complete()
+        self.assertEqual(len(self.task_manager.tasks), 2)
+        self.assertEqual((series["completed"], series["due"]), (False, next_occurrence("every 2 days", first)))
+        occurrence = self.task_manager.tasks[1]
+        self.assertEqual((occurrence["completed"], occurrence["due"], occurrence["series"]), (True, first, series["id"]))
+        self.assertEqual(self.view_text(1, 6), "")
+        self.task_manager.persistence.flush()
+        self.assertEqual(len(JournalStore(self.test_tasks_file).load()), 2)
+
+    def test_paste_adds_one_task_per_line(self):
+        """Test that pasting several lines into the task box adds them as tasks in one write."""
+        from PyQt5.QtTest import QTest
+        self.app.clipboard().setText("Buy milk\n\n  Call mum  \nFile taxes\n")
+        self.task_manager.priority_input.setCurrentText("High")
+        
+        submit_many = self.task_manager.persistence.submit_many
+        with patch.object(self.task_manager.persistence, 'submit_many', wraps=submit_many) as writes:
+            QTest.keyClick(self.task_manager.task_input, Qt.Key_V, Qt.ControlModifier)
+        
+        self.assertEqual([(t["task"], t["priority"]) for t in self.task_manager.tasks],
+                         [("Buy milk", "High"), ("Call mum", "High"), ("File taxes", "High")])
+        writes.assert_called_once()
+        self.assertEqual(self.task_manager.task_input.text(), "")
+        
+        # A single line pastes into the box as usual
+        self.app.clipboard().setText("Just one")
+        QTest.keyClick(self.task_manager.task_input, Qt.Key_V, Qt.ControlModifier)
+        self.assertEqual(self.task_manager.task_input.text(), "Just one")
+        self.assertEqual(len(self.task_manager.tasks), 3)
+    
+    def test_completed_tasks_move_to_archive(self):
+        """Test that old completed tasks leave the list and can be restored or deleted."""
+        from PyQt5.QtWidgets import QMessageBox
+        self.task_manager.tasks = [
+            {"task": "Task %d" % i, "priority": "Low", "completed": False} for i in range(4)
+        ]
+        self.task_manager.save_tasks()
+        self.select_rows(0, 1, 2)
+        self.task_manager.toggle_complete()
+        self.assertIsInstance(self.task_manager.tasks[0]["completed_at"], float)
+        for task in self.task_manager.tasks[:2]:
+            self.task_manager.tasks.update(task["id"], completed_at=1.0)
+        
+        self.task_manager.archive_completed()
+        self.assertEqual([t["task"] for t in self.task_manager.tasks], ["Task 2", "Task 3"])
+        self.assertEqual(self.task_manager.model.rowCount(), 2)
+        
+        dialog = ArchiveDialog(self.task_manager)
+        self.assertEqual(dialog.model.rowCount(), 2)
+        with patch.object(dialog, 'selected_ids', return_value=[dialog.model.tasks[0]["id"]]):
+            dialog.restore()
+        restored = self.task_manager.tasks[-1]
+        self.assertEqual((restored["task"], restored["completed"], restored["completed_at"]),
+                         ("Task 0", False, None))
+        with patch.object(dialog, 'selected_ids', return_value=[dialog.model.tasks[0]["id"]]), \
+                patch('PyQt5.QtWidgets.QMessageBox.question', return_value=QMessageBox.Yes):
+            dialog.delete()
+        self.assertEqual(dialog.model.rowCount(), 0)
+        self.assertEqual(len(self.task_manager.store.archive.load()), 0)
+        self.task_manager.persistence.flush()
+        self.assertEqual([t["task"] for t in JournalStore(self.test_tasks_file).load()],
+                         ["Task 2", "Task 3", "Task 0"])
+
+    def test_windows_share_a_task_server(self):
+        """Test that two windows using a task server apply each other's changes row by row."""
+        socket_path = os.path.join(self.test_dir, 'tasks.sock')
+        with running_server(self.test_tasks_file, path=socket_path) as server, \
+                patch.dict(os.environ, {'TASKS_SERVER': server.address}):
+            first, second = TaskManager(), TaskManager()
+            try:
+                first.task_input.setText("Shared")
+                first.add_task()
+                first.persistence.flush()
+                resets = []
+                second.model.modelReset.connect(lambda: resets.append(True))
+                second.merge_changes()
+                self.assertEqual([t["task"] for t in second.tasks], ["Shared"])
+                
+                with patch.object(second, 'selected_ids', return_value=[second.tasks[0]["id"]]):
+                    second.toggle_complete()
+                second.persistence.flush()
+                first.merge_changes()
+                self.assertTrue(first.tasks[0]["completed"])
+                self.assertEqual(first.model.rowCount(), 1)
+                self.assertEqual(resets, [])
+            finally:
+                for window in (first, second):
+                    window.persistence_thread.shutdown()
+                    window.store.close()
+
 if __name__ == '__main__':
     unittest.main() 
\ No newline at end of file
@@ -0,0 +1,328 @@
+import unittest
+import json
+import time
+import os
+import tempfile
+import shutil
+from unittest.mock import patch
+import tkinter as tk
+
+# Import the TaskManagerApp class
+from task_manager import TaskManagerApp, WINDOW_ROWS
+from task_model import due_label, next_occurrence
+from task_storage import JournalStore
+
+class TestTaskManagerApp(unittest.TestCase):
+    """Test cases for the Tkinter TaskManagerApp; skipped without a display."""
+
+    def setUp(self):
+        """Set up test environment before each test."""
+        try:
+            self.root = tk.Tk()
+        except tk.TclError as exc:
+            self.skipTest("no display: %s" % exc)
+        self.root.withdraw()
+
+        # Create a temporary directory for test data
+        self.test_dir = tempfile.mkdtemp()
+        self.original_cwd = os.getcwd()
+        os.chdir(self.test_dir)
+        self.test_tasks_file = os.path.join(self.test_dir, 'test_tasks.json')
+        self.app = None
+
+    def tearDown(self):
+        """Clean up after each test."""
+        # Stops the background writer and destroys the window
+        if self.app is not None:
+            self.app.on_close()
+        else:
+            self.root.destroy()
+        os.chdir(self.original_cwd)
+        shutil.rmtree(self.test_dir)
+
+    def start(self, tasks=()):
+        """Open the app on a tasks file holding ``tasks``."""
+        if tasks:
+            with open(self.test_tasks_file, 'w') as f:
+                json.dump(list(tasks), f)
+        with patch('task_manager.TASKS_FILE', self.test_tasks_file):
+            self.app = TaskManagerApp(self.root)
+        self.app.finish_loading()
+        return self.app
+
+    def shown(self, column="Task"):
+        """The tree's rows, top to bottom, as the text of one column."""
+        return [self.app.tree.set(iid, column) for iid in self.app.tree.get_children()]
+
+    def select(self, *task_ids):
+        """Select tasks as a Ctrl+click on each would."""
+        self.app.tree.selection_set(task_ids)
+        self.app.on_select(None)
+
+    def ids(self, *rows):
+        return [self.app.tasks[row]["id"] for row in rows]
+
+    def status(self):
+        return str(self.app.status_label.cget("text"))
+
+    def test_rows_are_diffed(self):
+        """Test that adds, edits and deletes touch only their own rows in the tree."""
+        self.start({"task": "Task %d" % i, "priority": "Low", "completed": False} for i in range(5))
+        tree = self.app.tree
+        with patch.object(tree, 'insert', wraps=tree.insert) as insert, \
+                patch.object(tree, 'delete', wraps=tree.delete) as delete, \
+                patch.object(tree, 'item', wraps=tree.item) as item:
+            self.select(*self.ids(2))
+            self.app.toggle_complete()
+            self.assertEqual((insert.call_count, delete.call_count, item.call_count), (0, 0, 1))
+            self.assertEqual(tree.set(self.app.tasks[2]["id"], "Status"), "Complete")
+
+            self.app.task_entry.insert(0, "Task 5")
+            self.app.priority_var.set("Low")
+            self.app.add_task()
+            self.assertEqual((insert.call_count, delete.call_count, item.call_count), (1, 0, 1))
+
+            gone = self.app.tasks[1]["id"]
+            self.select(gone)
+            with patch('tkinter.messagebox.askyesno', return_value=True):
+                self.app.delete_task()
+            delete.assert_called_once_with(gone)
+            self.assertEqual(insert.call_count, 1)
+        self.assertEqual(self.shown(), ["Task 0", "Task 2", "Task 3", "Task 4", "Task 5"])
+        self.assertEqual(self.app.row_keys, self.app.tasks.ids())
+
+        # Sorted, a new task goes straight to its place
+        self.app.sort_by_priority()
+        self.app.task_entry.insert(0, "Urgent")
+        self.app.priority_var.set("High")
+        self.app.add_task()
+        self.assertEqual(self.shown(), ["Urgent", "Task 0", "Task 3", "Task 4", "Task 5", "Task 2"])
+        self.assertEqual(self.app.row_keys, self.app.order.ids())
+
+    def test_windowed_rendering(self):
+        """Test that a long list only puts a window of rows in the tree, and selections outlive it."""
+        self.start({"task": "Task %d" % i, "priority": "Low", "completed": False} for i in range(2500))
+        self.assertEqual(len(self.app.row_keys), 2500)
+        self.assertEqual(self.shown()[:2], ["Task 0", "Task 1"])
+        self.assertEqual(len(self.shown()), WINDOW_ROWS)
+        self.select(*self.ids(5, 3))
+
+        self.app.show_window_at(1200)
+        rows = self.shown()
+        self.assertEqual(len(rows), WINDOW_ROWS)
+        self.assertIn("Task 1200", rows)
+        self.assertNotIn("Task 5", rows)
+
+        # The selected rows are out of the window but still selected, in view order
+        self.assertEqual(self.app.selected_ids(), self.ids(3, 5))
+        self.app.toggle_complete()
+        self.assertTrue(self.app.tasks[3]["completed"])
+        self.assertTrue(self.app.tasks[5]["completed"])
+
+        # Deleting above the window shifts what it shows by one row
+        first = self.shown()[0]
+        self.app.selected_keys = {self.app.tasks[0]["id"]}
+        with patch('tkinter.messagebox.askyesno', return_value=True):
+            self.app.delete_task()
+        self.assertEqual(len(self.app.row_keys), 2499)
+        self.assertEqual(self.shown()[0], "Task %d" % (int(first.split()[1]) + 1))
+
+    def test_multi_select_in_sorted_view(self):
+        """Test that a selection acts on every selected task, first in view order first."""
+        self.start([
+            {"task": "a", "priority": "Low", "completed": False},
+            {"task": "b", "priority": "High", "completed": False},
+            {"task": "c", "priority": "Low", "completed": False},
+            {"task": "d", "priority": "High", "completed": False}
+        ])
+        self.app.sort_by_priority()
+        self.assertEqual(self.shown(), ["b", "d", "a", "c"])
+        self.select(*self.ids(2, 3))
+        self.assertEqual(self.app.selected_id(), self.app.tasks[3]["id"])
+
+        with patch('tkinter.simpledialog.askstring', return_value="High") as ask:
+            self.app.set_priority()
+        self.assertEqual(ask.call_args[1]["initialvalue"], "High")  # from "d", the first shown
+        self.assertEqual([t["priority"] for t in self.app.tasks], ["Low", "High", "High", "High"])
+        self.assertEqual(self.shown(), ["b", "c", "d", "a"])
+
+        self.app.toggle_complete()
+        self.assertEqual([t["completed"] for t in self.app.tasks], [False, False, True, True])
+        self.assertEqual(self.shown("Status"), ["Incomplete", "Complete", "Complete", "Incomplete"])
+
+    def test_paste_adds_one_task_per_line(self):
+        """Test that pasting several lines into the task box adds them as tasks in one write."""
+        self.start()
+        self.root.clipboard_clear()
+        self.root.clipboard_append("Buy milk\n\n  Call mum  \nFile taxes\n")
+        self.app.priority_var.set("High")
+
+        submit_many = self.app.persistence.submit_many
+        with patch.object(self.app.persistence, 'submit_many', wraps=submit_many) as writes:
+            self.assertEqual(self.app.on_paste(None), "break")
+        self.assertEqual([(t["task"], t["priority"]) for t in self.app.tasks],
+                         [("Buy milk", "High"), ("Call mum", "High"), ("File taxes", "High")])
+        writes.assert_called_once()
+        self.assertEqual(self.shown(), ["Buy milk", "Call mum", "File taxes"])
+
+        # A single line is left to the entry's own paste
+        self.root.clipboard_clear()
+        self.root.clipboard_append("Just one")
+        self.assertIsNone(self.app.on_paste(None))
+        self.assertEqual(len(self.app.tasks), 3)
+
+    def test_status_bar_counts(self):
+        """Test that the status bar counts follow adds, toggles, deletes and merges."""
+        self.start({"task": "Task %d" % i, "priority": "Low", "completed": i == 1} for i in range(3))
+        self.assertEqual(self.status(), "3 tasks: 2 open, 1 complete   Low 2/1   (open/complete)")
+
+        self.app.task_entry.insert(0, "Urgent")
+        self.app.priority_var.set("High")
+        self.app.add_task()
+        self.select(*self.ids(0, 3))
+        self.app.toggle_complete()
+        self.app.counts.check()
+        self.assertEqual(self.status(), "4 tasks: 1 open, 3 complete   High 0/1   Low 1/2   (open/complete)")
+
+        # A merged edit to a task a search hides changes no rows, but still the counts
+        self.app.search_var.set("Urgent")
+        self.assertEqual(self.shown(), ["Urgent"])
+        self.app.persistence.flush()
+        other = JournalStore(self.test_tasks_file)
+        other.load()
+        other.append({"op": "update", "id": self.app.tasks[2]["id"], "task": dict(self.app.tasks[2], completed=True)})
+        other.close()
+        self.app.merge_changes()
+        self.app.counts.check()
+        self.assertEqual(self.status(), "4 tasks: 0 open, 4 complete   High 0/1   Low 0/3   (open/complete)")
+
+        self.app.search_var.set("")
+        self.select(*self.ids(0, 1))
+        with patch('tkinter.messagebox.askyesno', return_value=True):
+            self.app.delete_task()
+        self.assertEqual(self.status(), "2 tasks: 0 open, 2 complete   High 0/1   Low 0/1   (open/complete)")
+
+    def test_due_dates_and_reminders(self):
+        """Test that one timer is armed for the next due time and overdue rows are highlighted."""
+        now = time.time()
+        self.start([
+            {"task": "Late", "priority": "", "completed": False, "due": now - 60},
+            {"task": "Later", "priority": "", "completed": False, "due": now + 3600},
+            {"task": "Someday", "priority": "", "completed": False}
+        ])
+        late, later, _ = self.ids(0, 1, 2)
+        self.assertIsNotNone(self.app.reminder)
+
+        self.app.remind()
+        # Re-armed for the next one
+        self.assertEqual(self.app.due.next_due, now + 3600)
+        self.assertIsNotNone(self.app.reminder)
+        self.assertTrue(self.app.tree.tag_has("overdue", late))
+        self.assertFalse(self.app.tree.tag_has("overdue", later))
+        self.assertEqual(self.status(), "Due: Late")
+        self.assertEqual(self.app.tree.set(later, "Due"), due_label(now + 3600))
+
+        # Clearing the due date takes the highlight off
+        self.select(late)
+        with patch('tkinter.simpledialog.askstring', return_value=""):
+            self.app.set_due()
+        self.assertFalse(self.app.tree.tag_has("overdue", late))
+        self.assertEqual(self.app.tree.set(late, "Due"), "")
+        self.app.persistence.flush()
+        self.assertIsNone(JournalStore(self.test_tasks_file).load()[0]["due"])
+
+    def test_tag_filters(self):
+        """Test tagging tasks and filtering by tag, priority and status together."""
+        self.start([
+            {"task": "Draft", "priority": "High", "completed": False, "tags": ["site", "copy"]},
+            {"task": "Deploy", "priority": "High", "completed": True, "tags": ["site"]},
+            {"task": "Taxes", "priority": "High", "completed": False}
+        ])
+        self.app.task_entry.insert(0, "Logo")
+        self.app.priority_var.set("High")
+        self.app.tags_entry.insert(0, "site, design")
+        self.app.add_task()
+        self.assertEqual(self.app.tasks[3]["tags"], ["site", "design"])
+        self.assertEqual(self.shown("Tags")[3], "site, design")
+
+        self.app.tag_filter_var.set("site")
+        self.app.priority_filter_var.set("High")
+        self.app.status_filter_var.set("Incomplete")
+        self.assertEqual(self.shown(), ["Draft", "Logo"])
+        self.app.search_var.set("logo")
+        self.assertEqual(self.shown(), ["Logo"])
+        self.app.search_var.set("")
+
+        # Completing or retagging a task takes it out of (or puts it in) the filtered rows
+        self.select(*self.ids(0))
+        self.app.toggle_complete()
+        self.assertEqual(self.shown(), ["Logo"])
+        self.app.status_filter_var.set("All")
+        self.app.sort_by_priority()
+        self.assertEqual(self.shown(), ["Logo", "Deploy", "Draft"])
+        self.app.tag_filter_var.set("")
+        self.assertEqual(self.shown(), ["Logo", "Taxes", "Deploy", "Draft"])
+        self.select(*self.ids(2))
+        with patch('tkinter.simpledialog.askstring', return_value="home"):
+            self.app.set_tags()
+        self.app.list_tags()
+        self.assertEqual(list(self.app.tag_filter.cget("values")), ["copy", "design", "home", "site"])
+        self.app.tag_filter_var.set("home")
+        self.assertEqual(self.shown(), ["Taxes"])
+
+    def test_subtasks_and_blockers(self):
+        """Test linking tasks, and the blocked and progress columns following completions."""
+        self.start([
+            {"task": "Launch", "priority": "", "completed": False},
+            {"task": "Site", "priority": "", "completed": False},
+            {"task": "Ads", "priority": "", "completed": False}
+        ])
+        launch, site, ads = self.ids(0, 1, 2)
+        self.select(site, ads)
+        with patch.object(self.app, 'choose_link', return_value=(launch, True)):
+            self.app.set_parent()
+        self.select(ads)
+        with patch.object(self.app, 'choose_link', return_value=(site, True)):
+            self.app.set_blocked_by()
+        self.assertEqual(self.shown("Progress"), ["0% (0/2)", "", ""])
+        self.assertEqual(self.shown("Status"), ["Incomplete", "Incomplete", "Blocked"])
+
+        # A link that would close a cycle is refused
+        self.select(launch)
+        with patch.object(self.app, 'choose_link', return_value=(site, True)), \
+                patch('tkinter.messagebox.showwarning') as warning:
+            self.app.set_parent()
+        warning.assert_called_once()
+        self.assertNotIn("parent", self.app.tasks[0])
+
+        self.select(site)
+        self.app.toggle_complete()
+        self.assertEqual(self.shown("Progress"), ["50% (1/2)", "", ""])
+        self.assertEqual(self.shown("Status"), ["Incomplete", "Complete", "Incomplete"])
+        self.app.status_filter_var.set("Ready")
+        self.assertEqual(self.shown(), ["Launch", "Ads"])
+        self.app.persistence.flush()
+        self.assertEqual(JournalStore(self.test_tasks_file).load()[2]["blocked_by"], [site])
+
+    def test_recurring_task(self):
+        """Test that completing a recurring task materializes one occurrence and moves the task on."""
+        self.start([{"task": "Stand-up", "priority": "", "completed": False}])
+        self.select(*self.ids(0))
+        with patch('tkinter.simpledialog.askstring', return_value="every 2 days"):
+            self.app.set_repeat()
+        series = self.app.tasks[0]
+        first = series["due"]
+        self.assertEqual(due_label(first)[11:], "23:59")
+        self.assertEqual(self.shown("Repeat"), ["every 2 days"])
+
+        self.app.toggle_complete()
+        self.assertEqual(len(self.app.tasks), 2)
+        self.assertEqual((series["completed"], series["due"]), (False, next_occurrence("every 2 days", first)))
+        occurrence = self.app.tasks[1]
+        self.assertEqual((occurrence["completed"], occurrence["due"], occurrence["series"]), (True, first, series["id"]))
+        self.assertEqual(self.shown("Repeat"), ["every 2 days", ""])
+        self.app.persistence.flush()
+        self.assertEqual(len(JournalStore(self.test_tasks_file).load()), 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+import unittest
+import os
+import pstats
+import shutil
+import tempfile
+from unittest.mock import patch
+
+from task_model import TaskList
+from task_storage import JournalStore
+import io
+
+from task_metrics import Histogram, Metrics, StartupProfile, configure, startup_profile, BUCKETS_MS
+
+class Widget:
+    def __init__(self):
+        self.tasks = [1, 2, 3]
+
+    def click(self):
+        return "clicked"
+
+    def change(self, record):
+        return record["op"]
+
+class TestHistogram(unittest.TestCase):
+    """Test cases for the latency histogram."""
+
+    def test_percentiles_are_bucket_bounds(self):
+        """Test that percentiles report the bucket bound, capped at the slowest call."""
+        histogram = Histogram()
+        for ms in [0.05] * 90 + [7.0] * 9 + [30.0]:
+            histogram.add(ms)
+        self.assertEqual(histogram.calls, 100)
+        self.assertEqual(histogram.percentile(0.5), BUCKETS_MS[0])
+        self.assertEqual(histogram.percentile(0.95), 10)
+        self.assertEqual(histogram.percentile(1.0), 30.0)
+        histogram.add(99999.0)
+        self.assertEqual(histogram.percentile(1.0), 99999.0)
+
+class TestMetrics(unittest.TestCase):
+    """Test cases for wrapping methods with timers."""
+
+    def setUp(self):
+        """Start each test with fresh metrics and unwrapped classes."""
+        self.metrics = Metrics()
+        self.addCleanup(self.metrics.uninstrument)
+
+    def test_instrument_records_calls(self):
+        """Test that wrapped methods still work and are timed by name with their rows."""
+        original = Widget.click
+        self.metrics.instrument(Widget, "click")
+        self.metrics.instrument(Widget, "change", name=lambda self, record: "change." + record["op"])
+        widget = Widget()
+        self.assertEqual(widget.click(), "clicked")
+        self.assertEqual(widget.change({"op": "add"}), "add")
+        self.assertEqual(widget.change({"op": "add"}), "add")
+        self.assertEqual(self.metrics.histograms["click"].calls, 1)
+        self.assertEqual(self.metrics.histograms["change.add"].calls, 2)
+        self.assertEqual(self.metrics.rows["click"], 3)
+        self.assertIn("change.add", self.metrics.summary())
+        self.metrics.uninstrument()
+        self.assertIs(Widget.click, original)
+
+    def test_extra_signal_arguments_are_dropped(self):
+        """Test that a wrapped slot tolerates the extra arguments Qt signals pass."""
+        self.metrics.instrument(Widget, "click")
+        self.assertEqual(Widget().click(False), "clicked")
+
+    def test_store_bytes(self):
+        """Test that configure() times the store and counts the bytes it writes."""
+        test_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, test_dir)
+        with patch("task_metrics.atexit.register"):
+            argv, metrics = configure(["app", "--metrics"], Widget, environ={})
+        self.addCleanup(metrics.uninstrument)
+        self.assertEqual(argv, ["app"])
+        store = JournalStore(os.path.join(test_dir, "tasks.json"))
+        tasks = TaskList([{"task": "A", "priority": "High", "completed": False}])
+        store.save(tasks)
+        store.append_many([{"op": "add", "task": dict(tasks.add({"task": "B"}))}])
+        store.close()
+        self.assertEqual(metrics.bytes["JournalStore.save"], os.path.getsize(store.path))
+        self.assertEqual(metrics.bytes["JournalStore.append_many"], os.path.getsize(store.journal_path))
+        self.assertEqual(metrics.rows["JournalStore.save"], 1)
+
+    def test_off_by_default(self):
+        """Test that nothing is wrapped unless asked for."""
+        original = Widget.click
+        with patch("task_metrics.atexit.register") as register:
+            argv, metrics = configure(["app"], Widget, environ={"TASKS_METRICS": "0"})
+        self.assertIsNone(metrics)
+        self.assertIs(Widget.click, original)
+        register.assert_not_called()
+
+    def test_profile(self):
+        """Test that --profile writes a pstats file at exit."""
+        test_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, test_dir)
+        path = os.path.join(test_dir, "session.prof")
+        with patch("task_metrics.atexit.register") as register:
+            argv, metrics = configure(["app", "--profile", path, "-x"], Widget, environ={})
+            Widget().click()
+            register.call_args[0][0]()
+        self.assertEqual(argv, ["app", "-x"])
+        self.assertIsNone(metrics)
+        self.assertTrue(pstats.Stats(path).stats)
+
+class TestStartupProfile(unittest.TestCase):
+    """Test cases for the startup milestone report."""
+
+    def test_follow_reports_once(self):
+        """Test that following a method marks and reports its first return only."""
+        out = io.StringIO()
+        profile = StartupProfile(0.0, 0.0, file=out)
+        widget = Widget()
+        with patch("task_metrics.atexit.register"):
+            profile.follow(widget, "click", "clicked", lambda: "%d tasks" % len(widget.tasks))
+        profile.mark("first paint")
+        self.assertEqual(widget.click(), "clicked")
+        widget.click()
+        report = out.getvalue()
+        self.assertIn("first paint", report)
+        self.assertIn("3 tasks", report)
+        self.assertEqual(report.count("Startup profile"), 1)
+        self.assertNotIn("click", widget.__dict__)
+
+    def test_off_unless_asked(self):
+        """Test that the flag is stripped and that a disabled profile does nothing."""
+        argv, profile = startup_profile(["app", "--startup-profile"], 0.0, 0.0, environ={})
+        self.assertEqual(argv, ["app"])
+        self.assertTrue(profile.enabled)
+        argv, profile = startup_profile(["app"], 0.0, 0.0, environ={})
+        widget = Widget()
+        profile.follow(widget, "click", "clicked")
+        profile.mark("first paint")
+        self.assertEqual(len(profile.marks), 1)
+        self.assertNotIn("click", widget.__dict__)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,322 @@
+import unittest
+import json
+
+from task_model import (Task, TaskList, SortedOrder, TaskCounts, DueSchedule, normalize_priority, parse_due, due_label,
+                        parse_tags, task_tags, parse_repeat, next_occurrence, occurrences, completion_records)
+
+class TestTask(unittest.TestCase):
+    """Test cases for the slotted task record."""
+
+    def test_reads_like_a_dict(self):
+        """Test item access, dict() and equality against the JSON form."""
+        task = Task.from_dict({"task": "Write", "priority": "High", "completed": False, "id": "a"})
+        self.assertEqual(task["task"], "Write")
+        self.assertEqual(dict(task, completed=True)["completed"], True)
+        self.assertEqual(task, {"task": "Write", "priority": "High", "completed": False, "id": "a"})
+        self.assertNotIn("due", task)
+        self.assertIsNone(task.get("due"))
+        task["completed"] = True
+        self.assertTrue(task.completed)
+
+    def test_json_round_trip(self):
+        """Test that a task converts back to exactly the object it came from."""
+        data = {"task": "Odd", "priority": "Urgent", "completed": 0, "id": "x", "due": "2026-01-01"}
+        task = Task.from_dict(data)
+        self.assertEqual(json.dumps(task, default=dict), json.dumps(data))
+        without_id = Task.from_dict({"task": "New", "priority": "", "completed": False})
+        self.assertEqual(list(without_id), ["task", "priority", "completed"])
+
+    def test_priority_is_normalized(self):
+        """Test that "None" and "" both mean no priority and levels are shared strings."""
+        self.assertEqual(normalize_priority("None"), "")
+        self.assertEqual(normalize_priority(None), "")
+        self.assertEqual(normalize_priority("high"), "High")
+        self.assertIs(Task(priority="".join(["Med", "ium"])).priority, Task(priority="Medium").priority)
+        self.assertIs(Task(priority="".join(["Urg", "ent"])).priority, Task(priority="Urgent").priority)
+        task = Task("Edited")
+        task["priority"] = "None"
+        self.assertEqual(task["priority"], "")
+
+    def test_compact(self):
+        """Test that tasks carry no per-instance dict."""
+        self.assertFalse(hasattr(Task(), "__dict__"))
+
+    def test_tags(self):
+        """Test that tags parse from a comma list and read back as a list however stored."""
+        self.assertEqual(parse_tags(" site, copy,,site , "), ["site", "copy"])
+        self.assertEqual(task_tags(Task.from_dict({"task": "t", "tags": ["a", 3, "b"]})), ["a", "b"])
+        self.assertEqual(task_tags(Task.from_dict({"task": "t", "tags": "a, b"})), ["a", "b"])
+        self.assertEqual(task_tags(Task.from_dict({"task": "t"})), [])
+
+
+class TestTaskList(unittest.TestCase):
+    """Test cases for the id-indexed task collection."""
+
+    def setUp(self):
+        """Create a task list with a few tasks."""
+        self.tasks = TaskList([
+            {"task": "Task %d" % i, "priority": "Low", "completed": False, "id": "t%d" % i}
+            for i in range(5)
+        ])
+
+    def test_list_behaviour(self):
+        """Test that reads behave like the plain list of dicts."""
+        self.assertEqual(len(self.tasks), 5)
+        self.assertEqual(self.tasks[0]["task"], "Task 0")
+        self.assertEqual([t["id"] for t in self.tasks], ["t0", "t1", "t2", "t3", "t4"])
+        self.assertEqual(TaskList(), [])
+
+    def test_missing_ids_are_assigned(self):
+        """Test that tasks without an id (or with a duplicate one) get a fresh id."""
+        tasks = TaskList([
+            {"task": "No id", "priority": "", "completed": False},
+            {"task": "Dup 1", "priority": "", "completed": False, "id": "x"},
+            {"task": "Dup 2", "priority": "", "completed": False, "id": "x"}
+        ])
+        ids = [t["id"] for t in tasks]
+        self.assertEqual(len(set(ids)), 3)
+        self.assertEqual(tasks.assigned_ids, 2)
+        self.assertIs(tasks.get(ids[0]), tasks[0])
+
+    def test_dicts_become_tasks(self):
+        """Test that dicts handed to the list are stored as Task records."""
+        self.assertTrue(all(isinstance(t, Task) for t in self.tasks))
+        task = self.tasks.add({"task": "New", "priority": "None", "completed": False})
+        self.assertIsInstance(task, Task)
+        self.assertIs(self.tasks.get(task["id"]), task)
+        self.assertEqual(task["priority"], "")
+
+    def test_update_by_id(self):
+        """Test editing a task through the index."""
+        task = self.tasks.update("t3", completed=True)
+        self.assertIs(task, self.tasks[3])
+        self.assertTrue(self.tasks[3]["completed"])
+
+    def test_remove_keeps_rows_consistent(self):
+        """Test that row lookups stay correct across removals and additions."""
+        self.assertEqual(self.tasks.row_of("t4"), 4)
+        row, task = self.tasks.remove("t1")
+        self.assertEqual((row, task["id"]), (1, "t1"))
+        self.assertIsNone(self.tasks.get("t1"))
+
+        self.tasks.add({"task": "New", "priority": "", "completed": False, "id": "new"})
+        self.assertEqual(self.tasks.row_of("t4"), 3)
+        self.assertEqual(self.tasks.row_of("new"), 4)
+        self.assertEqual(self.tasks.row_of("t0"), 0)
+        with self.assertRaises(KeyError):
+            self.tasks.row_of("t1")
+
+    def test_sort_invalidates_rows(self):
+        """Test that rows are recomputed after a reorder."""
+        self.tasks.row_of("t0")
+        self.tasks.sort(key=lambda t: t["id"] != "t4")
+        self.assertEqual(self.tasks.row_of("t4"), 0)
+        self.assertEqual(self.tasks.row_of("t0"), 1)
+
+class TestSortedOrder(unittest.TestCase):
+    """Test cases for the incrementally maintained sort order."""
+
+    def setUp(self):
+        """Create a task list with mixed priorities, states and titles."""
+        self.tasks = TaskList([
+            {"task": "beta", "priority": "Low", "completed": False, "id": "a"},
+            {"task": "Alpha", "priority": "High", "completed": True, "id": "b"},
+            {"task": "alpha", "priority": "High", "completed": False, "id": "c"},
+            {"task": "Gamma", "priority": "", "completed": False, "id": "d"},
+            {"task": "alpha", "priority": "High", "completed": False, "id": "e"}
+        ])
+        self.order = SortedOrder(self.tasks)
+
+    def test_initial_order(self):
+        """Test priority, then status, then casefolded title, then creation order."""
+        self.assertEqual(self.order.ids(), ["c", "e", "b", "a", "d"])
+        self.assertEqual(self.order.row_of("b"), 2)
+        self.assertEqual(self.order.id_at(4), "d")
+        # The stored order is left alone
+        self.assertEqual([t["id"] for t in self.tasks], ["a", "b", "c", "d", "e"])
+
+    def test_follows_changes(self):
+        """Test that adds, edits and removals keep the order without a re-sort."""
+        new = {"task": "Aardvark", "priority": "Low", "completed": False}
+        row = self.order.row_for_new(new)
+        new = self.tasks.add(new)
+        self.assertEqual(self.order.row_of(new["id"]), row)
+        self.assertEqual(self.order.ids(), ["c", "e", "b", new["id"], "a", "d"])
+
+        # Now equal to "b" on every key but creation order, so it lands after it
+        self.assertEqual(self.order.row_after_update("c", {"completed": True}), 2)
+        self.tasks.update("c", completed=True)
+        self.assertEqual(self.order.ids(), ["e", "b", "c", new["id"], "a", "d"])
+
+        self.tasks.remove("b")
+        self.assertEqual(self.order.ids(), ["e", "c", new["id"], "a", "d"])
+
+    def test_descending(self):
+        """Test that a descending order is the exact reverse and maps rows to match."""
+        self.order.descending = True
+        self.assertEqual(self.order.ids(), ["d", "a", "b", "e", "c"])
+        self.assertEqual(self.order.row_of("c"), 4)
+        new = {"task": "zeta", "priority": "", "completed": False}
+        row = self.order.row_for_new(new)
+        new = self.tasks.add(new)
+        self.assertEqual((row, self.order.id_at(row)), (0, new["id"]))
+
+    def test_detach(self):
+        """Test that a detached order stops following the list."""
+        self.order.detach()
+        self.tasks.add({"task": "Late", "priority": "High", "completed": False, "id": "late"})
+        self.assertNotIn("late", self.order.ids())
+
+class TestTaskCounts(unittest.TestCase):
+    """Test cases for the incrementally maintained priority x status counts."""
+
+    def setUp(self):
+        self.tasks = TaskList([
+            {"task": "a", "priority": "Low", "completed": False, "id": "a"},
+            {"task": "b", "priority": "High", "completed": True, "id": "b"},
+            {"task": "c", "priority": "High", "completed": False, "id": "c"},
+            {"task": "d", "priority": "", "completed": False, "id": "d"}
+        ])
+        self.counts = TaskCounts(self.tasks)
+
+    def test_initial_counts(self):
+        """Test the counts taken from the list as it stands."""
+        self.counts.check()
+        self.assertEqual(self.counts.count(), 4)
+        self.assertEqual(self.counts.count("High"), 2)
+        self.assertEqual(self.counts.count(completed=True), 1)
+        self.assertEqual(self.counts.count("High", False), 1)
+        self.assertEqual(self.counts.summary(),
+                         "4 tasks: 3 open, 1 complete   High 1/1   Low 1/0   None 1/0   (open/complete)")
+
+    def test_follows_changes(self):
+        """Test that adds, edits, toggles and removals keep the counts right."""
+        self.tasks.add({"task": "e", "priority": "Medium", "completed": False})
+        self.tasks.extend([{"task": "f", "priority": "Urgent", "completed": True}])
+        self.tasks.update("a", priority="High")
+        self.tasks.update("b", completed=False)
+        self.tasks.update("c", task="renamed")
+        self.tasks.remove("d")
+        self.counts.check()
+        self.assertEqual(self.counts.counts(), {("High", False): 3, ("Medium", False): 1, ("Urgent", True): 1})
+        self.assertEqual(self.counts.summary(),
+                         "5 tasks: 4 open, 1 complete   High 3/0   Medium 1/0   Urgent 0/1   (open/complete)")
+
+    def test_check_catches_drift(self):
+        """Test that a change made behind the list's back fails the check."""
+        self.tasks.get("a")["completed"] = True
+        with self.assertRaises(AssertionError):
+            self.counts.check()
+
+    def test_detach(self):
+        """Test that detached counts stop following the list."""
+        self.counts.detach()
+        self.tasks.add({"task": "late", "priority": "High", "completed": False})
+        self.assertEqual(self.counts.count(), 4)
+
+class TestDueSchedule(unittest.TestCase):
+    """Test cases for the heap of upcoming due times."""
+
+    def setUp(self):
+        self.tasks = TaskList([
+            {"task": "a", "priority": "", "completed": False, "id": "a", "due": 300},
+            {"task": "b", "priority": "", "completed": False, "id": "b", "due": 100},
+            {"task": "c", "priority": "", "completed": True, "id": "c", "due": 50},
+            {"task": "d", "priority": "", "completed": False, "id": "d"}
+        ])
+        self.armed = []
+        self.due = DueSchedule(self.tasks, self.armed.append)
+
+    def test_next_due_skips_completed_tasks(self):
+        """Test that only open tasks with a due time are scheduled."""
+        self.assertEqual(self.due.next_due, 100)
+        self.assertEqual(self.armed, [100])
+
+    def test_advance(self):
+        """Test that advancing marks what came due overdue and re-arms for the next."""
+        self.assertEqual(self.due.advance(99), [])
+        self.assertEqual(self.due.advance(100), ["b"])
+        self.assertEqual(self.due.overdue, {"b"})
+        self.assertEqual(self.armed, [100, 300])
+        self.assertEqual(self.due.advance(1000), ["a"])
+        self.assertEqual(self.armed, [100, 300, None])
+
+    def test_follows_changes(self):
+        """Test that edits, completions and removals re-arm without a rescan."""
+        self.tasks.update("d", due=20)
+        self.assertEqual(self.due.next_due, 20)
+        self.tasks.update("d", completed=True)
+        self.assertEqual(self.due.next_due, 100)
+        self.tasks.remove("b")
+        self.tasks.update("a", task="renamed")
+        self.assertEqual(self.armed, [100, 20, 100, 300])
+
+        self.tasks.add({"task": "e", "priority": "", "completed": False, "id": "e", "due": 10})
+        self.assertEqual(self.due.advance(400), ["e", "a"])
+        # Reopening or moving the due time takes a task off the overdue list
+        self.tasks.update("a", due=500)
+        self.assertEqual((self.due.overdue, self.due.next_due), ({"e"}, 500))
+
+    def test_parse_due(self):
+        """Test the due date formats, with a date alone meaning the end of that day."""
+        self.assertIsNone(parse_due("  "))
+        self.assertEqual(due_label(parse_due("2024-05-31 17:05")), "2024-05-31 17:05")
+        self.assertEqual(due_label(parse_due("2024-05-31")), "2024-05-31 23:59")
+        self.assertEqual(due_label(None), "")
+        with self.assertRaises(ValueError):
+            parse_due("tomorrow")
+
+class TestRecurrence(unittest.TestCase):
+    """Test cases for recurrence rules and their occurrences."""
+
+    def test_parse_repeat(self):
+        """Test the rule spellings, with a count of one stored by name."""
+        self.assertIsNone(parse_repeat(" "))
+        self.assertEqual(parse_repeat("Weekly"), "weekly")
+        self.assertEqual(parse_repeat("every 1 day"), "daily")
+        self.assertEqual(parse_repeat("every 2 Weeks"), "every 2 weeks")
+        for text in ("hourly", "every 0 days", "every two weeks"):
+            with self.assertRaises(ValueError):
+                parse_repeat(text)
+
+    def test_occurrences_in_window(self):
+        """Test that only the occurrences in the window come out, however far off it is."""
+        due = parse_due("2024-01-31 09:00")
+        self.assertEqual([due_label(when) for when in occurrences("monthly", due, due, parse_due("2024-04-01"))],
+                         ["2024-01-31 09:00", "2024-02-29 09:00", "2024-03-31 09:00"])
+        self.assertEqual(due_label(next_occurrence("every 2 weeks", due)), "2024-02-14 09:00")
+        window = list(occurrences("daily", due, parse_due("2124-03-01 00:00"), parse_due("2124-03-03 00:00")))
+        self.assertEqual([due_label(when) for when in window], ["2124-03-01 09:00", "2124-03-02 09:00"])
+
+    def test_completion_records(self):
+        """Test that completing a recurring task adds its occurrence and moves it on, and nothing else recurs."""
+        tasks = [{"task": "Water plants", "priority": "Low", "completed": False, "id": "w", "due": 1000.0,
+                  "repeat": "weekly", "tags": ["home"]},
+                 {"task": "Once", "priority": "", "completed": False, "id": "o", "repeat": "daily"},
+                 {"task": "Done", "priority": "", "completed": True, "id": "d"}]
+        records = completion_records(tasks, True, now=5.0)
+        self.assertEqual(records[0], {"op": "add", "task": {"task": "Water plants", "priority": "Low", "due": 1000.0,
+                                                            "series": "w", "tags": ["home"], "completed": True,
+                                                            "completed_at": 5.0}})
+        self.assertEqual((records[1]["id"], records[1]["task"]["due"], records[1]["task"]["completed"]),
+                         ("w", next_occurrence("weekly", 1000.0), False))
+        # Without a due time there is nothing to count from, so it is just completed
+        self.assertEqual((records[2]["id"], records[2]["task"]["completed"]), ("o", True))
+        self.assertEqual(len(records), 3)
+        self.assertEqual([record["id"] for record in completion_records(tasks, False)], ["d"])
+
+    def test_monthly_keeps_its_day(self):
+        """Test that a monthly task moved to a short month's last day goes back to its own day after it."""
+        task = {"task": "Rent", "priority": "", "completed": False, "id": "r", "due": parse_due("2023-01-31 09:00"),
+                "repeat": "monthly"}
+        labels = []
+        for _ in range(3):
+            task = completion_records([task], True)[1]["task"]
+            labels.append(due_label(task["due"]))
+        self.assertEqual(labels, ["2023-02-28 09:00", "2023-03-31 09:00", "2023-04-30 09:00"])
+        # Moved by hand to a day that is not a month's end, it repeats on that day
+        task["due"] = parse_due("2023-04-15 09:00")
+        self.assertEqual(due_label(completion_records([task], True)[1]["task"]["due"]), "2023-05-15 09:00")
+
+if __name__ == '__main__':
+    unittest.main()
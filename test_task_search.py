@@ -0,0 +1,102 @@
+import unittest
+
+from task_model import TaskList, SortedOrder
+from task_search import FilterIndex, SearchIndex, in_order, tokenize
+
+class TestSearchIndex(unittest.TestCase):
+    """Test cases for the word and trigram search index."""
+
+    def setUp(self):
+        """Create an index over a few tasks."""
+        self.tasks = TaskList([
+            {"task": "Buy milk", "priority": "Low", "completed": False, "id": "milk"},
+            {"task": "Email the report", "priority": "High", "completed": False, "id": "email"},
+            {"task": "Milkshake for Bob", "priority": "", "completed": False, "id": "shake"},
+            {"task": "Book the meeting room", "priority": "Medium", "completed": False, "id": "meeting"}
+        ])
+        self.index = SearchIndex(self.tasks)
+
+    def test_tokenize(self):
+        """Test that text is split into casefolded words."""
+        self.assertEqual(tokenize("Call Bob, re: Q3-report!"), ["call", "bob", "re", "q3", "report"])
+
+    def test_exact_and_prefix(self):
+        """Test that exact words rank above longer words they prefix."""
+        self.assertEqual(self.index.search("milk"), ["milk", "shake"])
+        self.assertEqual(self.index.search("MIL"), ["milk", "shake"])
+        self.assertEqual(self.index.search("b"), ["milk", "shake", "meeting"])
+
+    def test_all_words_must_match(self):
+        """Test that every query word has to match."""
+        # "room" is a closer completion of "r" than "report"
+        self.assertEqual(self.index.search("the r"), ["meeting", "email"])
+        self.assertEqual(self.index.search("milk bob"), ["shake"])
+        self.assertEqual(self.index.search("milk nothing"), [])
+        self.assertEqual(self.index.search("  ,  "), [])
+
+    def test_fuzzy(self):
+        """Test that misspelled words still match, below real matches."""
+        self.assertEqual(self.index.search("meetnig"), ["meeting"])
+        self.assertEqual(self.index.search("raport"), ["email"])
+        self.assertEqual(self.index.search("milkshak"), ["shake", "milk"])
+        self.assertEqual(self.index.search("xyzzy"), [])
+
+    def test_follows_changes(self):
+        """Test that adds, edits and deletes are indexed incrementally."""
+        self.tasks.add({"task": "Milk the cow", "priority": "", "completed": False, "id": "cow"})
+        self.tasks.update("milk", task="Buy bread")
+        self.tasks.remove("shake")
+        self.tasks.update("email", completed=True)
+        self.assertEqual(self.index.search("milk"), ["cow"])
+        self.assertEqual(self.index.search("bread"), ["milk"])
+        self.assertEqual(self.index.search("bob"), [])
+        self.assertEqual(self.index.search("email"), ["email"])
+
+    def test_ties_follow_order(self):
+        """Test that equally good matches keep the given view order."""
+        order = SortedOrder(self.tasks)
+        self.assertEqual(self.index.search("the", order), ["email", "meeting"])
+        order.descending = True
+        self.assertEqual(self.index.search("the", order), ["meeting", "email"])
+
+class TestFilterIndex(unittest.TestCase):
+    """Test cases for the tag, priority and status filter index."""
+
+    def setUp(self):
+        """Create an index over a few tagged tasks."""
+        self.tasks = TaskList([
+            {"task": "Draft", "priority": "High", "completed": False, "id": "a", "tags": ["site", "copy"]},
+            {"task": "Deploy", "priority": "High", "completed": True, "id": "b", "tags": ["site"]},
+            {"task": "Logo", "priority": "Low", "completed": False, "id": "c", "tags": ["site", "design"]},
+            {"task": "Taxes", "priority": "High", "completed": False, "id": "d"}
+        ])
+        self.index = FilterIndex(self.tasks)
+
+    def test_intersections(self):
+        """Test that every criterion given has to hold."""
+        self.assertIsNone(self.index.filter())
+        self.assertEqual(self.index.filter(tags=["site"]), {"a", "b", "c"})
+        self.assertEqual(self.index.filter(tags=["site"], priority="High", completed=False), {"a"})
+        self.assertEqual(self.index.filter(tags=["site", "design"]), {"c"})
+        self.assertEqual(self.index.filter(tags=["nope"], completed=False), set())
+        self.assertEqual(self.index.filter(priority="High", completed=False), {"a", "d"})
+        self.assertEqual(self.index.tags(), ["copy", "design", "site"])
+
+    def test_follows_changes(self):
+        """Test that tagging, edits and removals re-file only that task."""
+        self.tasks.update("d", tags=["home"], priority="Low")
+        self.tasks.update("b", completed=False)
+        self.tasks.update("a", tags=["copy"])
+        self.tasks.remove("c")
+        self.tasks.add({"task": "Call", "priority": "Low", "completed": False, "id": "e", "tags": "home, phone"})
+        self.assertEqual(self.index.filter(tags=["site"], completed=False), {"b"})
+        self.assertEqual(self.index.filter(tags=["home"], priority="Low"), {"d", "e"})
+        self.assertEqual(self.index.tags(), ["copy", "home", "phone", "site"])
+
+    def test_in_order(self):
+        """Test that filtered ids come back in the stored or the sorted order."""
+        self.assertEqual(in_order({"d", "a", "c"}, self.tasks), ["a", "c", "d"])
+        self.assertEqual(in_order({"d", "a", "c"}, SortedOrder(self.tasks)), ["a", "d", "c"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,287 @@
+import unittest
+import asyncio
+import http.client
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from unittest.mock import patch
+
+from task_server import ServerError, ServerStore, TaskServer, TaskService, foreign_changes
+from task_storage import JournalStore, diff_tasks, open_store
+
+
+@contextmanager
+def running_server(tasks_path, log_size=None, **listen):
+    """Serve the tasks file at ``tasks_path`` from a background event loop; yields
+    the TaskServer (its ``address`` is what TASKS_SERVER would be)."""
+    store = JournalStore(tasks_path)
+    service = TaskService(store) if log_size is None else TaskService(store, log_size)
+    server = TaskServer(service)
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    try:
+        asyncio.run_coroutine_threadsafe(server.start(**listen), loop).result(5)
+        yield server
+    finally:
+        if server.address is not None:
+            asyncio.run_coroutine_threadsafe(server.close(), loop).result(5)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(5)
+        loop.close()
+        service.close()
+
+
+def on_loop(server, function, *args):
+    """Run ``function`` on the server's event loop thread and return its result."""
+    async def call():
+        return function(*args)
+    loop = server._server.get_loop()
+    return asyncio.run_coroutine_threadsafe(call(), loop).result(5)
+
+
+class TestTaskServer(unittest.TestCase):
+    """Test cases for the task service and its client store."""
+
+    def setUp(self):
+        """Serve a temporary tasks file over a Unix socket."""
+        self.test_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.test_dir, 'tasks.json')
+        store = JournalStore(self.path)
+        store.save([{"task": "Existing", "priority": "Low", "completed": False, "id": "a"}])
+        store.close()
+        self.stores = []
+
+    def tearDown(self):
+        """Close the clients and clean up temporary files."""
+        for store in self.stores:
+            store.close()
+        shutil.rmtree(self.test_dir)
+
+    def serve(self, **options):
+        options.setdefault('path', os.path.join(self.test_dir, 'tasks.sock'))
+        return running_server(self.path, **options)
+
+    def client(self, server):
+        store = ServerStore(server.address)
+        self.stores.append(store)
+        return store
+
+    def test_crud_and_filter(self):
+        """Test the single-task endpoints and the filtered list."""
+        with self.serve() as server:
+            store = self.client(server)
+            added = store.request('POST', '/tasks', {"task": "Ship release", "priority": "high"})
+            self.assertEqual(added["task"]["priority"], "High")
+            task_id = added["task"]["id"]
+            store.request('PATCH', '/tasks/' + task_id, {"completed": True})
+            task = store.request('GET', '/tasks/' + task_id)["task"]
+            self.assertEqual(task["completed"], True)
+            self.assertIsInstance(task["completed_at"], float)
+            found = store.request('GET', '/tasks?match=RELEASE&completed=true')["tasks"]
+            self.assertEqual([task["id"] for task in found], [task_id])
+            store.request('DELETE', '/tasks/a')
+            with self.assertRaises(ServerError) as error:
+                store.request('DELETE', '/tasks/a')
+            self.assertEqual(error.exception.status, 404)
+            self.assertEqual(store.request('GET', '/tasks')["revision"], 3)
+
+    def test_bad_batch_applies_nothing(self):
+        """Test that one invalid record rejects the whole batch."""
+        with self.serve() as server:
+            store = self.client(server)
+            tasks = store.load()
+            with self.assertRaises(ServerError) as error:
+                store.append_many([{"op": "add", "task": {"task": "Fine"}},
+                                   {"op": "update", "id": "a", "task": {"completed": "yes"}}])
+            self.assertEqual(error.exception.status, 400)
+            self.assertEqual(store.changes(tasks), [])
+            self.assertEqual(len(server.service.tasks), 1)
+
+    def test_clients_get_each_others_deltas(self):
+        """Test that each client sees the other's changes but not its own."""
+        with self.serve() as server:
+            first, second = self.client(server), self.client(server)
+            mine, theirs = first.load(), second.load()
+            task = mine.add({"task": "New", "priority": "", "completed": False})
+            first.append({"op": "add", "task": task})
+            self.assertEqual(first.changes(mine), [])
+            records = second.changes(theirs)
+            self.assertEqual([(r["op"], r["task"]["id"]) for r in records], [("add", task.id)])
+            for record in records:
+                theirs.add(record["task"])
+
+            # Both edit the same task; the server applies the second edit last
+            first.append({"op": "update", "id": "a", "task": dict(mine.get("a"), completed=True)})
+            second.append({"op": "update", "id": "a", "task": dict(theirs.get("a"), task="Renamed")})
+            self.assertEqual(second.changes(theirs), [])
+            records = first.changes(mine)
+            self.assertEqual([(r["op"], r["task"]["task"], r["task"]["completed"]) for r in records],
+                             [("update", "Renamed", False)])
+
+    def test_own_later_update_wins(self):
+        """Test that an update overwritten by one of the client's own is dropped."""
+        entries = [{"op": "update", "id": "a", "task": {"task": "Theirs"}, "client": "them", "revision": 1},
+                   {"op": "update", "id": "a", "task": {"task": "Mine"}, "client": "me", "revision": 2},
+                   {"op": "delete", "id": "b", "client": "them", "revision": 3}]
+        self.assertEqual(foreign_changes(entries, "me"), [{"op": "delete", "id": "b"}])
+        self.assertEqual(foreign_changes(entries, "them"), [{"op": "update", "id": "a", "task": {"task": "Mine"}}])
+
+    def test_client_behind_the_log_gets_a_diff(self):
+        """Test that a client the change log no longer reaches back to gets the difference from the server's list."""
+        with self.serve(log_size=2) as server:
+            first, second = self.client(server), self.client(server)
+            tasks = second.load()
+            first.append_many([{"op": "add", "task": {"task": "T%d" % i, "id": str(i)}} for i in range(3)]
+                              + [{"op": "delete", "id": "0"}])
+            self.assertIsNone(on_loop(server, server.service.changes_since, 0))
+            with patch('task_server.diff_tasks', wraps=diff_tasks) as diff:
+                records = second.changes(tasks)
+            diff.assert_called_once()
+            self.assertEqual(diff.call_args[0][1].ids(), ["a", "1", "2"])
+            self.assertEqual(sorted((r["op"], r["task"]["id"]) for r in records), [("add", "1"), ("add", "2")])
+            for record in records:
+                tasks.add(record["task"])
+
+            # Caught up again, the next change comes from the log
+            first.append({"op": "delete", "id": "1"})
+            with patch('task_server.diff_tasks', wraps=diff_tasks) as diff:
+                self.assertEqual(second.changes(tasks), [{"op": "delete", "id": "1"}])
+            diff.assert_not_called()
+
+    def test_restarted_server_gets_a_diff(self):
+        """Test that a client of a restarted server compares lists, even at a revision the new server also has."""
+        with self.serve() as server:
+            store = self.client(server)
+            tasks = store.load()
+            old_id = server.service.server_id
+        other = JournalStore(self.path)
+        other.load()
+        other.append({"op": "add", "task": {"task": "Written meanwhile", "priority": "", "completed": False,
+                                            "id": "b"}})
+        other.close()
+        with self.serve() as server:
+            self.assertNotEqual(server.service.server_id, old_id)
+            self.assertEqual(server.service.revision, 0)
+            with patch('task_server.diff_tasks', wraps=diff_tasks) as diff:
+                records = store.changes(tasks)
+            diff.assert_called_once()
+            self.assertEqual([(r["op"], r["task"]["id"]) for r in records], [("add", "b")])
+            self.assertEqual(store.changes(tasks), [])
+
+    def test_long_poll_and_stream(self):
+        """Test that the feed waits for the next change and streams changes."""
+        with self.serve(path=None, port=0) as server:
+            store = self.client(server)
+            timer = threading.Timer(0.2, store.request, ('POST', '/tasks', {"task": "Later"}))
+            timer.start()
+            started = time.perf_counter()
+            reply = store.request('GET', '/changes?since=0&wait=5')
+            timer.join()
+            self.assertLess(time.perf_counter() - started, 4)
+            self.assertEqual([entry["task"]["task"] for entry in reply["changes"]], ["Later"])
+
+            host, port = server.address[len('http://'):].split(':')
+            connection = http.client.HTTPConnection(host, int(port), timeout=5)
+            connection.request('GET', '/changes?since=0&stream=1')
+            response = connection.getresponse()
+            self.assertEqual(json.loads(response.readline())["task"]["task"], "Later")
+            store.request('DELETE', '/tasks/a')
+            line = response.readline()
+            while line == b'\n':
+                line = response.readline()
+            self.assertEqual(json.loads(line), dict(json.loads(line), op="delete", id="a", revision=2))
+            connection.close()
+
+    def test_idle_waits_leave_no_waiters(self):
+        """Test that long polls and stream heartbeats that time out do not pile up waiters."""
+        with self.serve(path=None, port=0) as server, patch('task_server.STREAM_HEARTBEAT', 0.05):
+            store = self.client(server)
+            for _ in range(3):
+                self.assertEqual(store.request('GET', '/changes?since=0&wait=0.05')["changes"], [])
+            self.assertEqual(on_loop(server, len, server.service._waiters), 0)
+
+            host, port = server.address[len('http://'):].split(':')
+            connection = http.client.HTTPConnection(host, int(port), timeout=5)
+            connection.request('GET', '/changes?stream=1')
+            response = connection.getresponse()
+            for _ in range(5):
+                self.assertEqual(response.readline(), b'\n')
+            # At most the wait in progress
+            self.assertLessEqual(on_loop(server, len, server.service._waiters), 1)
+            connection.close()
+
+    def test_bad_since_is_a_bad_request(self):
+        """Test that a since that is not a revision gets a 400, streamed or not."""
+        with self.serve(path=None, port=0) as server:
+            store = self.client(server)
+            for since in ("nan", "inf", "x"):
+                with self.assertRaises(ServerError) as error:
+                    store.request('GET', '/changes?since=%s' % since)
+                self.assertEqual(error.exception.status, 400)
+
+            host, port = server.address[len('http://'):].split(':')
+            connection = http.client.HTTPConnection(host, int(port), timeout=5)
+            connection.request('GET', '/changes?since=nan&stream=1')
+            response = connection.getresponse()
+            self.assertEqual(response.status, 400)
+            self.assertIn("since", json.loads(response.read())["error"])
+            connection.close()
+
+    def test_connections_are_reused(self):
+        """Test that requests share one pooled keep-alive connection."""
+        with self.serve() as server:
+            store = self.client(server)
+            store.load()
+            connection = store._idle[0]
+            for _ in range(5):
+                store.changes(store.load())
+            self.assertEqual(store._idle, [connection])
+            self.assertEqual(len(server._connections), 1)
+
+    def test_writes_reach_the_files(self):
+        """Test that changes are persisted and direct file writes are published."""
+        with self.serve() as server:
+            store = self.client(server)
+            tasks = store.load()
+            store.append({"op": "update", "id": "a", "task": {"completed": True}})
+            server.service.persistence.flush()
+            other = JournalStore(self.path)
+            self.assertTrue(other.load().get("a")["completed"])
+            other.append({"op": "add", "task": {"task": "Direct", "id": "d"}})
+            other.close()
+            on_loop(server, server.service.merge_store)
+            self.assertEqual([(r["op"], r["task"]["id"]) for r in store.changes(tasks)], [("add", "d")])
+
+    def test_server_archives_old_completed_tasks(self):
+        """Test that the server moves long-completed tasks into its archive."""
+        store = JournalStore(self.path)
+        store.append({"op": "add", "task": {"task": "Done", "completed": True, "id": "d", "completed_at": 1.0}})
+        store.close()
+        with self.serve() as server:
+            client = self.client(server)
+            self.assertIsNone(client.archive)
+            self.assertEqual([task.id for task in client.load()], ["a"])
+            server.service.persistence.flush()
+        self.assertEqual(JournalStore(self.path).archive.load().ids(), ["d"])
+
+    def test_open_store_uses_server(self):
+        """Test that $TASKS_SERVER makes open_store() return a client."""
+        with self.serve() as server, patch.dict(os.environ, {'TASKS_SERVER': server.address}):
+            store = open_store(self.path)
+            self.stores.append(store)
+            self.assertIsInstance(store, ServerStore)
+            self.assertEqual([task.id for task in store.load()], ["a"])
+            store.save_settings({"sort": "priority"})
+            self.assertEqual(store.load_settings(), {"sort": "priority"})
+            local = open_store(self.path, 'json')
+            self.assertIsInstance(local, JournalStore)
+            local.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,973 @@
+import unittest
+import errno
+import json
+import os
+import tempfile
+import shutil
+import sqlite3
+import io
+import threading
+from unittest.mock import patch
+
+from task_model import TaskList
+from task_storage import (
+    BinaryStore, JournalStore, PersistenceWorker, ShardedStore, SqliteStore, TaskArchive, apply_record,
+    archive_age, archive_records, fingerprint, iter_json_array, main, migrate_json_to_sqlite, open_store,
+    write_binary_atomic, write_json_atomic
+)
+
+class TestJournalStore(unittest.TestCase):
+    """Test cases for the snapshot + journal storage."""
+
+    def setUp(self):
+        """Create a temporary tasks file location."""
+        self.test_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.test_dir, 'tasks.json')
+
+    def tearDown(self):
+        """Clean up temporary files."""
+        shutil.rmtree(self.test_dir)
+
+    def read_snapshot(self):
+        with open(self.path, 'r') as f:
+            return json.load(f)
+
+    def test_load_missing_files(self):
+        """Test loading when neither snapshot nor journal exists."""
+        self.assertEqual(JournalStore(self.path).load(), [])
+
+    def test_failed_snapshot_write_cleans_up(self):
+        """Test that a snapshot write that fails removes its temp file and reports its own error."""
+        def rows():
+            yield {"task": "Fine", "priority": "", "completed": False, "id": "a"}
+            raise ValueError("bad row")
+        with self.assertRaises(ValueError):
+            write_json_atomic(self.path, rows())
+        self.assertEqual(os.listdir(self.test_dir), [])
+        # Not even created: the error is the create's, not a FileNotFoundError from the cleanup
+        with patch('task_storage.open', side_effect=OSError(errno.ENOSPC, "No space left on device"), create=True):
+            with self.assertRaises(OSError) as error:
+                write_json_atomic(self.path, [])
+        self.assertEqual(error.exception.errno, errno.ENOSPC)
+
+    def test_append_does_not_rewrite_snapshot(self):
+        """Test that mutations only touch the journal."""
+        store = JournalStore(self.path)
+        store.save([{"task": "Existing", "priority": "Low", "completed": False, "id": "a"}])
+        before = fingerprint(self.path)
+
+        store.append({"op": "add", "task": {"task": "New", "priority": "High", "completed": False, "id": "b"}})
+        store.append({"op": "update", "id": "a", "task": {"task": "Existing", "priority": "Low", "completed": True, "id": "a"}})
+
+        self.assertEqual(fingerprint(self.path), before)
+        self.assertTrue(os.path.exists(store.journal_path))
+
+    def test_replay_on_load(self):
+        """Test that the journal is replayed on top of the snapshot."""
+        store = JournalStore(self.path)
+        store.save([
+            {"task": "Low task", "priority": "Low", "completed": False, "id": "low"},
+            {"task": "Doomed", "priority": "Medium", "completed": False, "id": "doomed"}
+        ])
+        store.append({"op": "add", "task": {"task": "High task", "priority": "High", "completed": False, "id": "high"}})
+        store.append({"op": "delete", "id": "doomed"})
+        store.append({"op": "update", "id": "low", "task": {"task": "Low task", "priority": "Low", "completed": True, "id": "low"}})
+        store.append({"op": "sort", "key": "priority"})
+        store.close()
+
+        tasks = JournalStore(self.path).load()
+        self.assertEqual([t["task"] for t in tasks], ["High task", "Low task"])
+        self.assertTrue(tasks.get("low")["completed"])
+
+    def test_iter_tasks_streams_with_journal(self):
+        """Test that iter_tasks() yields what load() would, a batch at a time."""
+        store = JournalStore(self.path, compact_threshold=float("inf"))
+        store.save([{"task": "Task %d" % i, "priority": "", "completed": False, "id": str(i)} for i in range(25)])
+        store.append_many([{"op": "delete", "id": "3"},
+                           {"op": "update", "id": "7", "task": {"task": "Seven", "priority": "High",
+                                                                "completed": True, "id": "7"}},
+                           {"op": "add", "task": {"task": "New", "priority": "", "completed": False, "id": "new"}},
+                           {"op": "delete", "id": "new"},
+                           {"op": "add", "task": {"task": "Last", "priority": "", "completed": False, "id": "last"}}])
+
+        batches = list(store.iter_tasks(batch_size=10))
+        self.assertTrue(all(len(batch) <= 10 for batch in batches))
+        self.assertEqual([task for batch in batches for task in batch], JournalStore(self.path).load())
+
+        # Compaction streams through the same overlay
+        store.compact()
+        self.assertEqual([task["id"] for task in self.read_snapshot()][-3:], ["23", "24", "last"])
+        self.assertEqual(len(self.read_snapshot()), 25)
+
+    def test_legacy_file_gets_ids(self):
+        """Test that files from before task ids are migrated once on load."""
+        with open(self.path, 'w') as f:
+            json.dump([
+                {"task": "First", "priority": "", "completed": False},
+                {"task": "Second", "priority": "High", "completed": False}
+            ], f)
+        with open(self.path + '.journal', 'w') as f:
+            f.write(json.dumps({"base": fingerprint(self.path)}) + '\n')
+            f.write(json.dumps({"op": "update", "index": 1, "seq": 1,
+                                "task": {"task": "Second", "priority": "High", "completed": True}}) + '\n')
+            f.write(json.dumps({"op": "delete", "index": 0, "seq": 2}) + '\n')
+
+        tasks = JournalStore(self.path).load()
+        self.assertEqual([t["task"] for t in tasks], ["Second"])
+        self.assertTrue(tasks[0]["completed"])
+        self.assertIn("id", tasks[0])
+        # The ids were written back, so they are stable across loads
+        self.assertEqual(self.read_snapshot(), list(tasks))
+        self.assertEqual(JournalStore(self.path).load()[0]["id"], tasks[0]["id"])
+
+    def test_save_clears_journal(self):
+        """Test that a full save folds everything into the snapshot."""
+        store = JournalStore(self.path)
+        store.append({"op": "add", "task": {"task": "Task", "priority": "Low", "completed": False}})
+        tasks = store.load()
+        store.save(tasks)
+
+        self.assertFalse(os.path.exists(store.journal_path))
+        self.assertEqual(self.read_snapshot(), tasks)
+        self.assertEqual(JournalStore(self.path).load(), tasks)
+
+    def test_settings_round_trip(self):
+        """Test that view settings are kept next to the snapshot."""
+        store = JournalStore(self.path)
+        self.assertEqual(store.load_settings(), {})
+        store.save_settings({"sort": "priority", "descending": True})
+        self.assertEqual(JournalStore(self.path).load_settings(), {"sort": "priority", "descending": True})
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_background_compaction(self):
+        """Test that a large journal is folded into the snapshot."""
+        store = JournalStore(self.path, compact_threshold=512)
+        for i in range(50):
+            store.append({"op": "add", "task": {"task": "Task %d" % i, "priority": "", "completed": False}})
+        store.wait_for_compaction()
+
+        self.assertGreater(len(self.read_snapshot()), 0)
+        self.assertLess(os.path.getsize(store.journal_path) if os.path.exists(store.journal_path) else 0, 4096)
+        tasks = JournalStore(self.path).load()
+        self.assertEqual([t["task"] for t in tasks], ["Task %d" % i for i in range(50)])
+
+    def test_streaming_load(self):
+        """Test that batches stream from the snapshot and the journal is replayed after them."""
+        store = JournalStore(self.path)
+        store.save([{"task": "Task %d" % i, "priority": "", "completed": False, "id": str(i)} for i in range(25)])
+        store.append({"op": "delete", "id": "3"})
+        store.close()
+
+        store = JournalStore(self.path, compact_threshold=1)
+        tasks = TaskList()
+        fractions = []
+        for batch, done in store.load_batches(batch_size=10):
+            tasks.extend(batch)
+            fractions.append(done)
+            # Nothing compacts the snapshot away while it is being read
+            store.append({"op": "add", "task": {"task": "Queued", "priority": "", "completed": False}})
+            self.assertIsNone(store._compactor)
+        self.assertEqual(len(fractions), 3)
+        self.assertEqual(fractions, sorted(fractions))
+        self.assertEqual(fractions[-1], 1.0)
+        store.finish_load(tasks)
+        self.assertEqual(len(tasks), 24 + 3)
+        self.assertIsNone(tasks.get("3"))
+
+    def test_crash_after_snapshot_replace(self):
+        """Test that a checkpointed journal is not replayed twice."""
+        store = JournalStore(self.path)
+        store.append({"op": "add", "task": {"task": "Once", "priority": "", "completed": False}})
+        store.close()
+
+        # Simulate a crash between moving the snapshot in and resetting the journal
+        with open(store.journal_path, 'r') as f:
+            journal = f.read()
+        JournalStore(self.path).save([{"task": "Once", "priority": "", "completed": False}])
+        with open(store.journal_path, 'w') as f:
+            f.write(journal)
+            f.write(json.dumps({"checkpoint": 1, "base": fingerprint(self.path)}) + '\n')
+
+        tasks = JournalStore(self.path).load()
+        self.assertEqual([t["task"] for t in tasks], ["Once"])
+
+    def test_torn_journal_tail(self):
+        """Test that a partially written last record is ignored."""
+        store = JournalStore(self.path)
+        store.append({"op": "add", "task": {"task": "Kept", "priority": "", "completed": False}})
+        store.close()
+        with open(store.journal_path, 'a') as f:
+            f.write('{"op": "add", "ta')
+
+        tasks = JournalStore(self.path).load()
+        self.assertEqual([t["task"] for t in tasks], ["Kept"])
+
+class TestIterJsonArray(unittest.TestCase):
+    """Test cases for the incremental JSON array parser."""
+
+    def parse(self, text, chunk_size):
+        return [value for value, _ in iter_json_array(io.StringIO(text), chunk_size)]
+
+    def test_matches_json_loads(self):
+        """Test that every chunk size gives the same result as json.loads."""
+        text = json.dumps([{"task": "a, ] }", "n": [1, {"x": None}]}, 1.5e3, -20, "s\"t", True, None], indent=2)
+        for chunk_size in (1, 2, 3, 7, 64):
+            self.assertEqual(self.parse(text, chunk_size), json.loads(text))
+        self.assertEqual(self.parse(" [ ] ", 1), [])
+
+    def test_malformed(self):
+        """Test that truncated or invalid documents raise ValueError."""
+        for text in ("", "{}", "[1,", "[1 2]", "[1,]", '[{"task": "cut'):
+            for chunk_size in (1, 64):
+                with self.assertRaises(ValueError):
+                    self.parse(text, chunk_size)
+
+class TestSqliteStore(unittest.TestCase):
+    """Test cases for the SQLite backend."""
+
+    def setUp(self):
+        """Open a store in a temporary directory."""
+        self.test_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.test_dir, 'tasks.db')
+        self.store = SqliteStore(self.path)
+
+    def tearDown(self):
+        """Close the store and clean up temporary files."""
+        self.store.close()
+        shutil.rmtree(self.test_dir)
+
+    def reopen(self):
+        self.store.close()
+        self.store = SqliteStore(self.path)
+        return self.store.load()
+
+    def test_records_become_row_statements(self):
+        """Test add, update and delete against the table."""
+        self.store.append_many([
+            {"op": "add", "task": {"task": "First", "priority": "Low", "completed": False, "id": "1"}},
+            {"op": "add", "task": {"task": "Second", "priority": "High", "completed": False, "id": "2"}},
+            {"op": "add", "task": {"task": "Third", "priority": "", "completed": False, "id": "3"}},
+            {"op": "update", "id": "2", "task": {"task": "Second", "priority": "High", "completed": True, "id": "2"}},
+            {"op": "delete", "id": "1"}
+        ])
+
+        tasks = self.reopen()
+        self.assertEqual([t["task"] for t in tasks], ["Second", "Third"])
+        self.assertTrue(tasks[0]["completed"])
+        self.assertFalse(tasks[1]["completed"])
+
+    def test_sort_matches_list_sort(self):
+        """Test that the SQL sort is stable and matches the in-memory sort."""
+        tasks = [
+            {"task": "a", "priority": "Low", "completed": False},
+            {"task": "b", "priority": "", "completed": False},
+            {"task": "c", "priority": "High", "completed": False},
+            {"task": "d", "priority": "Low", "completed": True},
+            {"task": "e", "priority": "Medium", "completed": False}
+        ]
+        self.store.save(tasks)
+        self.store.append({"op": "sort", "key": "priority"})
+
+        self.assertEqual([t["task"] for t in self.reopen()], ["c", "e", "a", "d", "b"])
+
+    def test_settings_round_trip(self):
+        """Test that view settings are kept in the database."""
+        self.assertEqual(self.store.load_settings(), {})
+        self.store.save_settings({"sort": "priority", "descending": False})
+        self.reopen()
+        self.assertEqual(self.store.load_settings(), {"sort": "priority", "descending": False})
+
+    def test_indexes_exist(self):
+        """Test that priority, completion and order are indexed."""
+        self.store.close()
+        db = sqlite3.connect(self.path)
+        indexes = {row[0] for row in db.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        plan = " ".join(row[-1] for row in db.execute(
+            "EXPLAIN QUERY PLAN SELECT id FROM tasks ORDER BY priority_rank, position"))
+        db.close()
+        self.store = SqliteStore(self.path)
+
+        self.assertTrue({"tasks_task_id", "tasks_position", "tasks_priority", "tasks_completed"} <= indexes)
+        self.assertIn("tasks_priority", plan)
+
+    def test_database_without_task_ids(self):
+        """Test that databases from before task ids get an id column and ids."""
+        self.store.close()
+        os.remove(self.path)
+        db = sqlite3.connect(self.path)
+        db.execute("CREATE TABLE tasks (id INTEGER PRIMARY KEY, position INTEGER NOT NULL, "
+                   "task TEXT NOT NULL, priority TEXT NOT NULL DEFAULT '', "
+                   "priority_rank INTEGER NOT NULL DEFAULT 3, completed INTEGER NOT NULL DEFAULT 0)")
+        db.execute("INSERT INTO tasks (position, task) VALUES (0, 'Old row')")
+        db.commit()
+        db.close()
+
+        self.store = SqliteStore(self.path)
+        task_id = self.store.load()[0]["id"]
+        self.assertEqual(self.reopen()[0]["id"], task_id)
+
+    def test_completion_time_round_trip(self):
+        """Test that completion times get their own column and come back."""
+        self.store.append_many([
+            {"op": "add", "task": {"task": "Done", "priority": "", "completed": True, "id": "1",
+                                   "completed_at": 1000.5}},
+            {"op": "add", "task": {"task": "Open", "priority": "", "completed": False, "id": "2"}},
+            {"op": "update", "id": "2", "task": {"task": "Open", "priority": "", "completed": True, "id": "2",
+                                                 "completed_at": 2000.0}},
+            {"op": "update", "id": "1", "task": {"task": "Done", "priority": "", "completed": False, "id": "1",
+                                                 "completed_at": None}}
+        ])
+
+        tasks = self.reopen()
+        self.assertNotIn("completed_at", tasks.get("1"))
+        self.assertEqual(tasks.get("2")["completed_at"], 2000.0)
+
+    def test_due_time_round_trip(self):
+        """Test that due times get their own column, through a save and through journal records."""
+        self.store.save([{"task": "Report", "priority": "High", "completed": False, "id": "1", "due": 1500.0}])
+        self.store.append_many([
+            {"op": "add", "task": {"task": "Call", "priority": "", "completed": False, "id": "2", "due": 2500.0}},
+            {"op": "update", "id": "1", "task": {"task": "Report", "priority": "High", "completed": False,
+                                                 "id": "1", "due": None}}
+        ])
+
+        tasks = self.reopen()
+        self.assertNotIn("due", tasks.get("1"))
+        self.assertEqual(tasks.get("2")["due"], 2500.0)
+
+    def test_tags_round_trip(self):
+        """Test that tags come back as stored, an emptied list too."""
+        self.store.save([{"task": "Draft", "priority": "", "completed": False, "id": "1", "tags": ["site", "copy"]}])
+        self.store.append_many([
+            {"op": "add", "task": {"task": "Logo", "priority": "", "completed": False, "id": "2", "tags": ["site"]}},
+            {"op": "update", "id": "1", "task": {"task": "Draft", "priority": "", "completed": False, "id": "1",
+                                                 "tags": []}}
+        ])
+
+        tasks = self.reopen()
+        self.assertEqual(tasks.get("1")["tags"], [])
+        self.assertEqual(tasks.get("2")["tags"], ["site"])
+
+    def test_links_round_trip(self):
+        """Test that parent and blocked-by links survive a reopen, and a cleared parent is dropped."""
+        self.store.save([{"task": "Launch", "priority": "", "completed": False, "id": "1"}])
+        self.store.append_many([
+            {"op": "add", "task": {"task": "Site", "priority": "", "completed": False, "id": "2", "parent": "1"}},
+            {"op": "add", "task": {"task": "Ads", "priority": "", "completed": False, "id": "3", "parent": "1",
+                                   "blocked_by": ["2"]}},
+            {"op": "update", "id": "2", "task": {"task": "Site", "priority": "", "completed": False, "id": "2",
+                                                 "parent": None}}
+        ])
+
+        tasks = self.reopen()
+        self.assertNotIn("parent", tasks.get("2"))
+        self.assertEqual((tasks.get("3")["parent"], tasks.get("3")["blocked_by"]), ("1", ["2"]))
+
+    def test_repeat_round_trip(self):
+        """Test that a recurrence rule and an occurrence's series survive a reopen."""
+        self.store.save([{"task": "Stand-up", "priority": "", "completed": False, "id": "1", "due": 100.0,
+                          "repeat": "daily"}])
+        self.store.append({"op": "add", "task": {"task": "Stand-up", "priority": "", "completed": True, "id": "2",
+                                                 "due": 100.0, "series": "1"}})
+
+        tasks = self.reopen()
+        self.assertEqual(tasks.get("1")["repeat"], "daily")
+        self.assertEqual((tasks.get("2")["series"], tasks.get("2").get("repeat")), ("1", None))
+
+    def test_locked_is_one_transaction(self):
+        """Test that writes inside locked() keep its transaction open until the block ends, or roll back with it."""
+        self.store.save([{"task": "First", "priority": "", "completed": False, "id": "1"}])
+        with self.store.locked():
+            self.store.append({"op": "add", "task": {"task": "Second", "priority": "", "completed": False, "id": "2"}})
+            self.store.save_settings({"sort": "priority"})
+            self.assertTrue(self.store._db.in_transaction)
+            other = sqlite3.connect(self.path, timeout=0)
+            with self.assertRaises(sqlite3.OperationalError):
+                other.execute("BEGIN IMMEDIATE")
+            other.close()
+        self.assertFalse(self.store._db.in_transaction)
+        with self.assertRaises(RuntimeError):
+            with self.store.locked():
+                self.store.append({"op": "delete", "id": "1"})
+                raise RuntimeError("abandoned")
+        self.assertEqual(self.reopen().ids(), ["1", "2"])
+
+    def test_unknown_fields_survive_migration(self):
+        """Test that fields outside the standard ones are kept through a migration and updates."""
+        json_path = os.path.join(self.test_dir, 'notes.json')
+        journal = JournalStore(json_path)
+        journal.save([{"task": "Plan", "priority": "", "completed": False, "id": "1", "note": "see wiki",
+                       "estimate": {"hours": 3}}])
+        journal.close()
+        self.store.close()
+        migrate_json_to_sqlite(json_path, self.path)
+        self.store = SqliteStore(self.path)
+        task = self.store.load().get("1")
+        self.assertEqual((task["note"], task["estimate"]), ("see wiki", {"hours": 3}))
+        self.store.append({"op": "update", "id": "1", "task": dict(task, note="done")})
+        self.assertEqual(self.reopen().get("1")["note"], "done")
+
+    def test_old_columns_fold_into_extra(self):
+        """Test that a database that kept fields in columns of their own keeps them."""
+        self.store.close()
+        os.remove(self.path)
+        db = sqlite3.connect(self.path)
+        db.execute("CREATE TABLE tasks (id INTEGER PRIMARY KEY, task_id TEXT, position INTEGER NOT NULL, "
+                   "task TEXT NOT NULL, priority TEXT NOT NULL DEFAULT '', priority_rank INTEGER NOT NULL DEFAULT 3, "
+                   "completed INTEGER NOT NULL DEFAULT 0, completed_at REAL, due REAL, tags TEXT)")
+        db.execute("INSERT INTO tasks (task_id, position, task, completed, completed_at, due, tags) "
+                   "VALUES ('1', 0, 'Old', 1, 5.0, 10.0, '[\"site\"]')")
+        db.commit()
+        db.close()
+
+        task = self.reopen().get("1")
+        self.assertEqual((task["completed_at"], task["due"], task["tags"]), (5.0, 10.0, ["site"]))
+
+    def test_open_store_migrates_json(self):
+        """Test the one-shot migration from an existing tasks.json."""
+        json_path = os.path.join(self.test_dir, 'legacy.json')
+        journal = JournalStore(json_path)
+        journal.save([{"task": "Old", "priority": "Medium", "completed": True}])
+        journal.append({"op": "add", "task": {"task": "Journaled", "priority": "", "completed": False}})
+        journal.close()
+
+        store = open_store(json_path, backend='sqlite')
+        try:
+            self.assertEqual([t["task"] for t in store.load()], ["Old", "Journaled"])
+            self.assertIsInstance(store, SqliteStore)
+            self.assertTrue(os.path.exists(os.path.join(self.test_dir, 'legacy.db')))
+        finally:
+            store.close()
+
+    def test_migrate_command(self):
+        """Test the migrate command line entry point."""
+        json_path = os.path.join(self.test_dir, 'cli.json')
+        JournalStore(json_path).save([{"task": "CLI", "priority": "High", "completed": False}])
+        target = os.path.join(self.test_dir, 'cli.db')
+
+        with patch('sys.stdout', new_callable=io.StringIO):
+            self.assertEqual(main(['migrate', json_path, target]), 0)
+        store = SqliteStore(target)
+        try:
+            self.assertEqual([t["task"] for t in store.load()], ["CLI"])
+        finally:
+            store.close()
+
+class TestBinaryStore(unittest.TestCase):
+    """Test cases for the memory-mapped binary snapshot."""
+
+    def setUp(self):
+        """Create a temporary snapshot location."""
+        self.test_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.test_dir, 'tasks.bin')
+
+    def tearDown(self):
+        """Clean up temporary files."""
+        shutil.rmtree(self.test_dir)
+
+    def test_round_trip(self):
+        """Test that every kind of task comes back as it was saved."""
+        tasks = [
+            {"task": "Plain", "priority": "High", "completed": False, "id": "a"},
+            {"task": "Done", "priority": "", "completed": True, "id": "b"},
+            {"task": "Custom", "priority": "Urgent", "completed": False, "id": "c"},
+            {"task": "Ünïcødé ✓", "priority": "Low", "completed": True, "id": "d", "note": {"x": [1, 2]}},
+            {"task": "", "priority": "Medium", "completed": False},
+        ]
+        store = BinaryStore(self.path)
+        store.save(tasks)
+        store.close()
+        loaded = BinaryStore(self.path).load()
+        self.assertEqual([dict(task) for task in loaded[:4]], tasks[:4])
+        # Like tasks.json, a task saved without an id is given one on load
+        self.assertEqual(loaded[4]["task"], "")
+        self.assertTrue(loaded[4]["id"])
+
+        store.save([])
+        self.assertEqual(BinaryStore(self.path).load(), [])
+
+
+    def test_failed_save_leaves_no_temp_file(self):
+        """Test that a snapshot that cannot be written is cleaned up and the old one kept."""
+        store = BinaryStore(self.path)
+        store.save([{"task": "Kept", "priority": "Low", "completed": False, "id": "a"}])
+        with patch('task_storage.os.fsync', side_effect=OSError(28, "No space left on device")):
+            with self.assertRaises(OSError):
+                store.save([{"task": "Lost", "priority": "Low", "completed": False, "id": "b"}])
+        store.close()
+        self.assertEqual([name for name in os.listdir(self.test_dir) if name.endswith('.tmp')], [])
+        self.assertEqual([task["task"] for task in BinaryStore(self.path).load()], ["Kept"])
+        # Not even created: the error is the create's, not a FileNotFoundError from the cleanup
+        with patch('task_storage.open', side_effect=OSError(errno.ENOSPC, "No space left on device"), create=True):
+            with self.assertRaises(OSError) as error:
+                write_binary_atomic(self.path, [])
+        self.assertEqual(error.exception.errno, errno.ENOSPC)
+
+    def test_loads_in_batches(self):
+        """Test that rows are decoded a batch at a time."""
+        tasks = [{"task": "Task %d" % i, "priority": "Low", "completed": False, "id": str(i)} for i in range(25)]
+        BinaryStore(self.path).save(tasks)
+        store = BinaryStore(self.path)
+        batches = list(store.load_batches(batch_size=10))
+        self.assertEqual([len(batch) for batch, fraction in batches], [10, 10, 5])
+        self.assertEqual(batches[-1][1], 1.0)
+        store.finish_load(TaskList([task for batch, fraction in batches for task in batch]))
+        store.close()
+
+    def test_journal_and_compaction(self):
+        """Test that the journal replays and compacts onto the binary snapshot."""
+        store = BinaryStore(self.path, compact_threshold=1)
+        store.save([{"task": "Base", "priority": "Low", "completed": False, "id": "a"}])
+        store.append({"op": "add", "task": {"task": "Added", "priority": "High", "completed": False, "id": "b"}})
+        store.wait_for_compaction()
+        store.close()
+
+        with open(store.journal_path) as f:
+            self.assertFalse([line for line in f if '"op"' in line])
+        with open(self.path, 'rb') as f:
+            self.assertEqual(f.read(8), b'TASKSNAP')
+        self.assertEqual([t["task"] for t in BinaryStore(self.path).load()], ["Base", "Added"])
+
+    def test_rejects_damaged_files(self):
+        """Test that a foreign or truncated file is refused rather than misread."""
+        BinaryStore(self.path).save([{"task": "Whole", "priority": "Low", "completed": False, "id": "a"}])
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        for damaged in (b'[{"task": "json"}]', data[:-3]):
+            with open(self.path, 'wb') as f:
+                f.write(damaged)
+            with self.assertRaises(ValueError):
+                BinaryStore(self.path).load()
+
+    def test_open_store_converts_json(self):
+        """Test that the binary backend starts from the existing tasks.json."""
+        json_path = os.path.join(self.test_dir, 'tasks.json')
+        JournalStore(json_path).save([{"task": "From JSON", "priority": "Medium", "completed": False, "id": "j"}])
+        store = open_store(json_path, backend='binary')
+        try:
+            self.assertIsInstance(store, BinaryStore)
+            self.assertEqual(store.path, self.path)
+            self.assertEqual([t["task"] for t in store.load()], ["From JSON"])
+        finally:
+            store.close()
+
+    def test_convert_command(self):
+        """Test converting tasks.json to the binary snapshot and back."""
+        json_path = os.path.join(self.test_dir, 'tasks.json')
+        tasks = [{"task": "One", "priority": "High", "completed": False, "id": "1"},
+                 {"task": "Two", "priority": "Later", "completed": True, "id": "2"}]
+        store = JournalStore(json_path)
+        store.save(tasks[:1])
+        store.append({"op": "add", "task": tasks[1]})
+        store.close()
+        back = os.path.join(self.test_dir, 'back.json')
+
+        with patch('sys.stdout', new_callable=io.StringIO):
+            self.assertEqual(main(['convert', json_path, self.path]), 0)
+            self.assertEqual(main(['convert', self.path, back]), 0)
+            with patch('sys.stderr', new_callable=io.StringIO), self.assertRaises(SystemExit):
+                main(['convert', json_path, back])
+        with open(back) as f:
+            self.assertEqual(json.load(f), tasks)
+
+class TestShardedStore(unittest.TestCase):
+    """Test cases for the snapshot split across shard files."""
+
+    def setUp(self):
+        """Create a temporary manifest location."""
+        self.test_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.test_dir, 'tasks.shards')
+        self.tasks = [{"task": "Task %d" % i, "priority": "Low", "completed": False, "id": str(i)} for i in range(8)]
+
+    def tearDown(self):
+        """Clean up temporary files."""
+        shutil.rmtree(self.test_dir)
+
+    def shard_files(self, store):
+        return [entry["file"] for entry in store.shards()]
+
+    def test_round_trip(self):
+        """Test that tasks come back in order from several shards."""
+        self.tasks[3].update(priority="Urgent", note={"x": [1, 2]})
+        store = ShardedStore(self.path, shard_size=3)
+        store.save(self.tasks + [{"task": "No id", "priority": "", "completed": True}])
+        store.close()
+        self.assertEqual([entry["count"] for entry in store.shards()], [3, 3, 3])
+        self.assertEqual(sorted(os.listdir(store.shard_dir)), sorted(self.shard_files(store)))
+
+        loaded = ShardedStore(self.path).load()
+        self.assertEqual([dict(task) for task in loaded[:8]], self.tasks)
+        self.assertEqual(loaded[8]["task"], "No id")
+        self.assertTrue(loaded[8]["id"])
+
+        store.save([])
+        self.assertEqual(ShardedStore(self.path).load(), [])
+        self.assertEqual(os.listdir(store.shard_dir), [])
+
+    def test_save_rewrites_changed_shards(self):
+        """Test that a save writes new files only for the shards that changed."""
+        store = ShardedStore(self.path, shard_size=3)
+        store.save(self.tasks)
+        store.close()
+        store = ShardedStore(self.path, shard_size=3)
+        tasks = store.load()
+        first, middle, last = self.shard_files(store)
+
+        tasks.update("4", completed=True)
+        tasks.add({"task": "New", "priority": "", "completed": False, "id": "new"})
+        store.save(tasks)
+        files = self.shard_files(store)
+        self.assertEqual(files[0], first)
+        self.assertNotIn(middle, files)
+        self.assertNotIn(last, files)
+        self.assertEqual([entry["count"] for entry in store.shards()], [3, 3, 3])
+
+        # Without its first task a shard runs on from the one before, up to shard_size
+        tasks.remove("0")
+        tasks.remove("3")
+        store.save(tasks)
+        self.assertEqual([entry["count"] for entry in store.shards()], [3, 1, 3])
+        self.assertEqual(self.shard_files(store)[2], files[2])
+        self.assertEqual(sorted(os.listdir(store.shard_dir)), sorted(self.shard_files(store)))
+        self.assertEqual(ShardedStore(self.path).load(), tasks)
+        store.close()
+
+    def test_parallel_load(self):
+        """Test that shards parsed in worker processes load like the rest."""
+        ShardedStore(self.path, shard_size=2).save(self.tasks)
+        store = ShardedStore(self.path, workers=2, parallel_threshold=0)
+        batches = list(store.load_batches(batch_size=3))
+        self.assertEqual([len(batch) for batch, fraction in batches], [2, 2, 2, 2])
+        self.assertEqual(batches[-1][1], 1.0)
+        tasks = TaskList([task for batch, fraction in batches for task in batch])
+        store.finish_load(tasks)
+        self.assertEqual([dict(task) for task in tasks], self.tasks)
+        store.close()
+
+    def test_journal_and_compaction(self):
+        """Test that compaction folds the journal into just the shards it touches."""
+        store = ShardedStore(self.path, shard_size=3)
+        store.save(self.tasks)
+        store.close()
+        store = ShardedStore(self.path, compact_threshold=1, shard_size=3)
+        store.load()
+        before = self.shard_files(store)
+        store.append({"op": "update", "id": "7", "task": dict(self.tasks[7], task="Edited")})
+        store.wait_for_compaction()
+        store.close()
+
+        with open(store.journal_path) as f:
+            self.assertFalse([line for line in f if '"op"' in line])
+        self.assertEqual(self.shard_files(store)[:2], before[:2])
+        self.assertEqual(ShardedStore(self.path).load()[7]["task"], "Edited")
+
+    def test_load_survives_a_save_elsewhere(self):
+        """Test that a load under way keeps reading shards another store deletes."""
+        ShardedStore(self.path, shard_size=3).save(self.tasks)
+        reader = ShardedStore(self.path)
+        batches = reader.load_batches(batch_size=3)
+        tasks = TaskList(next(batches)[0])
+        writer = ShardedStore(self.path, shard_size=3)
+        saved = writer.load()
+        for task in saved:
+            saved.update(task.id, completed=True)
+        writer.save(saved)
+        writer.close()
+
+        for batch, fraction in batches:
+            tasks.extend(batch)
+        reader.finish_load(tasks)
+        self.assertEqual(len(tasks), 8)
+        for record in reader.changes(tasks):
+            apply_record(tasks, record)
+        self.assertEqual(tasks, saved)
+        reader.close()
+
+    def test_open_store_and_convert(self):
+        """Test that the sharded backend starts from tasks.json and converts back."""
+        json_path = os.path.join(self.test_dir, 'tasks.json')
+        JournalStore(json_path).save(self.tasks)
+        store = open_store(json_path, backend='sharded')
+        try:
+            self.assertIsInstance(store, ShardedStore)
+            self.assertEqual(store.path, self.path)
+            self.assertEqual([dict(task) for task in store.load()], self.tasks)
+        finally:
+            store.close()
+
+        back = os.path.join(self.test_dir, 'back.json')
+        with patch('sys.stdout', new_callable=io.StringIO):
+            self.assertEqual(main(['convert', self.path, back]), 0)
+        with open(back) as f:
+            self.assertEqual(json.load(f), self.tasks)
+
+class TestSharedFiles(unittest.TestCase):
+    """Test cases for two stores (as in two windows) sharing the same files."""
+
+    store_class = JournalStore
+    filename = 'tasks.json'
+
+    def setUp(self):
+        """Load the same tasks into two stores."""
+        self.test_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.test_dir, self.filename)
+        store = self.store_class(self.path)
+        store.save([{"task": "Task %d" % i, "priority": "Low", "completed": False, "id": str(i)} for i in range(5)])
+        store.close()
+        self.store_a, self.store_b = self.store_class(self.path), self.store_class(self.path)
+        self.tasks_a, self.tasks_b = self.store_a.load(), self.store_b.load()
+
+    def tearDown(self):
+        """Close both stores and clean up temporary files."""
+        self.store_a.close()
+        self.store_b.close()
+        shutil.rmtree(self.test_dir)
+
+    def on_disk(self):
+        store = self.store_class(self.path)
+        try:
+            return store.load()
+        finally:
+            store.close()
+
+    def write_a(self, *records):
+        """Apply records to A's list and write them, the way the GUI does."""
+        for record in records:
+            apply_record(self.tasks_a, record)
+        self.store_a.append_many(records)
+
+    def merge_b(self):
+        records = self.store_b.changes(self.tasks_b)
+        for record in records:
+            apply_record(self.tasks_b, record)
+        return records
+
+    def test_changes_are_read_incrementally(self):
+        """Test that only the records another store wrote are handed over."""
+        self.assertEqual(self.store_b.changes(self.tasks_b), [])
+        self.write_a({"op": "add", "task": {"task": "New", "priority": "High", "completed": False, "id": "new"}},
+                     {"op": "update", "id": "1", "task": {"task": "Task 1", "priority": "Low", "completed": True, "id": "1"}},
+                     {"op": "delete", "id": "2"})
+
+        self.assertEqual([r["op"] for r in self.merge_b()], ["add", "update", "delete"])
+        self.assertEqual(self.tasks_b, self.tasks_a)
+        self.assertEqual(self.store_b.changes(self.tasks_b), [])
+
+    def test_interleaved_writes(self):
+        """Test that writes from both stores all land and each sees the other's."""
+        self.write_a({"op": "update", "id": "1", "task": {"task": "A edit", "priority": "Low", "completed": False, "id": "1"}})
+        # B writes without having looked first; its edit comes later, so it wins
+        self.tasks_b.update("1", task="B edit")
+        self.tasks_b.add({"task": "From B", "priority": "", "completed": False, "id": "b"})
+        self.store_b.append_many([{"op": "update", "id": "1", "task": dict(self.tasks_b.get("1"))},
+                                  {"op": "add", "task": dict(self.tasks_b.get("b"))}])
+
+        self.assertEqual(self.merge_b(), [])
+        self.write_a({"op": "delete", "id": "3"})
+        self.assertEqual([r["op"] for r in self.merge_b()], ["delete"])
+        for record in self.store_a.changes(self.tasks_a):
+            apply_record(self.tasks_a, record)
+
+        on_disk = self.on_disk()
+        self.assertEqual(self.tasks_a, on_disk)
+        self.assertEqual(self.tasks_b, on_disk)
+        self.assertEqual(on_disk.get("1")["task"], "B edit")
+
+    def test_full_save_is_compared(self):
+        """Test that a full save elsewhere only yields the tasks that differ."""
+        store = self.store_class(self.path)
+        tasks = store.load()
+        tasks.update("0", completed=True)
+        tasks.remove("4")
+        tasks.add({"task": "Saved elsewhere", "priority": "Medium", "completed": False, "id": "s"})
+        store.save(tasks)
+        store.close()
+
+        records = self.merge_b()
+        self.assertEqual(sorted((r["op"], r.get("id") or r["task"]["id"]) for r in records),
+                         [("add", "s"), ("delete", "4"), ("update", "0")])
+        self.assertEqual(sorted(self.tasks_b.ids()), sorted(tasks.ids()))
+        self.assertTrue(self.tasks_b.get("0")["completed"])
+
+    def test_followed_across_compaction(self):
+        """Test that another store's compaction does not force a full reload."""
+        self.write_a({"op": "update", "id": "0", "task": {"task": "Seen", "priority": "High", "completed": False, "id": "0"}})
+        self.merge_b()
+        self.store_a.compact()
+        self.write_a({"op": "delete", "id": "4"})
+
+        with patch.object(self.store_b, '_read_snapshot', side_effect=AssertionError("full reload")):
+            self.assertEqual([r["op"] for r in self.merge_b()], ["delete"])
+        self.assertEqual(self.tasks_b, self.on_disk())
+
+    def test_lock_excludes_other_writers(self):
+        """Test that a write waits while another store holds the lock."""
+        written = threading.Event()
+
+        def write():
+            self.store_b.append({"op": "delete", "id": "0"})
+            written.set()
+
+        with self.store_a.locked():
+            writer = threading.Thread(target=write)
+            writer.start()
+            self.assertFalse(written.wait(0.2))
+        writer.join(5)
+        self.assertTrue(written.is_set())
+
+class TestSharedDatabase(TestSharedFiles):
+    """The same cases for two SQLite stores sharing a database."""
+
+    store_class = SqliteStore
+    filename = 'tasks.db'
+
+    def test_followed_across_compaction(self):
+        self.skipTest("SQLite has no journal to compact")
+
+class TestTaskArchive(unittest.TestCase):
+    """Test cases for the compressed archive of completed tasks."""
+
+    def setUp(self):
+        """Create a temporary archive location."""
+        self.test_dir = tempfile.mkdtemp()
+        self.archive = TaskArchive(os.path.join(self.test_dir, 'tasks.json.archive'))
+
+    def tearDown(self):
+        """Clean up temporary files."""
+        shutil.rmtree(self.test_dir)
+
+    def test_segments_replay_in_order(self):
+        """Test that each change is a new segment and load() replays them."""
+        self.assertEqual(len(self.archive.load()), 0)
+        self.archive.add([{"task": "A", "priority": "", "completed": True, "id": "a"},
+                          {"task": "B", "priority": "", "completed": True, "id": "b"}])
+        self.archive.remove(["a"])
+        self.archive.add([{"task": "C", "priority": "", "completed": True, "id": "c"}])
+        self.archive.add([])
+
+        # No temporary files are left behind, and nothing was written for the empty add
+        self.assertEqual(sorted(os.listdir(self.archive.path)),
+                         ["000001.jsonl.gz", "000002.jsonl.gz", "000003.jsonl.gz"])
+        self.assertEqual(self.archive.load().ids(), ["b", "c"])
+        with open(self.archive.segments()[0], 'rb') as f:
+            self.assertEqual(f.read(2), b'\x1f\x8b')
+
+    def test_records_move_old_completed_tasks(self):
+        """Test that only tasks completed long enough ago are archived."""
+        day = 24 * 60 * 60
+        now = 100 * day
+        tasks = TaskList([
+            {"task": "Old", "priority": "", "completed": True, "id": "old", "completed_at": now - 20 * day},
+            {"task": "Recent", "priority": "", "completed": True, "id": "recent", "completed_at": now - day},
+            {"task": "Unstamped", "priority": "", "completed": True, "id": "unstamped"},
+            {"task": "Open", "priority": "", "completed": False, "id": "open"}
+        ])
+
+        records = archive_records(self.archive, tasks, 14 * day, now)
+        self.assertEqual([(record["op"], record["id"]) for record in records],
+                         [("delete", "old"), ("update", "unstamped")])
+        self.assertEqual(records[1]["task"]["completed_at"], now)
+        self.assertEqual(self.archive.load(), [tasks.get("old")])
+        self.assertEqual(archive_records(self.archive, TaskList(), 14 * day, now), [])
+        self.assertEqual(len(self.archive.segments()), 1)
+
+    def test_archive_age(self):
+        """Test reading the archive period from $TASKS_ARCHIVE_DAYS."""
+        with patch.dict(os.environ, {'TASKS_ARCHIVE_DAYS': ''}):
+            self.assertEqual(archive_age(), 14 * 24 * 60 * 60)
+        with patch.dict(os.environ, {'TASKS_ARCHIVE_DAYS': '0.5'}):
+            self.assertEqual(archive_age(), 12 * 60 * 60)
+        with patch.dict(os.environ, {'TASKS_ARCHIVE_DAYS': 'Off'}):
+            self.assertIsNone(archive_age())
+        with patch.dict(os.environ, {'TASKS_ARCHIVE_DAYS': 'soon'}):
+            self.assertRaises(ValueError, archive_age)
+
+    def test_stores_have_an_archive(self):
+        """Test that each file store keeps its archive next to its data."""
+        for store in (JournalStore(os.path.join(self.test_dir, 'tasks.json')),
+                      SqliteStore(os.path.join(self.test_dir, 'tasks.db'))):
+            self.assertEqual(store.archive.path, store.path + '.archive')
+            store.close()
+
+class TestSharedShards(TestSharedFiles):
+    """The same cases for two stores sharing a sharded snapshot."""
+
+    store_class = ShardedStore
+    filename = 'tasks.shards'
+
+class CountingStore(JournalStore):
+    """Journal store that counts how many writes it performs."""
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.writes = 0
+
+    def append_many(self, records):
+        self.writes += 1
+        super().append_many(records)
+
+class TestPersistenceWorker(unittest.TestCase):
+    """Test cases for the background journal writer."""
+
+    def setUp(self):
+        """Start a worker over a temporary store."""
+        self.test_dir = tempfile.mkdtemp()
+        self.store = CountingStore(os.path.join(self.test_dir, 'tasks.json'))
+        # Long enough that only flush() or stop() ends a burst, even on a stalled test run
+        self.worker = PersistenceWorker(self.store, coalesce_delay=30)
+        self.worker.start()
+
+    def tearDown(self):
+        """Stop the worker and clean up temporary files."""
+        self.worker.stop()
+        self.store.close()
+        shutil.rmtree(self.test_dir)
+
+    def test_burst_is_coalesced(self):
+        """Test that rapid toggles end up in a single write."""
+        for i in range(200):
+            self.worker.submit({"op": "add", "task": {"task": "Task %d" % i, "priority": "", "completed": False}})
+        self.worker.flush()
+
+        self.assertEqual(self.store.writes, 1)
+        self.assertEqual(len(JournalStore(self.store.path).load()), 200)
+
+    def test_submit_many_is_one_write(self):
+        """Test that a batch is written by a single append_many() call."""
+        self.worker.submit_many([{"op": "add", "task": {"task": "Task %d" % i, "priority": "", "completed": False}}
+                                 for i in range(50)])
+        self.worker.flush()
+
+        self.assertEqual(self.store.writes, 1)
+        self.assertEqual(len(JournalStore(self.store.path).load()), 50)
+
+    def test_submit_copies_task(self):
+        """Test that later edits to the GUI's dict do not leak into queued records."""
+        task = {"task": "Original", "priority": "", "completed": False}
+        self.worker.submit({"op": "add", "task": task})
+        task["task"] = "Changed"
+        self.worker.flush()
+
+        self.assertEqual(JournalStore(self.store.path).load()[0]["task"], "Original")
+
+    def test_stop_flushes(self):
+        """Test that the exit hook writes everything still queued."""
+        self.worker.submit({"op": "add", "task": {"task": "Last", "priority": "", "completed": False}})
+        self.worker.stop()
+
+        self.assertEqual(JournalStore(self.store.path).load()[0]["task"], "Last")
+
+    def test_errors_are_reported(self):
+        """Test that write failures reach the on_error callback."""
+        errors = []
+        self.worker.on_error = errors.append
+        os.rmdir(self.test_dir)  # make the journal unwritable
+        self.worker.submit({"op": "add", "task": {"task": "Lost", "priority": "", "completed": False}})
+        self.worker.flush()
+        os.mkdir(self.test_dir)
+
+        self.assertEqual(len(errors), 1)
+        self.assertIsInstance(errors[0], OSError)
+
+if __name__ == '__main__':
+    unittest.main()